@@ -1,10 +1,16 @@
 # aplicacion principal de eventlink
+import logging
 import os
 from flask import Flask, render_template
 from flask_migrate import Migrate
 from flask_mail import Mail
+from bitacora import configurar_logging
 from config import get_config
 from database import db
+from tareas import (ejecutor_tareas, escritor_notificaciones, despachador_notificaciones, enviador_correos,
+                    enviador_push, bus_notificaciones, agrupador_notificaciones)
+from patterns.contadores import contadores_usuario
+from patterns.singleton import payment_gateway
 from dotenv import load_dotenv
 
 # cargar variables de entorno desde .env
@@ -14,7 +20,7 @@ load_dotenv(override=True)
 if not os.environ.get('MERCADOPAGO_ACCESS_TOKEN'):
     os.environ['MERCADOPAGO_ACCESS_TOKEN'] = 'TEST-4157849620035829-091318-914e52c84a25ee69d717188c213520c2-812982447'
 
-print(f"Token cargado: {os.environ.get('MERCADOPAGO_ACCESS_TOKEN', 'NO ENCONTRADO')}")
+logger = logging.getLogger(__name__)
 
 # inicializar extensiones
 migrate = Migrate()
@@ -28,10 +34,22 @@ def create_app(config_name=None):
     config_name = config_name or os.environ.get('FLASK_ENV', 'development')
     app.config.from_object(get_config(config_name))
     
+    # logging estructurado con cola (antes que el resto: los demás módulos ya registran)
+    configurar_logging(app)
+    
     # inicializar extensiones
     db.init_app(app)
     migrate.init_app(app, db)
     mail.init_app(app)
+    ejecutor_tareas.init_app(app)
+    escritor_notificaciones.init_app(app)
+    despachador_notificaciones.init_app(app)
+    enviador_correos.init_app(app)
+    enviador_push.init_app(app)
+    bus_notificaciones.init_app(app)
+    agrupador_notificaciones.init_app(app)
+    contadores_usuario.init_app(app)
+    payment_gateway.init_app(app)
     
     # registrar blueprints
     register_blueprints(app)
@@ -39,6 +57,9 @@ def create_app(config_name=None):
     # registrar modelos para migraciones
     register_models()
     
+    # registrar comandos de consola
+    register_commands(app)
+    
     # configurar patrones de diseño
     configure_patterns()
     
@@ -76,18 +97,35 @@ def create_app(config_name=None):
     # context processors
     @app.context_processor
     def inject_user():
-        # inyecta informacion del usuario en todas las plantillas
-        from flask import session
-        if 'user_id' in session:
+        # inyecta informacion del usuario en todas las plantillas; las consultas se
+        # hacen solo si la plantilla usa current_user / contadores (y una vez por petición)
+        from flask import g, session
+        from werkzeug.local import LocalProxy
+        
+        def current_user():
+            if 'user_id' not in session:
+                return None
+            if 'current_user' not in g:
+                try:
+                    from models.usuario import Usuario
+                    g.current_user = Usuario.query.get(session['user_id'])
+                except Exception:
+                    # si hay error en la consulta no limpiar la sesion automaticamente
+                    logger.exception("Error en inject_user")
+                    g.current_user = None
+            return g.current_user
+        
+        def contadores():
+            # notificaciones no leídas, carrito y solicitudes pendientes (del cache)
+            if 'user_id' not in session:
+                return {}
             try:
-                from models.usuario import Usuario
-                user = Usuario.query.get(session['user_id'])
-                return dict(current_user=user)
-            except Exception as e:
-                # si hay error en la consulta no limpiar la sesion automaticamente
-                print(f"Error en inject_user: {str(e)}")
-                return dict(current_user=None)
-        return dict(current_user=None)
+                return contadores_usuario.obtener(session['user_id'])
+            except Exception:
+                logger.exception("Error al obtener los contadores del usuario")
+                return {}
+        
+        return dict(current_user=LocalProxy(current_user), contadores=LocalProxy(contadores))
     
     @app.context_processor
     def inject_config():
@@ -121,9 +159,125 @@ def register_models():
     # registra todos los modelos para las migraciones
     from models import (
         Usuario, Evento, Servicio, Contratacion, 
-        Calificacion, Notificacion, Pago, CarritoItem
+        Calificacion, Notificacion, NotificacionFallida, NotificacionHistorica, SuscripcionPush, Pago, CarritoItem,
+        EventoWebhook, ClaveIdempotencia
     )
 
+def register_commands(app):
+    # registra los comandos de consola (flask <comando>)
+    import click
+    
+    @app.cli.command('actualizar-esquema')
+    def actualizar_esquema_command():
+        """Agrega columnas e indices nuevos a una base de datos existente"""
+        from database import actualizar_esquema
+        cambios = actualizar_esquema()
+        for cambio in cambios:
+            click.echo(f"[OK] {cambio}")
+        click.echo(f"Esquema actualizado ({len(cambios)} cambios)")
+    
+    @app.cli.command('migrar-pagos')
+    @click.option('--lote', default=500, type=int, help='Pagos por lote')
+    def migrar_pagos_command(lote):
+        """Migra pagos existentes a JSONB y a las columnas mercadopago_id/preference_id"""
+        from tareas.migraciones import migrar_datos_pagos
+        click.echo(f"Pagos migrados: {migrar_datos_pagos(tamano_lote=lote)}")
+    
+    @app.cli.command('procesar-webhooks')
+    @click.option('--lote', default=None, type=int, help='Eventos por lote')
+    @click.option('--continuo', is_flag=True, help='Seguir procesando cada --intervalo segundos')
+    @click.option('--intervalo', default=2.0, type=float, help='Segundos entre pasadas en modo continuo')
+    def procesar_webhooks_command(lote, continuo, intervalo):
+        """Aplica las notificaciones pendientes de MercadoPago"""
+        import time
+        from tareas.webhooks import procesar_pendientes
+        while True:
+            inicio = time.perf_counter()
+            resumen = procesar_pendientes(tamano_lote=lote)
+            duracion = time.perf_counter() - inicio
+            if resumen['eventos'] or not continuo:
+                velocidad = resumen['eventos'] / duracion if duracion else 0
+                click.echo(f"{resumen} en {duracion:.2f}s ({velocidad:.0f} eventos/s)")
+            if not continuo:
+                break
+            time.sleep(intervalo)
+    
+    @app.cli.command('limpiar-checkouts')
+    @click.option('--horas', default=None, type=int, help='Antigüedad mínima de los checkouts abandonados')
+    @click.option('--lote', default=None, type=int, help='Contrataciones por lote')
+    @click.option('--simular', is_flag=True, help='Solo contar lo que se eliminaría')
+    def limpiar_checkouts_command(horas, lote, simular):
+        """Elimina contrataciones y pagos de checkouts abandonados"""
+        from tareas.limpieza import limpiar_checkouts_abandonados
+        resumen = limpiar_checkouts_abandonados(horas=horas, tamano_lote=lote, simular=simular)
+        click.echo(f"{'[SIMULACION] ' if simular else ''}{resumen}")
+    
+    @app.cli.command('particionar-notificaciones')
+    @click.option('--meses', default=None, type=int, help='Meses futuros con partición ya creada')
+    def particionar_notificaciones_command(meses):
+        """Particiona por mes la tabla de notificaciones (solo PostgreSQL; bloquea la tabla al convertirla)"""
+        from tareas.retencion import particionar_notificaciones
+        click.echo(f"{particionar_notificaciones(meses_futuros=meses)}")
+    
+    @app.cli.command('retener-notificaciones')
+    @click.option('--dias', default=None, type=int, help='Antigüedad máxima de cualquier notificación')
+    @click.option('--dias-archivadas', default=None, type=int, help='Antigüedad máxima de las archivadas')
+    @click.option('--lote', default=None, type=int, help='Notificaciones por lote')
+    @click.option('--simular', is_flag=True, help='Solo contar lo que se movería')
+    def retener_notificaciones_command(dias, dias_archivadas, lote, simular):
+        """Mueve las notificaciones archivadas y antiguas a notificaciones_historico"""
+        from tareas.retencion import retener_notificaciones
+        resumen = retener_notificaciones(dias=dias, dias_archivadas=dias_archivadas, tamano_lote=lote, simular=simular)
+        click.echo(f"{'[SIMULACION] ' if simular else ''}{resumen}")
+    
+    @app.cli.command('conciliar-pagos')
+    @click.option('--horas', default=None, type=int, help='Antigüedad máxima de los pagos pendientes')
+    @click.option('--lote', default=None, type=int, help='Pagos por lote')
+    @click.option('--concurrencia', default=None, type=int, help='Consultas simultáneas a MercadoPago')
+    @click.option('--simular', is_flag=True, help='Consultar sin modificar los pagos')
+    def conciliar_pagos_command(horas, lote, concurrencia, simular):
+        """Actualiza los pagos pendientes con su estado en MercadoPago"""
+        from tareas.conciliacion import conciliar_pagos
+        resumen = conciliar_pagos(horas=horas, tamano_lote=lote, concurrencia=concurrencia, simular=simular)
+        velocidad = resumen['revisados'] / resumen['segundos'] if resumen['segundos'] else 0
+        click.echo(f"{'[SIMULACION] ' if simular else ''}{resumen} ({velocidad:.0f} pagos/s)")
+    
+    @app.cli.command('metricas-pagos')
+    @click.option('--reiniciar', is_flag=True, help='Poner los contadores en cero después de mostrarlos')
+    def metricas_pagos_command(reiniciar):
+        """Muestra las llamadas, fallos y latencias hacia MercadoPago de todos los workers"""
+        resumen = payment_gateway.metricas_pasarela()
+        click.echo(f"Desde {resumen['desde'] or '-'} ({resumen['segundos']}s)")
+        for nombre, operacion in resumen['operaciones'].items():
+            latencia = operacion['latencia_ms']
+            click.echo(f"{nombre}: {operacion['llamadas']} llamadas, {operacion['fallos']} fallos "
+                       f"({operacion['tasa_fallos']:.1%}), {operacion['por_minuto']}/min, "
+                       f"p50 {latencia['p50']}ms p95 {latencia['p95']}ms p99 {latencia['p99']}ms")
+        if reiniciar:
+            payment_gateway.reset_estadisticas()
+            click.echo("[OK] Métricas reiniciadas")
+
+    @app.cli.command('reintentar-notificaciones')
+    @click.option('--lote', default=100, type=int, help='Notificaciones fallidas por lote')
+    def reintentar_notificaciones_command(lote):
+        # reenvía las notificaciones que fallaron en todos los reintentos (dead letter)
+        from tareas.notificaciones import reintentar_fallidas
+        click.echo(f"Notificaciones fallidas: {reintentar_fallidas(tamano_lote=lote)}")
+    
+    @app.cli.command('generar-claves-push')
+    def generar_claves_push_command():
+        # par de claves VAPID para firmar las notificaciones web push
+        from tareas.push import generar_claves_vapid
+        privada, publica = generar_claves_vapid()
+        click.echo(f"PUSH_VAPID_CLAVE_PRIVADA={privada}")
+        click.echo(f"# clave pública (applicationServerKey): {publica}")
+
+    @app.cli.command('reconciliar-contadores')
+    @click.option('--lote', default=500, type=int, help='Usuarios por lote')
+    def reconciliar_contadores_command(lote):
+        # recalcula desde la base los contadores de la barra de navegación de todos los usuarios
+        click.echo(f"Contadores reconciliados: {contadores_usuario.reconciliar(tamano_lote=lote)} usuarios")
+
 def configure_patterns():
     # los patrones se configuran automaticamente al importar los modulos
     # factory observer singleton y strategy estan listos para usar
@@ -133,11 +287,11 @@ def configure_patterns():
 app = create_app()
 
 if __name__ == "__main__":
-    # crear tablas si no existen
+    # crear tablas si no existen y agregar columnas nuevas a las existentes
     with app.app_context():
-        from database import db
-        db.create_all()
-        print("Base de datos inicializada")
+        from database import actualizar_esquema
+        actualizar_esquema()
+        logger.info("Base de datos inicializada")
     
     # ejecutar la aplicacion
     app.run(
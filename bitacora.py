@@ -0,0 +1,331 @@
+# bitacora.py
+"""
+Registro (logging) estructurado que no bloquea las peticiones
+
+- Los módulos usan logging.getLogger(__name__); los campos extra van en
+  extra={'datos': {...}} y salen como claves del JSON.
+- ManejadorCola deja cada registro en una cola acotada y un QueueListener lo
+  escribe desde otro hilo: una salida lenta no frena a los workers (si la cola se
+  llena, los registros se descartan y se cuentan).
+- Cada registro lleva el id de la petición (X-Request-Id o uno nuevo), también en
+  las tareas en segundo plano encoladas durante la petición.
+- Los campos de pago (token, tarjeta, documento, access token...) se ocultan antes
+  de encolar, en el mensaje, en sus argumentos y en los datos.
+- LOG_MUESTREO conserva solo una fracción de los registros INFO/DEBUG de algunos
+  loggers (por petición: se guardan o se descartan todos los de una misma petición).
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+# id de la petición en curso (o de la que encoló la tarea en segundo plano)
+id_peticion = contextvars.ContextVar('id_peticion', default=None)
+
+CAMPOS_SENSIBLES = {
+    'token', 'card_token', 'access_token', 'card_number', 'security_code', 'cvv', 'cvc',
+    'expiration_month', 'expiration_year', 'cardholder', 'identification', 'number',
+    'numero_documento', 'documento_pagador', 'nombre_titular', 'password', 'contrasena', 'authorization', 'x-signature',
+    'secret', 'secreto'
+}
+CAMPOS_CORREO = {'email', 'correo', 'email_pagador', 'payer_email'}
+
+OCULTO = '[oculto]'
+
+_PATRON_CAMPO_SENSIBLE = re.compile(
+    r"""(['"]?(?:%s)['"]?\s*[:=]\s*)(['"]?)(?![{\[])[^'",}\s]+""" % '|'.join(
+        re.escape(campo) for campo in sorted(CAMPOS_SENSIBLES, key=len, reverse=True)),
+    re.IGNORECASE
+)
+_PATRON_ACCESS_TOKEN = re.compile(r'\b(TEST|APP_USR)-[\w-]{8,}')
+_PATRON_TARJETA = re.compile(r'\b\d(?:[ -]?\d){12,18}\b')
+_PATRON_CORREO = re.compile(r'\b([\w.+-])[\w.+-]*@([\w-]+\.[\w.-]+)\b')
+_PATRON_ID_PETICION = re.compile(r'^[\w.-]{1,64}$')
+
+
+def _luhn_valido(digitos):
+    # dígito verificador de los números de tarjeta
+    suma = 0
+    for posicion, digito in enumerate(reversed(digitos)):
+        valor = int(digito) * (2 if posicion % 2 else 1)
+        suma += valor - 9 if valor > 9 else valor
+    return suma % 10 == 0
+
+
+def _ocultar_tarjeta(coincidencia):
+    # solo los números que pasan Luhn: ids, referencias y montos largos quedan visibles
+    digitos = re.sub(r'[ -]', '', coincidencia.group(0))
+    return OCULTO if _luhn_valido(digitos) else coincidencia.group(0)
+
+
+def _ocultar_correo(correo):
+    return _PATRON_CORREO.sub(r'\1***@\2', correo)
+
+
+def redactar(valor, campo=None):
+    """
+    Copia de `valor` con los datos de pago ocultos.
+
+    En dicts y listas se ocultan las claves sensibles y se enmascaran los correos;
+    en textos se ocultan 'token: ...', access tokens, números de tarjeta y correos.
+    """
+    if campo is not None:
+        campo = str(campo).lower()
+        if campo in CAMPOS_SENSIBLES:
+            return OCULTO
+        if campo in CAMPOS_CORREO and isinstance(valor, str):
+            return _ocultar_correo(valor)
+    if isinstance(valor, dict):
+        return {clave: redactar(contenido, clave) for clave, contenido in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return type(valor)(redactar(contenido) for contenido in valor)
+    if isinstance(valor, str):
+        valor = _PATRON_CAMPO_SENSIBLE.sub(lambda m: f"{m.group(1)}{m.group(2)}{OCULTO}", valor)
+        valor = _PATRON_ACCESS_TOKEN.sub(lambda m: f"{m.group(1)}-{OCULTO}", valor)
+        valor = _PATRON_TARJETA.sub(_ocultar_tarjeta, valor)
+        return _ocultar_correo(valor)
+    return valor
+
+
+class FiltroContexto(logging.Filter):
+    """Agrega el id de la petición a cada registro"""
+
+    def filter(self, record):
+        record.id_peticion = id_peticion.get() or '-'
+        return True
+
+
+class FiltroRedaccion(logging.Filter):
+    """Oculta los datos de pago del mensaje, sus argumentos y los datos extra"""
+
+    def filter(self, record):
+        # se redacta el mensaje ya armado: en el formato, '%s' parecería un valor
+        record.msg = redactar(record.getMessage())
+        record.args = None
+        datos = getattr(record, 'datos', None)
+        if datos:
+            record.datos = redactar(datos)
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Conserva una fracción de los registros por debajo de WARNING de cada logger
+    configurado (el prefijo más largo que coincida). Con id de petición la decisión
+    es la misma para todos los registros de la petición.
+    """
+
+    def __init__(self, tasas):
+        super().__init__()
+        self.tasas = dict(tasas)
+        self.descartados = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.tasas:
+            return True
+        prefijos = [prefijo for prefijo in self.tasas
+                    if record.name == prefijo or record.name.startswith(prefijo + '.')]
+        if not prefijos:
+            return True
+        tasa = self.tasas[max(prefijos, key=len)]
+        peticion = getattr(record, 'id_peticion', '-')
+        if peticion != '-':
+            conservar = zlib.crc32(f'{peticion}:{record.name}'.encode()) % 10000 < tasa * 10000
+        else:
+            conservar = random.random() < tasa
+        if not conservar:
+            self.descartados += 1
+        return conservar
+
+
+def leer_muestreo(texto):
+    """'controllers.pago_controller=0.1,patterns=0.5' -> {'controllers.pago_controller': 0.1, ...}"""
+    tasas = {}
+    for parte in (texto or '').split(','):
+        nombre, _, tasa = parte.partition('=')
+        try:
+            tasas[nombre.strip()] = min(max(float(tasa), 0.0), 1.0)
+        except ValueError:
+            continue
+    return {nombre: tasa for nombre, tasa in tasas.items() if nombre}
+
+
+class FormateadorJson(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record):
+        entrada = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+            'id_peticion': getattr(record, 'id_peticion', '-'),
+            'hilo': record.threadName,
+        }
+        entrada.update(getattr(record, 'datos', None) or {})
+        if getattr(record, 'excepcion', None):
+            entrada['excepcion'] = record.excepcion
+        elif record.exc_info:
+            entrada['excepcion'] = self.formatException(record.exc_info)
+        return json.dumps(entrada, ensure_ascii=False, default=str)
+
+
+class FormateadorTexto(logging.Formatter):
+    """Formato legible para desarrollo: campos extra como clave=valor"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(id_peticion)s] %(name)s: %(message)s')
+
+    def format(self, record):
+        if not hasattr(record, 'id_peticion'):
+            record.id_peticion = '-'
+        texto = super().format(record)
+        datos = getattr(record, 'datos', None)
+        if datos:
+            texto += ' ' + ' '.join(f'{clave}={valor}' for clave, valor in datos.items())
+        if getattr(record, 'excepcion', None):
+            texto += '\n' + record.excepcion
+        return texto
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) en lugar de bloquear si la cola está llena"""
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        # el mensaje se arma aquí (los argumentos pueden cambiar después); la traza
+        # de la excepción viaja como texto, también redactada
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.excepcion = redactar(logging.Formatter().formatException(record.exc_info))
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+_estado = {'manejador': None, 'oyente': None, 'opciones': None}
+
+
+def configurar_logging(app=None, nivel=None, formato=None, muestreo=None, maximo_cola=None):
+    """
+    Instala en el logger raíz el manejador con cola, redacción y muestreo, y (si se
+    pasa la aplicación) la asignación del id de petición.
+
+    Los valores no indicados se leen de app.config: LOG_NIVEL, LOG_FORMATO
+    ('json' o 'texto'), LOG_MUESTREO y LOG_COLA_MAXIMO.
+    """
+    config = app.config if app is not None else {}
+    opciones = {
+        'nivel': (nivel or config.get('LOG_NIVEL') or 'INFO').upper(),
+        'formato': formato or config.get('LOG_FORMATO') or 'json',
+        'muestreo': muestreo if muestreo is not None else leer_muestreo(config.get('LOG_MUESTREO')),
+        'maximo_cola': maximo_cola or config.get('LOG_COLA_MAXIMO') or 10000,
+    }
+    _instalar(opciones)
+
+    if app is not None and not app.extensions.get('bitacora'):
+        app.before_request(_asignar_id_peticion)
+        app.after_request(_devolver_id_peticion)
+        app.teardown_request(_liberar_id_peticion)
+        app.extensions['bitacora'] = _estado
+    return _estado['manejador']
+
+
+def _instalar(opciones):
+    raiz = logging.getLogger()
+    detener()
+    if _estado['manejador'] is not None:
+        raiz.removeHandler(_estado['manejador'])
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormateadorTexto() if opciones['formato'] == 'texto' else FormateadorJson())
+
+    manejador = ManejadorCola(queue.Queue(maxsize=opciones['maximo_cola']))
+    manejador.addFilter(FiltroContexto())
+    manejador.addFilter(FiltroMuestreo(opciones['muestreo']))
+    manejador.addFilter(FiltroRedaccion())
+    oyente = logging.handlers.QueueListener(manejador.queue, salida)
+    oyente.start()
+
+    raiz.addHandler(manejador)
+    raiz.setLevel(opciones['nivel'])
+    _estado.update(manejador=manejador, oyente=oyente, opciones=opciones)
+
+
+def detener():
+    """Escribe lo que quede en la cola y detiene el hilo de salida"""
+    oyente, _estado['oyente'] = _estado['oyente'], None
+    if oyente is not None:
+        oyente.stop()
+
+
+def metricas():
+    """Registros descartados por cola llena y por muestreo en este proceso"""
+    manejador = _estado['manejador']
+    if manejador is None:
+        return {'cola': 0, 'descartados_cola': 0, 'descartados_muestreo': 0}
+    muestreo = next(filtro for filtro in manejador.filters if isinstance(filtro, FiltroMuestreo))
+    return {
+        'cola': manejador.queue.qsize(),
+        'descartados_cola': manejador.descartados,
+        'descartados_muestreo': muestreo.descartados
+    }
+
+
+def _asignar_id_peticion():
+    from flask import g, request
+
+    valor = request.headers.get('X-Request-Id', '')
+    if not _PATRON_ID_PETICION.match(valor):
+        valor = uuid.uuid4().hex
+    g.id_peticion = valor
+    id_peticion.set(valor)
+
+
+def _devolver_id_peticion(respuesta):
+    from flask import g
+
+    if getattr(g, 'id_peticion', None):
+        respuesta.headers['X-Request-Id'] = g.id_peticion
+    return respuesta
+
+
+def _liberar_id_peticion(_error=None):
+    # el hilo del worker atiende después otras peticiones
+    id_peticion.set(None)
+
+
+def _reiniciar_despues_de_fork():
+    # el hilo de salida no sobrevive al fork y la cola pudo quedar con su lock tomado
+    if _estado['opciones'] is not None:
+        _estado['oyente'] = None
+        _instalar(_estado['opciones'])
+
+
+atexit.register(detener)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_despues_de_fork)
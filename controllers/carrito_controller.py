@@ -4,13 +4,20 @@ Controlador para gestión del carrito de compras
 Principio SOLID: Single Responsibility - Responsabilidad única para carrito
 """
 
+import logging
+
 from flask import request, session, flash, redirect, url_for, render_template, jsonify
 from models.carrito import CarritoItem, EstadoCarritoItem
 from models.servicio import Servicio
 from models.evento import Evento
 from models.usuario import Usuario
-from database import db
+from models.pago import nueva_referencia_pago
+from models.idempotencia import ClaveIdempotencia, clave_del_cliente
+from database import db, insertar_ignorando_duplicados, reintentar_si_conflicto
 from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
 class CarritoController:
 
     @staticmethod
@@ -77,8 +84,9 @@ class CarritoController:
                 tipo_item='servicio'
             )
 
-            db.session.add(nuevo_item)
-            db.session.flush()
+            if not CarritoItem.agregar_pendiente(nuevo_item):
+                flash('Este servicio ya está en tu carrito para este evento', 'warning')
+                return redirect(url_for('carrito.ver_carrito'))
             db.session.commit()
 
             flash('Servicio agregado al carrito exitosamente', 'success')
@@ -97,6 +105,132 @@ class CarritoController:
             return render_template('servicios/solicitar_servicio.html', 
                                    servicio=servicio, eventos=eventos)
 
+    @staticmethod
+    def agregar_multiples_al_carrito():
+        """
+        Agrega varios servicios al carrito para un mismo evento en una sola petición
+
+        Espera un JSON con la forma:
+            {
+                "evento_id": 1,
+                "ubicacion": "opcional, por defecto la del evento",
+                "items": [
+                    {"servicio_id": 3, "fecha_evento": "2025-05-01T18:00",
+                     "duracion_horas": 4, "numero_personas": 80}
+                ]
+            }
+
+        Returns:
+            Response: JSON con los items agregados y omitidos
+        """
+        if not CarritoController._usuario_autenticado():
+            return jsonify({'success': False, 'message': 'No autorizado'}), 401
+
+        if session['user_rol'] != 'organizador':
+            return jsonify({'success': False, 'message': 'Solo los organizadores pueden agregar servicios al carrito'}), 403
+
+        data = request.get_json(silent=True) or {}
+        evento_id = data.get('evento_id')
+        entradas = data.get('items') or []
+
+        if not evento_id:
+            return jsonify({'success': False, 'message': 'Debes seleccionar un evento'}), 400
+        if not isinstance(entradas, list) or not entradas:
+            return jsonify({'success': False, 'message': 'Debes enviar al menos un servicio'}), 400
+
+        try:
+            # 1. Validar una sola vez que el evento pertenezca al organizador
+            evento = Evento.query.filter_by(
+                id=evento_id,
+                organizador_id=session['user_id']
+            ).first()
+
+            if not evento:
+                return jsonify({'success': False, 'message': 'El evento seleccionado no es válido'}), 400
+
+            ubicacion = (data.get('ubicacion') or evento.ubicacion or '').strip()
+            if not ubicacion:
+                return jsonify({'success': False, 'message': 'La ubicación es obligatoria'}), 400
+
+            # 2. Normalizar entradas (un servicio repetido en la petición cuenta una sola vez)
+            errores = []
+            solicitudes = {}
+            for posicion, entrada in enumerate(entradas, start=1):
+                try:
+                    servicio_id = int(entrada.get('servicio_id'))
+                    fecha_texto = (entrada.get('fecha_evento') or '').strip()
+                    fecha_evento = (datetime.strptime(fecha_texto, '%Y-%m-%dT%H:%M') if fecha_texto
+                                    else evento.fecha_evento or evento.fecha_inicio)
+                    duracion_horas = int(entrada.get('duracion_horas') or 4)
+                    numero_personas = entrada.get('numero_personas')
+                    numero_personas = int(numero_personas) if numero_personas else None
+                except (TypeError, ValueError, AttributeError):
+                    errores.append(f'Item {posicion}: datos inválidos')
+                    continue
+
+                if duracion_horas < 1:
+                    errores.append(f'Item {posicion}: la duración debe ser mayor a 0')
+                    continue
+
+                solicitudes.setdefault(servicio_id, (fecha_evento, duracion_horas, numero_personas))
+
+            if errores:
+                return jsonify({'success': False, 'message': 'Datos inválidos', 'errores': errores}), 400
+
+            # 3. Cargar y tarifar todos los servicios con una sola consulta
+            from models.servicio import EstadoServicio
+            servicios = Servicio.query.filter(
+                Servicio.id.in_(list(solicitudes.keys())),
+                Servicio.estado == EstadoServicio.disponible
+            ).all()
+            servicios_por_id = {servicio.id: servicio for servicio in servicios}
+
+            no_disponibles = [sid for sid in solicitudes if sid not in servicios_por_id]
+
+            filas = []
+            for servicio_id, (fecha_evento, duracion_horas, numero_personas) in solicitudes.items():
+                servicio = servicios_por_id.get(servicio_id)
+                if not servicio:
+                    continue
+
+                filas.append({
+                    'servicio_id': servicio_id,
+                    'evento_id': evento.id,
+                    'organizador_id': session['user_id'],
+                    'fecha_evento': fecha_evento,
+                    'duracion_horas': duracion_horas,
+                    'numero_personas': numero_personas,
+                    'ubicacion': ubicacion,
+                    'notas_especiales': data.get('notas_especiales', ''),
+                    'precio_base': servicio.precio_base or 0,
+                    'precio_por_hora': servicio.precio_por_hora,
+                    'precio_por_persona': servicio.precio_por_persona,
+                    'precio_total': CarritoItem.calcular_precio_total(
+                        servicio.precio_base, servicio.precio_por_hora, servicio.precio_por_persona,
+                        duracion_horas, numero_personas
+                    ),
+                    'estado': EstadoCarritoItem.pendiente,
+                    'tipo_item': 'servicio'
+                })
+
+            # 4. Insertar todo omitiendo los ya pendientes (uq_carrito_item_pendiente) y confirmar una sola vez
+            agregados = insertar_ignorando_duplicados(CarritoItem, filas)
+            db.session.commit()
+
+            return jsonify({
+                'success': True,
+                'message': f'{agregados} servicio(s) agregados al carrito',
+                'agregados': agregados,
+                'duplicados': len(filas) - agregados,
+                'no_disponibles': no_disponibles
+            })
+
+        except Exception:
+            db.session.rollback()
+            logger.exception("Error al agregar varios servicios al carrito",
+                             extra={'datos': {'organizador_id': session.get('user_id')}})
+            return jsonify({'success': False, 'message': 'Error al agregar los servicios al carrito'}), 500
+
     @staticmethod
     def ver_carrito():
         """Muestra el carrito del usuario"""
@@ -247,7 +381,106 @@ class CarritoController:
     def _acceso_no_autorizado():
         flash('Debes iniciar sesión para acceder a esta página', 'error')
         return redirect(url_for('usuario.login'))
+
+    @staticmethod
+    def _reservar_items_pendientes(user_id, items_ids=None, referencia=None):
+        """
+        Pasa los items pendientes del usuario a 'procesando' con control de
+        concurrencia optimista. Si otra pestaña reservó alguno primero se
+        recargan los pendientes y se reintenta, así cada item entra en un
+        solo checkout.
+
+        Si se indica referencia (external_reference del checkout) queda guardada
+        en los items, para que el webhook de MercadoPago los encuentre.
+
+        Returns:
+            list: Items reservados (vacía si ya no quedan pendientes)
+        """
+        def operacion():
+            consulta = CarritoItem.query.filter_by(
+                organizador_id=user_id,
+                estado=EstadoCarritoItem.pendiente
+            )
+            if items_ids is not None:
+                consulta = consulta.filter(CarritoItem.id.in_(items_ids))
+
+            items = consulta.all()
+            for item in items:
+                item.procesar()
+                if referencia:
+                    item.referencia_pago = referencia
+            db.session.commit()
+            return items
+
+        return reintentar_si_conflicto(operacion)
+
+    @staticmethod
+    def _liberar_items(user_id, items_ids):
+        """
+        Devuelve a 'pendiente' los items que siguen en 'procesando' (pago fallido o
+        abandonado). Los que el usuario volvió a agregar mientras tanto se cancelan.
+        """
+        def operacion():
+            items = CarritoItem.query.filter(
+                CarritoItem.id.in_(items_ids),
+                CarritoItem.organizador_id == user_id,
+                CarritoItem.estado == EstadoCarritoItem.procesando
+            ).all()
+            liberados = CarritoItem.liberar_items(items)
+            db.session.commit()
+            return liberados
+
+        return reintentar_si_conflicto(operacion)
     
+    @staticmethod
+    def _reclamar_clave_item(item, alcance, *partes, ttl=None):
+        """
+        Reclama la clave de idempotencia de una operación de pago sobre un item.
+
+        La clave sale de la Idempotency-Key del cliente o, si no la envía, del item
+        y los datos que fijan su precio (editar el item abre un intento nuevo) más
+        las partes dadas. No se usa item.version: reservar el item o guardarle la
+        referencia de pago la incrementa y el reintento derivaría otra clave.
+
+        Args:
+            ttl (timedelta): Vigencia del resultado guardado (por defecto la de la clave)
+
+        Returns:
+            tuple: (registro, es_nuevo) de ClaveIdempotencia.reclamar
+        """
+        clave = ClaveIdempotencia.derivar(
+            item.organizador_id, alcance, item.id, item.precio_total, item.fecha_evento,
+            item.duracion_horas, item.numero_personas, *partes,
+            clave_cliente=clave_del_cliente(request.headers)
+        )
+        if ttl is None:
+            return ClaveIdempotencia.reclamar(clave, alcance, item.organizador_id)
+        return ClaveIdempotencia.reclamar(clave, alcance, item.organizador_id, ttl=ttl)
+
+    @staticmethod
+    def _reclamar_preferencia_item(item):
+        # la preferencia guardada se reutiliza solo mientras MercadoPago la acepte
+        from patterns.singleton import payment_gateway
+        return CarritoController._reclamar_clave_item(
+            item, 'preferencia_item', ttl=payment_gateway.vigencia_preferencia
+        )
+
+    @staticmethod
+    def _liberar_clave(registro):
+        # la operación falló: la clave se descarta para permitir un nuevo intento
+        if registro is not None:
+            registro.liberar()
+            db.session.commit()
+
+    @staticmethod
+    def _repetir_preferencia(registro):
+        """Respuesta para un clic repetido sobre un checkout ya iniciado"""
+        if registro.completado and (registro.respuesta or {}).get('url_pago'):
+            # misma preferencia: ni otra llamada a MercadoPago ni filas nuevas
+            return redirect(registro.respuesta['url_pago'])
+        flash('El pago de este item ya se está preparando, intenta de nuevo en unos segundos', 'info')
+        return redirect(url_for('carrito.ver_carrito'))
+
     @staticmethod
     def pago_mercadopago(item_id):
         """
@@ -268,6 +501,7 @@ class CarritoController:
             flash('Solo los organizadores pueden procesar pagos', 'error')
             return redirect(url_for('index'))
         
+        registro = None
         try:
             # 3. Obtener el item del carrito
             item = CarritoItem.query.filter_by(
@@ -289,7 +523,12 @@ class CarritoController:
                 flash('Este item ya fue procesado o no está disponible', 'error')
                 return redirect(url_for('carrito.ver_carrito'))
             
-            # 6. Redirigir directamente a MercadoPago
+            # 6. Un clic repetido reutiliza la preferencia ya creada para el item
+            registro, nuevo = CarritoController._reclamar_preferencia_item(item)
+            if not nuevo:
+                return CarritoController._repetir_preferencia(registro)
+            
+            # 7. Redirigir directamente a MercadoPago
             from patterns.singleton import PaymentGateway
             from models.pago import Pago, MetodoPago, EstadoPago
             from models.contratacion import Contratacion, EstadoContratacion
@@ -307,7 +546,8 @@ class CarritoController:
                 notas_especiales=item.notas_especiales,
                 precio_total=item.precio_total,
                 deposito_requerido=0,
-                estado=EstadoContratacion.solicitada
+                estado=EstadoContratacion.solicitada,
+                origen='carrito'
             )
             db.session.add(contratacion)
             db.session.flush()
@@ -330,6 +570,9 @@ class CarritoController:
                 }
             )
             db.session.add(pago)
+            # external_reference del checkout: asocia las notificaciones de MercadoPago
+            pago.referencia_pago = nueva_referencia_pago()
+            item.referencia_pago = pago.referencia_pago
             db.session.flush()
             
             # Procesar con MercadoPago
@@ -337,13 +580,18 @@ class CarritoController:
             resultado_mp = payment_gateway.procesar_pago_mercadopago(
                 monto=item.precio_total,
                 descripcion=f"Servicio: {item.servicio.nombre} - Evento: {item.evento.titulo}",
-                email_pagador=session.get('user_email', 'usuario@eventlink.com')
+                email_pagador=session.get('user_email', 'usuario@eventlink.com'),
+                referencia_externa=pago.referencia_pago
             )
             
             if resultado_mp.get('success'):
                 # Guardar datos y redirigir
-                pago.datos_adicionales['mercadopago_id'] = resultado_mp.get('payment_id')
+                pago.preference_id = resultado_mp.get('id_preferencia')
                 pago.datos_adicionales['url_pago'] = resultado_mp.get('url_pago')
+                registro.completar(
+                    {'url_pago': resultado_mp.get('url_pago'), 'preference_id': resultado_mp.get('id_preferencia')},
+                    pago_id=pago.id, contratacion_id=contratacion.id, referencia_externa=pago.referencia_pago
+                )
                 db.session.commit()
                 
                 # Redirigir directamente a MercadoPago
@@ -351,12 +599,15 @@ class CarritoController:
             else:
                 pago.estado = EstadoPago.rechazado
                 pago.datos_adicionales['error'] = resultado_mp.get('message', 'Error desconocido')
+                registro.liberar()
                 db.session.commit()
                 flash(f'Error al crear el pago: {resultado_mp.get("message", "Error desconocido")}', 'error')
                 return redirect(url_for('carrito.ver_carrito'))
             
         except Exception as e:
-            print(f"❌ Error en pago_mercadopago: {e}")
+            db.session.rollback()
+            logger.exception("Error en pago_mercadopago")
+            CarritoController._liberar_clave(registro)
             flash(f'Error al procesar el pago: {str(e)}', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
@@ -401,10 +652,19 @@ class CarritoController:
                 flash('Este item ya fue procesado o no está disponible', 'error')
                 return redirect(url_for('carrito.ver_carrito'))
             
-            # 6. Crear una contratación real para el pago
+            # 6. Reutilizar la contratación de una vista anterior del formulario
             from models.contratacion import Contratacion, EstadoContratacion
             
-            # Crear contratación real en la base de datos
+            registro, nuevo = CarritoController._reclamar_clave_item(item, 'checkout_item')
+            if not nuevo and not registro.completado:
+                flash('El pago de este item ya se está preparando, intenta de nuevo en unos segundos', 'info')
+                return redirect(url_for('carrito.ver_carrito'))
+            
+            contratacion = None if nuevo else Contratacion.query.get(registro.contratacion_id)
+            if contratacion is not None and contratacion.estado == EstadoContratacion.solicitada:
+                return render_template('pagos/procesar_pago.html', contratacion=contratacion, item=item)
+            
+            # 7. Crear contratación real en la base de datos
             contratacion = Contratacion(
                 servicio_id=item.servicio_id,
                 evento_id=item.evento.id,
@@ -417,18 +677,22 @@ class CarritoController:
                 notas_especiales=item.notas_especiales,
                 precio_total=item.precio_total,
                 deposito_requerido=0,
-                estado=EstadoContratacion.solicitada
+                estado=EstadoContratacion.solicitada,
+                origen='carrito'
             )
             db.session.add(contratacion)
+            db.session.flush()
+            registro.completar({'contratacion_id': contratacion.id}, contratacion_id=contratacion.id)
             db.session.commit()
             
-            print(f"✅ Contratación creada con ID: {contratacion.id}")
+            logger.info("Contratación creada", extra={'datos': {'contratacion_id': contratacion.id, 'item_id': item.id}})
             
             # Mostrar formulario de pago con MercadoPago Checkout API
             return render_template('pagos/procesar_pago.html', contratacion=contratacion, item=item)
             
         except Exception as e:
-            print(f"❌ Error en checkout_api: {e}")
+            db.session.rollback()
+            logger.exception("Error en checkout_api")
             flash(f'Error al cargar el formulario de pago: {str(e)}', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
@@ -444,9 +708,10 @@ class CarritoController:
             Response: JSON con el resultado del pago
         """
         from flask import jsonify
-        from patterns.singleton import PaymentGateway
-        from models.pago import Pago, MetodoPago, EstadoPago
+        from models.pago import Pago, MetodoPago, EstadoPago, EstadoTrabajo
         from models.contratacion import Contratacion, EstadoContratacion
+        from tareas.ejecutor import ejecutor_tareas
+        from tareas.pagos import nuevo_id_trabajo, encolar, procesar_pago_carrito
         
         # 1. Verificar autenticación
         if not CarritoController._usuario_autenticado():
@@ -456,13 +721,20 @@ class CarritoController:
         if session['user_rol'] != 'organizador':
             return jsonify({'success': False, 'message': 'Solo organizadores pueden procesar pagos'}), 403
         
+        # 3. Sin cupo para más pagos en este worker: pedir que reintente en lugar de bloquearlo
+        if not ejecutor_tareas.hay_capacidad():
+            respuesta = jsonify({'success': False, 'message': 'Hay demasiados pagos en proceso, intenta de nuevo en unos segundos'})
+            respuesta.headers['Retry-After'] = '5'
+            return respuesta, 503
+        
+        registro = None
         try:
-            # 3. Obtener datos del request
+            # 4. Obtener datos del request
             data = request.get_json()
             if not data:
                 return jsonify({'success': False, 'message': 'Datos de pago requeridos'}), 400
             
-            # 4. Obtener el item del carrito
+            # 5. Obtener el item del carrito
             item = CarritoItem.query.filter_by(
                 id=item_id,
                 organizador_id=session['user_id']
@@ -471,11 +743,24 @@ class CarritoController:
             if not item:
                 return jsonify({'success': False, 'message': 'Item del carrito no encontrado'}), 404
             
-            # 5. Verificar que el item esté en estado pendiente
-            if not item.esta_pendiente():
+            # 6. Un doble envío (mismo token o Idempotency-Key) recibe el mismo trabajo
+            registro, nuevo = CarritoController._reclamar_clave_item(item, 'pago_item', data.get('token'))
+            if not nuevo:
+                if registro.completado:
+                    return CarritoController._respuesta_trabajo_encolado(registro.respuesta)
+                respuesta = jsonify({'success': False, 'message': 'Este pago ya se está procesando'})
+                respuesta.headers['Retry-After'] = '1'
+                return respuesta, 409
+            
+            # 7. Reservar el item (pendiente -> procesando) antes de llamar a la pasarela;
+            #    si otra pestaña lo reservó primero, este checkout no continúa
+            reservados = CarritoController._reservar_items_pendientes(session['user_id'], [item_id])
+            if not reservados:
+                CarritoController._liberar_clave(registro)
                 return jsonify({'success': False, 'message': 'Este item ya fue procesado'}), 400
+            item = reservados[0]
             
-            # 6. Crear contratación
+            # 8. Crear contratación
             contratacion = Contratacion(
                 servicio_id=item.servicio_id,
                 evento_id=item.evento_id,
@@ -488,12 +773,13 @@ class CarritoController:
                 notas_especiales=item.notas_especiales,
                 precio_total=item.precio_total,
                 deposito_requerido=0,
-                estado=EstadoContratacion.solicitada
+                estado=EstadoContratacion.solicitada,
+                origen='carrito'
             )
             db.session.add(contratacion)
             db.session.flush()
             
-            # 7. Crear registro de pago
+            # 9. Crear registro de pago
             pago = Pago(
                 contratacion_id=contratacion.id,
                 organizador_id=item.organizador_id,
@@ -514,63 +800,78 @@ class CarritoController:
                 }
             )
             db.session.add(pago)
+            # external_reference del checkout: asocia las notificaciones de MercadoPago
+            pago.referencia_pago = nueva_referencia_pago()
+            item.referencia_pago = pago.referencia_pago
             db.session.flush()
             
-            # 8. Procesar pago con MercadoPago
-            payment_gateway = PaymentGateway()
-            resultado_mp = payment_gateway.procesar_pago_checkout_api(
-                monto=item.precio_total,
-                descripcion=f"Servicio: {item.servicio.nombre} - Evento: {item.evento.titulo}",
-                token=data.get('token'),
-                payment_method_id=data.get('payment_method_id'),
-                installments=data.get('installments', 1),
-                issuer_id=data.get('issuer_id'),
-                payer=data.get('payer', {})
-            )
+            # 10. Guardar el pago como pendiente y enviarlo a MercadoPago en segundo plano
+            pago.id_trabajo = nuevo_id_trabajo()
+            pago.estado_trabajo = EstadoTrabajo.en_cola.value
+            resultado = CarritoController._datos_trabajo_encolado(pago)
+            registro.completar(resultado, pago_id=pago.id, contratacion_id=contratacion.id,
+                               referencia_externa=pago.referencia_pago)
+            db.session.commit()
             
-            if resultado_mp.get('success'):
-                # 9. Actualizar estado del pago
-                payment_status = resultado_mp.get('estado', 'pending')
-                if payment_status == 'approved':
-                    pago.estado = EstadoPago.aprobado
-                    item.estado = EstadoCarritoItem.procesando
-                    message = '¡Pago procesado exitosamente!'
-                elif payment_status == 'rejected':
-                    pago.estado = EstadoPago.rechazado
-                    message = 'El pago fue rechazado'
-                else:
-                    pago.estado = EstadoPago.pendiente
-                    message = 'Pago pendiente de confirmación'
-                
-                # Guardar datos adicionales
-                pago.datos_adicionales['mercadopago_id'] = resultado_mp.get('payment_id')
-                pago.datos_adicionales['mercadopago_response'] = resultado_mp.get('response', {})
-                db.session.commit()
-                
-                return jsonify({
-                    'success': True,
-                    'message': message,
-                    'payment_id': resultado_mp.get('payment_id'),
-                    'estado': payment_status
-                })
-            else:
-                # Error en el pago
-                pago.estado = EstadoPago.rechazado
-                pago.datos_adicionales['error'] = resultado_mp.get('message', 'Error desconocido')
-                db.session.commit()
-                
-                return jsonify({
-                    'success': False,
-                    'message': resultado_mp.get('message', 'Error al procesar el pago')
-                }), 400
+            datos_tarjeta = {
+                'token': data.get('token'),
+                'payment_method_id': data.get('payment_method_id'),
+                'installments': data.get('installments', 1),
+                'issuer_id': data.get('issuer_id'),
+                'payer': data.get('payer', {})
+            }
+            if not encolar(pago, procesar_pago_carrito, item.id, datos_tarjeta, registro.clave):
+                CarritoController._liberar_items(session['user_id'], [item_id])
+                CarritoController._liberar_clave(registro)
+                respuesta = jsonify({'success': False, 'message': pago.mensaje_trabajo})
+                respuesta.headers['Retry-After'] = '5'
+                return respuesta, 503
+            
+            return CarritoController._respuesta_trabajo_encolado(resultado)
             
         except Exception as e:
-            print(f"❌ Error en procesar_pago_api: {e}")
+            db.session.rollback()
+            logger.exception("Error en procesar_pago_api")
+            CarritoController._liberar_items(session['user_id'], [item_id])
+            CarritoController._liberar_clave(registro)
             return jsonify({
                 'success': False,
                 'message': f'Error interno: {str(e)}'
             }), 500
     
+    @staticmethod
+    def _datos_trabajo_encolado(pago):
+        """Cuerpo de la respuesta para un pago enviado a segundo plano"""
+        return {
+            'success': True,
+            'pendiente': True,
+            'message': 'Pago en proceso',
+            'pago_id': pago.id,
+            'id_trabajo': pago.id_trabajo,
+            'url_estado': url_for('pagos.estado_trabajo', id_trabajo=pago.id_trabajo),
+            'reintentar_en': 1
+        }
+    
+    @staticmethod
+    def _respuesta_trabajo_encolado(datos):
+        """
+        Respuesta 202 para un pago enviado a segundo plano, con la URL donde
+        consultar su estado y la espera sugerida antes del primer sondeo.
+        
+        Args:
+            datos (dict): Cuerpo generado por _datos_trabajo_encolado (o guardado
+                          en la clave de idempotencia, para un doble envío)
+            
+        Returns:
+            tuple: (Response, 202)
+        """
+        from flask import jsonify
+        
+        respuesta = jsonify(datos)
+        respuesta.headers['Retry-After'] = str(datos.get('reintentar_en', 1))
+        respuesta.headers['Location'] = datos['url_estado']
+        return respuesta, 202
+    
     @staticmethod
     def mercadopago_public_key():
         """
@@ -668,11 +969,18 @@ class CarritoController:
             # 6. Crear preferencia de pago con MercadoPago
             from patterns.singleton import PaymentGateway
             
-            # Cambiar todos los items a procesando
-            for item in items_pendientes:
-                item.procesar()
+            # Reservar los items (pendiente -> procesando); si otra pestaña ya
+            # reservó alguno, solo se cobran los que siguen disponibles
+            referencia = nueva_referencia_pago()
+            items_pendientes = CarritoController._reservar_items_pendientes(
+                user_id, [item.id for item in items_pendientes], referencia
+            )
             
-            db.session.commit()
+            if not items_pendientes:
+                flash('Los items de tu carrito ya están siendo procesados en otro pago', 'warning')
+                return redirect(url_for('carrito.ver_carrito'))
+            
+            total = sum(item.precio_total for item in items_pendientes)
             
             # Crear preferencia de pago para todo el carrito
             payment_gateway = PaymentGateway()
@@ -682,6 +990,7 @@ class CarritoController:
                 monto=total,
                 descripcion=descripcion,
                 email_pagador=email_pagador,
+                referencia_externa=referencia,
                 datos_tarjeta={
                     'numero_tarjeta': numero_tarjeta,
                     'cvv': cvv,
@@ -701,7 +1010,8 @@ class CarritoController:
                     'email_pagador': email_pagador,
                     'telefono_pagador': telefono_pagador,
                     'documento_pagador': documento_pagador,
-                    'mercadopago_id': resultado_mp.get('payment_id'),
+                    'preference_id': resultado_mp.get('id_preferencia'),
+                    'referencia': referencia,
                     'total': float(total)
                 }
                 
@@ -709,11 +1019,9 @@ class CarritoController:
                 return redirect(resultado_mp.get('url_pago'))
             else:
                 # Si falla, volver items a pendiente
-                for item in items_pendientes:
-                    item.estado = EstadoCarritoItem.pendiente
-                    item.fecha_actualizacion = datetime.utcnow()
-                
-                db.session.commit()
+                items_pendientes = CarritoController._liberar_items(
+                    user_id, [item.id for item in items_pendientes]
+                )
                 
                 error_msg = resultado_mp.get('message', 'Error desconocido en el pago')
                 flash(f'Error al procesar el pago: {error_msg}', 'error')
@@ -723,7 +1031,7 @@ class CarritoController:
             
         except Exception as e:
             db.session.rollback()
-            print(f"❌ Error en procesar_pago: {e}")
+            logger.exception("Error en procesar_pago")
             flash(f'Error al procesar el pago: {str(e)}', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
@@ -767,7 +1075,7 @@ class CarritoController:
             
         except Exception as e:
             db.session.rollback()
-            print(f"❌ Error en limpiar_carrito: {e}")
+            logger.exception("Error en limpiar_carrito")
             flash(f'Error al limpiar el carrito: {str(e)}', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
@@ -794,15 +1102,18 @@ class CarritoController:
                 flash('No hay items pendientes de pago en tu carrito', 'warning')
                 return redirect(url_for('carrito.ver_carrito'))
             
-            # Calcular total
-            total = sum(item.precio_total for item in items_pendientes)
+            # Cambiar estado a procesando (solo los que ninguna otra pestaña reservó)
+            referencia = nueva_referencia_pago()
+            items_pendientes = CarritoController._reservar_items_pendientes(
+                user_id, [item.id for item in items_pendientes], referencia
+            )
             
-            # Cambiar estado a procesando
-            for item in items_pendientes:
-                item.estado = EstadoCarritoItem.procesando
-                item.fecha_actualizacion = datetime.utcnow()
+            if not items_pendientes:
+                flash('Los items de tu carrito ya están siendo procesados en otro pago', 'warning')
+                return redirect(url_for('carrito.ver_carrito'))
             
-            db.session.commit()
+            # Calcular total
+            total = sum(item.precio_total for item in items_pendientes)
             
             # Crear preferencia de MercadoPago
             from patterns.singleton import PaymentGateway
@@ -814,7 +1125,8 @@ class CarritoController:
             resultado_mp = payment_gateway.procesar_pago_mercadopago(
                 monto=total,
                 descripcion=descripcion,
-                email_pagador=email_pagador
+                email_pagador=email_pagador,
+                referencia_externa=referencia
             )
             
             if resultado_mp.get('success'):
@@ -822,17 +1134,17 @@ class CarritoController:
                 session['pago_pendiente'] = {
                     'items_ids': [item.id for item in items_pendientes],
                     'total': float(total),
-                    'mercadopago_id': resultado_mp.get('payment_id')
+                    'preference_id': resultado_mp.get('id_preferencia'),
+                    'referencia': referencia
                 }
                 
                 # Redirigir directamente a MercadoPago
                 return redirect(resultado_mp.get('url_pago'))
             else:
                 # Revertir estado si falla
-                for item in items_pendientes:
-                    item.estado = EstadoCarritoItem.pendiente
-                    item.fecha_actualizacion = datetime.utcnow()
-                db.session.commit()
+                CarritoController._liberar_items(
+                    user_id, [item.id for item in items_pendientes]
+                )
                 
                 error_msg = resultado_mp.get('message', 'Error desconocido')
                 flash(f'Error al crear el pago: {error_msg}', 'error')
@@ -840,10 +1152,99 @@ class CarritoController:
                 
         except Exception as e:
             db.session.rollback()
-            print(f"❌ Error en pagar_directo_mercadopago: {e}")
+            logger.exception("Error en pagar_directo_mercadopago")
             flash(f'Error al procesar el pago: {str(e)}', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
+    @staticmethod
+    def _confirmar_items_pagados(items, pago_data):
+        """
+        Crea la contratación (confirmada) y el pago (aprobado) de cada item pagado
+        y marca el item como completado. No hace commit.
+        
+        Lo usan la redirección de éxito de MercadoPago y el procesamiento de webhooks;
+        quien llame debe filtrar solo los items que siguen en 'procesando'.
+        
+        Args:
+            items (list): Items del carrito pagados
+            pago_data (dict): Datos del pagador, mercadopago_id y preference_id
+            
+        Returns:
+            list: Tuplas (item, contratacion, pago) creadas
+        """
+        from models.contratacion import Contratacion, EstadoContratacion
+        from models.pago import Pago, MetodoPago, EstadoPago
+        
+        creados = []
+        for item in items:
+            # Crear contratación
+            contratacion = Contratacion(
+                servicio_id=item.servicio_id,
+                evento_id=item.evento_id,
+                organizador_id=item.organizador_id,
+                proveedor_id=item.servicio.proveedor_id,
+                fecha_evento=item.fecha_evento,
+                duracion_horas=item.duracion_horas,
+                numero_personas=item.numero_personas,
+                ubicacion=item.ubicacion,
+                notas_especiales=item.notas_especiales,
+                precio_total=item.precio_total,
+                deposito_requerido=0,
+                estado=EstadoContratacion.confirmada
+            )
+            
+            db.session.add(contratacion)
+            db.session.flush()
+            
+            # Crear pago
+            pago = Pago(
+                contratacion_id=contratacion.id,
+                organizador_id=item.organizador_id,
+                monto=item.precio_total,
+                metodo_pago=MetodoPago.mercadopago,
+                estado=EstadoPago.aprobado,
+                nombre_titular=pago_data.get('nombre_titular'),
+                email_pagador=pago_data.get('email_pagador'),
+                telefono_pagador=pago_data.get('telefono_pagador'),
+                documento_pagador=pago_data.get('documento_pagador'),
+                id_transaccion=pago_data.get('id_transaccion'),
+                mercadopago_id=pago_data.get('mercadopago_id'),
+                preference_id=pago_data.get('preference_id'),
+                fecha_aprobacion=datetime.utcnow(),
+                datos_adicionales={
+                    'item_carrito_id': item.id,
+                    'servicio_id': item.servicio_id,
+                    'evento_id': item.evento_id
+                },
+                referencia_pago=item.referencia_pago
+            )
+            
+            db.session.add(pago)
+            db.session.flush()
+            
+            # Marcar item como completado (UPDATE condicionado a la versión leída)
+            item.completar()
+            creados.append((item, contratacion, pago))
+        
+        return creados
+    
+    @staticmethod
+    def _notificar_contrataciones(creados):
+        """Notifica a cada proveedor la contratación creada por un pago confirmado"""
+        from controllers.notificacion_controller import NotificacionController
+        from models.notificacion import TipoNotificacion
+        
+        for item, contratacion, pago in creados:
+            NotificacionController.crear_notificacion(
+                usuario_id=item.servicio.proveedor_id,
+                titulo="Nueva Contratación Recibida",
+                mensaje=f"Has recibido una nueva contratación para el servicio '{item.servicio.nombre}' del evento '{item.evento.titulo}' por ${item.precio_total:,.0f}",
+                tipo=TipoNotificacion.nueva_contratacion,
+                servicio_id=item.servicio_id,
+                contratacion_id=contratacion.id,
+                pago_id=pago.id
+            )
+    
     @staticmethod
     def pago_exitoso():
         """Maneja la respuesta exitosa de MercadoPago"""
@@ -854,87 +1255,30 @@ class CarritoController:
                 flash('No hay datos de pago pendiente', 'error')
                 return redirect(url_for('carrito.ver_carrito'))
             
-            # Obtener items del carrito
-            items = CarritoItem.query.filter(
-                CarritoItem.id.in_(pago_data['items_ids']),
-                CarritoItem.organizador_id == session['user_id']
-            ).all()
-            
-            if not items:
-                flash('Items del carrito no encontrados', 'error')
-                return redirect(url_for('carrito.ver_carrito'))
+            def operacion():
+                # Solo los items que siguen reservados para este pago; si otra
+                # petición (o el webhook) ya los completó no se duplican contrataciones ni pagos
+                items = CarritoItem.query.filter(
+                    CarritoItem.id.in_(pago_data['items_ids']),
+                    CarritoItem.organizador_id == session['user_id'],
+                    CarritoItem.estado == EstadoCarritoItem.procesando
+                ).all()
+                
+                creados = CarritoController._confirmar_items_pagados(items, pago_data)
+                db.session.commit()
+                return creados
             
-            # Crear contrataciones y pagos
-            from models.contratacion import Contratacion, EstadoContratacion
-            from models.pago import Pago, MetodoPago, EstadoPago
+            creados = reintentar_si_conflicto(operacion)
             
-            contrataciones_creadas = 0
+            if not creados:
+                session.pop('pago_pendiente', None)
+                flash('Este pago ya fue procesado', 'info')
+                return redirect(url_for('carrito.ver_carrito'))
             
-            for item in items:
-                try:
-                    # Crear contratación
-                    contratacion = Contratacion(
-                        servicio_id=item.servicio_id,
-                        evento_id=item.evento_id,
-                        organizador_id=item.organizador_id,
-                        proveedor_id=item.servicio.proveedor_id,
-                        fecha_evento=item.fecha_evento,
-                        duracion_horas=item.duracion_horas,
-                        numero_personas=item.numero_personas,
-                        ubicacion=item.ubicacion,
-                        notas_especiales=item.notas_especiales,
-                        precio_total=item.precio_total,
-                        deposito_requerido=0,
-                        estado=EstadoContratacion.confirmada
-                    )
-                    
-                    db.session.add(contratacion)
-                    db.session.flush()
-                    
-                    # Crear pago
-                    pago = Pago(
-                        contratacion_id=contratacion.id,
-                        organizador_id=item.organizador_id,
-                        monto=item.precio_total,
-                        metodo_pago=MetodoPago.mercadopago,
-                        estado=EstadoPago.completado,
-                        nombre_titular=pago_data['nombre_titular'],
-                        email_pagador=pago_data['email_pagador'],
-                        telefono_pagador=pago_data['telefono_pagador'],
-                        documento_pagador=pago_data['documento_pagador'],
-                        datos_adicionales={
-                            'item_carrito_id': item.id,
-                            'mercadopago_id': pago_data['mercadopago_id'],
-                            'servicio_id': item.servicio_id,
-                            'evento_id': item.evento_id
-                        }
-                    )
-                    
-                    db.session.add(pago)
-                    
-                    # Marcar item como completado
-                    item.completar()
-                    contrataciones_creadas += 1
-                    
-                    # Crear notificación para el proveedor
-                    from controllers.notificacion_controller import NotificacionController
-                    from models.notificacion import TipoNotificacion
-                    
-                    NotificacionController.crear_notificacion(
-                        usuario_id=item.servicio.proveedor_id,
-                        titulo="Nueva Contratación Recibida",
-                        mensaje=f"Has recibido una nueva contratación para el servicio '{item.servicio.nombre}' del evento '{item.evento.nombre}' por ${item.precio_total:,.0f}",
-                        tipo=TipoNotificacion.nueva_contratacion,
-                        servicio_id=item.servicio_id,
-                        contratacion_id=contratacion.id,
-                        pago_id=pago.id
-                    )
-                    
-                except Exception as e:
-                    print(f"❌ Error creando contratación para item {item.id}: {e}")
-                    continue
+            contrataciones_creadas = len(creados)
             
-            db.session.commit()
+            # Crear notificaciones para los proveedores una vez confirmado todo
+            CarritoController._notificar_contrataciones(creados)
             
             # Limpiar datos de sesión
             session.pop('pago_pendiente', None)
@@ -944,7 +1288,7 @@ class CarritoController:
             
         except Exception as e:
             db.session.rollback()
-            print(f"❌ Error en pago_exitoso: {e}")
+            logger.exception("Error en pago_exitoso")
             flash(f'Error al procesar el pago exitoso: {str(e)}', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
@@ -955,17 +1299,8 @@ class CarritoController:
             # Obtener datos del pago pendiente de la sesión
             pago_data = session.get('pago_pendiente')
             if pago_data:
-                # Obtener items del carrito y volverlos a pendiente
-                items = CarritoItem.query.filter(
-                    CarritoItem.id.in_(pago_data['items_ids']),
-                    CarritoItem.organizador_id == session['user_id']
-                ).all()
-                
-                for item in items:
-                    item.estado = EstadoCarritoItem.pendiente
-                    item.fecha_actualizacion = datetime.utcnow()
-                
-                db.session.commit()
+                # Volver a pendiente los items que siguen reservados para este pago
+                CarritoController._liberar_items(session['user_id'], pago_data['items_ids'])
                 
                 # Limpiar datos de sesión
                 session.pop('pago_pendiente', None)
@@ -974,7 +1309,7 @@ class CarritoController:
             return redirect(url_for('carrito.ver_carrito'))
             
         except Exception as e:
-            print(f"❌ Error en pago_fallido: {e}")
+            logger.exception("Error en pago_fallido")
             flash('Error al procesar la respuesta de pago fallido', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
@@ -993,7 +1328,7 @@ class CarritoController:
             return redirect(url_for('carrito.ver_carrito'))
             
         except Exception as e:
-            print(f"❌ Error en pago_pendiente: {e}")
+            logger.exception("Error en pago_pendiente")
             flash('Error al procesar la respuesta de pago pendiente', 'error')
             return redirect(url_for('carrito.ver_carrito'))
     
@@ -1048,8 +1383,10 @@ class CarritoController:
                 tipo_item='servicio'
             )
             
-            db.session.add(nuevo_item)
-            db.session.flush()  # Para que se cargue la relación con servicio
+            # el INSERT hace que se cargue la relación con servicio
+            if not CarritoItem.agregar_pendiente(nuevo_item):
+                flash('Este servicio ya está en tu carrito para este evento', 'warning')
+                return redirect(url_for('carrito.ver_carrito'))
             
             # Calcular precios después de que la relación esté disponible
             nuevo_item.calcular_precios()
@@ -1077,6 +1414,7 @@ class CarritoController:
             flash('Solo los organizadores pueden procesar pagos', 'error')
             return redirect(url_for('index'))
         
+        registro = None
         try:
             # Obtener el item del carrito
             item = CarritoItem.query.filter_by(
@@ -1095,6 +1433,11 @@ class CarritoController:
                 return redirect(url_for('carrito.ver_carrito'))
             
             if request.method == 'GET':
+                # Un clic repetido reutiliza la preferencia ya creada para el item
+                registro, nuevo = CarritoController._reclamar_preferencia_item(item)
+                if not nuevo:
+                    return CarritoController._repetir_preferencia(registro)
+                
                 # Redirigir directamente a MercadoPago sin formulario
                 from patterns.singleton import PaymentGateway
                 from models.pago import Pago, MetodoPago, EstadoPago
@@ -1113,7 +1456,8 @@ class CarritoController:
                     notas_especiales=item.notas_especiales,
                     precio_total=item.precio_total,
                     deposito_requerido=0,
-                    estado=EstadoContratacion.solicitada
+                    estado=EstadoContratacion.solicitada,
+                    origen='carrito'
                 )
                 db.session.add(contratacion)
                 db.session.flush()
@@ -1136,6 +1480,9 @@ class CarritoController:
                     }
                 )
                 db.session.add(pago)
+                # external_reference del checkout: asocia las notificaciones de MercadoPago
+                pago.referencia_pago = nueva_referencia_pago()
+                item.referencia_pago = pago.referencia_pago
                 db.session.flush()
                 
                 # Procesar con MercadoPago
@@ -1143,18 +1490,25 @@ class CarritoController:
                 resultado_mp = payment_gateway.procesar_pago_mercadopago(
                     monto=item.precio_total,
                     descripcion=f"Servicio: {item.servicio.nombre} - Evento: {item.evento.titulo}",
-                    email_pagador=session.get('user_email', 'usuario@eventlink.com')
+                    email_pagador=session.get('user_email', 'usuario@eventlink.com'),
+                    referencia_externa=pago.referencia_pago
                 )
                 
                 if resultado_mp.get('success'):
                     # Guardar datos y redirigir
-                    pago.datos_adicionales['mercadopago_id'] = resultado_mp.get('payment_id')
+                    pago.preference_id = resultado_mp.get('id_preferencia')
                     pago.datos_adicionales['url_pago'] = resultado_mp.get('url_pago')
+                    registro.completar(
+                        {'url_pago': resultado_mp.get('url_pago'), 'preference_id': resultado_mp.get('id_preferencia')},
+                        pago_id=pago.id, contratacion_id=contratacion.id, referencia_externa=pago.referencia_pago
+                    )
                     db.session.commit()
                     
                     # Redirigir directamente a MercadoPago
                     return redirect(resultado_mp.get('url_pago'))
                 else:
+                    db.session.rollback()
+                    CarritoController._liberar_clave(registro)
                     flash(f'Error al crear el pago: {resultado_mp.get("message", "Error desconocido")}', 'error')
                     return redirect(url_for('carrito.ver_carrito'))
             
@@ -1180,7 +1534,12 @@ class CarritoController:
                                        item=item, 
                                        total=item.precio_total)
             
-            print(f"DEBUG: Iniciando pago de item {item.id} - Servicio: {item.servicio.nombre}")
+            # Un doble envío del formulario reutiliza la preferencia ya creada
+            registro, nuevo = CarritoController._reclamar_preferencia_item(item)
+            if not nuevo:
+                return CarritoController._repetir_preferencia(registro)
+            
+            logger.debug("Iniciando pago de item", extra={'datos': {'item_id': item.id, 'servicio_id': item.servicio_id}})
             
             from patterns.singleton import PaymentGateway
             from models.pago import Pago, MetodoPago, EstadoPago
@@ -1199,11 +1558,12 @@ class CarritoController:
                 notas_especiales=item.notas_especiales,
                 precio_total=item.precio_total,
                 deposito_requerido=0,
-                estado=EstadoContratacion.solicitada
+                estado=EstadoContratacion.solicitada,
+                origen='carrito'
             )
             db.session.add(contratacion)
             db.session.flush()
-            print(f"DEBUG: Contratación creada con ID {contratacion.id}")
+            logger.debug("Contratación creada", extra={'datos': {'contratacion_id': contratacion.id, 'item_id': item.id}})
             
             # Crear registro de pago
             pago = Pago(
@@ -1223,22 +1583,30 @@ class CarritoController:
                 }
             )
             db.session.add(pago)
+            # external_reference del checkout: asocia las notificaciones de MercadoPago
+            pago.referencia_pago = nueva_referencia_pago()
+            item.referencia_pago = pago.referencia_pago
             db.session.flush()
-            print(f"DEBUG: Pago creado con ID {pago.id}")
+            logger.debug("Pago creado", extra={'datos': {'pago_id': pago.id, 'item_id': item.id}})
             
             # Procesar con MercadoPago
             payment_gateway = PaymentGateway()
             resultado_mp = payment_gateway.procesar_pago_mercadopago(
                 monto=item.precio_total,
                 descripcion=f"Servicio: {item.servicio.nombre} - Evento: {item.evento.titulo}",
-                email_pagador=email_pagador
+                email_pagador=email_pagador,
+                referencia_externa=pago.referencia_pago
             )
             
             if resultado_mp.get('success'):
                 # NO marcar como aprobado aún - solo guardar la preferencia
                 pago.estado = EstadoPago.pendiente
-                pago.datos_adicionales['mercadopago_id'] = resultado_mp.get('payment_id')
+                pago.preference_id = resultado_mp.get('id_preferencia')
                 pago.datos_adicionales['url_pago'] = resultado_mp.get('url_pago')
+                registro.completar(
+                    {'url_pago': resultado_mp.get('url_pago'), 'preference_id': resultado_mp.get('id_preferencia')},
+                    pago_id=pago.id, contratacion_id=contratacion.id, referencia_externa=pago.referencia_pago
+                )
                 db.session.commit()
                 
                 # Redirigir directamente a MercadoPago
@@ -1246,6 +1614,7 @@ class CarritoController:
             else:
                 pago.estado = EstadoPago.rechazado
                 pago.datos_adicionales['error'] = resultado_mp.get('message', 'Error desconocido')
+                registro.liberar()
                 db.session.commit()
                 flash(f'Error al procesar el pago: {resultado_mp.get("message", "Error desconocido")}', 'error')
                 return render_template('carrito/pago_mercadopago.html', 
@@ -1254,8 +1623,8 @@ class CarritoController:
         
         except Exception as e:
             db.session.rollback()
-            import traceback
-            print(f"ERROR procesar_pago_mercadopago: {e}\n{traceback.format_exc()}")
+            logger.exception("Error en procesar_pago_mercadopago")
+            CarritoController._liberar_clave(registro)
             flash(f'Error al procesar el pago: {str(e)}', 'error')
             return render_template('carrito/pago_mercadopago.html', 
                                    item=item if 'item' in locals() else None, 
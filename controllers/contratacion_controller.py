@@ -9,12 +9,15 @@ from models.contratacion import Contratacion, EstadoContratacion, MetodoPago
 from models.usuario import Usuario, RolUsuario
 from models.servicio import Servicio
 from models.evento import Evento
-from database import db
+from database import db, reintentar_si_conflicto
 from datetime import datetime
 from patterns.observer import sistema_notificaciones
 from patterns.factory import NotificacionFactory
 from patterns.singleton import payment_gateway
 
+# estados desde los que una contratación se puede cancelar
+ESTADOS_CANCELABLES = (EstadoContratacion.solicitada, EstadoContratacion.confirmada, EstadoContratacion.en_progreso)
+
 class ContratacionController:
     
     @staticmethod
@@ -95,9 +98,16 @@ class ContratacionController:
         notas_adicionales = request.form.get('notas_adicionales', '').strip()
         
         try:
-            # Aceptar contratación
-            contratacion.aceptar(notas_adicionales)
-            db.session.commit()
+            # Aceptar contratación (falla si otra petición ya la procesó)
+            contratacion = ContratacionController._aplicar_transicion(
+                contratacion_id,
+                [EstadoContratacion.solicitada],
+                lambda c: c.aceptar(notas_adicionales)
+            )
+            if not contratacion:
+                flash('Esta contratación ya fue procesada por otra solicitud', 'warning')
+                return redirect(url_for('contratacion.detalle_contratacion', 
+                                     contratacion_id=contratacion_id))
             
             # Crear notificación para el organizador
             notificacion = NotificacionFactory.crear_notificacion_aceptacion(
@@ -151,9 +161,16 @@ class ContratacionController:
                                  contratacion=contratacion)
         
         try:
-            # Rechazar contratación
-            contratacion.rechazar(motivo)
-            db.session.commit()
+            # Rechazar contratación (falla si otra petición ya la procesó)
+            contratacion = ContratacionController._aplicar_transicion(
+                contratacion_id,
+                [EstadoContratacion.solicitada],
+                lambda c: c.rechazar(motivo)
+            )
+            if not contratacion:
+                flash('Esta contratación ya fue procesada por otra solicitud', 'warning')
+                return redirect(url_for('contratacion.detalle_contratacion', 
+                                     contratacion_id=contratacion_id))
             
             # Crear notificación para el organizador
             notificacion = NotificacionFactory.crear_notificacion_rechazo(
@@ -197,9 +214,16 @@ class ContratacionController:
                                  contratacion_id=contratacion_id))
         
         try:
-            # Confirmar contratación
-            contratacion.confirmar()
-            db.session.commit()
+            # Confirmar contratación (falla si otra petición ya la procesó)
+            contratacion = ContratacionController._aplicar_transicion(
+                contratacion_id,
+                [EstadoContratacion.aceptada],
+                lambda c: c.confirmar()
+            )
+            if not contratacion:
+                flash('Esta contratación ya fue procesada por otra solicitud', 'warning')
+                return redirect(url_for('contratacion.detalle_contratacion', 
+                                     contratacion_id=contratacion_id))
             
             flash('Contratación confirmada exitosamente', 'success')
             return redirect(url_for('contratacion.detalle_contratacion', 
@@ -235,9 +259,16 @@ class ContratacionController:
                                  contratacion_id=contratacion_id))
         
         try:
-            # Iniciar servicio
-            contratacion.iniciar_servicio()
-            db.session.commit()
+            # Iniciar servicio (falla si otra petición ya lo procesó)
+            contratacion = ContratacionController._aplicar_transicion(
+                contratacion_id,
+                [EstadoContratacion.confirmada],
+                lambda c: c.iniciar_servicio()
+            )
+            if not contratacion:
+                flash('Esta contratación ya fue procesada por otra solicitud', 'warning')
+                return redirect(url_for('contratacion.detalle_contratacion', 
+                                     contratacion_id=contratacion_id))
             
             flash('Servicio iniciado exitosamente', 'success')
             return redirect(url_for('contratacion.detalle_contratacion', 
@@ -273,9 +304,16 @@ class ContratacionController:
                                  contratacion_id=contratacion_id))
         
         try:
-            # Completar servicio
-            contratacion.completar()
-            db.session.commit()
+            # Completar servicio (falla si otra petición ya lo procesó)
+            contratacion = ContratacionController._aplicar_transicion(
+                contratacion_id,
+                [EstadoContratacion.en_progreso],
+                lambda c: c.completar()
+            )
+            if not contratacion:
+                flash('Esta contratación ya fue procesada por otra solicitud', 'warning')
+                return redirect(url_for('contratacion.detalle_contratacion', 
+                                     contratacion_id=contratacion_id))
             
             flash('Servicio completado exitosamente', 'success')
             return redirect(url_for('contratacion.detalle_contratacion', 
@@ -301,6 +339,9 @@ class ContratacionController:
             return redirect(url_for('contratacion.detalle_contratacion', 
                                  contratacion_id=contratacion_id))
         
+        if contratacion.estado not in ESTADOS_CANCELABLES:
+            return ContratacionController._no_cancelable(contratacion)
+        
         if request.method == 'GET':
             return render_template('contrataciones/cancelar_contratacion.html', 
                                  contratacion=contratacion)
@@ -313,9 +354,15 @@ class ContratacionController:
                                  contratacion=contratacion)
         
         try:
-            # Cancelar contratación
-            contratacion.cancelar(motivo)
-            db.session.commit()
+            # Cancelar contratación (se reintenta si otra petición la modificó, y
+            # falla si mientras tanto se completó o ya se canceló)
+            cancelada = ContratacionController._aplicar_transicion(
+                contratacion_id,
+                ESTADOS_CANCELABLES,
+                lambda c: c.cancelar(motivo)
+            )
+            if not cancelada:
+                return ContratacionController._no_cancelable(Contratacion.query.get(contratacion_id))
             
             flash('Contratación cancelada exitosamente', 'success')
             return redirect(url_for('contratacion.detalle_contratacion', 
@@ -421,6 +468,35 @@ class ContratacionController:
         flash('Debes iniciar sesión para acceder a esta página', 'error')
         return redirect(url_for('usuario.login'))
     
+    @staticmethod
+    def _aplicar_transicion(contratacion_id, estados_validos, transicion):
+        """
+        Aplica una transición de estado con control de concurrencia optimista.
+        
+        Si otra petición modificó la contratación entre la lectura y la escritura,
+        se recarga, se valida de nuevo el estado y se reintenta.
+        
+        Returns:
+            Contratacion: La contratación actualizada, o None si su estado actual
+            ya no permite la transición
+        """
+        def operacion():
+            contratacion = Contratacion.query.get(contratacion_id)
+            if estados_validos and contratacion.estado not in estados_validos:
+                return None
+            
+            transicion(contratacion)
+            db.session.commit()
+            return contratacion
+        
+        return reintentar_si_conflicto(operacion)
+    
+    @staticmethod
+    def _no_cancelable(contratacion):
+        """Respuesta 400 para una contratación que ya no se puede cancelar"""
+        flash(f'Una contratación en estado {contratacion.estado.value} no se puede cancelar', 'error')
+        return ContratacionController.detalle_contratacion(contratacion.id), 400
+    
     @staticmethod
     def _tiene_acceso_contratacion(contratacion):
         """Verifica si el usuario tiene acceso a la contratación"""
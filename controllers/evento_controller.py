@@ -4,6 +4,8 @@ Controlador para gestión de eventos
 Principio SOLID: Single Responsibility - Responsabilidad única para eventos
 """
 
+import logging
+
 from flask import request, session, flash, redirect, url_for, render_template, jsonify
 from models.evento import Evento, EstadoEvento, TipoEvento
 from models.usuario import Usuario, RolUsuario
@@ -17,6 +19,8 @@ import os
 import json
 from werkzeug.utils import secure_filename
 
+logger = logging.getLogger(__name__)
+
 class EventoController:
     
     # Configuración para subida de archivos
@@ -52,7 +56,7 @@ class EventoController:
                 # Retornar ruta relativa para la base de datos
                 return f"uploads/eventos/{folder_name}/{unique_filename}"
             except Exception as e:
-                print(f"Error al guardar imagen: {str(e)}")
+                logger.exception("Error al guardar imagen")
                 return None
         return None
     
@@ -167,7 +171,7 @@ class EventoController:
             return render_template('eventos/crear_evento.html', tipos_evento=TipoEvento, datos=datos)
         except Exception as e:
             db.session.rollback()
-            print(f"Error al crear evento: {str(e)}")  # Para debugging
+            logger.exception("Error al crear evento")
             flash('Error al crear el evento. Verifica que todos los campos estén correctos.', 'error')
             return render_template('eventos/crear_evento.html', tipos_evento=TipoEvento, datos=datos)
     
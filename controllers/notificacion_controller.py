@@ -4,12 +4,16 @@ Controlador para gestión de notificaciones
 Principio SOLID: Single Responsibility - Responsabilidad única para notificaciones
 """
 
+import logging
+
 from flask import render_template, redirect, url_for, flash, request, session, jsonify
 from models.notificacion import Notificacion, TipoNotificacion, EstadoNotificacion
 from models.usuario import Usuario
 from database import db
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 class NotificacionController:
     
     @staticmethod
@@ -29,9 +33,23 @@ class NotificacionController:
         if not NotificacionController._usuario_autenticado():
             return NotificacionController._acceso_no_autorizado()
         
-        notificaciones = Notificacion.query.filter_by(usuario_id=session['user_id']).order_by(Notificacion.fecha_creacion.desc()).all()
+        from flask import current_app
+        
+        # por páginas y sin las archivadas (salvo ?archivadas=1): usa el índice
+        # (usuario_id, estado, fecha_creacion DESC) sin importar cuánto historial tenga el usuario
+        archivadas = request.args.get('archivadas') == '1'
+        estados = [EstadoNotificacion.archivada] if archivadas else [EstadoNotificacion.no_leida, EstadoNotificacion.leida]
+        paginacion = Notificacion.query.filter(
+            Notificacion.usuario_id == session['user_id'],
+            Notificacion.estado.in_(estados)
+        ).order_by(Notificacion.fecha_creacion.desc()).paginate(
+            page=request.args.get('pagina', 1, type=int),
+            per_page=current_app.config.get('NOTIFICACIONES_POR_PAGINA', 20),
+            error_out=False
+        )
         
-        return render_template('notificaciones/listar_notificaciones.html', notificaciones=notificaciones)
+        return render_template('notificaciones/listar_notificaciones.html', notificaciones=paginacion.items,
+                               paginacion=paginacion, archivadas=archivadas)
     
     @staticmethod
     def marcar_como_leida(notificacion_id):
@@ -86,22 +104,91 @@ class NotificacionController:
             return NotificacionController._acceso_no_autorizado()
         
         try:
-            notificaciones = Notificacion.query.filter_by(
-                usuario_id=session['user_id'],
-                estado=EstadoNotificacion.no_leida
-            ).all()
-            
-            for notificacion in notificaciones:
-                notificacion.marcar_como_leida()
-            
+            # un solo UPDATE, sin cargar las notificaciones
+            marcadas = Notificacion.marcar_leidas(session['user_id'])
             db.session.commit()
-            flash('Todas las notificaciones marcadas como leídas', 'success')
+            flash(f'{marcadas} notificaciones marcadas como leídas', 'success')
         except Exception as e:
             db.session.rollback()
+            logger.exception("Error al marcar todas las notificaciones como leídas")
             flash('Error al marcar las notificaciones', 'error')
         
         return redirect(url_for('notificacion.listar_notificaciones'))
     
+    @staticmethod
+    def marcar_seleccionadas_como_leidas():
+        """Marca como leídas las notificaciones seleccionadas (formulario `ids` o JSON {"ids": [...]})"""
+        if not NotificacionController._usuario_autenticado():
+            if request.is_json:
+                return jsonify({'success': False, 'message': 'No autenticado'}), 401
+            return NotificacionController._acceso_no_autorizado()
+        
+        if request.is_json:
+            ids = (request.get_json(silent=True) or {}).get('ids') or []
+        else:
+            ids = request.form.getlist('ids')
+        try:
+            ids = [int(notificacion_id) for notificacion_id in ids]
+        except (TypeError, ValueError):
+            if request.is_json:
+                return jsonify({'success': False, 'message': 'Ids inválidos'}), 400
+            flash('Selección inválida', 'error')
+            return redirect(url_for('notificacion.listar_notificaciones'))
+        
+        try:
+            # solo las del usuario: el UPDATE filtra por usuario_id
+            marcadas = Notificacion.marcar_leidas(session['user_id'], ids)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Error al marcar las notificaciones seleccionadas")
+            if request.is_json:
+                return jsonify({'success': False, 'message': 'Error al marcar las notificaciones'}), 500
+            flash('Error al marcar las notificaciones', 'error')
+            return redirect(url_for('notificacion.listar_notificaciones'))
+        
+        if request.is_json:
+            return jsonify({'success': True, 'marcadas': marcadas})
+        flash(f'{marcadas} notificaciones marcadas como leídas', 'success')
+        return redirect(url_for('notificacion.listar_notificaciones'))
+    
+    @staticmethod
+    def archivar_leidas_antiguas():
+        """Archiva las notificaciones leídas de más de `dias` días (por defecto NOTIFICACIONES_ARCHIVO_DIAS)"""
+        from flask import current_app
+        
+        if not NotificacionController._usuario_autenticado():
+            if request.is_json:
+                return jsonify({'success': False, 'message': 'No autenticado'}), 401
+            return NotificacionController._acceso_no_autorizado()
+        
+        datos = (request.get_json(silent=True) or {}) if request.is_json else request.form
+        try:
+            dias = int(datos.get('dias') or current_app.config.get('NOTIFICACIONES_ARCHIVO_DIAS', 30))
+        except (TypeError, ValueError):
+            dias = -1
+        if dias < 0:
+            if request.is_json:
+                return jsonify({'success': False, 'message': 'Días inválidos'}), 400
+            flash('Número de días inválido', 'error')
+            return redirect(url_for('notificacion.listar_notificaciones'))
+        
+        try:
+            archivadas = Notificacion.archivar_leidas(session['user_id'], dias)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Error al archivar las notificaciones leídas")
+            if request.is_json:
+                return jsonify({'success': False, 'message': 'Error al archivar las notificaciones'}), 500
+            flash('Error al archivar las notificaciones', 'error')
+            return redirect(url_for('notificacion.listar_notificaciones'))
+        
+        if request.is_json:
+            return jsonify({'success': True, 'archivadas': archivadas})
+        flash(f'{archivadas} notificaciones leídas archivadas', 'success')
+        return redirect(url_for('notificacion.listar_notificaciones'))
+    
     @staticmethod
     def obtener_notificaciones_no_leidas():
         """API para obtener notificaciones no leídas (AJAX)"""
@@ -115,11 +202,112 @@ class NotificacionController:
         
         return jsonify([notif.to_dict() for notif in notificaciones])
     
+    @staticmethod
+    def eventos_notificaciones():
+        """Flujo SSE con los contadores y las notificaciones nuevas del usuario (EventSource)"""
+        from flask import Response
+        from patterns.contadores import contadores_usuario
+        from tareas.tiempo_real import bus_notificaciones, DemasiadasConexiones
+        
+        if not NotificacionController._usuario_autenticado():
+            return jsonify({'error': 'No autenticado'}), 401
+        
+        usuario_id = session['user_id']
+        try:
+            suscripcion = bus_notificaciones.suscribir(usuario_id)
+        except DemasiadasConexiones:
+            return jsonify({'error': 'Demasiadas conexiones'}), 503, {'Retry-After': '30'}
+        
+        try:
+            # al (re)conectar: los contadores actuales, por si se perdieron eventos
+            contadores = contadores_usuario.obtener(usuario_id)
+        except Exception:
+            logger.exception("Error al obtener los contadores para el flujo de notificaciones")
+            contadores = None
+        
+        # el generador corre después de liberar el contexto de la petición y la sesión de la base
+        respuesta = Response(bus_notificaciones.eventos(suscripcion, contadores), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'   # sin buffer en nginx
+        })
+        # también si la conexión se cierra antes de empezar a enviar
+        respuesta.call_on_close(lambda: bus_notificaciones.cancelar(suscripcion))
+        return respuesta
+    
+    @staticmethod
+    def clave_publica_push():
+        """API con la clave pública VAPID (applicationServerKey de PushManager.subscribe)"""
+        from tareas.push import enviador_push
+        
+        if not enviador_push.habilitado:
+            return jsonify({'success': False, 'message': 'Notificaciones push no disponibles'}), 404
+        return jsonify({'success': True, 'clave_publica': enviador_push.vapid.publica})
+    
+    @staticmethod
+    def suscribir_push():
+        """API para guardar la suscripción push del navegador (JSON de PushSubscription)"""
+        from models.suscripcion_push import SuscripcionPush
+        
+        if not NotificacionController._usuario_autenticado():
+            return jsonify({'success': False, 'message': 'No autenticado'}), 401
+        
+        data = request.get_json(silent=True) or {}
+        endpoint = data.get('endpoint')
+        claves = data.get('keys') or {}
+        if not endpoint or not endpoint.startswith('https://') or not claves.get('p256dh') or not claves.get('auth'):
+            return jsonify({'success': False, 'message': 'Suscripción inválida'}), 400
+        if len(endpoint) > 1000:
+            return jsonify({'success': False, 'message': 'Endpoint demasiado largo'}), 400
+        
+        try:
+            # el mismo navegador puede volver a suscribirse, también con otro usuario
+            suscripcion = SuscripcionPush.query.filter_by(endpoint=endpoint).first()
+            if suscripcion is None:
+                suscripcion = SuscripcionPush(session['user_id'], endpoint, claves['p256dh'], claves['auth'])
+                db.session.add(suscripcion)
+            else:
+                suscripcion.usuario_id = session['user_id']
+                suscripcion.p256dh = claves['p256dh']
+                suscripcion.auth = claves['auth']
+            suscripcion.agente = (request.headers.get('User-Agent') or '')[:300]
+            db.session.commit()
+            return jsonify({'success': True, 'suscripcion_id': suscripcion.id})
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Error guardando suscripción push")
+            return jsonify({'success': False, 'message': 'No se pudo guardar la suscripción'}), 500
+    
+    @staticmethod
+    def cancelar_push():
+        """API para eliminar la suscripción push del navegador"""
+        from models.suscripcion_push import SuscripcionPush
+        
+        if not NotificacionController._usuario_autenticado():
+            return jsonify({'success': False, 'message': 'No autenticado'}), 401
+        
+        endpoint = (request.get_json(silent=True) or {}).get('endpoint')
+        if not endpoint:
+            return jsonify({'success': False, 'message': 'Endpoint requerido'}), 400
+        
+        eliminadas = SuscripcionPush.query.filter_by(
+            endpoint=endpoint, usuario_id=session['user_id']
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return jsonify({'success': True, 'eliminadas': eliminadas})
+    
     @staticmethod
     def crear_notificacion(usuario_id, titulo, mensaje, tipo, servicio_id=None, contratacion_id=None, pago_id=None):
-        """Método estático para crear notificaciones desde otros controladores"""
+        """
+        Método estático para crear notificaciones desde otros controladores.
+        La notificación se guarda por lotes (al terminar la petición o en el hilo de
+        escritura), no con un commit propio.
+        """
+        from tareas.escritura_notificaciones import escritor_notificaciones, fila_notificacion
+        from tareas.agrupacion import agrupador_notificaciones
+        
         try:
-            notificacion = Notificacion(
+            # con agrupación para su tipo puede llegar en el resumen de la ventana
+            agrupador_notificaciones.enviar(fila_notificacion(
                 titulo=titulo,
                 mensaje=mensaje,
                 tipo=tipo,
@@ -127,12 +315,9 @@ class NotificacionController:
                 servicio_id=servicio_id,
                 contratacion_id=contratacion_id,
                 pago_id=pago_id
-            )
-            
-            db.session.add(notificacion)
-            db.session.commit()
+            ), escritor_notificaciones.agregar)
             return True
         except Exception as e:
             db.session.rollback()
-            print(f"Error creando notificación: {e}")
+            logger.exception("Error creando notificación")
             return False
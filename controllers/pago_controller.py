@@ -1,9 +1,27 @@
-﻿from flask import current_app
+﻿import logging
+from datetime import datetime, timedelta
+
+from flask import current_app, flash, jsonify, redirect, render_template, request, session, url_for
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import joinedload
+
 from database import db
-from models.pago import Pago, EstadoPago, MetodoPago
-import mercadopago
+from models.pago import Pago, EstadoPago, MetodoPago, EstadoTrabajo, nueva_referencia_pago
+from patterns.singleton import payment_gateway
+import threading
 import time
 
+logger = logging.getLogger(__name__)
+
+HISTORIAL_POR_PAGINA = 24
+HISTORIAL_MAXIMO_POR_PAGINA = 100
+
+# resumen del historial por (usuario, filtros): agregarlo recorre todos los pagos
+# del usuario, así que al paginar se reutiliza unos segundos
+TTL_RESUMEN_HISTORIAL = 15
+_cache_resumen_historial = {}
+_lock_resumen_historial = threading.Lock()
+
 
 class PagoController:
 
@@ -27,7 +45,8 @@ class PagoController:
             # Procesar el pago en MercadoPago
             resultado = PagoController._procesar_mercadopago(pago, datos_frontend)
 
-            if resultado["success"]:
+            if resultado["success"] or resultado.get("incierto"):
+                # sin confirmación de MercadoPago el pago queda pendiente (webhook o conciliación)
                 return resultado
             else:
                 pago.estado = EstadoPago.rechazado
@@ -39,21 +58,281 @@ class PagoController:
             return {"success": False, "message": str(e)}
 
     @staticmethod
-    def _procesar_mercadopago(pago, data):
+    def encolar_pago(contratacion, datos_form, datos_frontend):
+        """
+        Guarda el pago como pendiente y lo envía a MercadoPago en segundo plano.
+
+        Returns:
+            dict: Resultado con id_trabajo y url_estado para consultar el estado
+        """
+        from models.idempotencia import ClaveIdempotencia, clave_del_cliente
+        from tareas.pagos import nuevo_id_trabajo, encolar, procesar_pago_contratacion
+
+        registro = None
+        try:
+            # un doble envío (mismo token de tarjeta o misma Idempotency-Key) recibe
+            # el mismo trabajo en lugar de crear otro pago
+            clave = ClaveIdempotencia.derivar(
+                contratacion.organizador_id, 'pago_contratacion',
+                contratacion.id, datos_frontend.get("token"),
+                clave_cliente=clave_del_cliente(request.headers)
+            )
+            registro, nuevo = ClaveIdempotencia.reclamar(clave, 'pago_contratacion', contratacion.organizador_id)
+            if not nuevo:
+                if registro.completado:
+                    return dict(registro.respuesta, repetido=True)
+                return {"success": False, "en_proceso": True,
+                        "message": "Este pago ya se está procesando", "reintentar_en": 1}
+
+            pago = Pago(
+                contratacion_id=contratacion.id,
+                organizador_id=contratacion.organizador_id,
+                monto=contratacion.precio_total,
+                metodo_pago=MetodoPago.mercadopago,
+                estado=EstadoPago.pendiente,
+                email_pagador=datos_frontend.get("cardholderEmail") or datos_form.get("email_pagador"),
+                nombre_titular=datos_frontend.get("cardholderName") or datos_form.get("nombre_titular"),
+                documento_pagador=datos_frontend.get("identificationNumber") or datos_form.get("documento_pagador"),
+                id_trabajo=nuevo_id_trabajo(),
+                estado_trabajo=EstadoTrabajo.en_cola.value,
+                referencia_pago=nueva_referencia_pago(),
+            )
+            db.session.add(pago)
+            db.session.flush()
+
+            resultado = {
+                "success": True,
+                "pendiente": True,
+                "message": "Pago en proceso",
+                "pago_id": pago.id,
+                "id_trabajo": pago.id_trabajo,
+                "url_estado": url_for("pagos.estado_trabajo", id_trabajo=pago.id_trabajo),
+                "reintentar_en": 1,
+            }
+            registro.completar(resultado, pago_id=pago.id, contratacion_id=contratacion.id,
+                               referencia_externa=pago.referencia_pago)
+            db.session.commit()
+
+            if not encolar(pago, procesar_pago_contratacion, datos_frontend, clave):
+                registro.liberar()
+                db.session.commit()
+                return {"success": False, "message": pago.mensaje_trabajo, "reintentar_en": 5}
+
+            return resultado
+
+        except Exception as e:
+            db.session.rollback()
+            if registro is not None:
+                registro.liberar()
+                db.session.commit()
+            return {"success": False, "message": str(e)}
+
+    @staticmethod
+    def estado_trabajo(id_trabajo):
+        """
+        Estado de un pago enviado en segundo plano (para sondeo desde el frontend).
+
+        Responde 202 mientras el trabajo no termina, con Retry-After indicando cuándo
+        volver a consultar, y 200 cuando se resuelve.
+        """
+        from tareas.pagos import consultar_estado
+
+        if 'user_id' not in session:
+            return jsonify({"success": False, "message": "No autorizado"}), 401
+
+        datos = consultar_estado(id_trabajo)
+        if not datos or datos['organizador_id'] != session['user_id']:
+            return jsonify({"success": False, "message": "Pago no encontrado"}), 404
+
+        cuerpo = {clave: valor for clave, valor in datos.items() if clave != 'organizador_id'}
+        if datos['resuelto']:
+            cuerpo['url_pago'] = url_for('pagos.pago_exitoso', pago_id=datos['pago_id'])
+            respuesta = jsonify(cuerpo)
+            respuesta.headers['Cache-Control'] = 'private, max-age=300'
+            return respuesta
+
+        respuesta = jsonify(cuerpo)
+        respuesta.headers['Retry-After'] = str(datos['reintentar_en'])
+        respuesta.headers['Cache-Control'] = 'no-store'
+        return respuesta, 202
+
+    @staticmethod
+    def _filtros_historial(args):
+        # estado y rango de fechas (YYYY-MM-DD, ambos inclusive) desde la query string;
+        # los valores inválidos se ignoran
+        filtros = {'estado': None, 'desde': None, 'hasta': None}
+        estado = args.get('estado')
+        if estado in EstadoPago.__members__:
+            filtros['estado'] = EstadoPago[estado]
+        for clave in ('desde', 'hasta'):
+            try:
+                filtros[clave] = datetime.strptime(args.get(clave, ''), '%Y-%m-%d')
+            except ValueError:
+                pass
+        return filtros
+
+    @staticmethod
+    def _ramas_historial(usuario_id, filtros, *columnas):
+        """
+        SELECTs de los pagos del usuario como organizador y como proveedor.
+
+        La segunda rama excluye los pagos que ya trae la primera, así las dos son
+        disjuntas y se pueden combinar con UNION ALL sin repetir filas.
+        """
+        from models.contratacion import Contratacion
+
+        condiciones = []
+        if filtros['estado']:
+            condiciones.append(Pago.estado == filtros['estado'])
+        if filtros['desde']:
+            condiciones.append(Pago.fecha_creacion >= filtros['desde'])
+        if filtros['hasta']:
+            condiciones.append(Pago.fecha_creacion < filtros['hasta'] + timedelta(days=1))
+
+        como_organizador = select(*columnas).where(Pago.organizador_id == usuario_id, *condiciones)
+        como_proveedor = (select(*columnas)
+                          .join(Contratacion, Contratacion.id == Pago.contratacion_id)
+                          .where(Contratacion.proveedor_id == usuario_id,
+                                 Pago.organizador_id != usuario_id,
+                                 *condiciones))
+        return como_organizador, como_proveedor
+
+    @staticmethod
+    def _resumen_historial(usuario_id, filtros):
+        # cantidad y monto por estado de los pagos filtrados (también da el total
+        # para la paginación), cacheado TTL_RESUMEN_HISTORIAL segundos
+        clave = (usuario_id, filtros['estado'], filtros['desde'], filtros['hasta'])
+        ahora = time.monotonic()
+        with _lock_resumen_historial:
+            en_cache = _cache_resumen_historial.get(clave)
+        if en_cache and en_cache[0] > ahora:
+            return en_cache[1]
+
+        resumen = {estado.value: {'cantidad': 0, 'monto': 0.0} for estado in EstadoPago}
+        montos = union_all(*PagoController._ramas_historial(
+            usuario_id, filtros, Pago.estado, Pago.monto)).subquery()
+        for estado, cantidad, monto in db.session.execute(
+                select(montos.c.estado, func.count(), func.coalesce(func.sum(montos.c.monto), 0))
+                .group_by(montos.c.estado)):
+            resumen[estado.value] = {'cantidad': cantidad, 'monto': float(monto)}
+
+        with _lock_resumen_historial:
+            _cache_resumen_historial[clave] = (ahora + TTL_RESUMEN_HISTORIAL, resumen)
+            if len(_cache_resumen_historial) > 5000:
+                for vieja in [c for c, (expira, _) in _cache_resumen_historial.items() if expira <= ahora]:
+                    del _cache_resumen_historial[vieja]
+        return resumen
+
+    @staticmethod
+    def historial_pagos():
+        """
+        Historial de pagos del usuario (como organizador y como proveedor).
+
+        Una consulta UNION ALL ordenada y paginada en la base de datos trae los ids de
+        la página; cada rama se limita a offset + por_pagina filas para que use los
+        índices (organizador_id, fecha_creacion) y (contratacion_id, fecha_creacion).
+        Una segunda consulta agrupada por estado da el total y el resumen (cacheada
+        unos segundos, ver _resumen_historial).
+        """
+        from models.contratacion import Contratacion
+
+        if 'user_id' not in session:
+            flash('Debes iniciar sesión para ver tu historial de pagos', 'error')
+            return redirect(url_for('usuario.login'))
+
+        usuario_id = session['user_id']
+        filtros = PagoController._filtros_historial(request.args)
+        pagina = max(request.args.get('pagina', 1, type=int) or 1, 1)
+        por_pagina = request.args.get('por_pagina', HISTORIAL_POR_PAGINA, type=int) or HISTORIAL_POR_PAGINA
+        por_pagina = min(max(por_pagina, 1), HISTORIAL_MAXIMO_POR_PAGINA)
+        desplazamiento = (pagina - 1) * por_pagina
+
+        resumen = PagoController._resumen_historial(usuario_id, filtros)
+        total = sum(fila['cantidad'] for fila in resumen.values())
+
+        # ids de la página: cada rama trae solo sus primeras offset + por_pagina filas
+        ramas = []
+        for rama in PagoController._ramas_historial(usuario_id, filtros, Pago.id, Pago.fecha_creacion):
+            rama = (rama.order_by(Pago.fecha_creacion.desc(), Pago.id.desc())
+                    .limit(desplazamiento + por_pagina).subquery())
+            ramas.append(select(rama.c.id, rama.c.fecha_creacion))
+        combinada = union_all(*ramas).subquery()
+        ids = db.session.execute(
+            select(combinada.c.id)
+            .order_by(combinada.c.fecha_creacion.desc(), combinada.c.id.desc())
+            .offset(desplazamiento).limit(por_pagina)
+        ).scalars().all()
+
+        pagos = []
+        if ids:
+            por_id = {pago.id: pago for pago in Pago.query.options(
+                joinedload(Pago.contratacion).joinedload(Contratacion.servicio),
+                joinedload(Pago.contratacion).joinedload(Contratacion.evento)
+            ).filter(Pago.id.in_(ids))}
+            pagos = [por_id[pago_id] for pago_id in ids if pago_id in por_id]
+
+        paginas = max((total + por_pagina - 1) // por_pagina, 1)
+        return render_template(
+            'pagos/historial_pagos.html',
+            pagos=pagos,
+            resumen=resumen,
+            total=total,
+            monto_total=sum(fila['monto'] for fila in resumen.values()),
+            pagina=pagina,
+            paginas=paginas,
+            por_pagina=por_pagina,
+            filtros={clave: request.args[clave] for clave in ('estado', 'desde', 'hasta') if request.args.get(clave)}
+        )
+
+    @staticmethod
+    def recibir_webhook_mercadopago():
+        """
+        Recibe una notificación de MercadoPago: verifica la firma, la guarda en la
+        bandeja de entrada (descartando reenvíos) y responde de inmediato. Los cambios
+        de estado los aplica tareas.webhooks por lotes.
+        """
+        from models.webhook import EventoWebhook
+        from tareas.webhooks import verificar_firma, normalizar_evento, programar_procesamiento
+
+        secreto = current_app.config.get("MERCADOPAGO_WEBHOOK_SECRET")
+        if secreto:
+            firma_valida = verificar_firma(
+                secreto,
+                request.headers.get("x-signature"),
+                request.headers.get("x-request-id"),
+                request.args.get("data.id") or request.args.get("id")
+            )
+            if not firma_valida:
+                return jsonify({"success": False, "message": "Firma inválida"}), 401
+
+        evento = normalizar_evento(request.get_json(silent=True), request.args)
+        if not evento:
+            return jsonify({"success": False, "message": "Notificación sin tipo o id"}), 400
+
         try:
-            print("🚀 Iniciando procesamiento de pago con MercadoPago")
+            nuevo = EventoWebhook.registrar([evento]) > 0
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Error al guardar webhook", extra={'datos': {'recurso_id': evento.get('recurso_id')}})
+            # 500: MercadoPago reintenta la entrega
+            return jsonify({"success": False, "message": "Error al registrar la notificación"}), 500
+
+        if nuevo:
+            programar_procesamiento()
 
+        return jsonify({"success": True, "duplicado": not nuevo}), 200
+
+    @staticmethod
+    def _procesar_mercadopago(pago, data, clave_idempotencia=None):
+        try:
             access_token = current_app.config.get("MERCADOPAGO_ACCESS_TOKEN")
             if not access_token:
                 return {"success": False, "message": "Token de MercadoPago no configurado"}
 
-            sdk = mercadopago.SDK(access_token)
+            # SDK compartido del gateway: reutiliza las conexiones abiertas con MercadoPago
+            sdk = payment_gateway.obtener_sdk(access_token)
             
-            # Configurar modo sandbox si es token de prueba
-            if access_token.startswith('TEST-'):
-                sdk.sandbox = True
-                print("🔧 Modo SANDBOX activado")
-
             # Validar datos del frontend
             if not data:
                 return {"success": False, "message": "No se recibieron datos del pago"}
@@ -67,14 +346,6 @@ class PagoController:
             description = data.get("description", f"Pago para evento {getattr(pago.contratacion.evento, 'titulo', 'Evento')}")
             payer = data.get("payer", {})
 
-            print(f"📋 Datos de pago recibidos:")
-            print(f"   - Token: {token[:20]}..." if token else "   - Token: NO ENCONTRADO")
-            print(f"   - Método: {payment_method_id}")
-            print(f"   - Emisor: {issuer_id}")
-            print(f"   - Monto: ${transaction_amount}")
-            print(f"   - Cuotas: {installments}")
-            print(f"   - Descripción: {description}")
-
             if not token:
                 return {"success": False, "message": "No se recibió token de tarjeta"}
 
@@ -85,11 +356,6 @@ class PagoController:
             payer_email = payer.get("email", "test@test.com")
             identification_type = payer.get("identification", {}).get("type", "DNI")
             identification_number = payer.get("identification", {}).get("number", "12345678")
-            
-            print(f"📋 Datos del payer validados:")
-            print(f"   - Email: {payer_email}")
-            print(f"   - Tipo documento: {identification_type}")
-            print(f"   - Número documento: {identification_number}")
 
             # Crear el pago usando la API de MercadoPago siguiendo la documentación
             payment_data = {
@@ -111,29 +377,23 @@ class PagoController:
             if issuer_id:
                 payment_data["issuer_id"] = issuer_id
 
-            print(f"📤 Enviando datos a MercadoPago:")
-            print(f"   - transaction_amount: {payment_data['transaction_amount']}")
-            print(f"   - token: {payment_data['token'][:20]}...")
-            print(f"   - description: {payment_data['description']}")
-            print(f"   - installments: {payment_data['installments']}")
-            print(f"   - payment_method_id: {payment_data['payment_method_id']}")
-            print(f"   - payer: {payment_data['payer']}")
-            if 'issuer_id' in payment_data:
-                print(f"   - issuer_id: {payment_data['issuer_id']}")
+            # external_reference: asocia las notificaciones del webhook con este pago
+            if pago.referencia_pago:
+                payment_data["external_reference"] = pago.referencia_pago
+
+            logger.debug("Enviando pago a MercadoPago", extra={'datos': {
+                'pago_id': pago.id, 'sandbox': sdk.sandbox, 'datos_pago': payment_data
+            }})
             
-            result = sdk.payment().create(payment_data)
-            print(f"📥 Respuesta completa de MercadoPago:")
-            print(f"   - Status HTTP: {result.get('status')}")
-            print(f"   - Response: {result.get('response', {})}")
-            if 'error' in result:
-                print(f"   - Error: {result['error']}")
+            # con clave de idempotencia MercadoPago no crea un segundo pago si la petición se repite
+            result = sdk.payment().create(payment_data, payment_gateway.opciones_peticion(clave_idempotencia))
 
             response_data = result.get("response", {})
             payment_status = response_data.get("status")
             payment_id = response_data.get("id")
 
             if result.get("status") == 201 and payment_id:
-                pago.id_transaccion = str(payment_id)
+                pago.asignar_pago_mercadopago(payment_id)
 
                 if payment_status == "approved":
                     pago.estado = EstadoPago.aprobado
@@ -151,9 +411,9 @@ class PagoController:
 
                 db.session.commit()
                 
-                print(f"✅ Pago procesado: {message}")
-                print(f"   - ID: {payment_id}")
-                print(f"   - Estado: {payment_status}")
+                logger.info("Pago procesado", extra={'datos': {
+                    'pago_id': pago.id, 'payment_id': payment_id, 'estado_mp': payment_status
+                }})
 
                 return {
                     "success": True,
@@ -176,33 +436,40 @@ class PagoController:
                 if "status_detail" in response_data:
                     error_msg += f" | Status: {response_data['status_detail']}"
                 
-                print(f"❌ Error de MercadoPago:")
-                print(f"   - Status HTTP: {result.get('status')}")
-                print(f"   - Message: {response_data.get('message')}")
-                print(f"   - Status Detail: {response_data.get('status_detail')}")
-                print(f"   - Causes: {response_data.get('cause', [])}")
-                print(f"   - Response completa: {result}")
+                logger.warning("MercadoPago no creó el pago", extra={'datos': {
+                    'pago_id': pago.id,
+                    'status_http': result.get('status'),
+                    'mensaje_mp': response_data.get('message'),
+                    'status_detail': response_data.get('status_detail'),
+                    'causas': response_data.get('cause', [])
+                }})
+                
+                # el segundo intento con datos simplificados solo ayuda si MercadoPago rechazó
+                # los datos (4xx); si el servicio está caído o lento solo duplica la carga
+                if not 400 <= (result.get("status") or 0) < 429:
+                    # un 5xx (salvo el circuito abierto, que no envía nada) no dice si el pago se creó
+                    incierto = (result.get("status") or 0) >= 500 and response_data.get("error") != "circuit_open"
+                    return {"success": False, "incierto": incierto, "message": f"Error de MercadoPago: {error_msg}"}
                 
                 # En modo sandbox, usar datos simplificados directamente
                 if access_token.startswith('TEST-'):
-                    print("🎭 Modo sandbox: Usando datos optimizados...")
-                    return PagoController._intentar_pago_simplificado(sdk, payment_data, pago)
+                    logger.info("Reintentando con datos simplificados (sandbox)", extra={'datos': {'pago_id': pago.id}})
+                    return PagoController._intentar_pago_simplificado(sdk, payment_data, pago, clave_idempotencia)
                 elif response_data.get("message") == "internal_error" or payment_status == "rejected":
-                    print("🔄 Intentando con datos optimizados...")
-                    return PagoController._intentar_pago_simplificado(sdk, payment_data, pago)
+                    logger.info("Reintentando con datos simplificados", extra={'datos': {'pago_id': pago.id}})
+                    return PagoController._intentar_pago_simplificado(sdk, payment_data, pago, clave_idempotencia)
                 
                 return {"success": False, "message": f"Error de MercadoPago: {error_msg}"}
 
-        except Exception as e:
-            print(f"❌ Error en _procesar_mercadopago: {e}")
-            return {"success": False, "message": f"Error interno: {str(e)}"}
+        except Exception:
+            # timeout o conexión caída: no se sabe si MercadoPago creó el pago
+            logger.exception("Error en _procesar_mercadopago", extra={'datos': {'pago_id': pago.id}})
+            return {"success": False, "incierto": True, "message": "No se pudo confirmar el pago con MercadoPago"}
 
     @staticmethod
-    def _intentar_pago_simplificado(sdk, payment_data, pago):
+    def _intentar_pago_simplificado(sdk, payment_data, pago, clave_idempotencia=None):
         """Procesa el pago con datos optimizados para sandbox"""
         try:
-            print("🔄 Procesando pago...")
-            
             # Obtener access token para verificar modo sandbox
             access_token = current_app.config.get("MERCADOPAGO_ACCESS_TOKEN", "")
             
@@ -221,22 +488,26 @@ class PagoController:
                     }
                 }
             }
+            if "external_reference" in payment_data:
+                simplified_data["external_reference"] = payment_data["external_reference"]
             
-            print(f"📤 Enviando datos a MercadoPago: {simplified_data}")
+            logger.debug("Enviando pago simplificado a MercadoPago", extra={'datos': {
+                'pago_id': pago.id, 'datos_pago': simplified_data
+            }})
             
-            result = sdk.payment().create(simplified_data)
-            print(f"📥 Respuesta de MercadoPago: {result}")
+            # datos distintos al primer intento: clave derivada distinta
+            clave_reintento = f"{clave_idempotencia}-simplificado" if clave_idempotencia else None
+            result = sdk.payment().create(simplified_data, payment_gateway.opciones_peticion(clave_reintento))
             
             response_data = result.get("response", {})
             payment_status = response_data.get("status")
             payment_id = response_data.get("id")
             
             if result.get("status") == 201 and payment_id:
-                pago.id_transaccion = str(payment_id)
+                pago.asignar_pago_mercadopago(payment_id)
                 
                 # En modo sandbox, procesar pago
                 if access_token.startswith('TEST-'):
-                    print("🎭 Modo sandbox: Procesando pago")
                     pago.estado = EstadoPago.aprobado
                     message = "Pago aprobado ✅"
                     
@@ -259,9 +530,9 @@ class PagoController:
                 
                 db.session.commit()
                 
-                print(f"✅ Pago procesado: {message}")
-                print(f"   - ID: {payment_id}")
-                print(f"   - Estado: {payment_status}")
+                logger.info("Pago simplificado procesado", extra={'datos': {
+                    'pago_id': pago.id, 'payment_id': payment_id, 'estado_mp': payment_status
+                }})
                 
                 return {
                     "success": True,
@@ -272,24 +543,28 @@ class PagoController:
                 }
             else:
                 error_msg = response_data.get("message") or "Error desconocido"
-                print(f"❌ Error en pago: {error_msg}")
+                logger.warning("MercadoPago no creó el pago simplificado", extra={'datos': {
+                    'pago_id': pago.id, 'status_http': result.get('status'), 'mensaje_mp': error_msg
+                }})
                 return {"success": False, "message": f"Error de MercadoPago: {error_msg}"}
                 
         except Exception as e:
-            print(f"❌ Error en pago: {e}")
+            logger.exception("Error en el pago simplificado", extra={'datos': {'pago_id': pago.id}})
             return {"success": False, "message": f"Error interno: {str(e)}"}
 
     @staticmethod
     def _notificar_pago_aprobado(pago):
         """Notifica al proveedor cuando se aprueba un pago"""
         try:
-            from models.notificacion import Notificacion, TipoNotificacion, EstadoNotificacion
+            from models.notificacion import TipoNotificacion, EstadoNotificacion
+            from tareas.escritura_notificaciones import escritor_notificaciones, fila_notificacion
+            from tareas.agrupacion import agrupador_notificaciones
             
             # Obtener el proveedor del servicio
             proveedor_id = pago.contratacion.servicio.proveedor_id
             
             # Crear notificación para el proveedor
-            notificacion = Notificacion(
+            fila = fila_notificacion(
                 titulo="💰 Pago Aprobado",
                 mensaje=f"Se ha aprobado un pago de ${pago.monto} por el servicio '{pago.contratacion.servicio.nombre}' del evento '{pago.contratacion.evento.titulo}'",
                 tipo=TipoNotificacion.pago_recibido,
@@ -300,11 +575,14 @@ class PagoController:
                 pago_id=pago.id
             )
             
-            db.session.add(notificacion)
-            db.session.commit()
+            # por el escritor de notificaciones: se guarda por lotes y llega en vivo (SSE);
+            # varios pagos seguidos al mismo proveedor llegan en un resumen
+            agrupador_notificaciones.enviar(fila, escritor_notificaciones.agregar)
             
-            print(f"📧 Notificación enviada al proveedor {proveedor_id} sobre pago aprobado")
+            logger.info("Proveedor notificado del pago aprobado", extra={'datos': {
+                'pago_id': pago.id, 'proveedor_id': proveedor_id
+            }})
             
         except Exception as e:
-            print(f"❌ Error al notificar pago aprobado: {e}")
+            logger.exception("Error al notificar pago aprobado", extra={'datos': {'pago_id': pago.id}})
             # No fallar el pago por error en notificación
@@ -273,7 +273,54 @@ class ServicioController:
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
-    
+
+    @staticmethod
+    def cotizar_servicios_evento(evento_id):
+        """API para cotizar en bloque los servicios disponibles para un evento"""
+        if not ServicioController._usuario_autenticado():
+            return jsonify({'error': 'No autorizado'}), 401
+
+        if session['user_rol'] != 'organizador':
+            return jsonify({'error': 'Solo organizadores pueden acceder'}), 403
+
+        categoria = request.args.get('categoria', '').strip()
+        if categoria:
+            try:
+                categoria = CategoriaServicio(categoria)
+            except ValueError:
+                return jsonify({'error': 'Categoría no válida'}), 400
+
+        try:
+            evento = Evento.query.filter_by(
+                id=evento_id,
+                organizador_id=session['user_id']
+            ).first()
+
+            if not evento:
+                return jsonify({'error': 'Evento no encontrado'}), 404
+
+            cotizaciones = Servicio.cotizar_para_evento(evento, categoria or None)
+
+            # Los montos se envían como texto para conservar la precisión decimal
+            return jsonify({
+                'evento_id': evento.id,
+                'categoria': categoria.value if categoria else None,
+                'total_cotizaciones': len(cotizaciones),
+                'cotizaciones': [
+                    {
+                        **cotizacion,
+                        'duracion_horas': str(cotizacion['duracion_horas']),
+                        'precio_total': str(cotizacion['precio_total']),
+                        'deposito': str(cotizacion['deposito']),
+                        'saldo': str(cotizacion['saldo'])
+                    }
+                    for cotizacion in cotizaciones
+                ]
+            })
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     @staticmethod
     def editar_servicio(servicio_id):
         """Edita un servicio existente"""
@@ -607,7 +654,10 @@ class ServicioController:
                 precio_total=precio_total
             )
             
-            db.session.add(nuevo_item)
+            # otra petición pudo agregarlo después de la verificación anterior
+            if not CarritoItem.agregar_pendiente(nuevo_item):
+                flash('Este servicio ya está en tu carrito para este evento', 'warning')
+                return redirect(url_for('carrito.ver_carrito'))
             db.session.commit()
             
             flash('Servicio agregado al carrito. Procede al pago para confirmar la contratación.', 'success')
@@ -5,6 +5,7 @@ from models.usuario import Usuario
 from models.evento import Evento
 from models.servicio import Servicio
 from database import db
+from patterns.observer import invalidar_preferencias
 from datetime import datetime
 import re
 
@@ -124,7 +125,10 @@ class UsuarioController:
         
         try:
             usuario.nombre = nombre
+            usuario.notificaciones_email = 'notificaciones_email' in request.form
+            usuario.notificaciones_push = 'notificaciones_push' in request.form
             db.session.commit()
+            invalidar_preferencias(usuario.id)
             
             # Actualizar la sesión
             session['user_nombre'] = nombre
@@ -254,6 +258,7 @@ class UsuarioController:
             try:
                 usuario.activo = False
                 db.session.commit()
+                invalidar_preferencias(usuario.id)
                 
                 session.clear()
                 flash('Tu cuenta ha sido desactivada. ¡Esperamos verte pronto!', 'success')
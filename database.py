@@ -1,8 +1,214 @@
 # database.py - Instancia de base de datos separada
+import logging
+import random
+import time
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Enum, UniqueConstraint, inspect
+from sqlalchemy.orm.exc import StaleDataError
 
 # Crear instancia de SQLAlchemy
 db = SQLAlchemy()
 
+logger = logging.getLogger(__name__)
 
 
+class ConflictoConcurrencia(Exception):
+    """Otra petición sigue modificando las mismas filas después de agotar los reintentos"""
+
+
+def reintentar_si_conflicto(operacion, intentos=3, espera_base=0.05):
+    """
+    Ejecuta una operación de escritura con control de concurrencia optimista.
+
+    Los modelos versionados (version_id_col) emiten UPDATE ... WHERE id=? AND version=?;
+    si otra petición escribió primero, el flush lanza StaleDataError. En ese caso se
+    hace rollback y se vuelve a ejecutar la operación, que debe recargar las filas y
+    validar de nuevo el estado antes de escribir.
+
+    Args:
+        operacion (callable): Función sin argumentos que lee, valida, modifica y hace commit
+        intentos (int): Número máximo de intentos
+        espera_base (float): Espera base en segundos entre intentos (con jitter)
+
+    Returns:
+        El valor retornado por la operación
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            return operacion()
+        except StaleDataError:
+            db.session.rollback()
+            if intento == intentos:
+                raise ConflictoConcurrencia(
+                    f"Conflicto de concurrencia después de {intentos} intentos"
+                )
+            time.sleep(random.uniform(0, espera_base * intento))
+
+
+def insertar_ignorando_duplicados(modelo, filas):
+    """
+    Inserta varias filas en una sola sentencia (INSERT ... ON CONFLICT DO NOTHING),
+    omitiendo las que violan un índice único en lugar de fallar. En motores sin
+    ON CONFLICT se consulta cada fila y se inserta solo si no existe.
+
+    Args:
+        modelo: Modelo de SQLAlchemy destino
+        filas (list): Diccionarios columna -> valor
+
+    Returns:
+        int: Número de filas insertadas
+    """
+    if not filas:
+        return 0
+
+    dialecto = db.session.get_bind().dialect.name
+    if dialecto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialecto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return _insertar_si_no_existe(modelo.__table__, filas)
+
+    sentencia = insert(modelo.__table__).values(filas).on_conflict_do_nothing()
+    resultado = db.session.execute(sentencia)
+    return resultado.rowcount
+
+
+def _claves_unicas(tabla):
+    # (columnas, condición) de la clave primaria, las restricciones y los índices únicos;
+    # la condición es la de los índices parciales (postgresql_where, sqlite_where...)
+    claves = [(list(tabla.primary_key.columns), None)]
+    claves += [(list(restriccion.columns), None) for restriccion in tabla.constraints
+               if isinstance(restriccion, UniqueConstraint)]
+    for indice in tabla.indexes:
+        if indice.unique:
+            condicion = next((valor for nombre, valor in indice.dialect_kwargs.items()
+                              if nombre.endswith('_where') and valor is not None), None)
+            claves.append((list(indice.columns), condicion))
+    return claves
+
+
+def _insertar_si_no_existe(tabla, filas):
+    # SELECT + INSERT por fila. Una fila que otra transacción inserte entre ambos
+    # todavía puede fallar; la condición de un índice parcial solo se evalúa sobre las
+    # filas existentes (ante la duda la fila se omite)
+    from sqlalchemy import and_, exists, insert, or_
+
+    claves = _claves_unicas(tabla)
+    insertadas = 0
+    for fila in filas:
+        coincidencias = []
+        for columnas, condicion in claves:
+            if not all(fila.get(columna.name) is not None for columna in columnas):
+                continue    # NULL nunca choca con un índice único
+            criterios = [columna == fila[columna.name] for columna in columnas]
+            if condicion is not None:
+                criterios.append(condicion)
+            coincidencias.append(and_(*criterios))
+        if coincidencias and db.session.query(exists().where(or_(*coincidencias))).scalar():
+            continue
+        db.session.execute(insert(tabla).values(fila))
+        insertadas += 1
+    return insertadas
+
+
+def actualizar_esquema():
+    """
+    Crea las tablas faltantes y agrega a las tablas existentes las columnas e
+    índices declarados en los modelos que todavía no están en la base de datos
+    (db.create_all solo crea tablas nuevas). En PostgreSQL también agrega a los
+    tipos ENUM los valores nuevos de los enums de los modelos.
+
+    Antes de crear un índice único se llama a su info['deduplicar'](conexion), si lo
+    tiene, para resolver las filas que ya chocan con él. Los índices listados en
+    info['indices_reemplazados'] de una tabla se eliminan una vez creados los nuevos.
+
+    Returns:
+        list: Descripción de los cambios aplicados
+
+    Raises:
+        RuntimeError: Si un índice único no se pudo crear (la aplicación dejaría de
+                      evitar duplicados sin avisar)
+    """
+    db.create_all()
+
+    motor = db.engine
+    inspector = inspect(motor)
+    cambios = []
+
+    for tabla in db.metadata.sorted_tables:
+        columnas_existentes = {columna['name'] for columna in inspector.get_columns(tabla.name)}
+
+        for columna in tabla.columns:
+            if columna.name in columnas_existentes:
+                continue
+
+            ddl = f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {columna.type.compile(dialect=motor.dialect)}"
+            if columna.server_default is not None:
+                valor = columna.server_default.arg
+                ddl += f" DEFAULT {getattr(valor, 'text', None) or repr(str(valor))}"
+                if not columna.nullable:
+                    ddl += " NOT NULL"
+
+            with motor.begin() as conexion:
+                conexion.exec_driver_sql(ddl)
+            cambios.append(f"columna {tabla.name}.{columna.name}")
+
+        indices_existentes = {indice['name'] for indice in inspector.get_indexes(tabla.name)}
+        for indice in tabla.indexes:
+            if indice.name in indices_existentes:
+                continue
+            try:
+                with motor.begin() as conexion:
+                    deduplicar = indice.info.get('deduplicar') if indice.unique else None
+                    if deduplicar is not None:
+                        resueltas = deduplicar(conexion)
+                        if resueltas:
+                            cambios.append(f"{resueltas} filas duplicadas resueltas para {indice.name}")
+                    indice.create(conexion)
+                cambios.append(f"indice {indice.name}")
+            except Exception as e:
+                if indice.unique:
+                    raise RuntimeError(f"No se pudo crear el indice unico {indice.name}: {e}") from e
+                logger.warning("No se pudo crear el indice %s: %s", indice.name, e)
+
+        for nombre in tabla.info.get('indices_reemplazados', ()):
+            if nombre not in indices_existentes:
+                continue
+            with motor.begin() as conexion:
+                conexion.exec_driver_sql(f'DROP INDEX "{nombre}"')
+            cambios.append(f"indice {nombre} eliminado")
+
+    if motor.dialect.name == 'postgresql':
+        cambios.extend(_agregar_valores_enum(motor))
+
+    return cambios
+
+
+def _agregar_valores_enum(motor):
+    # los ENUM nativos de PostgreSQL no cambian al agregar miembros al enum de Python
+    cambios = []
+    tipos = {}
+    for tabla in db.metadata.sorted_tables:
+        for columna in tabla.columns:
+            if isinstance(columna.type, Enum) and columna.type.native_enum and columna.type.name:
+                tipos[columna.type.name] = columna.type.enums
+
+    with motor.connect() as conexion:
+        existentes = {}
+        for nombre, valor in conexion.exec_driver_sql(
+            "SELECT t.typname, e.enumlabel FROM pg_type t JOIN pg_enum e ON e.enumtypid = t.oid"
+        ):
+            existentes.setdefault(nombre, set()).add(valor)
+
+    for nombre, valores in tipos.items():
+        if nombre not in existentes:
+            continue
+        for valor in valores:
+            if valor in existentes[nombre]:
+                continue
+            # ADD VALUE no puede ir dentro de una transacción en versiones anteriores a la 12
+            with motor.connect().execution_options(isolation_level='AUTOCOMMIT') as conexion:
+                conexion.exec_driver_sql(f"ALTER TYPE {nombre} ADD VALUE IF NOT EXISTS '{valor}'")
+            cambios.append(f"valor {nombre}.{valor}")
+    return cambios
@@ -10,9 +10,12 @@ from .servicio import Servicio, CategoriaServicio, EstadoServicio
 from .contratacion import Contratacion, EstadoContratacion, MetodoPago
 from .calificacion import Calificacion
 from .resena import Resena
-from .notificacion import Notificacion, TipoNotificacion, EstadoNotificacion
-from .pago import Pago, MetodoPago as MetodoPagoPago, EstadoPago
+from .notificacion import Notificacion, TipoNotificacion, EstadoNotificacion, NotificacionFallida, NotificacionHistorica
+from .suscripcion_push import SuscripcionPush
+from .pago import Pago, MetodoPago as MetodoPagoPago, EstadoPago, EstadoTrabajo
 from .carrito import CarritoItem, EstadoCarritoItem
+from .webhook import EventoWebhook, EstadoEventoWebhook
+from .idempotencia import ClaveIdempotencia, EstadoClaveIdempotencia
 
 __all__ = [
     'Usuario', 'RolUsuario',
@@ -21,9 +24,12 @@ __all__ = [
     'Contratacion', 'EstadoContratacion', 'MetodoPago',
     'Calificacion',
     'Resena',
-    'Notificacion', 'TipoNotificacion', 'EstadoNotificacion',
-    'Pago', 'MetodoPagoPago', 'EstadoPago',
-    'CarritoItem', 'EstadoCarritoItem'
+    'Notificacion', 'TipoNotificacion', 'EstadoNotificacion', 'NotificacionFallida', 'NotificacionHistorica',
+    'SuscripcionPush',
+    'Pago', 'MetodoPagoPago', 'EstadoPago', 'EstadoTrabajo',
+    'CarritoItem', 'EstadoCarritoItem',
+    'EventoWebhook', 'EstadoEventoWebhook',
+    'ClaveIdempotencia', 'EstadoClaveIdempotencia'
 ]
 
 
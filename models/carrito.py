@@ -1,7 +1,8 @@
 # models/carrito.py
 from database import db
 from datetime import datetime
-from sqlalchemy import Enum
+from sqlalchemy import Enum, and_, exists, or_
+from sqlalchemy.exc import IntegrityError
 import enum
 
 class EstadoCarritoItem(enum.Enum):
@@ -46,6 +47,9 @@ class CarritoItem(db.Model):
     # Estado del item
     estado = db.Column(Enum(EstadoCarritoItem), default=EstadoCarritoItem.pendiente)
     
+    # Referencia externa del checkout de MercadoPago que cubre este item
+    referencia_pago = db.Column(db.String(64), nullable=True, index=True)
+    
     # Tipo de item para diferenciar entre servicios y contrataciones
     tipo_item = db.Column(db.String(20), default='servicio', nullable=False)
     
@@ -53,6 +57,24 @@ class CarritoItem(db.Model):
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Versión para control de concurrencia optimista (UPDATE ... WHERE id=? AND version=?)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
+    
+    # Un mismo servicio solo puede estar una vez pendiente por evento y organizador
+    __table_args__ = (
+        db.Index(
+            'uq_carrito_item_pendiente',
+            'organizador_id', 'evento_id', 'servicio_id', 'estado',
+            unique=True,
+            postgresql_where=db.text("estado = 'pendiente'"),
+            sqlite_where=db.text("estado = 'pendiente'"),
+            # actualizar_esquema lo llama antes de crear el índice en una base con duplicados
+            info={'deduplicar': lambda conexion: CarritoItem.cancelar_pendientes_duplicados(conexion)}
+        ),
+    )
+    
     def __init__(self, servicio_id, evento_id, organizador_id, fecha_evento, 
                  duracion_horas=4, numero_personas=None, ubicacion="", 
                  notas_especiales="", tipo_item='servicio', **kwargs):
@@ -85,15 +107,10 @@ class CarritoItem(db.Model):
             self.precio_por_persona = self.servicio.precio_por_persona
             
             # Calcular precio total
-            total = float(self.precio_base)
-            
-            if self.precio_por_hora:
-                total += float(self.precio_por_hora) * self.duracion_horas
-            
-            if self.precio_por_persona and self.numero_personas:
-                total += float(self.precio_por_persona) * self.numero_personas
-            
-            self.precio_total = total
+            self.precio_total = CarritoItem.calcular_precio_total(
+                self.precio_base, self.precio_por_hora, self.precio_por_persona,
+                self.duracion_horas, self.numero_personas
+            )
         else:
             # Si no hay servicio, usar valores por defecto
             self.precio_base = 0
@@ -105,6 +122,16 @@ class CarritoItem(db.Model):
         """Método público para calcular precios después de la creación"""
         self._calcular_precios()
     
+    @staticmethod
+    def calcular_precio_total(precio_base, precio_por_hora, precio_por_persona,
+                              duracion_horas, numero_personas):
+        """Calcula el precio total (Decimal) de un item a partir de las tarifas del servicio"""
+        from models.servicio import calcular_precio_total
+        return calcular_precio_total(
+            precio_base, precio_por_hora, precio_por_persona,
+            duracion_horas, numero_personas
+        )
+    
     def confirmar(self):
         """Confirma el item del carrito"""
         self.estado = EstadoCarritoItem.confirmado
@@ -125,6 +152,140 @@ class CarritoItem(db.Model):
         self.estado = EstadoCarritoItem.cancelado
         self.fecha_actualizacion = datetime.utcnow()
     
+    @staticmethod
+    def agregar_pendiente(item):
+        """
+        Agrega un item nuevo al carrito (INSERT dentro de un SAVEPOINT, sin commit).
+        Si el servicio ya está pendiente para el mismo evento y organizador
+        (uq_carrito_item_pendiente) no lo agrega y la sesión sigue utilizable.
+        
+        Returns:
+            bool: False si el servicio ya estaba en el carrito
+        """
+        try:
+            with db.session.begin_nested():
+                db.session.add(item)
+        except IntegrityError:
+            return False
+        return True
+    
+    @staticmethod
+    def liberar_items(items):
+        """
+        Devuelve a 'pendiente' items reservados cuyo pago falló, se canceló o se abandonó.
+        
+        Solo puede haber un item pendiente por organizador, evento y servicio
+        (uq_carrito_item_pendiente): si el servicio se volvió a agregar mientras el
+        item estaba reservado, queda el que está en el carrito y el reservado se
+        cancela. Entre varios reservados del mismo servicio se libera el más reciente.
+        
+        Returns:
+            list: Items que volvieron a 'pendiente'
+        """
+        items = sorted(items, key=lambda item: item.id, reverse=True)
+        if not items:
+            return []
+        
+        ocupados = {
+            (fila.organizador_id, fila.evento_id, fila.servicio_id)
+            for fila in db.session.query(
+                CarritoItem.organizador_id, CarritoItem.evento_id, CarritoItem.servicio_id
+            ).filter(
+                CarritoItem.organizador_id.in_({item.organizador_id for item in items}),
+                CarritoItem.servicio_id.in_({item.servicio_id for item in items}),
+                CarritoItem.estado == EstadoCarritoItem.pendiente,
+                CarritoItem.id.notin_([item.id for item in items])
+            )
+        }
+        liberados = []
+        for item in items:
+            clave = (item.organizador_id, item.evento_id, item.servicio_id)
+            if clave in ocupados:
+                item.cancelar()
+                continue
+            ocupados.add(clave)
+            item.estado = EstadoCarritoItem.pendiente
+            item.fecha_actualizacion = datetime.utcnow()
+            liberados.append(item)
+        return liberados
+    
+    @staticmethod
+    def liberar_por_referencias(referencias, valores=None):
+        """
+        Versión por lotes de liberar_items() para los items en 'procesando' con estas
+        referencias de pago: un UPDATE cancela los que chocarían con un item pendiente
+        (o con otro reservado más reciente del mismo servicio) y otro devuelve el resto
+        a 'pendiente'. No pasa por la sesión.
+        
+        Args:
+            referencias (list): Referencias de pago (external_reference)
+            valores (dict): Columnas adicionales a actualizar en los liberados
+        
+        Returns:
+            int: Items que volvieron a 'pendiente'
+        """
+        if not referencias:
+            return 0
+        ahora = datetime.utcnow()
+        otro = db.aliased(CarritoItem)
+        mismo_servicio = and_(
+            otro.organizador_id == CarritoItem.organizador_id,
+            otro.evento_id == CarritoItem.evento_id,
+            otro.servicio_id == CarritoItem.servicio_id,
+            otro.id != CarritoItem.id
+        )
+        reservados = and_(
+            CarritoItem.referencia_pago.in_(referencias),
+            CarritoItem.estado == EstadoCarritoItem.procesando
+        )
+        CarritoItem.query.filter(reservados, exists().where(mismo_servicio, or_(
+            otro.estado == EstadoCarritoItem.pendiente,
+            and_(otro.referencia_pago.in_(referencias),
+                 otro.estado == EstadoCarritoItem.procesando,
+                 otro.id > CarritoItem.id)
+        ))).update({
+            CarritoItem.estado: EstadoCarritoItem.cancelado,
+            CarritoItem.fecha_actualizacion: ahora,
+            CarritoItem.version: CarritoItem.version + 1
+        }, synchronize_session=False)
+        cambios = {
+            CarritoItem.estado: EstadoCarritoItem.pendiente,
+            CarritoItem.fecha_actualizacion: ahora,
+            CarritoItem.version: CarritoItem.version + 1
+        }
+        cambios.update({getattr(CarritoItem, columna): valor for columna, valor in (valores or {}).items()})
+        return CarritoItem.query.filter(reservados).update(cambios, synchronize_session=False)
+    
+    @staticmethod
+    def cancelar_pendientes_duplicados(conexion):
+        """
+        Cancela los items pendientes repetidos (mismo organizador, evento y servicio),
+        dejando solo el más reciente, para poder crear uq_carrito_item_pendiente en
+        una base de datos anterior al índice.
+        
+        Args:
+            conexion: Conexión (con transacción) en la que se crea el índice
+        
+        Returns:
+            int: Items cancelados
+        """
+        tabla = CarritoItem.__table__
+        otro = tabla.alias('otro')
+        repetido = exists().where(
+            otro.c.organizador_id == tabla.c.organizador_id,
+            otro.c.evento_id == tabla.c.evento_id,
+            otro.c.servicio_id == tabla.c.servicio_id,
+            otro.c.estado == EstadoCarritoItem.pendiente,
+            otro.c.id > tabla.c.id
+        )
+        return conexion.execute(tabla.update().where(
+            tabla.c.estado == EstadoCarritoItem.pendiente, repetido
+        ).values(
+            estado=EstadoCarritoItem.cancelado,
+            fecha_actualizacion=datetime.utcnow(),
+            version=tabla.c.version + 1
+        )).rowcount
+    
     def esta_pendiente(self):
         """Verifica si el item está pendiente"""
         return self.estado == EstadoCarritoItem.pendiente
@@ -45,6 +45,9 @@ class Contratacion(db.Model):
     contacto_organizador = db.Column(db.String(20), nullable=True)
     contacto_proveedor = db.Column(db.String(20), nullable=True)
     
+    # Origen: 'carrito' para las creadas al iniciar un checkout (se limpian si se abandonan)
+    origen = db.Column(db.String(20), nullable=True, index=True)
+    
     # Relaciones
     evento_id = db.Column(db.Integer, db.ForeignKey('eventos.id'), nullable=False)
     evento = db.relationship('Evento', backref=db.backref('contrataciones', lazy=True))
@@ -55,7 +58,7 @@ class Contratacion(db.Model):
     organizador_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     organizador = db.relationship('Usuario', foreign_keys=[organizador_id], backref=db.backref('contrataciones_organizador', lazy=True))
     
-    proveedor_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    proveedor_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
     proveedor = db.relationship('Usuario', foreign_keys=[proveedor_id], backref=db.backref('contrataciones_proveedor', lazy=True))
     
     # Campos de auditoría
@@ -64,6 +67,11 @@ class Contratacion(db.Model):
     fecha_aceptacion = db.Column(db.DateTime, nullable=True)
     fecha_completacion = db.Column(db.DateTime, nullable=True)
     
+    # Versión para control de concurrencia optimista (UPDATE ... WHERE id=? AND version=?)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
+    
     def __init__(self, evento_id, servicio_id, organizador_id, proveedor_id, fecha_evento, precio_total, **kwargs):
         self.evento_id = evento_id
         self.servicio_id = servicio_id
@@ -0,0 +1,136 @@
+# models/idempotencia.py
+from database import db, insertar_ignorando_duplicados
+from datetime import datetime, timedelta
+from sqlalchemy import Enum
+import enum
+import hashlib
+
+# encabezados con los que el cliente puede enviar su propia clave
+ENCABEZADOS_CLAVE = ('Idempotency-Key', 'X-Idempotency-Key')
+
+def clave_del_cliente(encabezados):
+    """Retorna la clave de idempotencia enviada por el cliente, si la hay"""
+    for nombre in ENCABEZADOS_CLAVE:
+        valor = encabezados.get(nombre)
+        if valor:
+            return valor[:200]
+    return None
+
+class EstadoClaveIdempotencia(enum.Enum):
+    """Estados de una operación protegida por clave de idempotencia"""
+    en_proceso = "en_proceso"
+    completado = "completado"
+
+class ClaveIdempotencia(db.Model):
+    """
+    Registro de una operación de pago identificada por una clave de idempotencia.
+
+    La primera petición con una clave la reclama (INSERT único), llama a la pasarela
+    y guarda aquí la respuesta junto con el pago y la contratación creados. Los
+    reintentos y dobles envíos con la misma clave reciben esa respuesta guardada sin
+    volver a llamar a MercadoPago ni insertar filas nuevas.
+    """
+    __tablename__ = "claves_idempotencia"
+
+    id = db.Column(db.Integer, primary_key=True)
+    clave = db.Column(db.String(100), nullable=False, unique=True)
+    alcance = db.Column(db.String(50), nullable=False)
+    organizador_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    estado = db.Column(Enum(EstadoClaveIdempotencia), default=EstadoClaveIdempotencia.en_proceso, nullable=False)
+
+    # Resultado guardado
+    respuesta = db.Column(db.JSON, nullable=True)
+    referencia_externa = db.Column(db.String(100), nullable=True)
+    pago_id = db.Column(db.Integer, db.ForeignKey('pagos.id'), nullable=True)
+    contratacion_id = db.Column(db.Integer, db.ForeignKey('contrataciones.id'), nullable=True)
+
+    # Campos de auditoría
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_expiracion = db.Column(db.DateTime, nullable=False, index=True)
+
+    # una clave en_proceso más antigua que esto se considera abandonada (worker caído)
+    BLOQUEO_MAXIMO = timedelta(minutes=2)
+
+    @staticmethod
+    def derivar(organizador_id, alcance, *partes, clave_cliente=None):
+        """
+        Construye la clave de idempotencia de una operación.
+
+        Si el cliente envió una (encabezado Idempotency-Key) se usa esa; si no, se
+        deriva de las partes que identifican el intento (item y su versión, token
+        de tarjeta, etc.). Siempre queda acotada al usuario y al alcance.
+
+        Returns:
+            str: Clave de 64 caracteres
+        """
+        base = clave_cliente.strip() if clave_cliente and clave_cliente.strip() else ':'.join(str(parte) for parte in partes)
+        return hashlib.sha256(f"{organizador_id}:{alcance}:{base}".encode()).hexdigest()
+
+    @staticmethod
+    def reclamar(clave, alcance, organizador_id, ttl=timedelta(hours=24)):
+        """
+        Intenta reclamar una clave para ejecutar la operación.
+
+        Args:
+            clave (str): Clave de idempotencia
+            alcance (str): Tipo de operación (preferencia_item, checkout_carrito, ...)
+            organizador_id (int): Usuario dueño de la operación
+            ttl (timedelta): Tiempo durante el que se recuerda el resultado
+
+        Returns:
+            tuple: (registro, es_nuevo). Si es_nuevo es False, el registro tiene la
+                   respuesta guardada (completado) o la operación sigue en proceso.
+        """
+        ahora = datetime.utcnow()
+        for _ in range(2):
+            insertados = insertar_ignorando_duplicados(ClaveIdempotencia, [{
+                'clave': clave,
+                'alcance': alcance,
+                'organizador_id': organizador_id,
+                'estado': EstadoClaveIdempotencia.en_proceso,
+                'fecha_creacion': ahora,
+                'fecha_expiracion': ahora + ttl
+            }])
+            db.session.commit()
+            registro = ClaveIdempotencia.query.filter_by(clave=clave).first()
+            if insertados:
+                return registro, True
+
+            # clave vencida o abandonada a mitad de camino: se libera y se reclama de nuevo
+            abandonada = (registro.estado == EstadoClaveIdempotencia.en_proceso
+                          and registro.fecha_creacion < ahora - ClaveIdempotencia.BLOQUEO_MAXIMO)
+            if registro.fecha_expiracion > ahora and not abandonada:
+                return registro, False
+            ClaveIdempotencia.query.filter_by(id=registro.id).delete()
+            db.session.commit()
+
+        return registro, False
+
+    def completar(self, respuesta, pago_id=None, contratacion_id=None, referencia_externa=None):
+        """Guarda la respuesta de la operación (sin commit)"""
+        self.estado = EstadoClaveIdempotencia.completado
+        self.respuesta = respuesta
+        self.pago_id = pago_id
+        self.contratacion_id = contratacion_id
+        self.referencia_externa = referencia_externa
+
+    def liberar(self):
+        """Descarta la clave (la operación falló y se puede reintentar), sin commit"""
+        # por id: funciona también después de un rollback de la sesión
+        ClaveIdempotencia.query.filter_by(id=self.id).delete(synchronize_session=False)
+
+    @property
+    def completado(self):
+        return self.estado == EstadoClaveIdempotencia.completado
+
+    @staticmethod
+    def limpiar_vencidas():
+        """Elimina las claves vencidas. Returns: int: Número de claves eliminadas"""
+        eliminadas = ClaveIdempotencia.query.filter(
+            ClaveIdempotencia.fecha_expiracion < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return eliminadas
+
+    def __repr__(self):
+        return f'<ClaveIdempotencia {self.alcance} {self.clave[:12]} - {self.estado.value}>'
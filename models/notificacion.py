@@ -1,6 +1,6 @@
 # models/notificacion.py
 from database import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy import Enum
 import enum
 
@@ -14,6 +14,12 @@ class TipoNotificacion(enum.Enum):
     servicio_rechazado = "servicio_rechazado"
     nueva_resena = "nueva_resena"
     evento_cancelado = "evento_cancelado"
+    bienvenida = "bienvenida"
+    nueva_solicitud = "nueva_solicitud"
+    contratacion_aceptada = "contratacion_aceptada"
+    contratacion_rechazada = "contratacion_rechazada"
+    evento_proximo = "evento_proximo"
+    nueva_calificacion = "nueva_calificacion"
 
 class EstadoNotificacion(enum.Enum):
     """Estados de notificaciones"""
@@ -24,6 +30,8 @@ class EstadoNotificacion(enum.Enum):
 class Notificacion(db.Model):
     """Modelo para notificaciones del sistema"""
     __tablename__ = "notificaciones"
+    # ix_notificaciones_usuario_estado_fecha cubre las mismas consultas
+    __table_args__ = {'info': {'indices_reemplazados': ('ix_notificaciones_usuario_estado',)}}
     
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(200), nullable=False)
@@ -49,7 +57,8 @@ class Notificacion(db.Model):
     contratacion = db.relationship('Contratacion', backref=db.backref('notificaciones', lazy=True))
     pago = db.relationship('Pago', backref=db.backref('notificaciones', lazy=True))
     
-    def __init__(self, titulo, mensaje, tipo, usuario_id, servicio_id=None, contratacion_id=None, pago_id=None):
+    def __init__(self, titulo, mensaje, tipo, usuario_id, servicio_id=None, contratacion_id=None, pago_id=None,
+                 evento_id=None, datos_adicionales=None):
         self.titulo = titulo
         self.mensaje = mensaje
         self.tipo = tipo
@@ -57,6 +66,8 @@ class Notificacion(db.Model):
         self.servicio_id = servicio_id
         self.contratacion_id = contratacion_id
         self.pago_id = pago_id
+        self.evento_id = evento_id
+        self.datos_adicionales = datos_adicionales
     
     def marcar_como_leida(self):
         """Marca la notificación como leída"""
@@ -67,6 +78,48 @@ class Notificacion(db.Model):
         """Archiva la notificación"""
         self.estado = EstadoNotificacion.archivada
     
+    @staticmethod
+    def marcar_leidas(usuario_id, ids=None):
+        """
+        Marca como leídas las notificaciones no leídas del usuario (todas o solo `ids`)
+        con un único UPDATE, sin cargarlas. El contador de no leídas se descuenta al
+        hacer commit.
+
+        Returns:
+            int: Notificaciones marcadas
+        """
+        from patterns.contadores import contadores_usuario
+        
+        consulta = Notificacion.query.filter(
+            Notificacion.usuario_id == usuario_id,
+            Notificacion.estado == EstadoNotificacion.no_leida
+        )
+        if ids is not None:
+            if not ids:
+                return 0
+            consulta = consulta.filter(Notificacion.id.in_(ids))
+        marcadas = consulta.update({
+            Notificacion.estado: EstadoNotificacion.leida,
+            Notificacion.fecha_lectura: datetime.utcnow()
+        }, synchronize_session=False)
+        contadores_usuario.sumar_al_confirmar(db.session, {usuario_id: {'notificaciones': -marcadas}})
+        return marcadas
+    
+    @staticmethod
+    def archivar_leidas(usuario_id, dias):
+        """
+        Archiva con un único UPDATE las notificaciones leídas del usuario creadas hace
+        más de `dias` días (no cambian el contador de no leídas).
+
+        Returns:
+            int: Notificaciones archivadas
+        """
+        return Notificacion.query.filter(
+            Notificacion.usuario_id == usuario_id,
+            Notificacion.estado == EstadoNotificacion.leida,
+            Notificacion.fecha_creacion < datetime.utcnow() - timedelta(days=dias)
+        ).update({Notificacion.estado: EstadoNotificacion.archivada}, synchronize_session=False)
+    
     def to_dict(self):
         """Convierte la notificación a diccionario para APIs"""
         return {
@@ -76,6 +129,7 @@ class Notificacion(db.Model):
             'tipo': self.tipo.value if self.tipo else None,
             'estado': self.estado.value if self.estado else None,
             'usuario_id': self.usuario_id,
+            'evento_id': self.evento_id,
             'servicio_id': self.servicio_id,
             'contratacion_id': self.contratacion_id,
             'pago_id': self.pago_id,
@@ -84,4 +138,56 @@ class Notificacion(db.Model):
         }
     
     def __repr__(self):
-        return f"<Notificacion {self.id}: {self.titulo}>"
\ No newline at end of file
+        return f"<Notificacion {self.id}: {self.titulo}>"
+
+# listado del usuario (más recientes primero) y actualizaciones por lote (no leídas, leídas antiguas)
+db.Index('ix_notificaciones_usuario_estado_fecha',
+         Notificacion.usuario_id, Notificacion.estado, Notificacion.fecha_creacion.desc())
+
+class NotificacionHistorica(db.Model):
+    """
+    Almacenamiento frío de notificaciones: las archivadas y las antiguas se mueven
+    aquí por lotes (tareas/retencion.py) para que la tabla de notificaciones solo
+    tenga las recientes. Sin claves foráneas: las filas sobreviven a sus referencias.
+    """
+    __tablename__ = "notificaciones_historico"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)   # el id original
+    titulo = db.Column(db.String(200), nullable=False)
+    mensaje = db.Column(db.Text, nullable=False)
+    tipo = db.Column(Enum(TipoNotificacion), nullable=False)
+    estado = db.Column(Enum(EstadoNotificacion), nullable=True)
+    usuario_id = db.Column(db.Integer, nullable=False, index=True)
+    evento_id = db.Column(db.Integer, nullable=True)
+    servicio_id = db.Column(db.Integer, nullable=True)
+    contratacion_id = db.Column(db.Integer, nullable=True)
+    pago_id = db.Column(db.Integer, nullable=True)
+    fecha_creacion = db.Column(db.DateTime, nullable=True)
+    fecha_lectura = db.Column(db.DateTime, nullable=True)
+    datos_adicionales = db.Column(db.JSON, nullable=True)
+    fecha_movida = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<NotificacionHistorica {self.id}: {self.titulo}>"
+
+class NotificacionFallida(db.Model):
+    """
+    Envíos de notificaciones que fallaron en todos los reintentos (dead letter).
+
+    Se guarda una fila por observador que falló, con los datos de la notificación,
+    para reenviarla a ese canal con `flask reintentar-notificaciones`.
+    """
+    __tablename__ = "notificaciones_fallidas"
+
+    id = db.Column(db.Integer, primary_key=True)
+    observador = db.Column(db.String(50), nullable=False, index=True)
+    datos = db.Column(db.JSON, nullable=False)
+    intentos = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+
+    # Campos de auditoría
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_ultimo_intento = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<NotificacionFallida {self.id}: {self.observador}>"
@@ -7,7 +7,9 @@ Principio SOLID: Single Responsibility - Responsabilidad única para pagos
 from database import db
 from datetime import datetime
 from enum import Enum
-import json  # <-- Importar json para serializar dicts
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.mutable import MutableDict
+import uuid
 
 class MetodoPago(Enum):
     """Métodos de pago disponibles"""
@@ -25,6 +27,21 @@ class EstadoPago(Enum):
     cancelado = "cancelado"
     reembolsado = "reembolsado"
 
+class EstadoTrabajo(Enum):
+    """Estados del trabajo en segundo plano que envía el pago a la pasarela"""
+    en_cola = "en_cola"
+    procesando = "procesando"
+    completado = "completado"
+    fallido = "fallido"
+
+# JSONB en PostgreSQL (JSON en otros motores); MutableDict registra los cambios hechos
+# en el dict (pago.datos_adicionales['clave'] = valor) para que se guarden con el commit
+TipoDatosAdicionales = MutableDict.as_mutable(db.JSON().with_variant(JSONB(), 'postgresql'))
+
+def nueva_referencia_pago():
+    """Genera la external_reference que identifica un checkout en MercadoPago"""
+    return f"eventlink_{uuid.uuid4().hex}"
+
 class Pago(db.Model):
     """Modelo para pagos"""
     __tablename__ = 'pagos'
@@ -45,10 +62,19 @@ class Pago(db.Model):
     organizador_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     
     # Datos de la transacción
-    id_transaccion = db.Column(db.String(100), nullable=True)  # ID de MercadoPago, Stripe, etc.
-    referencia_pago = db.Column(db.String(100), nullable=True)
+    id_transaccion = db.Column(db.String(100), nullable=True, index=True)  # ID de MercadoPago, Stripe, etc.
+    referencia_pago = db.Column(db.String(100), nullable=True, index=True)  # external_reference enviada a MercadoPago
     codigo_autorizacion = db.Column(db.String(50), nullable=True)
-    datos_adicionales = db.Column(db.JSON, nullable=True)
+    datos_adicionales = db.Column(TipoDatosAdicionales, nullable=True)
+    
+    # Identificadores de MercadoPago (búsquedas de webhooks y conciliación por índice)
+    mercadopago_id = db.Column(db.String(64), nullable=True, index=True)   # id del pago
+    preference_id = db.Column(db.String(100), nullable=True, index=True)   # id de la preferencia (Checkout Pro)
+    
+    # Envío asíncrono a la pasarela (valores de EstadoTrabajo)
+    id_trabajo = db.Column(db.String(36), nullable=True, unique=True, index=True)
+    estado_trabajo = db.Column(db.String(20), nullable=True)
+    mensaje_trabajo = db.Column(db.String(255), nullable=True)
     
     # Fechas
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
@@ -60,24 +86,26 @@ class Pago(db.Model):
     contratacion = db.relationship('Contratacion', backref='pagos')
     organizador = db.relationship('Usuario', backref='pagos')
     
+    # Historial de pagos: las dos ramas (como organizador / como proveedor) leen
+    # los pagos más recientes directamente del índice
+    __table_args__ = (
+        db.Index('ix_pagos_organizador_fecha', 'organizador_id', 'fecha_creacion'),
+        db.Index('ix_pagos_contratacion_fecha', 'contratacion_id', 'fecha_creacion'),
+    )
+    
+    def __init__(self, **kwargs):
+        # siempre un dict, para poder agregar claves antes del primer commit
+        kwargs.setdefault('datos_adicionales', {})
+        super().__init__(**kwargs)
+    
     def __repr__(self):
         return f'<Pago {self.id}: ${self.monto} - {self.estado.value}>'
     
-    # Setter y getter para manejar dicts automáticamente
-    @property
-    def datos_adicionales(self):
-        if self._datos_adicionales:
-            return json.loads(self._datos_adicionales)
-        return {}
-
-    @datos_adicionales.setter
-    def datos_adicionales(self, value):
-        if isinstance(value, dict):
-            self._datos_adicionales = json.dumps(value)
-        elif isinstance(value, str):
-            self._datos_adicionales = value
-        else:
-            self._datos_adicionales = None
+    def asignar_pago_mercadopago(self, payment_id):
+        """Guarda el id del pago de MercadoPago (también como id de transacción)"""
+        if payment_id:
+            self.mercadopago_id = str(payment_id)
+            self.id_transaccion = self.id_transaccion or self.mercadopago_id
     
     def to_dict(self):
         """Convierte el pago a diccionario"""
@@ -90,7 +118,11 @@ class Pago(db.Model):
             'email_pagador': self.email_pagador,
             'telefono_pagador': self.telefono_pagador,
             'documento_pagador': self.documento_pagador,
-            'datos_adicionales': self.datos_adicionales,
+            'datos_adicionales': dict(self.datos_adicionales or {}),
+            'mercadopago_id': self.mercadopago_id,
+            'preference_id': self.preference_id,
+            'id_trabajo': self.id_trabajo,
+            'estado_trabajo': self.estado_trabajo,
             'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
             'fecha_aprobacion': self.fecha_aprobacion.isoformat() if self.fecha_aprobacion else None
         }
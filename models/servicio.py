@@ -1,9 +1,41 @@
 # models/servicio.py
 from database import db
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 from sqlalchemy import Enum
 import enum
 
+CENTAVOS = Decimal('0.01')
+
+def _a_decimal(valor):
+    """Convierte un valor numérico (float, int, str o Decimal) a Decimal exacto"""
+    if valor is None:
+        return Decimal(0)
+    if isinstance(valor, Decimal):
+        return valor
+    return Decimal(str(valor))
+
+def calcular_precio_total(precio_base, precio_por_hora=None, precio_por_persona=None,
+                          duracion_horas=None, numero_personas=None):
+    """Calcula el precio de un servicio con aritmética decimal, redondeado a centavos"""
+    total = _a_decimal(precio_base)
+    
+    if precio_por_hora and duracion_horas:
+        total += _a_decimal(precio_por_hora) * _a_decimal(duracion_horas)
+    
+    if precio_por_persona and numero_personas:
+        total += _a_decimal(precio_por_persona) * _a_decimal(numero_personas)
+    
+    return total.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+def calcular_monto_deposito(precio_total, requiere_deposito, porcentaje_deposito):
+    """Calcula el depósito requerido con aritmética decimal (0 si no aplica)"""
+    if not requiere_deposito or not porcentaje_deposito:
+        return Decimal('0.00')
+    
+    deposito = _a_decimal(precio_total) * _a_decimal(porcentaje_deposito) / 100
+    return deposito.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
 class CategoriaServicio(enum.Enum):
     """Categorías de servicios disponibles"""
     catering = "catering"
@@ -82,22 +114,79 @@ class Servicio(db.Model):
     
     def calcular_precio_estimado(self, duracion_horas=None, numero_personas=None):
         """Calcula el precio estimado basado en los parámetros"""
-        precio_total = float(self.precio_base)
-        
-        if self.precio_por_hora and duracion_horas:
-            precio_total += float(self.precio_por_hora) * duracion_horas
-        
-        if self.precio_por_persona and numero_personas:
-            precio_total += float(self.precio_por_persona) * numero_personas
-        
-        return precio_total
+        return float(calcular_precio_total(
+            self.precio_base, self.precio_por_hora, self.precio_por_persona,
+            duracion_horas, numero_personas
+        ))
     
     def calcular_deposito(self, precio_total):
         """Calcula el monto del depósito requerido"""
         if not self.requiere_deposito or not self.porcentaje_deposito:
             return 
         
-        return (float(precio_total) * float(self.porcentaje_deposito)) / 100
+        return float(calcular_monto_deposito(precio_total, True, self.porcentaje_deposito))
+    
+    @staticmethod
+    def cotizar_para_evento(evento, categoria=None):
+        """
+        Cotiza todos los servicios disponibles (opcionalmente de una categoría)
+        para un evento en una sola pasada.
+        
+        Las horas salen de la duración del evento y las personas del número de
+        invitados. Solo se leen las columnas de tarifas, sin hidratar objetos.
+        
+        Returns:
+            list: Cotizaciones ordenadas de menor a mayor precio total
+        """
+        consulta = db.session.query(
+            Servicio.id,
+            Servicio.nombre,
+            Servicio.proveedor_id,
+            Servicio.precio_base,
+            Servicio.precio_por_hora,
+            Servicio.precio_por_persona,
+            Servicio.requiere_deposito,
+            Servicio.porcentaje_deposito
+        ).filter(Servicio.estado == EstadoServicio.disponible)
+        
+        if categoria:
+            consulta = consulta.filter(Servicio.categoria == categoria)
+        
+        filas = consulta.all()
+        if not filas:
+            return []
+        
+        horas = _a_decimal(evento.obtener_duracion_horas())
+        personas = evento.numero_invitados or 0
+        
+        # Separar en columnas y tarifar todas las filas en una sola pasada
+        (ids, nombres, proveedores, bases, por_hora,
+         por_persona, requiere, porcentajes) = zip(*filas)
+        
+        totales = [
+            calcular_precio_total(base, hora, persona, horas, personas)
+            for base, hora, persona in zip(bases, por_hora, por_persona)
+        ]
+        depositos = [
+            calcular_monto_deposito(total, req, porcentaje)
+            for total, req, porcentaje in zip(totales, requiere, porcentajes)
+        ]
+        
+        cotizaciones = [
+            {
+                'servicio_id': ids[i],
+                'nombre': nombres[i],
+                'proveedor_id': proveedores[i],
+                'duracion_horas': horas,
+                'numero_personas': personas,
+                'precio_total': totales[i],
+                'deposito': depositos[i],
+                'saldo': totales[i] - depositos[i]
+            }
+            for i in range(len(ids))
+        ]
+        cotizaciones.sort(key=lambda cotizacion: cotizacion['precio_total'])
+        return cotizaciones
     
     def esta_disponible(self):
         """Verifica si el servicio está disponible"""
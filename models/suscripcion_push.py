@@ -0,0 +1,45 @@
+# models/suscripcion_push.py
+from database import db
+from datetime import datetime
+
+class SuscripcionPush(db.Model):
+    """
+    Suscripción Web Push de un navegador (PushSubscription del Service Worker).
+
+    Un usuario puede tener varias (un navegador o dispositivo cada una). El servicio
+    push del navegador responde 404/410 cuando la suscripción venció; esas filas se
+    eliminan por lotes al terminar cada envío.
+    """
+    __tablename__ = "suscripciones_push"
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False, index=True)
+    endpoint = db.Column(db.String(1000), nullable=False, unique=True)
+    p256dh = db.Column(db.String(200), nullable=False)
+    auth = db.Column(db.String(100), nullable=False)
+    agente = db.Column(db.String(300), nullable=True)
+
+    # Campos de auditoría
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_ultimo_envio = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, usuario_id, endpoint, p256dh, auth, agente=None):
+        self.usuario_id = usuario_id
+        self.endpoint = endpoint
+        self.p256dh = p256dh
+        self.auth = auth
+        self.agente = agente
+
+    def to_dict(self):
+        """Convierte la suscripción a diccionario"""
+        return {
+            'id': self.id,
+            'usuario_id': self.usuario_id,
+            'endpoint': self.endpoint,
+            'agente': self.agente,
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
+            'fecha_ultimo_envio': self.fecha_ultimo_envio.isoformat() if self.fecha_ultimo_envio else None
+        }
+
+    def __repr__(self):
+        return f"<SuscripcionPush {self.id}: usuario {self.usuario_id}>"
@@ -112,12 +112,9 @@ class Usuario(db.Model):
         return Evento.query.filter_by(organizador_id=self.id).count()
     
     def obtener_notificaciones_no_leidas(self):
-        """Obtiene el número de notificaciones no leídas"""
-        from models.notificacion import Notificacion, EstadoNotificacion
-        return Notificacion.query.filter_by(
-            usuario_id=self.id, 
-            estado=EstadoNotificacion.no_leida
-        ).count()
+        """Obtiene el número de notificaciones no leídas (del cache de contadores)"""
+        from patterns.contadores import contadores_usuario
+        return contadores_usuario.obtener(self.id)['notificaciones']
     
     def desactivar_cuenta(self):
         """Desactiva la cuenta del usuario"""
@@ -0,0 +1,76 @@
+# models/webhook.py
+from database import db, insertar_ignorando_duplicados
+from datetime import datetime
+from sqlalchemy import Enum
+import enum
+
+class EstadoEventoWebhook(enum.Enum):
+    """Estados de un evento recibido por webhook"""
+    pendiente = "pendiente"
+    procesado = "procesado"
+    ignorado = "ignorado"
+    error = "error"
+
+class EventoWebhook(db.Model):
+    """
+    Bandeja de entrada de notificaciones de MercadoPago.
+
+    El webhook solo guarda el evento y responde; un trabajo en segundo plano
+    aplica los cambios por lotes. id_evento es único, así que los reenvíos de
+    la misma notificación se descartan al insertar.
+    """
+    __tablename__ = "webhook_eventos"
+
+    id = db.Column(db.Integer, primary_key=True)
+    proveedor = db.Column(db.String(30), nullable=False, default='mercadopago')
+    id_evento = db.Column(db.String(100), nullable=False, unique=True)
+    tipo = db.Column(db.String(50), nullable=True)
+    accion = db.Column(db.String(50), nullable=True)
+    recurso_id = db.Column(db.String(64), nullable=True, index=True)
+    payload = db.Column(db.JSON, nullable=True)
+
+    # Procesamiento
+    estado = db.Column(Enum(EstadoEventoWebhook), default=EstadoEventoWebhook.pendiente, nullable=False, index=True)
+    intentos = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+
+    # Campos de auditoría
+    fecha_recepcion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_procesado = db.Column(db.DateTime, nullable=True)
+
+    @staticmethod
+    def registrar(eventos):
+        """
+        Guarda eventos en la bandeja omitiendo los ya recibidos (mismo id_evento).
+
+        Args:
+            eventos (list): Diccionarios con id_evento, tipo, accion, recurso_id y payload
+
+        Returns:
+            int: Número de eventos nuevos
+        """
+        ahora = datetime.utcnow()
+        filas = [
+            dict(evento, proveedor=evento.get('proveedor', 'mercadopago'),
+                 estado=EstadoEventoWebhook.pendiente, intentos=0, fecha_recepcion=ahora)
+            for evento in eventos
+        ]
+        return insertar_ignorando_duplicados(EventoWebhook, filas)
+
+    def to_dict(self):
+        """Convierte el evento a diccionario"""
+        return {
+            'id': self.id,
+            'id_evento': self.id_evento,
+            'tipo': self.tipo,
+            'accion': self.accion,
+            'recurso_id': self.recurso_id,
+            'estado': self.estado.value,
+            'intentos': self.intentos,
+            'error': self.error,
+            'fecha_recepcion': self.fecha_recepcion.isoformat() if self.fecha_recepcion else None,
+            'fecha_procesado': self.fecha_procesado.isoformat() if self.fecha_procesado else None
+        }
+
+    def __repr__(self):
+        return f'<EventoWebhook {self.id_evento} - {self.estado.value}>'
@@ -0,0 +1,450 @@
+# patterns/contadores.py
+"""
+Contadores por usuario de la barra de navegación (notificaciones no leídas, items
+del carrito y solicitudes de contratación pendientes) en un cache compartido
+
+- Al mostrar una página se leen del cache, sin consultas a la base de datos; si el
+  usuario no está en el cache (o su entrada venció) se calculan con una consulta.
+- Los cambios hechos con el ORM se suman al cache al confirmar la transacción
+  (eventos de la sesión); las escrituras masivas (INSERT por lotes de notificaciones,
+  conciliación, limpieza) suman o invalidan explícitamente.
+- Cada entrada vence a los CONTADORES_TTL segundos y se vuelve a calcular: las
+  diferencias por carreras entre el cálculo y un cambio concurrente duran como
+  máximo eso. `flask reconciliar-contadores` recalcula todos de una vez.
+
+Almacenes (como las métricas de la pasarela):
+- AlmacenContadoresRedis: un hash por usuario con EXPIRE (CONTADORES_REDIS_URL).
+- AlmacenContadoresSqlite: un archivo SQLite compartido por los workers del host.
+- AlmacenContadoresMemoria: solo el proceso actual (pruebas).
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ('notificaciones', 'carrito', 'solicitudes')
+
+
+class AlmacenContadoresMemoria:
+    """Almacén del proceso actual (no se comparte entre workers)"""
+
+    def __init__(self):
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def leer(self, usuario_id):
+        with self._lock:
+            entrada = self._valores.get(usuario_id)
+            if entrada is None or entrada[1] <= time.time():
+                return None
+            return dict(entrada[0])
+
+    def guardar(self, valores_por_usuario, ttl):
+        expira = time.time() + ttl
+        with self._lock:
+            for usuario_id, valores in valores_por_usuario.items():
+                self._valores[usuario_id] = (dict(valores), expira)
+
+    def sumar(self, deltas):
+        ahora = time.time()
+        with self._lock:
+            for usuario_id, campos in deltas.items():
+                entrada = self._valores.get(usuario_id)
+                if entrada is None or entrada[1] <= ahora:
+                    continue
+                for campo, delta in campos.items():
+                    entrada[0][campo] = max(entrada[0].get(campo, 0) + delta, 0)
+
+    def eliminar(self, usuario_ids):
+        with self._lock:
+            for usuario_id in usuario_ids:
+                self._valores.pop(usuario_id, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+class AlmacenContadoresSqlite:
+    """
+    Almacén en un archivo SQLite compartido por los procesos del mismo host.
+    Una fila por usuario con una columna por contador y su vencimiento.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        columnas = ', '.join(f'{campo} INTEGER NOT NULL DEFAULT 0' for campo in CAMPOS)
+        with self._conectar() as conexion:
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute(f'CREATE TABLE IF NOT EXISTS contadores '
+                             f'(usuario_id INTEGER PRIMARY KEY, {columnas}, expira REAL NOT NULL)')
+
+    def _conectar(self):
+        # una conexión por operación: no hay conexiones compartidas entre hilos ni
+        # heredadas al hacer fork (abrir el archivo cuesta decenas de microsegundos)
+        return sqlite3.connect(self.ruta, timeout=5)
+
+    def leer(self, usuario_id):
+        conexion = self._conectar()
+        try:
+            fila = conexion.execute(f'SELECT {", ".join(CAMPOS)} FROM contadores WHERE usuario_id = ? AND expira > ?',
+                                    (usuario_id, time.time())).fetchone()
+        finally:
+            conexion.close()
+        return dict(zip(CAMPOS, fila)) if fila else None
+
+    def guardar(self, valores_por_usuario, ttl):
+        expira = time.time() + ttl
+        conexion = self._conectar()
+        try:
+            with conexion:
+                conexion.executemany(
+                    f'INSERT OR REPLACE INTO contadores (usuario_id, {", ".join(CAMPOS)}, expira) '
+                    f'VALUES (?, {", ".join("?" for _campo in CAMPOS)}, ?)',
+                    [(usuario_id, *(valores.get(campo, 0) for campo in CAMPOS), expira)
+                     for usuario_id, valores in valores_por_usuario.items()]
+                )
+        finally:
+            conexion.close()
+
+    def sumar(self, deltas):
+        ahora = time.time()
+        conexion = self._conectar()
+        try:
+            with conexion:
+                for campo in CAMPOS:
+                    filas = [(campos[campo], usuario_id, ahora)
+                             for usuario_id, campos in deltas.items() if campos.get(campo)]
+                    if filas:
+                        conexion.executemany(f'UPDATE contadores SET {campo} = MAX({campo} + ?, 0) '
+                                             f'WHERE usuario_id = ? AND expira > ?', filas)
+        finally:
+            conexion.close()
+
+    def eliminar(self, usuario_ids):
+        conexion = self._conectar()
+        try:
+            with conexion:
+                conexion.executemany('DELETE FROM contadores WHERE usuario_id = ?',
+                                     [(usuario_id,) for usuario_id in usuario_ids])
+        finally:
+            conexion.close()
+
+    def limpiar(self):
+        conexion = self._conectar()
+        try:
+            with conexion:
+                conexion.execute('DELETE FROM contadores')
+        finally:
+            conexion.close()
+
+
+class AlmacenContadoresRedis:
+    """Almacén en Redis: un hash por usuario que vence con EXPIRE"""
+
+    # suma solo si la entrada existe: una entrada vencida se recalcula completa
+    SUMAR = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+    for i = 1, #ARGV, 2 do
+        if redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1]) < 0 then
+            redis.call('HSET', KEYS[1], ARGV[i], 0)
+        end
+    end
+    return 1
+    """
+
+    def __init__(self, url, prefijo='eventlink:contadores:'):
+        import redis
+
+        self._cliente = redis.Redis.from_url(url)
+        self._sumar = self._cliente.register_script(self.SUMAR)
+        self.prefijo = prefijo
+
+    def leer(self, usuario_id):
+        valores = self._cliente.hgetall(f'{self.prefijo}{usuario_id}')
+        if not valores:
+            return None
+        return {campo.decode(): int(valor) for campo, valor in valores.items()}
+
+    def guardar(self, valores_por_usuario, ttl):
+        pipeline = self._cliente.pipeline(transaction=False)
+        for usuario_id, valores in valores_por_usuario.items():
+            clave = f'{self.prefijo}{usuario_id}'
+            pipeline.hset(clave, mapping={campo: valores.get(campo, 0) for campo in CAMPOS})
+            pipeline.expire(clave, int(ttl))
+        pipeline.execute()
+
+    def sumar(self, deltas):
+        pipeline = self._cliente.pipeline(transaction=False)
+        for usuario_id, campos in deltas.items():
+            argumentos = [valor for campo, delta in campos.items() if delta for valor in (campo, delta)]
+            if argumentos:
+                self._sumar(keys=[f'{self.prefijo}{usuario_id}'], args=argumentos, client=pipeline)
+        pipeline.execute()
+
+    def eliminar(self, usuario_ids):
+        claves = [f'{self.prefijo}{usuario_id}' for usuario_id in usuario_ids]
+        if claves:
+            self._cliente.delete(*claves)
+
+    def limpiar(self):
+        claves = list(self._cliente.scan_iter(f'{self.prefijo}*'))
+        if claves:
+            self._cliente.delete(*claves)
+
+
+class ContadoresUsuario:
+    """
+    Servicio de contadores por usuario.
+
+    obtener() lee del almacén (o calcula y guarda); los eventos de la sesión de
+    SQLAlchemy acumulan en session.info las diferencias de cada flush y las suman
+    al almacén después del commit (se descartan con el rollback).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.ttl = 300
+        self.almacen = AlmacenContadoresMemoria()
+        self._eventos_registrados = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # elige el almacén y registra los eventos de la sesión
+        self.app = app
+        self.ttl = app.config.get('CONTADORES_TTL', 300)
+        url_redis = app.config.get('CONTADORES_REDIS_URL')
+        ruta = app.config.get('CONTADORES_ARCHIVO') or os.path.join(tempfile.gettempdir(), 'eventlink-contadores.sqlite3')
+        try:
+            if url_redis:
+                self.almacen = AlmacenContadoresRedis(url_redis)
+            elif app.testing:
+                self.almacen = AlmacenContadoresMemoria()
+            else:
+                self.almacen = AlmacenContadoresSqlite(ruta)
+        except Exception as e:
+            logger.warning("Contadores solo del proceso actual, no se pudo abrir el almacén compartido: %s", e)
+            self.almacen = AlmacenContadoresMemoria()
+        self._registrar_eventos()
+        app.extensions['contadores_usuario'] = self
+
+    # ----- lectura -----
+
+    def obtener(self, usuario_id):
+        """
+        Contadores del usuario (una vez por petición; sin consultas si están en el cache).
+
+        Returns:
+            dict: notificaciones, carrito y solicitudes
+        """
+        from flask import g, has_request_context
+
+        if has_request_context():
+            por_peticion = g.setdefault('contadores_usuario', {})
+            if usuario_id in por_peticion:
+                return por_peticion[usuario_id]
+
+        try:
+            valores = self.almacen.leer(usuario_id)
+        except Exception as e:
+            logger.warning("No se pudieron leer los contadores del cache: %s", e)
+            valores = None
+        if valores is None:
+            valores = self.calcular([usuario_id])[usuario_id]
+            try:
+                self.almacen.guardar({usuario_id: valores}, self.ttl)
+            except Exception as e:
+                logger.warning("No se pudieron guardar los contadores en el cache: %s", e)
+
+        if has_request_context():
+            g.contadores_usuario[usuario_id] = valores
+        return valores
+
+    def calcular(self, usuario_ids):
+        """
+        Contadores de varios usuarios desde la base de datos (una consulta por contador).
+
+        Returns:
+            dict: usuario_id -> {'notificaciones': n, 'carrito': n, 'solicitudes': n}
+        """
+        from database import db
+        from models.carrito import CarritoItem, EstadoCarritoItem
+        from models.contratacion import Contratacion, EstadoContratacion
+        from models.notificacion import Notificacion, EstadoNotificacion
+        from sqlalchemy import func
+
+        usuario_ids = list(usuario_ids)
+        valores = {usuario_id: dict.fromkeys(CAMPOS, 0) for usuario_id in usuario_ids}
+        consultas = {
+            'notificaciones': db.session.query(Notificacion.usuario_id, func.count()).filter(
+                Notificacion.usuario_id.in_(usuario_ids),
+                Notificacion.estado == EstadoNotificacion.no_leida
+            ).group_by(Notificacion.usuario_id),
+            'carrito': db.session.query(CarritoItem.organizador_id, func.count()).filter(
+                CarritoItem.organizador_id.in_(usuario_ids),
+                CarritoItem.tipo_item == 'servicio',
+                CarritoItem.estado == EstadoCarritoItem.pendiente
+            ).group_by(CarritoItem.organizador_id),
+            'solicitudes': db.session.query(Contratacion.proveedor_id, func.count()).filter(
+                Contratacion.proveedor_id.in_(usuario_ids),
+                Contratacion.estado == EstadoContratacion.solicitada
+            ).group_by(Contratacion.proveedor_id),
+        }
+        for campo, consulta in consultas.items():
+            for usuario_id, cantidad in consulta:
+                valores[usuario_id][campo] = cantidad
+        return valores
+
+    # ----- actualización -----
+
+    def sumar(self, deltas):
+        """
+        Suma diferencias a los contadores que están en el cache (los demás se
+        calcularán completos al leerlos).
+
+        Args:
+            deltas (dict): usuario_id -> {campo: diferencia}
+        """
+        deltas = {usuario_id: campos for usuario_id, campos in deltas.items() if any(campos.values())}
+        if not deltas:
+            return
+        try:
+            self.almacen.sumar(deltas)
+        except Exception as e:
+            # la entrada queda desactualizada: mejor que se recalcule
+            logger.warning("No se pudieron sumar los contadores, se invalidan: %s", e)
+            self.invalidar(deltas.keys())
+
+    def sumar_al_confirmar(self, sesion, deltas):
+        """
+        Suma diferencias cuando la sesión haga commit (se descartan con el rollback),
+        para UPDATE/DELETE por lote que no pasan por los objetos de la sesión.
+
+        Args:
+            sesion: Sesión de SQLAlchemy (db.session)
+            deltas (dict): usuario_id -> {campo: diferencia}
+        """
+        pendientes = sesion.info.setdefault('contadores_deltas', defaultdict(lambda: defaultdict(int)))
+        for usuario_id, campos in deltas.items():
+            for campo, delta in campos.items():
+                pendientes[usuario_id][campo] += delta
+
+    def invalidar(self, usuario_ids):
+        """Elimina del cache los contadores de estos usuarios (se recalculan al leerlos)"""
+        usuario_ids = [usuario_id for usuario_id in set(usuario_ids) if usuario_id is not None]
+        if not usuario_ids:
+            return
+        try:
+            self.almacen.eliminar(usuario_ids)
+        except Exception:
+            logger.exception("No se pudieron invalidar los contadores",
+                             extra={'datos': {'usuarios': len(usuario_ids)}})
+
+    def reconciliar(self, tamano_lote=500):
+        """
+        Recalcula y guarda los contadores de todos los usuarios activos, por lotes.
+
+        Returns:
+            int: Usuarios reconciliados
+        """
+        from models.usuario import Usuario
+
+        total = 0
+        ultimo_id = 0
+        while True:
+            ids = [fila.id for fila in Usuario.query.with_entities(Usuario.id).filter(
+                Usuario.activo.is_(True), Usuario.id > ultimo_id
+            ).order_by(Usuario.id).limit(tamano_lote)]
+            if not ids:
+                return total
+            ultimo_id = ids[-1]
+            self.almacen.guardar(self.calcular(ids), self.ttl)
+            total += len(ids)
+
+    # ----- eventos de la sesión -----
+
+    def _registrar_eventos(self):
+        from models.carrito import CarritoItem
+        from models.contratacion import Contratacion
+        from models.notificacion import Notificacion
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        if self._eventos_registrados:
+            return
+        # al cambiar el estado de un objeto cuyo atributo venció (después de un commit)
+        # SQLAlchemy no guarda el valor anterior salvo con active_history
+        for atributo in (Notificacion.estado, CarritoItem.estado, CarritoItem.tipo_item, Contratacion.estado):
+            event.listen(atributo, 'set', lambda _objeto, valor, *_args: valor, active_history=True, retval=True)
+        event.listen(Session, 'after_flush', self._despues_de_flush)
+        event.listen(Session, 'after_commit', self._despues_de_commit)
+        event.listen(Session, 'after_rollback', self._despues_de_rollback)
+        self._eventos_registrados = True
+
+    def _despues_de_flush(self, sesion, _contexto):
+        from models.carrito import CarritoItem
+        from models.contratacion import Contratacion
+        from models.notificacion import Notificacion
+
+        deltas = sesion.info.setdefault('contadores_deltas', defaultdict(lambda: defaultdict(int)))
+        for objeto, signo in [(objeto, 1) for objeto in sesion.new] + [(objeto, -1) for objeto in sesion.deleted]:
+            clave = self._clave(objeto, Notificacion, CarritoItem, Contratacion)
+            if clave and self._cuenta(objeto):
+                deltas[clave[0]][clave[1]] += signo
+        for objeto in sesion.dirty:
+            clave = self._clave(objeto, Notificacion, CarritoItem, Contratacion)
+            if clave:
+                antes, despues = self._cuenta(objeto, anterior=True), self._cuenta(objeto)
+                if antes != despues:
+                    deltas[clave[0]][clave[1]] += 1 if despues else -1
+
+    def _clave(self, objeto, Notificacion, CarritoItem, Contratacion):
+        # (usuario, contador) al que afecta el objeto, o None
+        if isinstance(objeto, Notificacion):
+            return objeto.usuario_id, 'notificaciones'
+        if isinstance(objeto, CarritoItem):
+            return objeto.organizador_id, 'carrito'
+        if isinstance(objeto, Contratacion):
+            return objeto.proveedor_id, 'solicitudes'
+        return None
+
+    def _cuenta(self, objeto, anterior=False):
+        # si el objeto suma en su contador (con los valores previos al flush si anterior)
+        from models.carrito import CarritoItem, EstadoCarritoItem
+        from models.contratacion import Contratacion, EstadoContratacion
+        from models.notificacion import EstadoNotificacion, Notificacion
+        from sqlalchemy import inspect
+
+        def valor(atributo):
+            if anterior:
+                historia = inspect(objeto).attrs[atributo].history
+                if historia.deleted:
+                    return historia.deleted[0]
+            return getattr(objeto, atributo)
+
+        if isinstance(objeto, Notificacion):
+            return valor('estado') in (EstadoNotificacion.no_leida, None)
+        if isinstance(objeto, CarritoItem):
+            return valor('estado') in (EstadoCarritoItem.pendiente, None) and valor('tipo_item') in ('servicio', None)
+        if isinstance(objeto, Contratacion):
+            return valor('estado') in (EstadoContratacion.solicitada, None)
+        return False
+
+    def _despues_de_commit(self, sesion):
+        deltas = sesion.info.pop('contadores_deltas', None)
+        if deltas:
+            self.sumar(deltas)
+
+    def _despues_de_rollback(self, sesion):
+        sesion.info.pop('contadores_deltas', None)
+
+
+# instancia global (se inicializa con init_app en create_app)
+contadores_usuario = ContadoresUsuario()
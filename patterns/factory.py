@@ -168,7 +168,7 @@ class NotificacionFactory:
         return Notificacion(
             titulo="¡Bienvenido a EventLink!",
             mensaje=mensaje,
-            tipo=TipoNotificacion.BIENVENIDA,
+            tipo=TipoNotificacion.bienvenida,
             usuario_id=usuario_id
         )
     
@@ -178,7 +178,7 @@ class NotificacionFactory:
         return Notificacion(
             titulo="Nueva solicitud de servicio",
             mensaje="Has recibido una nueva solicitud de servicio para tu evento.",
-            tipo=TipoNotificacion.NUEVA_SOLICITUD,
+            tipo=TipoNotificacion.nueva_solicitud,
             usuario_id=proveedor_id,
             evento_id=evento_id,
             servicio_id=servicio_id
@@ -190,7 +190,7 @@ class NotificacionFactory:
         return Notificacion(
             titulo="Solicitud aceptada",
             mensaje="Tu solicitud de servicio ha sido aceptada por el proveedor.",
-            tipo=TipoNotificacion.CONTRATACION_ACEPTADA,
+            tipo=TipoNotificacion.contratacion_aceptada,
             usuario_id=organizador_id,
             contratacion_id=contratacion_id
         )
@@ -205,7 +205,7 @@ class NotificacionFactory:
         return Notificacion(
             titulo="Solicitud rechazada",
             mensaje=mensaje,
-            tipo=TipoNotificacion.CONTRATACION_RECHAZADA,
+            tipo=TipoNotificacion.contratacion_rechazada,
             usuario_id=organizador_id,
             contratacion_id=contratacion_id
         )
@@ -216,7 +216,7 @@ class NotificacionFactory:
         return Notificacion(
             titulo="Pago recibido",
             mensaje=f"Has recibido un pago de ${monto} por tu servicio.",
-            tipo=TipoNotificacion.PAGO_RECIBIDO,
+            tipo=TipoNotificacion.pago_recibido,
             usuario_id=proveedor_id,
             contratacion_id=contratacion_id,
             datos_adicionales={'monto': monto}
@@ -228,7 +228,7 @@ class NotificacionFactory:
         return Notificacion(
             titulo="Evento próximo",
             mensaje=f"Tu evento está próximo. Faltan {dias_restantes} días.",
-            tipo=TipoNotificacion.EVENTO_PROXIMO,
+            tipo=TipoNotificacion.evento_proximo,
             usuario_id=organizador_id,
             evento_id=evento_id,
             datos_adicionales={'dias_restantes': dias_restantes}
@@ -240,7 +240,7 @@ class NotificacionFactory:
         return Notificacion(
             titulo="Nueva calificación recibida",
             mensaje="Has recibido una nueva calificación por tu servicio.",
-            tipo=TipoNotificacion.NUEVA_CALIFICACION,
+            tipo=TipoNotificacion.nueva_calificacion,
             usuario_id=proveedor_id,
             datos_adicionales={'calificacion_id': calificacion_id}
         )
@@ -0,0 +1,364 @@
+# patterns/metricas.py
+"""
+Métricas de la pasarela de pagos compartidas entre workers
+
+Cada hilo suma en sus propios contadores (un dict que solo él modifica, sin locks);
+un hilo de fondo por proceso calcula cada pocos segundos lo que cambió desde el
+último envío y lo suma en un almacén compartido por todos los workers:
+
+- AlmacenMetricasRedis: un hash en Redis (METRICAS_REDIS_URL), para varios hosts.
+- AlmacenMetricasSqlite: un archivo SQLite local (por defecto en el directorio
+  temporal), compartido por los workers de gunicorn del mismo host.
+- AlmacenMetricasMemoria: solo el proceso actual (pruebas).
+
+El almacén se elige con la configuración de la aplicación (METRICAS_*) y se abre
+recién al primer envío o lectura, no al importar el módulo.
+
+Por operación se registran éxitos, fallos y un histograma de latencia con cubetas
+fijas, del que se estiman p50/p95/p99.
+"""
+
+import atexit
+import functools
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# límites superiores (ms) de las cubetas del histograma de latencia
+LIMITES_LATENCIA_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+CLAVE_DESDE = 'desde'
+
+
+class AlmacenMetricasMemoria:
+    """Almacén del proceso actual (no se comparte entre workers)"""
+
+    def __init__(self):
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, deltas):
+        with self._lock:
+            self._valores.setdefault(CLAVE_DESDE, time.time())
+            for clave, valor in deltas.items():
+                self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def leer(self):
+        with self._lock:
+            return dict(self._valores)
+
+    def limpiar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+class AlmacenMetricasSqlite:
+    """
+    Almacén en un archivo SQLite compartido por los procesos del mismo host.
+    Cada envío es una sola transacción con UPSERTs que suman al valor guardado.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with self._conectar() as conexion:
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('CREATE TABLE IF NOT EXISTS metricas (clave TEXT PRIMARY KEY, valor REAL NOT NULL)')
+
+    def _conectar(self):
+        # una conexión por operación: los envíos son cada pocos segundos y así no
+        # hay conexiones compartidas entre hilos ni heredadas al hacer fork
+        return sqlite3.connect(self.ruta, timeout=5)
+
+    def sumar(self, deltas):
+        conexion = self._conectar()
+        try:
+            with conexion:
+                conexion.execute('INSERT OR IGNORE INTO metricas (clave, valor) VALUES (?, ?)',
+                                 (CLAVE_DESDE, time.time()))
+                conexion.executemany(
+                    'INSERT INTO metricas (clave, valor) VALUES (?, ?) '
+                    'ON CONFLICT(clave) DO UPDATE SET valor = valor + excluded.valor',
+                    list(deltas.items())
+                )
+        finally:
+            conexion.close()
+
+    def leer(self):
+        conexion = self._conectar()
+        try:
+            return dict(conexion.execute('SELECT clave, valor FROM metricas'))
+        finally:
+            conexion.close()
+
+    def limpiar(self):
+        conexion = self._conectar()
+        try:
+            with conexion:
+                conexion.execute('DELETE FROM metricas')
+        finally:
+            conexion.close()
+
+
+class AlmacenMetricasRedis:
+    """Almacén en un hash de Redis (HINCRBYFLOAT en un pipeline por envío)"""
+
+    def __init__(self, url, clave='eventlink:metricas:pasarela'):
+        import redis
+
+        self._cliente = redis.Redis.from_url(url)
+        self.clave = clave
+
+    def sumar(self, deltas):
+        pipeline = self._cliente.pipeline(transaction=False)
+        pipeline.hsetnx(self.clave, CLAVE_DESDE, time.time())
+        for campo, valor in deltas.items():
+            pipeline.hincrbyfloat(self.clave, campo, valor)
+        pipeline.execute()
+
+    def leer(self):
+        return {campo.decode(): float(valor) for campo, valor in self._cliente.hgetall(self.clave).items()}
+
+    def limpiar(self):
+        self._cliente.delete(self.clave)
+
+
+def almacen_desde_config(config):
+    """
+    Almacén según la configuración: el del proceso con TESTING, Redis si hay
+    METRICAS_REDIS_URL y si no SQLite en METRICAS_ARCHIVO (por defecto en el
+    directorio temporal). Si el almacén no se puede abrir se usa el del proceso.
+
+    Args:
+        config (Mapping): Configuración de la aplicación (app.config)
+    """
+    if config.get('TESTING'):
+        return AlmacenMetricasMemoria()
+    url_redis = config.get('METRICAS_REDIS_URL')
+    ruta = config.get('METRICAS_ARCHIVO') or os.path.join(tempfile.gettempdir(), 'eventlink-metricas-pasarela.sqlite3')
+    try:
+        if url_redis:
+            return AlmacenMetricasRedis(url_redis)
+        return AlmacenMetricasSqlite(ruta)
+    except Exception as e:
+        logger.warning("Métricas solo del proceso actual, no se pudo abrir el almacén compartido: %s", e)
+        return AlmacenMetricasMemoria()
+
+
+class RegistroMetricas:
+    """
+    Contadores por hilo que se envían periódicamente a un almacén compartido.
+
+    Registrar una llamada no toma locks: cada hilo escribe en su propio dict. El
+    envío (hilo de fondo cada `intervalo` segundos, al salir del proceso o al pedir
+    un resumen) resta lo ya enviado de cada hilo y suma la diferencia al almacén.
+    Sin `almacen`, se crea con almacen_desde_config() la primera vez que se usa.
+    """
+
+    _instancias = weakref.WeakSet()
+
+    def __init__(self, almacen=None, intervalo=5.0, limites_ms=LIMITES_LATENCIA_MS):
+        self._almacen = almacen
+        self._config = {}
+        self.intervalo = intervalo
+        self.limites_ms = tuple(limites_ms)
+        self._local = threading.local()
+        self._hilos = []    # [hilo, contadores, enviado]
+        self._lock = threading.Lock()   # solo para registrar hilos y enviar
+        self._lock_almacen = threading.Lock()
+        self._vaciador = None
+        self._pid = os.getpid()
+        RegistroMetricas._instancias.add(self)
+        atexit.register(self.vaciar)
+
+    def init_app(self, app):
+        # lee la configuración; el almacén se abre en el primer envío o lectura
+        self._config = {clave: app.config.get(clave)
+                        for clave in ('TESTING', 'METRICAS_REDIS_URL', 'METRICAS_ARCHIVO')}
+        self.intervalo = app.config.get('METRICAS_INTERVALO', self.intervalo)
+        with self._lock_almacen:
+            self._almacen = None
+
+    @property
+    def almacen(self):
+        if self._almacen is None:
+            with self._lock_almacen:
+                if self._almacen is None:
+                    self._almacen = almacen_desde_config(self._config)
+        return self._almacen
+
+    def _contadores(self):
+        contadores = getattr(self._local, 'contadores', None)
+        if contadores is None or self._local.pid != os.getpid():
+            contadores = {}
+            self._local.contadores = contadores
+            self._local.pid = os.getpid()
+            with self._lock:
+                self._hilos.append([threading.current_thread(), contadores, {}])
+                self._iniciar_vaciador()
+        return contadores
+
+    def _iniciar_vaciador(self):
+        # uno por proceso; tras un fork el hilo del padre no existe en el hijo
+        if self._vaciador is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._vaciador = threading.Thread(target=self._vaciar_periodicamente,
+                                              name='metricas-pasarela', daemon=True)
+            self._vaciador.start()
+
+    def _vaciar_periodicamente(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.vaciar()
+
+    def incrementar(self, clave, valor=1):
+        contadores = self._contadores()
+        contadores[clave] = contadores.get(clave, 0) + valor
+
+    def observar(self, operacion, segundos, exito):
+        """Registra una llamada de `operacion`: resultado y latencia"""
+        milisegundos = segundos * 1000
+        cubeta = next((f'le_{limite}' for limite in self.limites_ms if milisegundos <= limite), 'le_inf')
+        contadores = self._contadores()
+        for clave, valor in ((f'{operacion}.{"exitos" if exito else "fallos"}', 1),
+                             (f'{operacion}.latencia_ms', milisegundos),
+                             (f'{operacion}.{cubeta}', 1)):
+            contadores[clave] = contadores.get(clave, 0) + valor
+
+    def vaciar(self):
+        """Envía al almacén lo acumulado desde el último envío; retorna las claves enviadas"""
+        with self._lock:
+            deltas = {}
+            copias = []
+            for registro in self._hilos:
+                hilo, contadores, enviado = registro
+                # dict.copy es atómico con el GIL; el hilo puede seguir sumando
+                actual = contadores.copy()
+                for clave, valor in actual.items():
+                    diferencia = valor - enviado.get(clave, 0)
+                    if diferencia:
+                        deltas[clave] = deltas.get(clave, 0) + diferencia
+                copias.append((registro, actual))
+
+            if deltas:
+                try:
+                    self.almacen.sumar(deltas)
+                except Exception as e:
+                    # se reintenta en el siguiente envío con lo acumulado
+                    logger.warning("No se pudieron enviar las métricas de la pasarela: %s", e)
+                    return 0
+
+            for registro, actual in copias:
+                registro[2] = actual
+            # hilos terminados (p. ej. un hilo por petición) ya enviados por completo
+            self._hilos = [registro for registro in self._hilos
+                           if registro[0].is_alive() or registro[1] != registro[2]]
+            return len(deltas)
+
+    def reiniciar(self):
+        """Descarta lo acumulado en este proceso y limpia el almacén compartido"""
+        with self._lock:
+            for registro in self._hilos:
+                registro[2] = registro[1].copy()
+            self.almacen.limpiar()
+
+    def _percentil(self, cubetas, total, fraccion):
+        # interpolación lineal dentro de la cubeta que contiene el percentil
+        objetivo = total * fraccion
+        acumulado = 0
+        inferior = 0
+        for limite in self.limites_ms:
+            cantidad = cubetas.get(f'le_{limite}', 0)
+            if cantidad and acumulado + cantidad >= objetivo:
+                return round(inferior + (limite - inferior) * (objetivo - acumulado) / cantidad, 1)
+            acumulado += cantidad
+            inferior = limite
+        return float(self.limites_ms[-1])
+
+    def _histograma(self, campos):
+        histograma = {f'<={limite}': int(campos.get(f'le_{limite}', 0)) for limite in self.limites_ms}
+        histograma[f'>{self.limites_ms[-1]}'] = int(campos.get('le_inf', 0))
+        return histograma
+
+    def resumen(self):
+        """
+        Métricas agregadas de todos los workers (envía antes las de este proceso).
+
+        Returns:
+            dict: desde, segundos y por operación llamadas, éxitos, fallos, tasa de
+                  fallos, llamadas por minuto, latencia media/p50/p95/p99 e histograma
+        """
+        self.vaciar()
+        valores = self.almacen.leer()
+        desde = valores.pop(CLAVE_DESDE, None)
+        segundos = max(time.time() - desde, 1) if desde else 0
+
+        por_operacion = {}
+        for clave, valor in valores.items():
+            operacion, _, campo = clave.rpartition('.')
+            por_operacion.setdefault(operacion, {})[campo] = valor
+
+        operaciones = {}
+        for operacion, campos in sorted(por_operacion.items()):
+            exitos = int(campos.get('exitos', 0))
+            fallos = int(campos.get('fallos', 0))
+            llamadas = exitos + fallos
+            operaciones[operacion] = {
+                'llamadas': llamadas,
+                'exitos': exitos,
+                'fallos': fallos,
+                'tasa_fallos': round(fallos / llamadas, 4) if llamadas else 0.0,
+                'por_minuto': round(llamadas * 60 / segundos, 2) if segundos else 0.0,
+                'latencia_ms': {
+                    'media': round(campos.get('latencia_ms', 0) / llamadas, 1) if llamadas else 0.0,
+                    'p50': self._percentil(campos, llamadas, 0.5) if llamadas else 0.0,
+                    'p95': self._percentil(campos, llamadas, 0.95) if llamadas else 0.0,
+                    'p99': self._percentil(campos, llamadas, 0.99) if llamadas else 0.0,
+                },
+                'histograma': self._histograma(campos)
+            }
+
+        return {
+            'desde': datetime.utcfromtimestamp(desde).isoformat() if desde else None,
+            'segundos': round(segundos, 1),
+            'operaciones': operaciones
+        }
+
+
+def medir(operacion):
+    """
+    Decorador para métodos de un objeto con atributo `metricas` (RegistroMetricas):
+    registra la latencia y si el resultado (dict) trae success verdadero.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(self, *args, **kwargs):
+            inicio = time.perf_counter()
+            exito = False
+            try:
+                resultado = funcion(self, *args, **kwargs)
+                exito = isinstance(resultado, dict) and bool(resultado.get('success'))
+                return resultado
+            finally:
+                self.metricas.observar(operacion, time.perf_counter() - inicio, exito)
+        return envoltura
+    return decorador
+
+
+def _reiniciar_despues_de_fork():
+    # el hijo no hereda el hilo de envío y no debe volver a enviar lo del padre
+    for registro in list(RegistroMetricas._instancias):
+        registro._lock = threading.Lock()
+        registro._lock_almacen = threading.Lock()
+        registro._hilos = []
+        registro._vaciador = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_despues_de_fork)
@@ -1,61 +1,155 @@
-
+import functools
+import logging
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional
 from models.notificacion import Notificacion, TipoNotificacion
 from models.usuario import Usuario
 from database import db
 
+logger = logging.getLogger(__name__)
+
+# cache en memoria de preferencias de notificación: usuario_id -> (expira, preferencias)
+# se invalida al editar el perfil en este proceso; en los demás workers dura como máximo el TTL
+TTL_PREFERENCIAS = 30
+_cache_preferencias = {}
+_lock_preferencias = threading.Lock()
+_version_preferencias = 0
+
+def invalidar_preferencias(usuario_id: int):
+    """Descarta las preferencias cacheadas de un usuario (llamar al cambiar su perfil)"""
+    global _version_preferencias
+    with _lock_preferencias:
+        _cache_preferencias.pop(usuario_id, None)
+        _version_preferencias += 1
+
+class ContextoDespacho:
+    """
+    Preferencias de los destinatarios de un lote de notificaciones.
+    
+    Se cargan una sola vez por lote (cache y una consulta IN para los que faltan) y
+    los observadores las leen de aquí en lugar de consultar cada uno al usuario.
+    """
+    
+    def __init__(self, preferencias: Optional[Dict[int, Any]] = None):
+        self._preferencias = dict(preferencias or {})
+    
+    @classmethod
+    def cargar(cls, usuario_ids: Iterable[int]) -> 'ContextoDespacho':
+        """Contexto con las preferencias de `usuario_ids` (None si el usuario no existe)"""
+        ahora = time.monotonic()
+        preferencias = {}
+        faltantes = []
+        with _lock_preferencias:
+            version = _version_preferencias
+            for usuario_id in set(usuario_ids):
+                en_cache = _cache_preferencias.get(usuario_id)
+                if en_cache and en_cache[0] > ahora:
+                    preferencias[usuario_id] = en_cache[1]
+                else:
+                    faltantes.append(usuario_id)
+        
+        if faltantes:
+            cargadas = dict.fromkeys(faltantes)
+            filas = db.session.query(
+                Usuario.id, Usuario.nombre, Usuario.correo, Usuario.activo,
+                Usuario.notificaciones_email, Usuario.notificaciones_push
+            ).filter(Usuario.id.in_(faltantes)).all()
+            for fila in filas:
+                cargadas[fila.id] = {
+                    'nombre': fila.nombre,
+                    'correo': fila.correo,
+                    'activo': fila.activo is not False,
+                    'email': bool(fila.notificaciones_email),
+                    'push': bool(fila.notificaciones_push)
+                }
+            preferencias.update(cargadas)
+            
+            with _lock_preferencias:
+                # si un perfil cambió mientras se consultaba, no se cachea lo leído
+                if version == _version_preferencias:
+                    for usuario_id, valores in cargadas.items():
+                        _cache_preferencias[usuario_id] = (ahora + TTL_PREFERENCIAS, valores)
+                if len(_cache_preferencias) > 10000:
+                    # descartar entradas vencidas para que la cache no crezca sin limite
+                    for clave in [c for c, (expira, _) in _cache_preferencias.items() if expira <= ahora]:
+                        del _cache_preferencias[clave]
+        
+        return cls(preferencias)
+    
+    def preferencias(self, usuario_id: int) -> Optional[Dict[str, Any]]:
+        """nombre, correo, activo, email y push del usuario (None si no existe)"""
+        if usuario_id not in self._preferencias:
+            # usuario fuera del lote (p. ej. si no se pudo cargar el lote completo)
+            self._preferencias.update(ContextoDespacho.cargar([usuario_id])._preferencias)
+        return self._preferencias[usuario_id]
+
 class NotificacionObserver(ABC):
     """Interfaz abstracta para observadores de notificaciones"""
     
+    # si la entrega queda pendiente al detener el proceso se guarda para reenviarla
+    durable = True
+    
     @abstractmethod
-    def actualizar(self, notificacion: Notificacion):
+    def actualizar(self, notificacion: Notificacion, contexto: Optional[ContextoDespacho] = None):
         """Método que se ejecuta cuando se crea una notificación"""
         pass
 
+def _preferencias_destinatario(notificacion: Notificacion, contexto: Optional[ContextoDespacho]):
+    contexto = contexto or ContextoDespacho.cargar([notificacion.usuario_id])
+    preferencias = contexto.preferencias(notificacion.usuario_id)
+    return preferencias if preferencias and preferencias['activo'] else None
+
 class EmailObserver(NotificacionObserver):
     """Observer para enviar notificaciones por email"""
     
-    def actualizar(self, notificacion: Notificacion):
-        """Envía notificación por email si el usuario lo tiene habilitado"""
-        usuario = Usuario.query.get(notificacion.usuario_id)
+    def actualizar(self, notificacion: Notificacion, contexto: Optional[ContextoDespacho] = None):
+        """Encola el correo de la notificación si el usuario lo tiene habilitado (se envía por lotes)"""
+        from tareas.correo import enviador_correos
+        from tareas.notificaciones import datos_notificacion
         
-        if usuario and usuario.notificaciones_email:
-            # Aquí se implementaría el envío real de email
-            print(f"[EMAIL] Email enviado a {usuario.correo}: {notificacion.titulo}")
-            # TODO: Implementar envío real con Flask-Mail
+        preferencias = _preferencias_destinatario(notificacion, contexto)
+        
+        if preferencias and preferencias['email']:
+            # ColaCorreosLlena hace que el despachador reintente más tarde
+            enviador_correos.encolar(preferencias['correo'], preferencias['nombre'], datos_notificacion(notificacion))
 
 class PushObserver(NotificacionObserver):
     """Observer para enviar notificaciones push"""
     
-    def actualizar(self, notificacion: Notificacion):
-        """Envía notificación push si el usuario lo tiene habilitado"""
-        usuario = Usuario.query.get(notificacion.usuario_id)
+    def actualizar(self, notificacion: Notificacion, contexto: Optional[ContextoDespacho] = None):
+        """Encola la notificación push si el usuario lo tiene habilitado (se envía a todos sus navegadores)"""
+        from tareas.push import enviador_push
+        from tareas.notificaciones import datos_notificacion
+        
+        preferencias = _preferencias_destinatario(notificacion, contexto)
         
-        if usuario and usuario.notificaciones_push:
-            # Aquí se implementaría el envío real de push notification
-            print(f"[PUSH] Push notification enviada a {usuario.nombre}: {notificacion.titulo}")
-            # TODO: Implementar envío real con Firebase o similar
+        if preferencias and preferencias['push']:
+            # ColaPushLlena hace que el despachador reintente más tarde
+            enviador_push.encolar(datos_notificacion(notificacion))
 
 class DatabaseObserver(NotificacionObserver):
     """Observer para guardar notificaciones en base de datos"""
     
-    def actualizar(self, notificacion: Notificacion):
-        """Guarda la notificación en la base de datos"""
-        try:
-            db.session.add(notificacion)
-            db.session.commit()
-            print(f"[DB] Notificación guardada en BD: {notificacion.titulo}")
-        except Exception as e:
-            db.session.rollback()
-            print(f"[ERROR] Error al guardar notificación: {e}")
+    def actualizar(self, notificacion: Notificacion, contexto: Optional[ContextoDespacho] = None):
+        """
+        Agrega la notificación al buffer que se guarda en la base de datos por lotes.
+        Si el escritor no logra guardarla la aparta como fallida de este observador.
+        """
+        from tareas.escritura_notificaciones import escritor_notificaciones, fila_notificacion
+        
+        escritor_notificaciones.agregar(fila_notificacion(notificacion))
+        logger.debug("Notificación encolada para guardar en BD", extra={'datos': {'usuario_id': notificacion.usuario_id}})
 
 class LogObserver(NotificacionObserver):
     """Observer para logging de notificaciones"""
     
-    def actualizar(self, notificacion: Notificacion):
+    durable = False
+    
+    def actualizar(self, notificacion: Notificacion, contexto: Optional[ContextoDespacho] = None):
         """Registra la notificación en logs"""
-        print(f"📝 LOG: Notificación {notificacion.tipo.value} para usuario {notificacion.usuario_id}")
+        logger.info("Notificación creada", extra={'datos': {'tipo': notificacion.tipo.value, 'usuario_id': notificacion.usuario_id}})
 
 class SistemaNotificaciones:
     """Sistema central de notificaciones que implementa el patrón Observer"""
@@ -73,23 +167,34 @@ class SistemaNotificaciones:
         """Registra un nuevo observador"""
         if observador not in self._observadores:
             self._observadores.append(observador)
-            print(f"[OK] Observador registrado: {type(observador).__name__}")
+            logger.debug("Observador registrado: %s", type(observador).__name__)
     
     def desregistrar_observador(self, observador: NotificacionObserver):
         """Desregistra un observador"""
         if observador in self._observadores:
             self._observadores.remove(observador)
-            print(f"[OK] Observador desregistrado: {type(observador).__name__}")
+            logger.debug("Observador desregistrado: %s", type(observador).__name__)
+    
+    @property
+    def observadores(self) -> List[NotificacionObserver]:
+        """Observadores registrados (copia)"""
+        return list(self._observadores)
     
-    def notificar_observadores(self, notificacion: Notificacion):
-        """Notifica a todos los observadores registrados"""
-        print(f"[NOTIFY] Notificando a {len(self._observadores)} observadores...")
+    def notificar_observadores(self, notificacion: Notificacion) -> bool:
+        """
+        Encola la notificación para entregarla a todos los observadores registrados.
         
-        for observador in self._observadores:
-            try:
-                observador.actualizar(notificacion)
-            except Exception as e:
-                print(f"[ERROR] Error en observador {type(observador).__name__}: {e}")
+        La entrega (con reintentos por observador) ocurre en los hilos del
+        despachador; la petición solo paga el encolado. Retorna False si se entregó
+        en el mismo hilo (modo síncrono o cola llena).
+        """
+        from tareas.notificaciones import despachador_notificaciones, datos_notificacion
+        from tareas.agrupacion import agrupador_notificaciones
+        
+        logger.debug("Notificando a %d observadores", len(self._observadores))
+        # los tipos con agrupación pueden quedar en la ventana y llegar en el resumen
+        return agrupador_notificaciones.enviar(datos_notificacion(notificacion),
+                                               functools.partial(despachador_notificaciones.encolar, self))
     
     def crear_notificacion(self, titulo: str, mensaje: str, tipo: TipoNotificacion, 
                           usuario_id: int, **kwargs) -> Notificacion:
@@ -127,14 +232,27 @@ class SistemaNotificaciones:
         if self._configuracion_global['logging']:
             self.registrar_observador(LogObserver())
         
-        print("[OK] Sistema de notificaciones configurado")
+        logger.debug("Sistema de notificaciones configurado")
     
     def obtener_estadisticas(self) -> Dict[str, Any]:
-        """Obtiene estadísticas del sistema de notificaciones"""
+        """Obtiene estadísticas del sistema de notificaciones (y del despacho en este proceso)"""
+        from tareas.notificaciones import despachador_notificaciones
+        from tareas.escritura_notificaciones import escritor_notificaciones
+        from tareas.correo import enviador_correos
+        from tareas.push import enviador_push
+        from tareas.tiempo_real import bus_notificaciones
+        from tareas.agrupacion import agrupador_notificaciones
+        
         return {
             'observadores_registrados': len(self._observadores),
             'tipos_observadores': [type(obs).__name__ for obs in self._observadores],
-            'configuracion': self._configuracion_global
+            'configuracion': self._configuracion_global,
+            'despacho': despachador_notificaciones.estadisticas(),
+            'escritura': escritor_notificaciones.estadisticas(),
+            'correo': enviador_correos.estadisticas(),
+            'push': enviador_push.estadisticas(),
+            'tiempo_real': bus_notificaciones.estadisticas(),
+            'agrupacion': agrupador_notificaciones.estadisticas()
         }
 
 # Instancia global del sistema de notificaciones
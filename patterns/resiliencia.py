@@ -0,0 +1,217 @@
+# patterns/resiliencia.py
+"""
+Patrones de resiliencia para llamadas a servicios externos (MercadoPago)
+
+- InterruptorCircuito: deja de llamar a un servicio que está fallando y responde de
+  inmediato hasta que pase la espera; luego deja pasar una llamada de prueba.
+- PresupuestoReintentos: limita los reintentos a una fracción de las llamadas, para
+  que una caída del servicio no multiplique el tráfico que recibe.
+- espera_con_jitter: backoff exponencial con jitter completo entre reintentos.
+
+Todos son seguros entre hilos y se comparten en el proceso (un worker de gunicorn).
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitoAbierto(Exception):
+    """El interruptor está abierto: la llamada no se hizo"""
+
+
+class InterruptorCircuito:
+    """
+    Interruptor de circuito por tasa de errores en una ventana de tiempo.
+
+    cerrado:     las llamadas pasan; si en la ventana hay al menos minimo_llamadas y la
+                 fracción de fallos supera el umbral, se abre.
+    abierto:     las llamadas se rechazan sin tocar el servicio durante espera_apertura.
+    semiabierto: pasa una llamada de prueba; si funciona se cierra, si falla se abre de nuevo.
+    """
+
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    SEMIABIERTO = 'semiabierto'
+
+    _instancias = weakref.WeakSet()
+
+    def __init__(self, nombre, umbral_errores=0.5, minimo_llamadas=10, ventana_segundos=30.0,
+                 espera_apertura=15.0):
+        self.nombre = nombre
+        self.umbral_errores = umbral_errores
+        self.minimo_llamadas = minimo_llamadas
+        self.ventana_segundos = ventana_segundos
+        self.espera_apertura = espera_apertura
+        self._lock = threading.Lock()
+        self._resultados = deque()   # (instante, exito)
+        self._estado = self.CERRADO
+        self._abierto_desde = None
+        self._prueba_en_curso = False
+        self._metricas = {'aperturas': 0, 'rechazadas': 0, 'exitos': 0, 'fallos': 0}
+        InterruptorCircuito._instancias.add(self)
+
+    @property
+    def estado(self):
+        with self._lock:
+            return self._estado_actual(time.monotonic())
+
+    def _estado_actual(self, ahora):
+        # pasada la espera, el circuito abierto admite una llamada de prueba
+        if self._estado == self.ABIERTO and ahora - self._abierto_desde >= self.espera_apertura:
+            self._cambiar_estado(self.SEMIABIERTO)
+        return self._estado
+
+    def _cambiar_estado(self, estado):
+        if estado != self._estado:
+            logger.warning("Circuito %s: %s -> %s", self.nombre, self._estado, estado)
+            self._estado = estado
+
+    def _depurar_ventana(self, ahora):
+        limite = ahora - self.ventana_segundos
+        while self._resultados and self._resultados[0][0] < limite:
+            self._resultados.popleft()
+
+    def permitir(self):
+        """
+        Indica si la llamada puede hacerse; si retorna True, el llamador debe
+        informar el resultado con registrar_exito o registrar_fallo.
+        """
+        with self._lock:
+            estado = self._estado_actual(time.monotonic())
+            if estado == self.CERRADO:
+                return True
+            if estado == self.SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            self._metricas['rechazadas'] += 1
+            return False
+
+    def registrar_exito(self):
+        with self._lock:
+            ahora = time.monotonic()
+            self._metricas['exitos'] += 1
+            if self._estado == self.SEMIABIERTO:
+                self._prueba_en_curso = False
+                self._resultados.clear()
+                self._cambiar_estado(self.CERRADO)
+                return
+            self._resultados.append((ahora, True))
+            self._depurar_ventana(ahora)
+
+    def registrar_fallo(self):
+        with self._lock:
+            ahora = time.monotonic()
+            self._metricas['fallos'] += 1
+            if self._estado == self.SEMIABIERTO:
+                self._prueba_en_curso = False
+                self._abrir(ahora)
+                return
+            self._resultados.append((ahora, False))
+            self._depurar_ventana(ahora)
+            total = len(self._resultados)
+            fallos = sum(1 for _, exito in self._resultados if not exito)
+            if self._estado == self.CERRADO and total >= self.minimo_llamadas \
+                    and fallos / total >= self.umbral_errores:
+                self._abrir(ahora)
+
+    def _abrir(self, ahora):
+        self._abierto_desde = ahora
+        self._metricas['aperturas'] += 1
+        self._resultados.clear()
+        self._cambiar_estado(self.ABIERTO)
+
+    def reiniciar(self):
+        """Vuelve a cerrado y descarta la ventana (p. ej. en pruebas)"""
+        with self._lock:
+            self._resultados.clear()
+            self._prueba_en_curso = False
+            self._abierto_desde = None
+            self._estado = self.CERRADO
+
+    def metricas(self):
+        """Estado actual, llamadas y fallos en la ventana y contadores acumulados"""
+        with self._lock:
+            ahora = time.monotonic()
+            estado = self._estado_actual(ahora)
+            self._depurar_ventana(ahora)
+            total = len(self._resultados)
+            fallos = sum(1 for _, exito in self._resultados if not exito)
+            return dict(
+                self._metricas,
+                nombre=self.nombre,
+                estado=estado,
+                llamadas_ventana=total,
+                fallos_ventana=fallos,
+                tasa_errores=round(fallos / total, 3) if total else 0.0,
+                segundos_abierto=round(ahora - self._abierto_desde, 1) if estado != self.CERRADO else 0
+            )
+
+
+class PresupuestoReintentos:
+    """
+    Presupuesto de reintentos compartido (cubeta de fichas).
+
+    Cada llamada deposita `proporcion` fichas y cada reintento gasta una; además se
+    reponen `minimo_por_segundo` fichas por segundo para que con poco tráfico se
+    pueda reintentar. Con proporcion=0.1 los reintentos suman como mucho ~10% extra.
+    """
+
+    _instancias = weakref.WeakSet()
+
+    def __init__(self, proporcion=0.1, minimo_por_segundo=1.0, maximo=10.0):
+        self.proporcion = proporcion
+        self.minimo_por_segundo = minimo_por_segundo
+        self.maximo = maximo
+        self._fichas = maximo
+        self._ultima_reposicion = time.monotonic()
+        self._lock = threading.Lock()
+        self._metricas = {'reintentos': 0, 'denegados': 0}
+        PresupuestoReintentos._instancias.add(self)
+
+    def _reponer(self, ahora):
+        transcurrido = ahora - self._ultima_reposicion
+        self._ultima_reposicion = ahora
+        self._fichas = min(self.maximo, self._fichas + transcurrido * self.minimo_por_segundo)
+
+    def registrar_llamada(self):
+        with self._lock:
+            self._reponer(time.monotonic())
+            self._fichas = min(self.maximo, self._fichas + self.proporcion)
+
+    def retirar(self):
+        """Retorna True si queda presupuesto para un reintento (y lo descuenta)"""
+        with self._lock:
+            self._reponer(time.monotonic())
+            if self._fichas >= 1:
+                self._fichas -= 1
+                self._metricas['reintentos'] += 1
+                return True
+            self._metricas['denegados'] += 1
+            return False
+
+    def metricas(self):
+        with self._lock:
+            self._reponer(time.monotonic())
+            return dict(self._metricas, fichas=round(self._fichas, 2))
+
+
+def espera_con_jitter(intento, base=0.1, maximo=2.0):
+    """Segundos a esperar antes del reintento número `intento` (desde 0), con jitter completo"""
+    return random.uniform(0, min(maximo, base * (2 ** intento)))
+
+
+def _reiniciar_locks_despues_de_fork():
+    # un lock tomado por otro hilo en el padre quedaría bloqueado para siempre en el hijo
+    for instancia in list(InterruptorCircuito._instancias) + list(PresupuestoReintentos._instancias):
+        instancia._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_locks_despues_de_fork)
@@ -1,7 +1,20 @@
+import logging
 import os
+import threading
 import time
+import uuid
+import weakref
+from datetime import datetime, timedelta, timezone
 import mercadopago
+import requests
 from flask import current_app
+from mercadopago.config import RequestOptions
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+from patterns.metricas import RegistroMetricas, medir
+from patterns.resiliencia import InterruptorCircuito, PresupuestoReintentos, espera_con_jitter
+
+logger = logging.getLogger(__name__)
 
 class DatabaseManager:
     # singleton para gestion de conexiones a bd
@@ -17,12 +30,157 @@ class DatabaseManager:
     def __init__(self):
         if not self._inicializado:
             self._inicializado = True
-            print("[OK] DatabaseManager inicializado (Singleton)")
+            logger.debug("DatabaseManager inicializado (Singleton)")
     
     def get_connection(self):
         # obtiene una conexion a la base de datos
         return current_app.db
 
+# prefijo de las URLs que arma el SDK (mercadopago.config.Config.api_base_url)
+URL_API_MERCADOPAGO = "https://api.mercadopago.com"
+
+# respuestas que indican un problema del servicio (no de la petición)
+ESTADOS_FALLO_SERVICIO = {429, 500, 502, 503, 504}
+
+class ClienteHttpMercadoPago(HttpClient):
+    """
+    Cliente HTTP para el SDK de MercadoPago con una sesión persistente por proceso.
+
+    El HttpClient del SDK abre una requests.Session nueva en cada llamada, con lo que
+    cada pago paga de nuevo la conexión TCP y el handshake TLS. Este cliente reutiliza
+    una sola sesión con keep-alive y un pool acotado de conexiones (pool_block=True:
+    en una ráfaga las peticiones esperan una conexión libre en lugar de abrir sockets
+    sin límite), y usa timeouts separados de conexión y de lectura.
+
+    La sesión se recrea en el proceso hijo después de un fork (os.register_at_fork),
+    para que los workers no compartan sockets heredados del proceso padre.
+
+    Cada llamada tiene un plazo total (incluidos los reintentos) y pasa por un
+    interruptor de circuito compartido: si MercadoPago falla o no responde, las
+    llamadas siguientes responden 503 al instante en lugar de ocupar un worker
+    hasta el timeout. Los reintentos (GET, o POST con x-idempotency-key) esperan
+    con jitter y consumen un presupuesto común.
+    """
+
+    _instancias = weakref.WeakSet()
+
+    def __init__(self, timeout_conexion=3.05, timeout_lectura=20.0, tamano_pool=10, reintentos=2, url_base=None,
+                 plazo=15.0, interruptor=None, presupuesto=None):
+        self.timeout = (timeout_conexion, timeout_lectura)
+        self.plazo = plazo
+        self.interruptor = interruptor or InterruptorCircuito('mercadopago')
+        self.presupuesto = presupuesto or PresupuestoReintentos()
+        # otra API compatible (p. ej. simuladores.mercadopago); el SDK siempre arma URLs de la real
+        self.url_base = url_base.rstrip('/') if url_base else None
+        self.tamano_pool = tamano_pool
+        self.reintentos = reintentos
+        self._sesion = None
+        self._pid = None
+        self._lock = threading.Lock()
+        ClienteHttpMercadoPago._instancias.add(self)
+
+    def _crear_sesion(self):
+        # sin reintentos en el adaptador: los hace request() dentro del plazo y el presupuesto
+        adaptador = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.tamano_pool,
+            pool_block=True,
+            max_retries=0
+        )
+        sesion = requests.Session()
+        sesion.mount('https://', adaptador)
+        sesion.mount('http://', adaptador)
+        return sesion
+
+    def obtener_sesion(self):
+        # retorna la sesion del proceso actual, creandola si no existe
+        if self._sesion is None or self._pid != os.getpid():
+            with self._lock:
+                if self._sesion is None or self._pid != os.getpid():
+                    self._sesion = self._crear_sesion()
+                    self._pid = os.getpid()
+        return self._sesion
+
+    def reiniciar(self):
+        # descarta la sesion actual; la siguiente peticion abre conexiones nuevas
+        sesion, self._sesion, self._pid = self._sesion, None, None
+        if sesion is not None:
+            sesion.close()
+
+    @classmethod
+    def _reiniciar_despues_de_fork(cls):
+        # en el hijo no se cierran los sockets heredados (siguen siendo del padre)
+        for cliente in list(cls._instancias):
+            cliente._sesion = None
+            cliente._pid = None
+            cliente._lock = threading.Lock()
+
+    def _reintentable(self, method, kwargs):
+        # un POST solo se repite si lleva clave de idempotencia (MercadoPago no lo duplica)
+        encabezados = {nombre.lower() for nombre in (kwargs.get('headers') or {})}
+        return method.upper() == 'GET' or 'x-idempotency-key' in encabezados
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        # maxretries del SDK se ignora: los reintentos los define este cliente
+        if self.url_base and url.startswith(URL_API_MERCADOPAGO):
+            url = self.url_base + url[len(URL_API_MERCADOPAGO):]
+        reintentable = self._reintentable(method, kwargs)
+        limite = time.monotonic() + self.plazo
+        self.presupuesto.registrar_llamada()
+
+        intento = 0
+        while True:
+            if not self.interruptor.permitir():
+                return {"status": 503, "response": {
+                    "message": "Servicio de pagos no disponible temporalmente (circuito abierto)",
+                    "error": "circuit_open", "status": 503
+                }}
+
+            restante = limite - time.monotonic()
+            kwargs['timeout'] = (min(self.timeout[0], restante), min(self.timeout[1], restante))
+            error, api_result = None, None
+            try:
+                api_result = self.obtener_sesion().request(method, url, **kwargs)
+            except Exception as e:
+                error = e
+
+            fallo = error is not None or api_result.status_code in ESTADOS_FALLO_SERVICIO
+            if fallo:
+                self.interruptor.registrar_fallo()
+            else:
+                self.interruptor.registrar_exito()
+
+            error_de_red = error is None or isinstance(error, requests.RequestException)
+            if fallo and reintentable and error_de_red and intento < self.reintentos:
+                espera = espera_con_jitter(intento)
+                retry_after = api_result.headers.get('Retry-After') if api_result is not None else None
+                if retry_after and retry_after.isdigit():
+                    espera = max(espera, float(retry_after))
+                # solo si al reintento le queda al menos medio segundo de plazo y hay presupuesto
+                if limite - time.monotonic() - espera > 0.5 and self.presupuesto.retirar():
+                    time.sleep(espera)
+                    intento += 1
+                    continue
+
+            if error is not None:
+                raise error
+            break
+
+        response = {"status": api_result.status_code, "response": None}
+
+        if api_result.status_code != 204 and api_result.content:
+            try:
+                response["response"] = api_result.json()
+            except ValueError as e:
+                logger.warning("Respuesta de MercadoPago no es JSON", extra={'datos': {'status_http': api_result.status_code, 'error': str(e)}})
+
+        return response
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=ClienteHttpMercadoPago._reiniciar_despues_de_fork)
+
+
 class PaymentGateway:
     # singleton para gestion de pagos con mercadopago
     
@@ -38,14 +196,38 @@ class PaymentGateway:
         if not self._inicializado:
             self._mercadopago_configurado = False
             self._mercadopago_token = None
-            self._estadisticas = {
-                'pagos_mercadopago': 0,
-                'pagos_exitosos': 0,
-                'pagos_fallidos': 0
-            }
+            self._cliente_http = ClienteHttpMercadoPago(
+                timeout_conexion=float(os.environ.get('MERCADOPAGO_TIMEOUT_CONEXION', 3.05)),
+                timeout_lectura=float(os.environ.get('MERCADOPAGO_TIMEOUT_LECTURA', 20)),
+                tamano_pool=int(os.environ.get('MERCADOPAGO_POOL_CONEXIONES', 10)),
+                reintentos=int(os.environ.get('MERCADOPAGO_REINTENTOS', 2)),
+                url_base=os.environ.get('MERCADOPAGO_API_URL'),
+                plazo=float(os.environ.get('MERCADOPAGO_PLAZO', 15)),
+                interruptor=InterruptorCircuito(
+                    'mercadopago',
+                    umbral_errores=float(os.environ.get('MERCADOPAGO_CIRCUITO_UMBRAL', 0.5)),
+                    minimo_llamadas=int(os.environ.get('MERCADOPAGO_CIRCUITO_MINIMO', 10)),
+                    ventana_segundos=float(os.environ.get('MERCADOPAGO_CIRCUITO_VENTANA', 30)),
+                    espera_apertura=float(os.environ.get('MERCADOPAGO_CIRCUITO_ESPERA', 15))
+                ),
+                presupuesto=PresupuestoReintentos(
+                    proporcion=float(os.environ.get('MERCADOPAGO_PRESUPUESTO_REINTENTOS', 0.1))
+                )
+            )
+            self._sdks = {}
+            # las preferencias de checkout pro vencen; mientras estén vigentes se reutilizan
+            self.vigencia_preferencia = timedelta(minutes=int(os.environ.get('MERCADOPAGO_PREFERENCIA_MINUTOS', 1440)))
+            # éxitos, fallos y latencia por operación, agregados entre workers
+            # (el almacén se elige en init_app con la configuración de la aplicación)
+            self.metricas = RegistroMetricas()
             self._configurar_pasarelas()
             self._inicializado = True
     
+    def init_app(self, app):
+        # configura el almacén de métricas de la pasarela
+        self.metricas.init_app(app)
+        app.extensions['payment_gateway'] = self
+    
     def _configurar_pasarelas(self):
         # configura mercadopago desde cero
         mp_token = os.environ.get('MERCADOPAGO_ACCESS_TOKEN')
@@ -53,28 +235,67 @@ class PaymentGateway:
         # si no hay token en variables de entorno, usar token fijo para pruebas
         if not mp_token or not mp_token.strip():
             mp_token = "TEST-4157849620035829-091318-914e52c84a25ee69d717188c213520c2-812982447"
-            print("[WARN] Usando token de prueba fijo ")
+            logger.warning("Usando token de prueba fijo de MercadoPago")
         
         if mp_token and mp_token.strip():
             self._mercadopago_token = mp_token.strip()
             self._mercadopago_configurado = True
             
             # determinar si es token de prueba o produccion
-            if mp_token.startswith('TEST-'):
-                print("[OK] MercadoPago configurado - MODO PRUEBA")
-                print(f"   - Token: {mp_token[:20]}...")
-                print("   - Modo: SANDBOX")
-            else:
-                print("[OK] MercadoPago configurado - MODO PRODUCCION")
-                print(f"   - Token: {mp_token[:20]}...")
-                print("   - Modo: PRODUCCIÓN")
+            logger.info("MercadoPago configurado", extra={'datos': {
+                'modo': 'sandbox' if mp_token.startswith('TEST-') else 'produccion'
+            }})
         else:
-            print("[ERROR] MercadoPago NO configurado")
-            print("   - Configura la variable de entorno MERCADOPAGO_ACCESS_TOKEN")
-            print("   - Obtén tu token en: https://www.mercadopago.com.co/developers")
+            logger.error("MercadoPago NO configurado: define MERCADOPAGO_ACCESS_TOKEN "
+                         "(https://www.mercadopago.com.co/developers)")
             self._mercadopago_configurado = False
     
-    def procesar_pago_mercadopago(self, monto, descripcion, email_pagador, datos_tarjeta=None):
+    def obtener_sdk(self, access_token=None):
+        """
+        Retorna el SDK de MercadoPago para el token indicado (por defecto el del gateway).
+
+        Los SDK se crean una sola vez por token y comparten el cliente HTTP del gateway,
+        así que todas las llamadas reutilizan las mismas conexiones.
+
+        Args:
+            access_token (str): Token de acceso de MercadoPago
+
+        Returns:
+            mercadopago.SDK: SDK configurado, o None si no hay token
+        """
+        access_token = access_token or self._mercadopago_token
+        if not access_token:
+            return None
+
+        sdk = self._sdks.get(access_token)
+        if sdk is None:
+            opciones = RequestOptions(
+                connection_timeout=float(self._cliente_http.timeout[1]),
+                max_retries=self._cliente_http.reintentos
+            )
+            sdk = mercadopago.SDK(access_token, http_client=self._cliente_http, request_options=opciones)
+            # configurar modo sandbox si es token de prueba
+            sdk.sandbox = access_token.startswith('TEST-')
+            self._sdks[access_token] = sdk
+        return sdk
+
+    def opciones_peticion(self, clave_idempotencia=None):
+        # opciones por llamada: sin clave se usan las del sdk (que generan una clave aleatoria)
+        if not clave_idempotencia:
+            return None
+        return RequestOptions(
+            access_token=self._mercadopago_token,
+            connection_timeout=float(self._cliente_http.timeout[1]),
+            max_retries=self._cliente_http.reintentos,
+            custom_headers={'x-idempotency-key': clave_idempotencia}
+        )
+    
+    def reiniciar_conexiones(self):
+        # cierra las conexiones abiertas con mercadopago (se reabren en la siguiente llamada)
+        self._cliente_http.reiniciar()
+
+    @medir('preferencia')
+    def procesar_pago_mercadopago(self, monto, descripcion, email_pagador, datos_tarjeta=None, referencia_externa=None, clave_idempotencia=None):
         # procesa un pago usando mercadopago
         if not self._mercadopago_configurado:
             return {
@@ -99,22 +320,12 @@ class PaymentGateway:
             }
         
         try:
-            print(f"🔄 Procesando pago con MercadoPago:")
-            print(f"   - Monto: ${monto}")
-            print(f"   - Descripción: {descripcion}")
-            print(f"   - Email: {email_pagador}")
-            
-            # inicializar sdk de mercadopago
-            sdk = mercadopago.SDK(self._mercadopago_token)
-            
-            # configurar modo sandbox si es token de prueba
-            if self._mercadopago_token.startswith('TEST-'):
-                sdk.sandbox = True
-                print("   - Modo: SANDBOX")
-            else:
-                print("   - Modo: PRODUCCIÓN")
+            # sdk compartido del gateway (conexiones persistentes)
+            sdk = self.obtener_sdk()
             
             # crear preferencia para checkout pro (permite seleccionar metodo de pago)
+            ahora = datetime.now(timezone.utc)
+            expira = ahora + self.vigencia_preferencia
             preferencia = {
                 "items": [
                     {
@@ -127,8 +338,11 @@ class PaymentGateway:
                 "payer": {
                     "email": email_pagador
                 },
-                "external_reference": f"eventlink_{int(time.time())}",
-                "notification_url": "https://webhook.site/mercadopago-eventlink",
+                "external_reference": referencia_externa or f"eventlink_{uuid.uuid4().hex}",
+                "notification_url": os.environ.get('MERCADOPAGO_NOTIFICATION_URL', "https://webhook.site/mercadopago-eventlink"),
+                "expires": True,
+                "expiration_date_from": ahora.isoformat(timespec='milliseconds'),
+                "expiration_date_to": expira.isoformat(timespec='milliseconds'),
                 "back_urls": {
                     "success": "https://webhook.site/mercadopago-success",
                     "failure": "https://webhook.site/mercadopago-failure", 
@@ -143,26 +357,23 @@ class PaymentGateway:
             }
             
             # crear preferencia
-            resultado = sdk.preference().create(preferencia)
+            resultado = sdk.preference().create(preferencia, self.opciones_peticion(clave_idempotencia))
             
             if resultado["status"] == 201:
-                # actualizar estadisticas
-                self._estadisticas['pagos_mercadopago'] += 1
-                self._estadisticas['pagos_exitosos'] += 1
-                
                 # obtener url de pago
                 url_pago = resultado['response'].get('sandbox_init_point', resultado['response']['init_point'])
                 payment_id = resultado['response']['id']
                 
-                print(f"[OK] Preferencia creada exitosamente")
-                print(f"   - ID: {payment_id}")
-                print(f"   - URL: {url_pago}")
+                logger.info("Preferencia creada", extra={'datos': {
+                    'id_preferencia': payment_id, 'referencia': referencia_externa, 'monto': monto
+                }})
                 
                 return {
                     'success': True,
                     'payment_id': payment_id,
                     'id_preferencia': payment_id,
                     'url_pago': url_pago,
+                    'expira': expira.isoformat(),
                     'monto': monto,
                     'metodo': 'mercadopago',
                     'estado': 'pending',
@@ -174,7 +385,9 @@ class PaymentGateway:
                 if "response" in resultado and "message" in resultado["response"]:
                     error_msg = resultado["response"]["message"]
                 
-                print(f"[ERROR] Error: {error_msg}")
+                logger.warning("MercadoPago no creó la preferencia", extra={'datos': {
+                    'status_http': resultado.get('status'), 'referencia': referencia_externa, 'mensaje_mp': error_msg
+                }})
                 
                 return {
                     'success': False,
@@ -183,14 +396,15 @@ class PaymentGateway:
                 }
                 
         except Exception as e:
-            print(f"[ERROR] Error interno: {e}")
+            logger.exception("Error al crear la preferencia", extra={'datos': {'referencia': referencia_externa}})
             return {
                 'success': False,
                 'message': f"Error interno: {str(e)}",
                 'metodo': 'mercadopago'
             }
     
-    def procesar_pago_checkout_api(self, monto, descripcion, token, payment_method_id, installments=1, issuer_id=None, payer=None):
+    @medir('checkout_api')
+    def procesar_pago_checkout_api(self, monto, descripcion, token, payment_method_id, installments=1, issuer_id=None, payer=None, referencia_externa=None, clave_idempotencia=None):
         """
         Procesa un pago usando Checkout API (pago directo con token de tarjeta)
         
@@ -202,6 +416,8 @@ class PaymentGateway:
             installments (int): Numero de cuotas
             issuer_id (str): ID del emisor de la tarjeta
             payer (dict): Datos del pagador
+            referencia_externa (str): external_reference para asociar las notificaciones del pago
+            clave_idempotencia (str): X-Idempotency-Key; MercadoPago no repite un pago con la misma clave
             
         Returns:
             dict: Resultado del pago
@@ -237,21 +453,8 @@ class PaymentGateway:
             }
         
         try:
-            print(f"🔄 Procesando pago con Checkout API:")
-            print(f"   - Monto: ${monto}")
-            print(f"   - Descripción: {descripcion}")
-            print(f"   - Método: {payment_method_id}")
-            print(f"   - Cuotas: {installments}")
-            
-            # inicializar sdk de mercadopago
-            sdk = mercadopago.SDK(self._mercadopago_token)
-            
-            # configurar modo sandbox si es token de prueba
-            if self._mercadopago_token.startswith('TEST-'):
-                sdk.sandbox = True
-                print("   - Modo: SANDBOX")
-            else:
-                print("   - Modo: PRODUCCIÓN")
+            # sdk compartido del gateway (conexiones persistentes)
+            sdk = self.obtener_sdk()
             
             # crear pago directo con checkout api
             payment_data = {
@@ -269,23 +472,22 @@ class PaymentGateway:
             if issuer_id:
                 payment_data["issuer_id"] = issuer_id
             
+            if referencia_externa:
+                payment_data["external_reference"] = referencia_externa
+                payment_data["notification_url"] = os.environ.get('MERCADOPAGO_NOTIFICATION_URL', "https://webhook.site/mercadopago-eventlink")
+            
             # crear pago directo
-            print(f"📤 Enviando datos a MercadoPago: {payment_data}")
-            resultado = sdk.payment().create(payment_data)
-            print(f"📥 Respuesta de MercadoPago: {resultado}")
+            logger.debug("Enviando pago a MercadoPago", extra={'datos': {'datos_pago': payment_data}})
+            resultado = sdk.payment().create(payment_data, self.opciones_peticion(clave_idempotencia))
             
             if resultado["status"] == 201:
-                # actualizar estadisticas
-                self._estadisticas['pagos_mercadopago'] += 1
-                self._estadisticas['pagos_exitosos'] += 1
-                
                 # obtener estado del pago
                 payment_status = resultado['response'].get('status', 'pending')
                 payment_id = resultado['response']['id']
                 
-                print(f"[OK] Pago procesado exitosamente")
-                print(f"   - ID: {payment_id}")
-                print(f"   - Estado: {payment_status}")
+                logger.info("Pago creado en MercadoPago", extra={'datos': {
+                    'payment_id': payment_id, 'estado_mp': payment_status, 'referencia': referencia_externa
+                }})
                 
                 return {
                     'success': True,
@@ -304,34 +506,147 @@ class PaymentGateway:
                 elif "response" in resultado and "cause" in resultado["response"]:
                     error_msg = resultado["response"]["cause"][0].get("description", error_msg)
                 
-                print(f"[ERROR] Error al crear el pago: {error_msg}")
-                print(f"[ERROR] Resultado completo: {resultado}")
+                logger.warning("MercadoPago no creó el pago", extra={'datos': {
+                    'status_http': resultado.get('status'), 'referencia': referencia_externa,
+                    'mensaje_mp': error_msg, 'respuesta': resultado.get('response')
+                }})
                 
                 return {
                     'success': False,
                     'message': f'Error de MercadoPago: {error_msg}',
-                    'metodo': 'mercadopago'
+                    'metodo': 'mercadopago',
+                    # un 5xx (salvo el circuito abierto, que no envía nada) no dice si el pago se creó
+                    'incierto': resultado["status"] >= 500 and (resultado.get("response") or {}).get("error") != "circuit_open"
                 }
                 
+        except Exception:
+            # timeout o conexión caída después de enviar: MercadoPago pudo crear el pago
+            logger.exception("Error en procesar_pago_checkout_api", extra={'datos': {'referencia': referencia_externa}})
+            return {
+                'success': False,
+                'message': 'No se pudo confirmar el pago con MercadoPago',
+                'metodo': 'mercadopago',
+                'incierto': True
+            }
+    
+    @medir('consulta')
+    def consultar_pago(self, payment_id):
+        """
+        Consulta el estado actual de un pago en MercadoPago (GET /v1/payments/{id})
+        
+        Args:
+            payment_id (str): ID del pago en MercadoPago
+            
+        Returns:
+            dict: success, payment_id, estado, estado_detalle, referencia_externa, monto;
+                  o success False y message
+        """
+        if not self._mercadopago_configurado:
+            return {'success': False, 'message': 'MercadoPago no configurado'}
+        
+        try:
+            resultado = self.obtener_sdk().payment().get(payment_id)
         except Exception as e:
-            print(f"[ERROR] Error en procesar_pago_checkout_api: {e}")
+            return {'success': False, 'message': f'Error interno: {str(e)}', 'reintentable': True}
+        
+        respuesta = resultado.get('response') or {}
+        if resultado.get('status') != 200:
             return {
                 'success': False,
-                'message': f'Error interno: {str(e)}',
-                'metodo': 'mercadopago'
+                'message': respuesta.get('message', f"HTTP {resultado.get('status')}"),
+                # 404: el pago no existe (no tiene sentido reintentar); 5xx/429 si
+                'reintentable': resultado.get('status', 500) >= 429
             }
+        
+        return self._info_pago(respuesta)
+    
+    @medir('busqueda')
+    def buscar_pagos_por_referencia(self, referencia):
+        """
+        Busca los pagos de MercadoPago con un external_reference (GET /v1/payments/search).
+        Sirve para pagos locales de los que todavía no se conoce el id de MercadoPago.
+        
+        Args:
+            referencia (str): referencia_pago enviada como external_reference
+            
+        Returns:
+            dict: success y pagos (lista con el formato de consultar_pago, el más reciente
+                  primero); o success False, message y reintentable
+        """
+        if not self._mercadopago_configurado:
+            return {'success': False, 'message': 'MercadoPago no configurado'}
+        
+        try:
+            resultado = self.obtener_sdk().payment().search({
+                'external_reference': referencia,
+                'sort': 'date_created',
+                'criteria': 'desc'
+            })
+        except Exception as e:
+            return {'success': False, 'message': f'Error interno: {str(e)}', 'reintentable': True}
+        
+        respuesta = resultado.get('response') or {}
+        if resultado.get('status') != 200:
+            return {
+                'success': False,
+                'message': respuesta.get('message', f"HTTP {resultado.get('status')}"),
+                'reintentable': resultado.get('status', 500) >= 429
+            }
+        
+        pagos = sorted(respuesta.get('results') or [], key=lambda pago: pago.get('date_created') or '', reverse=True)
+        return {'success': True, 'pagos': [self._info_pago(pago) for pago in pagos]}
+    
+    @staticmethod
+    def _info_pago(respuesta):
+        # datos de un pago de MercadoPago que usan webhooks y conciliación
+        return {
+            'success': True,
+            'payment_id': str(respuesta.get('id')),
+            'estado': respuesta.get('status'),
+            'estado_detalle': respuesta.get('status_detail'),
+            'referencia_externa': respuesta.get('external_reference'),
+            'monto': respuesta.get('transaction_amount')
+        }
     
     def get_estadisticas(self):
-        # retorna estadisticas de pagos
-        return self._estadisticas.copy()
+        # totales de pagos enviados a mercadopago (de todos los workers)
+        operaciones = self.metricas.resumen()['operaciones']
+        envios = [operaciones[nombre] for nombre in ('preferencia', 'checkout_api') if nombre in operaciones]
+        return {
+            'pagos_mercadopago': sum(operacion['llamadas'] for operacion in envios),
+            'pagos_exitosos': sum(operacion['exitos'] for operacion in envios),
+            'pagos_fallidos': sum(operacion['fallos'] for operacion in envios)
+        }
     
-    def reset_estadisticas(self):
-        # reinicia las estadisticas
-        self._estadisticas = {
-            'pagos_mercadopago': 0,
-            'pagos_exitosos': 0,
-            'pagos_fallidos': 0
+    def metricas_pasarela(self):
+        """
+        Métricas de las llamadas a MercadoPago agregadas entre todos los workers.
+
+        Returns:
+            dict: desde, segundos y por operación (preferencia, checkout_api, consulta,
+                  busqueda) llamadas, éxitos, fallos, tasa de fallos, llamadas por
+                  minuto, latencia media/p50/p95/p99 en ms e histograma
+        """
+        return self.metricas.resumen()
+    
+    def estado_resiliencia(self):
+        """
+        Métricas del interruptor de circuito y del presupuesto de reintentos
+        de las llamadas a MercadoPago (de este proceso).
+
+        Returns:
+            dict: circuito (estado, tasa de errores, aperturas, rechazadas...),
+                  reintentos (reintentos, denegados, fichas) y plazo_segundos
+        """
+        return {
+            'circuito': self._cliente_http.interruptor.metricas(),
+            'reintentos': self._cliente_http.presupuesto.metricas(),
+            'plazo_segundos': self._cliente_http.plazo
         }
+    
+    def reset_estadisticas(self):
+        # reinicia las estadisticas (también las de los demás workers)
+        self.metricas.reiniciar()
 
 # instancias globales de singletons
 db_manager = DatabaseManager()
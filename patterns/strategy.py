@@ -1,11 +1,14 @@
 
 
+import logging
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any
 from models.servicio import Servicio
 from models.usuario import Usuario
 from sqlalchemy import and_, or_, desc, asc
 
+logger = logging.getLogger(__name__)
+
 class BusquedaStrategy(ABC):
     """Estrategia abstracta para búsqueda de servicios"""
     
@@ -244,7 +247,7 @@ class BusquedaManager:
         if not estrategia:
             raise ValueError(f"Estrategia de búsqueda '{tipo_busqueda}' no encontrada")
         
-        print(f"🔍 Ejecutando búsqueda: {estrategia.obtener_nombre()}")
+        logger.debug("Ejecutando búsqueda: %s", estrategia.obtener_nombre())
         return estrategia.buscar(query)
     
     def obtener_estrategias_disponibles(self) -> List[str]:
@@ -254,7 +257,7 @@ class BusquedaManager:
     def registrar_estrategia(self, nombre: str, estrategia: BusquedaStrategy):
         """Registra una nueva estrategia de búsqueda"""
         self.estrategias[nombre] = estrategia
-        print(f"✅ Estrategia '{nombre}' registrada")
+        logger.debug("Estrategia '%s' registrada", nombre)
     
     def obtener_estadisticas_busqueda(self, query: Dict[str, Any]) -> Dict[str, Any]:
         """Obtiene estadísticas de búsqueda"""
@@ -16,6 +16,11 @@ def agregar_al_carrito(servicio_id):
     # agrega un servicio al carrito
     return CarritoController.agregar_al_carrito(servicio_id)
 
+@carrito_bp.route('/agregar-multiples', methods=['POST'])
+def agregar_multiples_al_carrito():
+    # agrega varios servicios al carrito para un mismo evento
+    return CarritoController.agregar_multiples_al_carrito()
+
 @carrito_bp.route('/editar/<int:item_id>', methods=['GET', 'POST'])
 def editar_item(item_id):
     # muestra el formulario para editar un item del carrito o procesa la actualización
@@ -0,0 +1,34 @@
+# rutas/monitoreo.py
+"""
+Acceso a las rutas de monitoreo (estado y métricas internas)
+Solo un administrador con sesión iniciada, o un monitor externo que envía
+"Authorization: Bearer <METRICAS_TOKEN>" (si METRICAS_TOKEN está configurado)
+"""
+
+import hmac
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+from models.usuario import RolUsuario
+
+
+def _token_valido():
+    token = current_app.config.get('METRICAS_TOKEN')
+    if not token:
+        return False
+    autorizacion = request.headers.get('Authorization', '')
+    return hmac.compare_digest(autorizacion.encode(), f'Bearer {token}'.encode())
+
+
+def solo_monitoreo(vista):
+    """Decorador: 401 sin sesión, 403 si el usuario no es admin (salvo token de monitoreo)"""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if not _token_valido():
+            if 'user_id' not in session:
+                return jsonify({'error': 'No autenticado'}), 401
+            if session.get('user_rol') != RolUsuario.admin.value:
+                return jsonify({'error': 'Solo administradores pueden acceder'}), 403
+        return vista(*args, **kwargs)
+    return envoltura
@@ -1,8 +1,9 @@
 # rutas de notificaciones
 # rutas para gestion de notificaciones
 
-from flask import Blueprint
+from flask import Blueprint, jsonify
 from controllers.notificacion_controller import NotificacionController
+from rutas.monitoreo import solo_monitoreo
 
 notificacion_bp = Blueprint('notificacion', __name__, url_prefix='/notificaciones')
 
@@ -11,4 +12,17 @@ notificacion_bp.route('/')(NotificacionController.listar_notificaciones)
 notificacion_bp.route('/marcar-leida/<int:notificacion_id>')(NotificacionController.marcar_como_leida)
 notificacion_bp.route('/archivar/<int:notificacion_id>')(NotificacionController.archivar_notificacion)
 notificacion_bp.route('/marcar-todas-leidas')(NotificacionController.marcar_todas_como_leidas)
+notificacion_bp.route('/marcar-leidas', methods=['POST'])(NotificacionController.marcar_seleccionadas_como_leidas)
+notificacion_bp.route('/archivar-leidas', methods=['POST'])(NotificacionController.archivar_leidas_antiguas)
 notificacion_bp.route('/api/no-leidas')(NotificacionController.obtener_notificaciones_no_leidas)
+notificacion_bp.route('/eventos')(NotificacionController.eventos_notificaciones)
+notificacion_bp.route('/push/clave-publica')(NotificacionController.clave_publica_push)
+notificacion_bp.route('/push/suscribir', methods=['POST'])(NotificacionController.suscribir_push)
+notificacion_bp.route('/push/cancelar', methods=['POST'])(NotificacionController.cancelar_push)
+
+@notificacion_bp.route('/metricas-despacho')
+@solo_monitoreo
+def metricas_despacho():
+    # cola, reintentos y fallidas del despacho de notificaciones en este worker (para monitoreo)
+    from patterns.observer import sistema_notificaciones
+    return jsonify(sistema_notificaciones.obtener_estadisticas())
@@ -1,12 +1,17 @@
 # rutas de pagos
 # rutas para gestion de pagos con mercadopago
 
+import logging
+
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from controllers.pago_controller import PagoController
 from models.contratacion import Contratacion
+from rutas.monitoreo import solo_monitoreo
 
 pago_bp = Blueprint('pagos', __name__, url_prefix='/pagos')
 
+logger = logging.getLogger(__name__)
+
 @pago_bp.route('/procesar/<int:contratacion_id>', methods=['GET', 'POST'])
 def procesar_pago(contratacion_id):
     contratacion = Contratacion.query.get_or_404(contratacion_id)
@@ -20,7 +25,7 @@ def procesar_pago(contratacion_id):
             if request.is_json:
                 # datos enviados desde el frontend (MercadoPago Checkout API)
                 datos_json = request.get_json()
-                print(f"📥 Datos recibidos del frontend: {datos_json}")
+                logger.debug("Datos de pago recibidos del frontend", extra={'datos': {'contratacion_id': contratacion_id, 'datos_pago': datos_json}})
 
                 datos_form = {
                     'email_pagador': datos_json.get('email_pagador'),
@@ -29,9 +34,18 @@ def procesar_pago(contratacion_id):
                     'tipo_documento': datos_json.get('tipo_documento'),
                 }
 
-                # procesar con PagoController
-                resultado = PagoController.procesar_pago(contratacion, datos_form, datos_json)
-                print(f"📤 Resultado del procesamiento: {resultado}")
+                # guardar el pago y enviarlo a MercadoPago en segundo plano
+                resultado = PagoController.encolar_pago(contratacion, datos_form, datos_json)
+                logger.info("Pago encolado", extra={'datos': {'contratacion_id': contratacion_id, 'resultado': resultado}})
+                if resultado.get('pendiente'):
+                    respuesta = jsonify(resultado)
+                    respuesta.headers['Retry-After'] = str(resultado['reintentar_en'])
+                    return respuesta, 202
+                if resultado.get('en_proceso'):
+                    # doble envío mientras el primero sigue en curso
+                    respuesta = jsonify(resultado)
+                    respuesta.headers['Retry-After'] = str(resultado['reintentar_en'])
+                    return respuesta, 409
                 return jsonify(resultado)
 
             else:
@@ -60,6 +74,27 @@ def procesar_pago(contratacion_id):
                 flash(f'Error interno: {str(e)}', 'error')
                 return render_template('pagos/pago_sin_sdk.html', contratacion=contratacion)
 
+@pago_bp.route('/trabajo/<id_trabajo>')
+def estado_trabajo(id_trabajo):
+    # estado de un pago enviado en segundo plano (sondeo desde el frontend)
+    return PagoController.estado_trabajo(id_trabajo)
+
+@pago_bp.route('/estado-pasarela')
+@solo_monitoreo
+def estado_pasarela():
+    # estado del circuito y de los reintentos hacia mercadopago (para monitoreo)
+    from patterns.singleton import payment_gateway
+    estado = payment_gateway.estado_resiliencia()
+    codigo = 503 if estado['circuito']['estado'] == 'abierto' else 200
+    return jsonify(estado), codigo
+
+@pago_bp.route('/metricas-pasarela')
+@solo_monitoreo
+def metricas_pasarela():
+    # llamadas, fallos y latencias hacia mercadopago de todos los workers (para monitoreo)
+    from patterns.singleton import payment_gateway
+    return jsonify(payment_gateway.metricas_pasarela())
+
 @pago_bp.route('/detalle/<int:pago_id>')
 def detalle_pago(pago_id):
     # detalle del pago (usando el mismo template que pago_exitoso)
@@ -69,36 +104,13 @@ def detalle_pago(pago_id):
 
 @pago_bp.route('/historial')
 def historial_pagos():
-    # historial de pagos del usuario actual
-    from flask import session
-    from models.pago import Pago
-    from models.contratacion import Contratacion
-    
-    if 'user_id' not in session:
-        flash('Debes iniciar sesión para ver tu historial de pagos', 'error')
-        return redirect(url_for('usuario.login'))
-    
-    # obtener pagos del usuario actual (como organizador o proveedor)
-    from models.servicio import Servicio
-    
-    # Pagos donde el usuario es el organizador (quien paga)
-    pagos_organizador = Pago.query.filter_by(organizador_id=session['user_id']).all()
-    
-    # Pagos donde el usuario es el proveedor (quien recibe)
-    pagos_proveedor = Pago.query.join(Contratacion).join(Servicio).filter(
-        Servicio.proveedor_id == session['user_id']
-    ).all()
-    
-    # Combinar y ordenar por fecha
-    todos_pagos = pagos_organizador + pagos_proveedor
-    pagos = sorted(todos_pagos, key=lambda p: p.fecha_creacion, reverse=True)
-    
-    return render_template('pagos/historial_pagos.html', pagos=pagos)
+    # historial de pagos del usuario actual (paginado, con filtros por estado y fecha)
+    return PagoController.historial_pagos()
 
 @pago_bp.route('/webhook/mercadopago', methods=['POST'])
 def webhook_mercadopago():
-    # implementar webhook de mercadopago
-    return "Webhook de MercadoPago"
+    # notificaciones de mercadopago (se guardan y se procesan en segundo plano)
+    return PagoController.recibir_webhook_mercadopago()
 
 @pago_bp.route('/exito/<int:pago_id>')
 def pago_exitoso(pago_id):
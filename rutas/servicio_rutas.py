@@ -16,6 +16,7 @@ servicio_bp.route('/buscar', endpoint='buscar_servicios')(ServicioController.bus
 servicio_bp.route('/catalogo', endpoint='catalogo_servicios')(ServicioController.catalogo_servicios)
 servicio_bp.route('/<int:servicio_id>/agregar-carrito', methods=['GET', 'POST'])(ServicioController.agregar_al_carrito_desde_detalle)
 servicio_bp.route('/api/evento/<int:evento_id>/datos')(ServicioController.obtener_datos_evento)
+servicio_bp.route('/api/evento/<int:evento_id>/cotizaciones')(ServicioController.cotizar_servicios_evento)
 
 
 
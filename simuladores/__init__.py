@@ -0,0 +1,5 @@
+# simuladores/__init__.py
+"""
+Simuladores locales de servicios externos de EventLink
+Permiten probar y medir la aplicación sin depender de MercadoPago ni de otros servicios reales
+"""
@@ -0,0 +1,133 @@
+# simuladores/enviar_webhooks.py
+"""
+Envía notificaciones de pago firmadas al webhook de EventLink, como lo haría MercadoPago,
+para medir cuántos eventos por segundo acepta el endpoint.
+
+Uso:
+    python -m simuladores.enviar_webhooks --url http://localhost:5000/pagos/webhook/mercadopago \\
+        --eventos 5000 --concurrencia 32 --secreto <MERCADOPAGO_WEBHOOK_SECRET> --duplicados 0.1
+
+Los ids de pago se toman de --pagos (lista separada por comas) o se generan al azar.
+Con --duplicados se reenvía esa fracción de notificaciones con el mismo id, para
+comprobar que la bandeja las descarta.
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tareas.webhooks import firmar
+
+
+def generar_eventos(cantidad, pagos=None, fraccion_duplicados=0.0):
+    # notificaciones con el formato de webhooks v1 de mercadopago
+    eventos = []
+    for _ in range(cantidad):
+        if eventos and random.random() < fraccion_duplicados:
+            eventos.append(random.choice(eventos))
+            continue
+        payment_id = random.choice(pagos) if pagos else str(random.randint(10**9, 10**10))
+        eventos.append({
+            'id': random.randint(10**11, 10**12),
+            'live_mode': False,
+            'type': 'payment',
+            'date_created': time.strftime('%Y-%m-%dT%H:%M:%S.000-04:00'),
+            'user_id': 812982447,
+            'api_version': 'v1',
+            'action': random.choice(['payment.created', 'payment.updated']),
+            'data': {'id': payment_id}
+        })
+    return eventos
+
+
+def enviar_evento(sesion, url, evento, secreto=None, timeout=10):
+    """Envía una notificación al webhook (firmada si hay secreto) y retorna la respuesta"""
+    data_id = evento['data']['id']
+    request_id = str(uuid.uuid4())
+    headers = {'x-request-id': request_id}
+    if secreto:
+        headers['x-signature'] = firmar(secreto, data_id, request_id, int(time.time()))
+    return sesion.post(
+        url, params={'data.id': data_id, 'type': evento['type']},
+        json=evento, headers=headers, timeout=timeout
+    )
+
+
+def enviar(url, eventos, concurrencia=16, secreto=None, timeout=10):
+    """
+    Envía los eventos en paralelo y retorna las estadísticas del envío.
+
+    Returns:
+        dict: total, segundos, eventos_por_segundo, codigos, latencia_ms (p50, p95, p99)
+    """
+    local = threading.local()
+    latencias = []
+    codigos = Counter()
+    lock = threading.Lock()
+
+    def sesion():
+        # una sesion (y su conexion keep-alive) por hilo
+        if not hasattr(local, 'sesion'):
+            local.sesion = requests.Session()
+        return local.sesion
+
+    def enviar_uno(evento):
+        inicio = time.perf_counter()
+        try:
+            codigo = enviar_evento(sesion(), url, evento, secreto, timeout).status_code
+        except requests.RequestException as e:
+            codigo = type(e).__name__
+        duracion = (time.perf_counter() - inicio) * 1000
+
+        with lock:
+            latencias.append(duracion)
+            codigos[codigo] += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(enviar_uno, eventos))
+    segundos = time.perf_counter() - inicio
+
+    percentiles = statistics.quantiles(latencias, n=100) if len(latencias) > 1 else latencias * 99
+    return {
+        'total': len(eventos),
+        'segundos': round(segundos, 2),
+        'eventos_por_segundo': round(len(eventos) / segundos, 1) if segundos else None,
+        'codigos': dict(codigos),
+        'latencia_ms': {
+            'p50': round(percentiles[49], 1),
+            'p95': round(percentiles[94], 1),
+            'p99': round(percentiles[98], 1)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Envía notificaciones de MercadoPago simuladas al webhook')
+    parser.add_argument('--url', default='http://localhost:5000/pagos/webhook/mercadopago')
+    parser.add_argument('--eventos', type=int, default=1000, help='Número de notificaciones')
+    parser.add_argument('--concurrencia', type=int, default=16, help='Envíos en paralelo')
+    parser.add_argument('--secreto', default=None, help='Clave para firmar (MERCADOPAGO_WEBHOOK_SECRET)')
+    parser.add_argument('--duplicados', type=float, default=0.0, help='Fracción de reenvíos (0-1)')
+    parser.add_argument('--pagos', default=None, help='IDs de pago separados por comas')
+    args = parser.parse_args()
+
+    pagos = [p.strip() for p in args.pagos.split(',')] if args.pagos else None
+    eventos = generar_eventos(args.eventos, pagos, args.duplicados)
+    resultado = enviar(args.url, eventos, args.concurrencia, args.secreto)
+
+    print(f"Enviados {resultado['total']} eventos en {resultado['segundos']}s "
+          f"({resultado['eventos_por_segundo']} eventos/s)")
+    print(f"Códigos de respuesta: {resultado['codigos']}")
+    print(f"Latencia (ms): {resultado['latencia_ms']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,463 @@
+# simuladores/mercadopago.py
+"""
+Servidor HTTP local que imita la API de MercadoPago usada por EventLink, para hacer
+pruebas de carga y de latencia del flujo de pago sin salir a internet.
+
+Implementa:
+    POST /checkout/preferences        crear preferencia (Checkout Pro)
+    POST /v1/payments                 crear pago (Checkout API)
+    GET  /v1/payments/<id>            consultar pago (webhooks, conciliación)
+    GET  /v1/payments/search          buscar pagos por external_reference
+    GET  /checkout/v1/redirect        "pagar" una preferencia y volver a back_urls
+    GET  /_simulador/estadisticas     peticiones atendidas por ruta y código
+
+Uso:
+    python -m simuladores.mercadopago --puerto 8081 --latencia-ms 150 --desviacion-ms 60 \\
+        --distribucion lognormal --errores 0.02 --limite 0.01 --aprobados 0.8 --rechazados 0.15
+
+    MERCADOPAGO_API_URL=http://127.0.0.1:8081 flask --app app run
+
+Como el sandbox real, respeta x-idempotency-key (misma clave, misma respuesta) y el
+nombre del titular decide el resultado: APRO aprueba, OTHE rechaza, CONT deja pendiente.
+Con --webhooks envía la notificación del pago a la notification_url recibida.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlparse, parse_qs
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# titulares de prueba de MercadoPago -> (status, status_detail)
+TITULARES_PRUEBA = {
+    'APRO': ('approved', 'accredited'),
+    'OTHE': ('rejected', 'cc_rejected_other_reason'),
+    'CONT': ('in_process', 'pending_contingency'),
+}
+
+
+class ConfiguracionSimulador:
+    """Latencia, errores inyectados y resultado de los pagos simulados"""
+
+    DISTRIBUCIONES = ('fija', 'normal', 'lognormal', 'exponencial')
+
+    def __init__(self, latencia_ms=0.0, desviacion_ms=0.0, distribucion='fija',
+                 tasa_errores=0.0, tasa_limite=0.0, aprobados=0.8, rechazados=0.1,
+                 webhooks=False, secreto=None, semilla=None):
+        if distribucion not in self.DISTRIBUCIONES:
+            raise ValueError(f"Distribución no soportada: {distribucion}")
+        if aprobados + rechazados > 1:
+            raise ValueError("aprobados + rechazados no puede superar 1")
+        self.latencia_ms = latencia_ms
+        self.desviacion_ms = desviacion_ms
+        self.distribucion = distribucion
+        self.tasa_errores = tasa_errores
+        self.tasa_limite = tasa_limite
+        self.aprobados = aprobados
+        self.rechazados = rechazados
+        self.webhooks = webhooks
+        self.secreto = secreto
+        self.azar = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def _aleatorio(self):
+        # el generador se comparte entre los hilos del servidor
+        with self._lock:
+            return self.azar.random()
+
+    def demora(self):
+        """Segundos de latencia de una respuesta según la distribución configurada"""
+        media, desviacion = self.latencia_ms, self.desviacion_ms
+        if media <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribucion == 'normal':
+                valor = self.azar.gauss(media, desviacion)
+            elif self.distribucion == 'lognormal' and desviacion > 0:
+                # parámetros de la normal subyacente para obtener esa media y desviación
+                sigma = math.sqrt(math.log(1 + (desviacion / media) ** 2))
+                valor = self.azar.lognormvariate(math.log(media) - sigma ** 2 / 2, sigma)
+            elif self.distribucion == 'exponencial':
+                valor = self.azar.expovariate(1 / media)
+            else:
+                valor = media
+        return max(0.0, valor) / 1000
+
+    def error_inyectado(self):
+        """Código HTTP de un error simulado, o None si la petición debe atenderse"""
+        with self._lock:
+            sorteo = self.azar.random()
+            if sorteo < self.tasa_limite:
+                return 429
+            if sorteo < self.tasa_limite + self.tasa_errores:
+                return self.azar.choice((500, 502, 503))
+        return None
+
+    def resultado_pago(self, titular=None):
+        """(status, status_detail) de un pago nuevo"""
+        if titular and titular.upper() in TITULARES_PRUEBA:
+            return TITULARES_PRUEBA[titular.upper()]
+        sorteo = self._aleatorio()
+        if sorteo < self.aprobados:
+            return TITULARES_PRUEBA['APRO']
+        if sorteo < self.aprobados + self.rechazados:
+            return TITULARES_PRUEBA['OTHE']
+        return TITULARES_PRUEBA['CONT']
+
+
+class AlmacenSimulado:
+    """Preferencias, pagos y respuestas por clave de idempotencia, en memoria"""
+
+    def __init__(self):
+        self.preferencias = {}
+        self.pagos = {}
+        self.idempotencia = {}
+        self.estadisticas = Counter()
+        self._ids_pago = itertools.count(10**10)
+        self.lock = threading.Lock()
+
+    def nuevo_id_pago(self):
+        with self.lock:
+            return next(self._ids_pago)
+
+
+def _ahora():
+    return datetime.now(timezone.utc)
+
+
+def _fecha(valor):
+    return valor.isoformat(timespec='milliseconds')
+
+
+class ManejadorMercadoPago(BaseHTTPRequestHandler):
+    """Atiende las rutas de la API simulada (un hilo por conexión)"""
+
+    # keep-alive, como la API real: el pool de conexiones del gateway se puede medir
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MercadoPagoSimulado/1.0'
+    # encabezados y cuerpo salen en escrituras separadas: sin esto Nagle suma ~40 ms
+    disable_nagle_algorithm = True
+
+    @property
+    def configuracion(self):
+        return self.server.configuracion
+
+    @property
+    def almacen(self):
+        return self.server.almacen
+
+    def log_message(self, formato, *args):
+        if self.server.detallado:
+            super().log_message(formato, *args)
+
+    # ----- utilidades -----
+
+    def _responder(self, codigo, cuerpo=None, encabezados=None):
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else b''
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+        with self.almacen.lock:
+            self.almacen.estadisticas[f"{self.command} {self._ruta_estadistica()} {codigo}"] += 1
+
+    def _ruta_estadistica(self):
+        ruta = urlparse(self.path).path
+        if ruta.startswith('/v1/payments/') and ruta != '/v1/payments/search':
+            return '/v1/payments/<id>'
+        return ruta
+
+    def _leer_json(self):
+        longitud = int(self.headers.get('Content-Length') or 0)
+        if not longitud:
+            return {}
+        try:
+            return json.loads(self.rfile.read(longitud))
+        except ValueError:
+            return None
+
+    def _autorizado(self):
+        return (self.headers.get('Authorization') or '').startswith('Bearer ')
+
+    def _antes_de_atender(self):
+        # latencia simulada y errores inyectados; retorna False si ya se respondió
+        time.sleep(self.configuracion.demora())
+        if not self._autorizado():
+            self._responder(401, {'message': 'invalid access token', 'status': 401})
+            return False
+        codigo = self.configuracion.error_inyectado()
+        if codigo == 429:
+            self._responder(429, {'message': 'too many requests', 'status': 429}, {'Retry-After': '1'})
+            return False
+        if codigo:
+            self._responder(codigo, {'message': 'internal error (simulado)', 'status': codigo})
+            return False
+        return True
+
+    def _con_idempotencia(self, crear):
+        # misma x-idempotency-key -> misma respuesta, sin crear otro recurso
+        clave = self.headers.get('x-idempotency-key')
+        if clave:
+            with self.almacen.lock:
+                guardada = self.almacen.idempotencia.get((self.path, clave))
+            if guardada:
+                return self._responder(*guardada)
+        codigo, cuerpo = crear()
+        if clave and codigo < 500:
+            with self.almacen.lock:
+                self.almacen.idempotencia[(self.path, clave)] = (codigo, cuerpo)
+        return self._responder(codigo, cuerpo)
+
+    # ----- rutas -----
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parametros = parse_qs(url.query)
+
+        if url.path == '/_simulador/estadisticas':
+            with self.almacen.lock:
+                cuerpo = {'peticiones': dict(self.almacen.estadisticas),
+                          'preferencias': len(self.almacen.preferencias),
+                          'pagos': len(self.almacen.pagos)}
+            return self._responder(200, cuerpo)
+
+        if url.path == '/checkout/v1/redirect':
+            return self._pagar_preferencia(parametros.get('pref_id', [None])[0])
+
+        if not self._antes_de_atender():
+            return
+
+        if url.path == '/v1/payments/search':
+            referencia = parametros.get('external_reference', [None])[0]
+            with self.almacen.lock:
+                resultados = [pago for pago in self.almacen.pagos.values()
+                              if referencia is None or pago['external_reference'] == referencia]
+            return self._responder(200, {
+                'results': resultados,
+                'paging': {'total': len(resultados), 'limit': len(resultados), 'offset': 0}
+            })
+
+        if url.path.startswith('/v1/payments/'):
+            pago = self.almacen.pagos.get(url.path.rsplit('/', 1)[-1])
+            if not pago:
+                return self._responder(404, {'message': 'Payment not found', 'status': 404})
+            return self._responder(200, pago)
+
+        self._responder(404, {'message': 'resource not found', 'status': 404})
+
+    def do_POST(self):
+        ruta = urlparse(self.path).path
+        if ruta not in ('/checkout/preferences', '/v1/payments'):
+            self._leer_json()
+            return self._responder(404, {'message': 'resource not found', 'status': 404})
+
+        datos = self._leer_json()
+        if not self._antes_de_atender():
+            return
+        if datos is None:
+            return self._responder(400, {'message': 'invalid json', 'status': 400})
+
+        if ruta == '/checkout/preferences':
+            return self._con_idempotencia(lambda: self._crear_preferencia(datos))
+        return self._con_idempotencia(lambda: self._crear_pago(datos))
+
+    def _crear_preferencia(self, datos):
+        if not datos.get('items'):
+            return 400, {'message': 'items must not be empty', 'status': 400}
+        id_preferencia = f"812982447-{uuid.uuid4()}"
+        base = f"http://{self.headers.get('Host')}"
+        ahora = _ahora()
+        preferencia = dict(
+            datos,
+            id=id_preferencia,
+            collector_id=812982447,
+            date_created=_fecha(ahora),
+            init_point=f"{base}/checkout/v1/redirect?pref_id={id_preferencia}",
+            sandbox_init_point=f"{base}/checkout/v1/redirect?pref_id={id_preferencia}",
+        )
+        with self.almacen.lock:
+            self.almacen.preferencias[id_preferencia] = preferencia
+        return 201, preferencia
+
+    def _crear_pago(self, datos):
+        if not datos.get('token') or not datos.get('transaction_amount'):
+            return 400, {'message': 'token and transaction_amount are required', 'status': 400}
+        payer = datos.get('payer') or {}
+        titular = payer.get('first_name') or (datos.get('additional_info') or {}).get('payer', {}).get('first_name')
+        return 201, self._registrar_pago(
+            monto=datos['transaction_amount'],
+            referencia=datos.get('external_reference'),
+            descripcion=datos.get('description'),
+            metodo=datos.get('payment_method_id'),
+            cuotas=datos.get('installments', 1),
+            email=payer.get('email'),
+            notification_url=datos.get('notification_url'),
+            resultado=self.configuracion.resultado_pago(titular)
+        )
+
+    def _registrar_pago(self, monto, referencia, descripcion, metodo, cuotas, email,
+                        notification_url, resultado, preferencia_id=None):
+        estado, detalle = resultado
+        ahora = _ahora()
+        pago = {
+            'id': self.almacen.nuevo_id_pago(),
+            'status': estado,
+            'status_detail': detalle,
+            'external_reference': referencia,
+            'preference_id': preferencia_id,
+            'transaction_amount': float(monto),
+            'currency_id': 'COP',
+            'description': descripcion,
+            'payment_method_id': metodo or 'visa',
+            'installments': cuotas,
+            'payer': {'email': email},
+            'date_created': _fecha(ahora),
+            'date_approved': _fecha(ahora) if estado == 'approved' else None,
+            'live_mode': False,
+        }
+        with self.almacen.lock:
+            self.almacen.pagos[str(pago['id'])] = pago
+        if notification_url and self.configuracion.webhooks:
+            self.server.notificar(notification_url, pago['id'])
+        return pago
+
+    def _pagar_preferencia(self, id_preferencia):
+        # equivale a que el comprador pague en el checkout de MercadoPago
+        preferencia = self.almacen.preferencias.get(id_preferencia)
+        if not preferencia:
+            return self._responder(404, {'message': 'preference not found', 'status': 404})
+        vence = preferencia.get('expiration_date_to')
+        if preferencia.get('expires') and vence and datetime.fromisoformat(vence) < _ahora():
+            return self._responder(410, {'message': 'preference expired', 'status': 410})
+
+        monto = sum(float(item.get('unit_price', 0)) * int(item.get('quantity', 1))
+                    for item in preferencia['items'])
+        pago = self._registrar_pago(
+            monto=monto,
+            referencia=preferencia.get('external_reference'),
+            descripcion=preferencia['items'][0].get('title'),
+            metodo='visa', cuotas=1,
+            email=(preferencia.get('payer') or {}).get('email'),
+            notification_url=preferencia.get('notification_url'),
+            resultado=self.configuracion.resultado_pago(),
+            preferencia_id=id_preferencia
+        )
+
+        destino = {'approved': 'success', 'rejected': 'failure'}.get(pago['status'], 'pending')
+        url_retorno = (preferencia.get('back_urls') or {}).get(destino)
+        if not url_retorno:
+            return self._responder(200, pago)
+        parametros = urlencode({
+            'collection_id': pago['id'], 'collection_status': pago['status'],
+            'payment_id': pago['id'], 'status': pago['status'],
+            'external_reference': pago['external_reference'] or '',
+            'preference_id': id_preferencia,
+        })
+        separador = '&' if '?' in url_retorno else '?'
+        self._responder(302, None, {'Location': f"{url_retorno}{separador}{parametros}"})
+
+
+class ServidorMercadoPago(ThreadingHTTPServer):
+    """Servidor del simulador con su configuración, almacén y envío de webhooks"""
+
+    daemon_threads = True
+
+    def __init__(self, direccion, configuracion=None, detallado=False):
+        super().__init__(direccion, ManejadorMercadoPago)
+        self.configuracion = configuracion or ConfiguracionSimulador()
+        self.almacen = AlmacenSimulado()
+        self.detallado = detallado
+        self._notificador = ThreadPoolExecutor(max_workers=4)
+        self._sesion = requests.Session()
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def notificar(self, notification_url, payment_id):
+        """Envía (en segundo plano) la notificación de un pago, firmada si hay secreto"""
+        self._notificador.submit(self._enviar_notificacion, notification_url, payment_id)
+
+    def _enviar_notificacion(self, notification_url, payment_id):
+        from simuladores.enviar_webhooks import generar_eventos, enviar_evento
+
+        evento = generar_eventos(1, [str(payment_id)])[0]
+        evento['action'] = 'payment.created'
+        try:
+            enviar_evento(self._sesion, notification_url, evento, self.configuracion.secreto)
+        except requests.RequestException as e:
+            logger.warning("No se pudo notificar el pago %s: %s", payment_id, e)
+
+    def server_close(self):
+        self._notificador.shutdown(wait=False)
+        super().server_close()
+
+
+def iniciar(configuracion=None, host='127.0.0.1', puerto=0, detallado=False):
+    """
+    Inicia el simulador en un hilo (para pruebas y benchmarks en el mismo proceso).
+
+    Args:
+        configuracion (ConfiguracionSimulador): Latencia, errores y resultados
+        puerto (int): 0 elige un puerto libre
+
+    Returns:
+        ServidorMercadoPago: Servidor en ejecución (usar .url y .shutdown())
+    """
+    servidor = ServidorMercadoPago((host, puerto), configuracion, detallado)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulador local de la API de MercadoPago')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8081)
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help='Latencia media por respuesta')
+    parser.add_argument('--desviacion-ms', type=float, default=0.0, help='Desviación estándar de la latencia')
+    parser.add_argument('--distribucion', choices=ConfiguracionSimulador.DISTRIBUCIONES, default='fija')
+    parser.add_argument('--errores', type=float, default=0.0, help='Fracción de respuestas 5xx (0-1)')
+    parser.add_argument('--limite', type=float, default=0.0, help='Fracción de respuestas 429 (0-1)')
+    parser.add_argument('--aprobados', type=float, default=0.8, help='Fracción de pagos aprobados')
+    parser.add_argument('--rechazados', type=float, default=0.1, help='Fracción de pagos rechazados')
+    parser.add_argument('--webhooks', action='store_true', help='Notificar cada pago a su notification_url')
+    parser.add_argument('--secreto', default=None, help='Clave para firmar las notificaciones')
+    parser.add_argument('--semilla', type=int, default=None, help='Semilla para resultados reproducibles')
+    parser.add_argument('--detallado', action='store_true', help='Registrar cada petición')
+    args = parser.parse_args()
+
+    configuracion = ConfiguracionSimulador(
+        latencia_ms=args.latencia_ms, desviacion_ms=args.desviacion_ms, distribucion=args.distribucion,
+        tasa_errores=args.errores, tasa_limite=args.limite, aprobados=args.aprobados,
+        rechazados=args.rechazados, webhooks=args.webhooks, secreto=args.secreto, semilla=args.semilla
+    )
+    servidor = ServidorMercadoPago((args.host, args.puerto), configuracion, args.detallado)
+    print(f"Simulador de MercadoPago en {servidor.url}")
+    print(f"Usar con: MERCADOPAGO_API_URL={servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
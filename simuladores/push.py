@@ -0,0 +1,373 @@
+# simuladores/push.py
+"""
+Servicio Web Push local (lo que FCM, Mozilla autopush, etc. hacen para un navegador),
+para probar y medir el envío de notificaciones push sin navegadores reales.
+
+Implementa:
+    POST /push/<token>                    recibir una notificación (201; 404 si no existe, 410 si venció)
+    POST /_simulador/suscripciones        crear suscripciones {"cantidad": N, "vencidas": 0.1}
+    GET  /_simulador/estadisticas         recibidas, descifradas, vencidas, errores...
+
+Cada suscripción creada tiene sus propias claves (p256dh/auth), así que el simulador
+verifica la firma VAPID y descifra el contenido como lo haría el navegador.
+
+Uso:
+    python -m simuladores.push --puerto 8082 --latencia-ms 40 --errores 0.01
+
+Para medir el envío de EventLink contra el simulador (SQLite en memoria):
+    python -m simuladores.push --medir 5000 --suscripciones 2 --vencidas 0.05 --conexiones 100
+"""
+
+import argparse
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from tareas.push import b64url, de_b64url
+
+
+class ConfiguracionSimulador:
+    """Latencia y errores inyectados del servicio push"""
+
+    def __init__(self, latencia_ms=0.0, tasa_errores=0.0, tasa_limite=0.0, semilla=None):
+        self.latencia_ms = latencia_ms
+        self.tasa_errores = tasa_errores
+        self.tasa_limite = tasa_limite
+        self._aleatorio = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def demora(self):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000.0)
+
+    def error_inyectado(self):
+        # 503, 429 o None
+        with self._lock:
+            valor = self._aleatorio.random()
+        if valor < self.tasa_errores:
+            return 503
+        if valor < self.tasa_errores + self.tasa_limite:
+            return 429
+        return None
+
+
+def descifrar(cuerpo, privada, auth):
+    """Descifra un cuerpo aes128gcm (RFC 8291) con las claves de la suscripción"""
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+    sal = cuerpo[:16]
+    _tamano, largo = struct.unpack('!IB', cuerpo[16:21])
+    publica_as = cuerpo[21:21 + largo]
+    clave_ua = privada.public_key().public_bytes(serialization.Encoding.X962,
+                                                 serialization.PublicFormat.UncompressedPoint)
+    compartido = privada.exchange(ec.ECDH(), ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), publica_as))
+    ikm = HKDF(hashes.SHA256(), 32, salt=auth, info=b'WebPush: info\x00' + clave_ua + publica_as).derive(compartido)
+    clave = HKDF(hashes.SHA256(), 16, salt=sal, info=b'Content-Encoding: aes128gcm\x00').derive(ikm)
+    nonce = HKDF(hashes.SHA256(), 12, salt=sal, info=b'Content-Encoding: nonce\x00').derive(ikm)
+    claro = AESGCM(clave).decrypt(nonce, cuerpo[21 + largo:], None).rstrip(b'\x00')
+    if not claro.endswith(b'\x02'):
+        raise ValueError('Delimitador de registro inválido')
+    return claro[:-1]
+
+
+def verificar_vapid(autorizacion, audiencia):
+    """True si el encabezado 'vapid t=<jwt>, k=<clave>' está firmado por esa clave y para esa audiencia"""
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+    try:
+        partes = dict(parte.strip().split('=', 1) for parte in autorizacion[len('vapid '):].split(','))
+        encabezado, reclamos, firma = partes['t'].split('.')
+        publica = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), de_b64url(partes['k']))
+        firma = de_b64url(firma)
+        publica.verify(encode_dss_signature(int.from_bytes(firma[:32], 'big'), int.from_bytes(firma[32:], 'big')),
+                       f'{encabezado}.{reclamos}'.encode(), ec.ECDSA(hashes.SHA256()))
+        reclamos = json.loads(de_b64url(reclamos))
+    except (KeyError, ValueError, InvalidSignature):
+        return False
+    return reclamos.get('aud') == audiencia and reclamos.get('exp', 0) > time.time()
+
+
+class ManejadorPush(BaseHTTPRequestHandler):
+    """Atiende el servicio push simulado (un hilo por conexión)"""
+
+    # keep-alive, como los servicios reales: el pool de conexiones del enviador se puede medir
+    protocol_version = 'HTTP/1.1'
+    server_version = 'PushSimulado/1.0'
+    disable_nagle_algorithm = True
+
+    def log_message(self, formato, *args):
+        if self.server.detallado:
+            super().log_message(formato, *args)
+
+    def setup(self):
+        super().setup()
+        self.server.sumar('conexiones')
+
+    def _responder(self, codigo, cuerpo=None, encabezados=None):
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else b''
+        self.send_response(codigo)
+        self.send_header('Content-Length', str(len(datos)))
+        if datos:
+            self.send_header('Content-Type', 'application/json')
+        for nombre, valor in (encabezados or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _leer_cuerpo(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/_simulador/estadisticas':
+            return self._responder(200, self.server.estadisticas())
+        self._responder(404, {'error': 'not found'})
+
+    def do_POST(self):
+        ruta = urlparse(self.path).path
+        cuerpo = self._leer_cuerpo()
+        if ruta == '/_simulador/suscripciones':
+            datos = json.loads(cuerpo or b'{}')
+            return self._responder(200, self.server.crear_suscripciones(datos.get('cantidad', 1), datos.get('vencidas', 0.0)))
+        if not ruta.startswith('/push/'):
+            return self._responder(404, {'error': 'not found'})
+        self._recibir(ruta[len('/push/'):], cuerpo)
+
+    def _recibir(self, token, cuerpo):
+        servidor = self.server
+        servidor.configuracion.demora()
+        codigo = servidor.configuracion.error_inyectado()
+        if codigo:
+            servidor.sumar(f'http_{codigo}')
+            return self._responder(codigo, None, {'Retry-After': '1'} if codigo == 429 else None)
+
+        suscripcion = servidor.suscripciones.get(token)
+        if suscripcion is None or suscripcion['vencida']:
+            servidor.sumar('vencidas')
+            return self._responder(404 if suscripcion is None else 410)
+        if not servidor.vapid_valido(self.headers.get('Authorization') or ''):
+            servidor.sumar('vapid_invalido')
+            return self._responder(403)
+        if self.headers.get('Content-Encoding') != 'aes128gcm' or not self.headers.get('TTL'):
+            servidor.sumar('mal_formadas')
+            return self._responder(400)
+        try:
+            contenido = json.loads(descifrar(cuerpo, suscripcion['privada'], suscripcion['auth']))
+        except Exception:
+            servidor.sumar('no_descifradas')
+            return self._responder(400)
+        servidor.recibir(token, contenido)
+        self._responder(201, None, {'Location': f'/mensajes/{uuid.uuid4().hex}'})
+
+
+class ServidorPush(ThreadingHTTPServer):
+    """Servidor del servicio push simulado con sus suscripciones y contadores"""
+
+    daemon_threads = True
+    # los envíos llegan en ráfagas de PUSH_CONEXIONES conexiones
+    request_queue_size = 1024
+
+    def __init__(self, direccion, configuracion=None, detallado=False):
+        super().__init__(direccion, ManejadorPush)
+        self.configuracion = configuracion or ConfiguracionSimulador()
+        self.detallado = detallado
+        self.suscripciones = {}
+        self.recibidas = Counter()
+        self.ultimas = []
+        self._contadores = Counter()
+        self._vapid_validos = set()
+        self._lock = threading.Lock()
+        self._inicio = time.monotonic()
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def sumar(self, clave, valor=1):
+        with self._lock:
+            self._contadores[clave] += valor
+
+    def crear_suscripciones(self, cantidad, vencidas=0.0):
+        """
+        Crea suscripciones como las que entregaría PushManager.subscribe en un navegador.
+
+        Returns:
+            list: [{'endpoint': ..., 'keys': {'p256dh': ..., 'auth': ...}}, ...]
+        """
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+
+        creadas = []
+        for _numero in range(cantidad):
+            token = uuid.uuid4().hex
+            privada = ec.generate_private_key(ec.SECP256R1())
+            auth = random.randbytes(16)
+            with self._lock:
+                self.suscripciones[token] = {'privada': privada, 'auth': auth, 'vencida': random.random() < vencidas}
+            creadas.append({
+                'endpoint': f'{self.url}/push/{token}',
+                'keys': {
+                    'p256dh': b64url(privada.public_key().public_bytes(
+                        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)),
+                    'auth': b64url(auth)
+                }
+            })
+        return creadas
+
+    def vapid_valido(self, autorizacion):
+        # el mismo token se reutiliza durante horas: se verifica una vez
+        if autorizacion in self._vapid_validos:
+            return True
+        if not verificar_vapid(autorizacion, self.url):
+            return False
+        with self._lock:
+            self._vapid_validos.add(autorizacion)
+        return True
+
+    def recibir(self, token, contenido):
+        with self._lock:
+            self._contadores['recibidas'] += 1
+            self.recibidas[token] += 1
+            if len(self.ultimas) < 100:
+                self.ultimas.append(contenido)
+
+    def estadisticas(self):
+        """Contadores desde el inicio y notificaciones recibidas por segundo"""
+        with self._lock:
+            contadores = dict(self._contadores)
+            contadores['suscripciones'] = len(self.suscripciones)
+        segundos = time.monotonic() - self._inicio
+        contadores['segundos'] = round(segundos, 2)
+        contadores['recibidas_por_segundo'] = round(contadores.get('recibidas', 0) / segundos, 1) if segundos else 0.0
+        return contadores
+
+
+def iniciar(configuracion=None, host='127.0.0.1', puerto=0, detallado=False):
+    """
+    Inicia el simulador en un hilo (para pruebas y benchmarks en el mismo proceso).
+
+    Args:
+        configuracion (ConfiguracionSimulador): Latencia y errores
+        puerto (int): 0 elige un puerto libre
+
+    Returns:
+        ServidorPush: Servidor en ejecución (usar .url, .crear_suscripciones() y .shutdown())
+    """
+    servidor = ServidorPush((host, puerto), configuracion, detallado)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def medir(usuarios, servidor, suscripciones_por_usuario=1, vencidas=0.0, conexiones=50, tamano_lote=200):
+    """
+    Envía una notificación push a cada uno de `usuarios` usuarios (con sus suscripciones)
+    con EnviadorPush contra el simulador.
+
+    Returns:
+        dict: envíos, segundos, envíos por segundo y las estadísticas del enviador y del simulador
+    """
+    import os
+
+    from sqlalchemy import insert
+
+    # sin base de datos real: usuarios y suscripciones en SQLite en memoria
+    os.environ.setdefault('FLASK_ENV', 'testing')
+    from app import create_app
+    from database import db
+    from models import SuscripcionPush, Usuario, RolUsuario
+    from tareas.push import enviador_push, generar_claves_vapid
+
+    app = create_app('testing')
+    app.config.update(PUSH_VAPID_CLAVE_PRIVADA=generar_claves_vapid()[0], NOTIFICACIONES_SINCRONAS=False,
+                      PUSH_CONEXIONES=conexiones, PUSH_TAMANO_LOTE=tamano_lote, PUSH_MAX_PENDIENTES=usuarios)
+    enviador_push.init_app(app)
+
+    suscripciones = servidor.crear_suscripciones(usuarios * suscripciones_por_usuario, vencidas)
+    with app.app_context():
+        db.create_all()
+        # INSERT por lotes: Usuario() calcula el hash de la contraseña de cada uno
+        db.session.execute(insert(Usuario.__table__), [
+            {'nombre': f'Usuario {numero}', 'correo': f'usuario{numero}@eventlink.test', 'contraseña': 'x',
+             'rol': RolUsuario.organizador} for numero in range(usuarios)
+        ])
+        ids = [fila.id for fila in Usuario.query.with_entities(Usuario.id).order_by(Usuario.id)]
+        db.session.execute(insert(SuscripcionPush.__table__), [
+            {'usuario_id': ids[numero % usuarios], 'endpoint': suscripcion['endpoint'],
+             'p256dh': suscripcion['keys']['p256dh'], 'auth': suscripcion['keys']['auth']}
+            for numero, suscripcion in enumerate(suscripciones)
+        ])
+        db.session.commit()
+
+    inicio = time.perf_counter()
+    for usuario_id in ids:
+        enviador_push.encolar({'titulo': 'Notificación de prueba', 'mensaje': f'Mensaje para {usuario_id}',
+                               'tipo': 'nueva_contratacion', 'usuario_id': usuario_id})
+    enviador_push.esperar_pendientes(espera=3600)
+    segundos = time.perf_counter() - inicio
+
+    enviador = enviador_push.estadisticas()
+    with app.app_context():
+        restantes = SuscripcionPush.query.count()
+    envios = enviador['enviados'] + enviador['vencidas'] + enviador['rechazados'] + enviador['errores']
+    return {
+        'envios': envios,
+        'segundos': round(segundos, 2),
+        'por_segundo': round(envios / segundos, 1),
+        'suscripciones_restantes': restantes,
+        'enviador': enviador,
+        'simulador': servidor.estadisticas()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servicio Web Push local')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8082)
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help='Demora por notificación')
+    parser.add_argument('--errores', type=float, default=0.0, help='Fracción de respuestas 503 (0-1)')
+    parser.add_argument('--limite', type=float, default=0.0, help='Fracción de respuestas 429 (0-1)')
+    parser.add_argument('--semilla', type=int, default=None, help='Semilla para errores reproducibles')
+    parser.add_argument('--detallado', action='store_true', help='Registrar cada petición')
+    parser.add_argument('--medir', type=int, default=0, help='Enviar una notificación a N usuarios y medir')
+    parser.add_argument('--suscripciones', type=int, default=1, help='Suscripciones por usuario al medir')
+    parser.add_argument('--vencidas', type=float, default=0.0, help='Fracción de suscripciones vencidas al medir')
+    parser.add_argument('--conexiones', type=int, default=50, help='Envíos simultáneos al medir')
+    args = parser.parse_args()
+
+    configuracion = ConfiguracionSimulador(args.latencia_ms, args.errores, args.limite, args.semilla)
+
+    if args.medir:
+        servidor = iniciar(configuracion, args.host, 0, args.detallado)
+        resultado = medir(args.medir, servidor, args.suscripciones, args.vencidas, args.conexiones)
+        print(f"{resultado['envios']} envíos push en {resultado['segundos']}s ({resultado['por_segundo']} por segundo), "
+              f"{resultado['suscripciones_restantes']} suscripciones vigentes")
+        print(f"Enviador: {resultado['enviador']}")
+        print(f"Simulador: {resultado['simulador']}")
+        servidor.shutdown()
+        return
+
+    servidor = ServidorPush((args.host, args.puerto), configuracion, args.detallado)
+    print(f"Servicio push simulado en {servidor.url}")
+    print(f"Suscripciones de prueba: POST {servidor.url}/_simulador/suscripciones {{\"cantidad\": 10}}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+# simuladores/smtp.py
+"""
+Servidor SMTP local que acepta y descarta correos (un "sumidero"), para probar y medir
+el envío de notificaciones por email sin un servidor de correo real.
+
+Implementa lo que usa smtplib: EHLO/HELO, MAIL FROM, RCPT TO, DATA, RSET, NOOP y QUIT
+(sin STARTTLS ni AUTH: usar MAIL_USE_TLS=false y sin usuario). Cuenta conexiones,
+mensajes y bytes, guarda los últimos mensajes y puede agregar latencia por mensaje y
+rechazos temporales (451) o de destinatario (550).
+
+Uso:
+    python -m simuladores.smtp --puerto 8025 --latencia-ms 5 --errores 0.01
+
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=8025 MAIL_USE_TLS=false flask --app app run
+
+Para medir el envío de EventLink contra el sumidero (sin base de datos ni peticiones):
+    python -m simuladores.smtp --medir 20000 --lote 200 --por-minuto 1000000
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+from collections import deque
+
+
+class ConfiguracionSumidero:
+    """Latencia y errores inyectados del sumidero"""
+
+    def __init__(self, latencia_ms=0.0, tasa_errores=0.0, tasa_rechazos=0.0, guardar=100, semilla=None):
+        self.latencia_ms = latencia_ms
+        self.tasa_errores = tasa_errores
+        self.tasa_rechazos = tasa_rechazos
+        self.guardar = guardar
+        self._aleatorio = random.Random(semilla)
+
+    def demora(self):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000.0)
+
+    def error_temporal(self):
+        return self.tasa_errores and self._aleatorio.random() < self.tasa_errores
+
+    def rechazar_destinatario(self):
+        return self.tasa_rechazos and self._aleatorio.random() < self.tasa_rechazos
+
+
+class ManejadorSmtp(socketserver.StreamRequestHandler):
+    """Una conexión SMTP: responde los comandos y acumula los mensajes recibidos"""
+
+    def _responder(self, linea):
+        self.wfile.write(linea.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        servidor = self.server
+        servidor.sumar('conexiones')
+        self._responder('220 eventlink-sumidero ESMTP')
+        remitente, destinatarios = None, []
+
+        for linea in self.rfile:
+            comando = linea.decode('utf-8', 'replace').strip()
+            verbo = comando[:4].upper()
+
+            if verbo == 'EHLO':
+                self._responder('250-eventlink-sumidero')
+                self._responder('250-8BITMIME')
+                self._responder('250 SIZE 52428800')
+            elif verbo == 'HELO':
+                self._responder('250 eventlink-sumidero')
+            elif verbo == 'MAIL':
+                remitente, destinatarios = comando[10:].strip(), []
+                self._responder('250 OK')
+            elif verbo == 'RCPT':
+                if servidor.configuracion.rechazar_destinatario():
+                    servidor.sumar('rechazados')
+                    self._responder('550 Buzon inexistente')
+                else:
+                    destinatarios.append(comando[8:].strip())
+                    self._responder('250 OK')
+            elif verbo == 'DATA':
+                if not destinatarios:
+                    self._responder('503 Sin destinatarios')
+                    continue
+                self._responder('354 Fin con <CRLF>.<CRLF>')
+                contenido = self._leer_datos()
+                servidor.configuracion.demora()
+                if servidor.configuracion.error_temporal():
+                    servidor.sumar('errores')
+                    self._responder('451 Error temporal, intente de nuevo')
+                else:
+                    servidor.recibir(remitente, destinatarios, contenido)
+                    self._responder('250 OK: mensaje aceptado')
+                remitente, destinatarios = None, []
+            elif verbo == 'RSET':
+                remitente, destinatarios = None, []
+                self._responder('250 OK')
+            elif verbo == 'NOOP':
+                self._responder('250 OK')
+            elif verbo == 'QUIT':
+                self._responder('221 Adios')
+                return
+            else:
+                self._responder('502 Comando no implementado')
+
+    def _leer_datos(self):
+        partes = []
+        for linea in self.rfile:
+            if linea in (b'.\r\n', b'.\n'):
+                break
+            # dot-stuffing (RFC 5321 4.5.2)
+            partes.append(linea[1:] if linea.startswith(b'..') else linea)
+        return b''.join(partes)
+
+
+class SumideroSmtp(socketserver.ThreadingTCPServer):
+    """Servidor del sumidero con sus contadores y los últimos mensajes recibidos"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, direccion, configuracion=None):
+        super().__init__(direccion, ManejadorSmtp)
+        self.configuracion = configuracion or ConfiguracionSumidero()
+        self.mensajes = deque(maxlen=self.configuracion.guardar)
+        self._contadores = {'conexiones': 0, 'mensajes': 0, 'destinatarios': 0, 'bytes': 0,
+                            'errores': 0, 'rechazados': 0}
+        self._lock = threading.Lock()
+        self._inicio = time.monotonic()
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def puerto(self):
+        return self.server_address[1]
+
+    def sumar(self, clave, valor=1):
+        with self._lock:
+            self._contadores[clave] += valor
+
+    def recibir(self, remitente, destinatarios, contenido):
+        with self._lock:
+            self._contadores['mensajes'] += 1
+            self._contadores['destinatarios'] += len(destinatarios)
+            self._contadores['bytes'] += len(contenido)
+            self.mensajes.append({'remitente': remitente, 'destinatarios': destinatarios, 'contenido': contenido})
+
+    def estadisticas(self):
+        """Contadores desde el inicio y mensajes por segundo"""
+        with self._lock:
+            contadores = dict(self._contadores)
+        segundos = time.monotonic() - self._inicio
+        contadores['segundos'] = round(segundos, 2)
+        contadores['mensajes_por_segundo'] = round(contadores['mensajes'] / segundos, 1) if segundos else 0.0
+        return contadores
+
+
+def iniciar(configuracion=None, host='127.0.0.1', puerto=0):
+    """
+    Inicia el sumidero en un hilo (para pruebas y benchmarks en el mismo proceso).
+
+    Args:
+        configuracion (ConfiguracionSumidero): Latencia y errores
+        puerto (int): 0 elige un puerto libre
+
+    Returns:
+        SumideroSmtp: Servidor en ejecución (usar .host, .puerto y .shutdown())
+    """
+    servidor = SumideroSmtp((host, puerto), configuracion)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def medir(cantidad, servidor, tamano_lote=100, trabajadores=1, por_minuto=1000000):
+    """
+    Envía `cantidad` correos de notificación con EnviadorCorreos contra el sumidero.
+
+    Returns:
+        dict: correos enviados, segundos, correos por segundo y por hora, y las
+              estadísticas del enviador y del sumidero
+    """
+    import os
+
+    # sin base de datos real: los correos fallidos quedan en SQLite en memoria
+    os.environ.setdefault('FLASK_ENV', 'testing')
+    from app import create_app, mail
+    from database import db
+    from tareas.correo import enviador_correos
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+    app.config.update(MAIL_SERVER=servidor.host, MAIL_PORT=servidor.puerto, MAIL_USE_TLS=False,
+                      MAIL_USE_SSL=False, MAIL_USERNAME=None, MAIL_PASSWORD=None,
+                      MAIL_SUPPRESS_SEND=False, TESTING=False, NOTIFICACIONES_SINCRONAS=False,
+                      CORREO_TAMANO_LOTE=tamano_lote, CORREO_TRABAJADORES=trabajadores,
+                      CORREO_MAXIMO_POR_MINUTO=por_minuto, CORREO_MAX_PENDIENTES=cantidad)
+    mail.init_app(app)
+    enviador_correos.init_app(app)
+
+    tipos = ('nueva_contratacion', 'contratacion_aceptada', 'pago_recibido', 'nueva_calificacion')
+    inicio = time.perf_counter()
+    for numero in range(cantidad):
+        enviador_correos.encolar(f'usuario{numero}@eventlink.test', f'Usuario {numero}', {
+            'titulo': 'Notificación de prueba', 'mensaje': f'Mensaje de prueba número {numero}',
+            'tipo': tipos[numero % len(tipos)], 'usuario_id': numero
+        })
+    enviador_correos.esperar_pendientes(espera=3600)
+    segundos = time.perf_counter() - inicio
+
+    enviador = enviador_correos.estadisticas()
+    return {
+        'enviados': enviador['enviados'],
+        'segundos': round(segundos, 2),
+        'por_segundo': round(enviador['enviados'] / segundos, 1),
+        'por_hora': int(enviador['enviados'] / segundos * 3600),
+        'enviador': enviador,
+        'sumidero': servidor.estadisticas()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor SMTP local que acepta y descarta correos')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8025)
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help='Demora por mensaje')
+    parser.add_argument('--errores', type=float, default=0.0, help='Fracción de mensajes con 451 (0-1)')
+    parser.add_argument('--rechazos', type=float, default=0.0, help='Fracción de destinatarios con 550 (0-1)')
+    parser.add_argument('--semilla', type=int, default=None, help='Semilla para errores reproducibles')
+    parser.add_argument('--medir', type=int, default=0, help='Enviar N correos de EventLink y medir')
+    parser.add_argument('--lote', type=int, default=100, help='Correos por conexión al medir')
+    parser.add_argument('--trabajadores', type=int, default=1, help='Hilos de envío al medir')
+    parser.add_argument('--por-minuto', type=int, default=1000000, help='Límite de correos por minuto al medir')
+    args = parser.parse_args()
+
+    configuracion = ConfiguracionSumidero(args.latencia_ms, args.errores, args.rechazos, semilla=args.semilla)
+
+    if args.medir:
+        servidor = iniciar(configuracion, args.host, 0)
+        resultado = medir(args.medir, servidor, args.lote, args.trabajadores, args.por_minuto)
+        print(f"Enviados {resultado['enviados']} correos en {resultado['segundos']}s "
+              f"({resultado['por_segundo']} correos/s, {resultado['por_hora']} por hora)")
+        print(f"Enviador: {resultado['enviador']}")
+        print(f"Sumidero: {resultado['sumidero']}")
+        servidor.shutdown()
+        return
+
+    servidor = SumideroSmtp((args.host, args.puerto), configuracion)
+    print(f"Sumidero SMTP en {args.host}:{servidor.puerto}")
+    print(f"Usar con: MAIL_SERVER={args.host} MAIL_PORT={servidor.puerto} MAIL_USE_TLS=false")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Estadísticas: {servidor.estadisticas()}")
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
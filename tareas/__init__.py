@@ -0,0 +1,23 @@
+# tareas/__init__.py
+"""
+Módulo de tareas en segundo plano de EventLink
+Trabajos que no deben bloquear un worker web (llamadas a la pasarela de pagos, envío de notificaciones, etc.)
+"""
+
+from .ejecutor import ejecutor_tareas, EjecutorTareas, ColaTareasLlena
+from .escritura_notificaciones import escritor_notificaciones, EscritorNotificaciones
+from .notificaciones import despachador_notificaciones, DespachadorNotificaciones
+from .correo import enviador_correos, EnviadorCorreos, ColaCorreosLlena
+from .push import enviador_push, EnviadorPush, ColaPushLlena
+from .tiempo_real import bus_notificaciones, BusNotificaciones, DemasiadasConexiones
+from .agrupacion import agrupador_notificaciones, AgrupadorNotificaciones
+
+__all__ = [
+    'ejecutor_tareas', 'EjecutorTareas', 'ColaTareasLlena',
+    'escritor_notificaciones', 'EscritorNotificaciones',
+    'despachador_notificaciones', 'DespachadorNotificaciones',
+    'enviador_correos', 'EnviadorCorreos', 'ColaCorreosLlena',
+    'enviador_push', 'EnviadorPush', 'ColaPushLlena',
+    'bus_notificaciones', 'BusNotificaciones', 'DemasiadasConexiones',
+    'agrupador_notificaciones', 'AgrupadorNotificaciones'
+]
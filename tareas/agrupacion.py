@@ -0,0 +1,261 @@
+# tareas/agrupacion.py
+"""
+Agrupación de notificaciones (resúmenes por ventana)
+Para los tipos configurados en NOTIFICACIONES_AGRUPAR ("nueva_contratacion=300,...")
+la primera notificación de un usuario se entrega en el momento y abre una ventana
+de esos segundos; las siguientes del mismo usuario y tipo dentro de la ventana no
+se guardan ni se envían: se acumulan y al cerrar la ventana se entrega una sola
+notificación resumen (con la cantidad y los ids en datos_adicionales) por el mismo
+camino que la primera (base de datos, o todos los observadores: correo, push...).
+Mientras sigan llegando, se entrega un resumen por ventana.
+
+Las ventanas son de cada proceso: con varios workers cada uno entrega su primera
+notificación y su resumen. Lo acumulado se entrega al detener el proceso.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+# importado antes de registrar apagar(): atexit corre en orden inverso y los resúmenes
+# deben entregarse antes de que el despachador y el escritor terminen
+import tareas.notificaciones  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# título del resumen por tipo ({n}: notificaciones agrupadas); el resto usa TITULO_RESUMEN
+TITULOS_RESUMEN = {
+    'nueva_contratacion': 'Recibiste {n} contrataciones nuevas',
+    'pago_recibido': 'Recibiste {n} pagos',
+    'nueva_solicitud': 'Recibiste {n} solicitudes nuevas',
+    'contratacion_aceptada': '{n} contrataciones aceptadas',
+    'contratacion_rechazada': '{n} contrataciones rechazadas',
+    'nueva_calificacion': 'Recibiste {n} calificaciones nuevas',
+    'nueva_resena': 'Recibiste {n} reseñas nuevas',
+}
+TITULO_RESUMEN = '{n} notificaciones nuevas: {titulo}'
+
+# mensajes de las notificaciones agrupadas que se citan en el resumen
+MENSAJES_RESUMEN = 3
+
+# referencias que el resumen guarda en datos_adicionales (campo -> clave de la lista)
+REFERENCIAS = {'contratacion_id': 'contrataciones', 'pago_id': 'pagos', 'servicio_id': 'servicios', 'evento_id': 'eventos'}
+
+
+def leer_reglas(texto):
+    """'nueva_contratacion=300,pago_recibido=120' -> {'nueva_contratacion': 300.0, ...}"""
+    from models.notificacion import TipoNotificacion
+
+    reglas = {}
+    for parte in (texto or '').split(','):
+        tipo, _, segundos = parte.partition('=')
+        tipo = tipo.strip()
+        if not tipo:
+            continue
+        try:
+            TipoNotificacion(tipo)
+            segundos = float(segundos)
+        except ValueError:
+            logger.warning("Regla de agrupación inválida: %s", parte)
+            continue
+        if segundos > 0:
+            reglas[tipo] = segundos
+    return reglas
+
+
+def _valor_tipo(tipo):
+    return getattr(tipo, 'value', tipo)
+
+
+class Ventana:
+    """Notificaciones acumuladas de un usuario y tipo hasta `cierra` (time.monotonic)"""
+
+    def __init__(self, cierra, entregar):
+        self.cierra = cierra
+        self.entregar = entregar
+        self.total = 0
+        self.primera = None
+        self.ultima = None
+        self.mensajes = []
+        self.referencias = {}
+        self.desde = None
+
+
+class AgrupadorNotificaciones:
+    """
+    Ventanas de agrupación por (usuario, tipo).
+
+    - enviar(datos, entregar) entrega en el momento (llamando a `entregar`) si el
+      tipo no se agrupa o no hay ventana abierta; si la hay, solo acumula.
+    - Un hilo cierra las ventanas vencidas y entrega su resumen con el `entregar`
+      de la notificación que abrió la ventana.
+    - NOTIFICACIONES_AGRUPAR_MAXIMO limita los ids por tipo que guarda el resumen.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.reglas = {}
+        self.maximo_referencias = 50
+        self._reiniciar()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # lee las reglas y registra el agrupador
+        self.app = app
+        self.reglas = leer_reglas(app.config.get('NOTIFICACIONES_AGRUPAR'))
+        self.maximo_referencias = app.config.get('NOTIFICACIONES_AGRUPAR_MAXIMO', 50)
+        self._reiniciar()
+        app.extensions['agrupador_notificaciones'] = self
+
+    def _reiniciar(self):
+        # las ventanas y el hilo son de cada proceso
+        self._ventanas = {}
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._pid = os.getpid()
+        self._metricas = {'recibidas': 0, 'entregadas': 0, 'agrupadas': 0, 'resumenes': 0, 'errores': 0}
+
+    def _iniciar_hilo(self):
+        if self._hilo is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._cerrar_periodicamente,
+                                          name='eventlink-agrupador-notificaciones', daemon=True)
+            self._hilo.start()
+
+    def enviar(self, datos, entregar):
+        """
+        Entrega la notificación o la acumula en la ventana abierta de su usuario y tipo.
+
+        Args:
+            datos (dict): Campos de la notificación (datos_notificacion() o fila_notificacion())
+            entregar (callable): Recibe los datos de la notificación (o del resumen) y la entrega
+
+        Returns:
+            El resultado de `entregar`, o True si quedó acumulada para el resumen
+        """
+        tipo = _valor_tipo(datos['tipo'])
+        segundos = self.reglas.get(tipo)
+        with self._lock:
+            self._metricas['recibidas'] += 1
+            if segundos is not None:
+                clave = (datos['usuario_id'], tipo)
+                ventana = self._ventanas.get(clave)
+                if ventana is not None:
+                    self._acumular(ventana, datos)
+                    self._metricas['agrupadas'] += 1
+                    return True
+                self._ventanas[clave] = Ventana(time.monotonic() + segundos, entregar)
+                self._iniciar_hilo()
+            self._metricas['entregadas'] += 1
+        return entregar(datos)
+
+    def _acumular(self, ventana, datos):
+        ventana.total += 1
+        ventana.primera = ventana.primera or datos
+        ventana.ultima = datos
+        ventana.desde = ventana.desde or datetime.utcnow()
+        if len(ventana.mensajes) < MENSAJES_RESUMEN:
+            ventana.mensajes.append(datos.get('mensaje') or datos.get('titulo'))
+        for campo, clave in REFERENCIAS.items():
+            valor = datos.get(campo)
+            if valor is not None:
+                lista = ventana.referencias.setdefault(clave, [])
+                if len(lista) < self.maximo_referencias and valor not in lista:
+                    lista.append(valor)
+
+    def _resumen(self, ventana, segundos):
+        # notificación resumen: la última agrupada con título, mensaje y datos del grupo
+        tipo = _valor_tipo(ventana.ultima['tipo'])
+        titulo = TITULOS_RESUMEN.get(tipo, TITULO_RESUMEN).format(n=ventana.total, titulo=ventana.primera['titulo'])
+        mensaje = ' · '.join(ventana.mensajes)
+        if ventana.total > len(ventana.mensajes):
+            mensaje += f" · y {ventana.total - len(ventana.mensajes)} más"
+        datos = dict(ventana.ultima, titulo=titulo[:200], mensaje=mensaje)
+        # las referencias individuales solo si todas las agrupadas comparten la misma
+        for campo, clave in REFERENCIAS.items():
+            if len(ventana.referencias.get(clave, ())) != 1:
+                datos[campo] = None
+        datos['datos_adicionales'] = dict(ventana.referencias, agrupadas=ventana.total, ventana_segundos=segundos,
+                                          desde=ventana.desde.isoformat(), hasta=datetime.utcnow().isoformat())
+        if 'fecha_creacion' in datos:
+            datos['fecha_creacion'] = datetime.utcnow()
+        return datos
+
+    def cerrar_vencidas(self, todas=False):
+        """
+        Cierra las ventanas vencidas (o todas) y entrega sus resúmenes. Una ventana con
+        notificaciones acumuladas se vuelve a abrir: si siguen llegando, se agrupan.
+
+        Returns:
+            int: Resúmenes entregados
+        """
+        ahora = time.monotonic()
+        resumenes = []
+        with self._lock:
+            for clave, ventana in list(self._ventanas.items()):
+                if not todas and ventana.cierra > ahora:
+                    continue
+                segundos = self.reglas.get(clave[1], 0)
+                if ventana.total:
+                    resumenes.append((ventana.entregar, self._resumen(ventana, segundos)))
+                if ventana.total and not todas:
+                    self._ventanas[clave] = Ventana(ahora + segundos, ventana.entregar)
+                else:
+                    del self._ventanas[clave]
+            self._metricas['resumenes'] += len(resumenes)
+
+        for entregar, datos in resumenes:
+            try:
+                entregar(datos)
+            except Exception:
+                with self._lock:
+                    self._metricas['errores'] += 1
+                logger.exception("No se pudo entregar el resumen de notificaciones",
+                                 extra={'datos': {'usuario_id': datos['usuario_id'],
+                                                  'tipo': _valor_tipo(datos['tipo']),
+                                                  'agrupadas': datos['datos_adicionales']['agrupadas']}})
+        return len(resumenes)
+
+    def _cerrar_periodicamente(self):
+        while True:
+            time.sleep(1)
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        self.cerrar_vencidas()
+                else:
+                    self.cerrar_vencidas()
+            except Exception:
+                logger.exception("Error al cerrar las ventanas de agrupación")
+
+    def estadisticas(self):
+        """Notificaciones recibidas, entregadas, agrupadas y resúmenes en este proceso"""
+        with self._lock:
+            return dict(self._metricas, ventanas_abiertas=len(self._ventanas),
+                        pendientes=sum(ventana.total for ventana in self._ventanas.values()))
+
+    def apagar(self):
+        # al salir se entregan los resúmenes de lo acumulado
+        if not self._ventanas or self._pid != os.getpid():
+            return
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    self.cerrar_vencidas(todas=True)
+            else:
+                self.cerrar_vencidas(todas=True)
+        except Exception:
+            logger.exception("Resúmenes de notificaciones sin entregar al detener el proceso")
+
+
+# instancia global (se inicializa con init_app en create_app)
+agrupador_notificaciones = AgrupadorNotificaciones()
+
+atexit.register(agrupador_notificaciones.apagar)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=agrupador_notificaciones._reiniciar)
@@ -0,0 +1,244 @@
+# tareas/conciliacion.py
+"""
+Conciliación de pagos pendientes con MercadoPago
+Si el webhook de un pago nunca llega (o llega antes de que exista el Pago local), el
+pago queda 'pendiente' para siempre: la página de pago pendiente solo muestra un
+mensaje. Esta tarea recorre por lotes los pagos pendientes recientes, consulta su
+estado en MercadoPago con un pool de hilos acotado y aplica los cambios con UPDATEs
+por lote. Se ejecuta desde consola (`flask conciliar-pagos`), fuera de los workers web
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from database import db
+from models.pago import Pago, EstadoPago, MetodoPago
+from tareas.webhooks import (
+    ESTADOS_APROBADOS, ESTADOS_RECHAZADOS, ESTADOS_CANCELADOS, ESTADOS_REEMBOLSADOS
+)
+
+
+def _consultar(pago):
+    """
+    Estado en MercadoPago de un pago local (fila con mercadopago_id y referencia_pago).
+    Sin id de MercadoPago se busca por external_reference; si hay varios intentos con
+    la misma referencia, manda el aprobado y si no, el más reciente.
+    """
+    from patterns.singleton import payment_gateway
+
+    if pago.mercadopago_id:
+        return payment_gateway.consultar_pago(pago.mercadopago_id)
+    if not pago.referencia_pago:
+        return {'success': False, 'no_encontrado': True, 'message': 'Pago sin referencia'}
+
+    busqueda = payment_gateway.buscar_pagos_por_referencia(pago.referencia_pago)
+    if not busqueda.get('success'):
+        return busqueda
+    encontrados = busqueda['pagos']
+    if not encontrados:
+        return {'success': False, 'no_encontrado': True, 'message': 'Sin pagos en MercadoPago'}
+    aprobados = [info for info in encontrados if info['estado'] in ESTADOS_APROBADOS]
+    return (aprobados or encontrados)[0]
+
+
+def _nuevo_estado(estado_mp):
+    # estado local que corresponde a un pago pendiente según el estado en MercadoPago
+    if estado_mp in ESTADOS_APROBADOS:
+        return EstadoPago.aprobado
+    if estado_mp in ESTADOS_RECHAZADOS:
+        return EstadoPago.rechazado
+    if estado_mp in ESTADOS_CANCELADOS:
+        return EstadoPago.cancelado
+    if estado_mp in ESTADOS_REEMBOLSADOS:
+        return EstadoPago.reembolsado
+    # pending / in_process / authorized: sigue pendiente
+    return None
+
+
+def _aplicar_cambios(por_estado, ids_mercadopago):
+    """
+    Aplica un lote de cambios con un UPDATE por estado (más los de contrataciones e
+    items del carrito) y hace commit.
+
+    Cada UPDATE exige que el pago siga 'pendiente': si un webhook lo resolvió
+    mientras se consultaba, gana el webhook.
+
+    Args:
+        por_estado (dict): EstadoPago -> lista de filas de pagos a pasar a ese estado
+        ids_mercadopago (list): [{'id', 'mercadopago_id'}] de pagos encontrados por referencia
+
+    Returns:
+        dict: EstadoPago -> pagos actualizados
+    """
+    from models.carrito import CarritoItem, EstadoCarritoItem
+    from models.contratacion import Contratacion, EstadoContratacion
+    from patterns.contadores import contadores_usuario
+
+    ahora = datetime.utcnow()
+    actualizados = {}
+    # los UPDATE por lote no pasan por la sesión: se invalidan los contadores de
+    # los organizadores (carrito) y proveedores (solicitudes) afectados
+    usuarios_afectados = set()
+
+    if ids_mercadopago:
+        db.session.bulk_update_mappings(Pago, ids_mercadopago)
+        Pago.query.filter(
+            Pago.id.in_([fila['id'] for fila in ids_mercadopago]),
+            Pago.id_transaccion.is_(None)
+        ).update({Pago.id_transaccion: Pago.mercadopago_id}, synchronize_session=False)
+
+    for estado, filas in por_estado.items():
+        ids = [fila.id for fila in filas]
+        valores = {Pago.estado: estado}
+        if estado == EstadoPago.aprobado:
+            valores[Pago.fecha_aprobacion] = ahora
+        actualizados[estado] = Pago.query.filter(
+            Pago.id.in_(ids), Pago.estado == EstadoPago.pendiente
+        ).update(valores, synchronize_session=False)
+
+        contrataciones = {fila.contratacion_id for fila in filas if fila.contratacion_id}
+        referencias = [fila.referencia_pago for fila in filas if fila.referencia_pago]
+
+        if estado == EstadoPago.aprobado:
+            # contratación ya aceptada por el proveedor: el pago la confirma
+            if contrataciones:
+                Contratacion.query.filter(
+                    Contratacion.id.in_(contrataciones),
+                    Contratacion.estado == EstadoContratacion.aceptada
+                ).update({
+                    Contratacion.estado: EstadoContratacion.confirmada,
+                    Contratacion.fecha_actualizacion: ahora,
+                    Contratacion.version: Contratacion.version + 1
+                }, synchronize_session=False)
+            if referencias:
+                usuarios_afectados.update(_organizadores_con_items(referencias))
+                CarritoItem.query.filter(
+                    CarritoItem.referencia_pago.in_(referencias),
+                    CarritoItem.estado.in_([EstadoCarritoItem.pendiente, EstadoCarritoItem.procesando])
+                ).update({
+                    CarritoItem.estado: EstadoCarritoItem.completado,
+                    CarritoItem.fecha_actualizacion: ahora,
+                    CarritoItem.version: CarritoItem.version + 1
+                }, synchronize_session=False)
+
+        elif estado in (EstadoPago.rechazado, EstadoPago.cancelado):
+            # el item vuelve al carrito para poder pagarlo de nuevo (o se cancela si el
+            # servicio ya se volvió a agregar)
+            if referencias:
+                usuarios_afectados.update(_organizadores_con_items(referencias))
+                CarritoItem.liberar_por_referencias(referencias)
+
+        elif estado == EstadoPago.reembolsado and contrataciones:
+            usuarios_afectados.update(fila.proveedor_id for fila in db.session.query(Contratacion.proveedor_id).filter(
+                Contratacion.id.in_(contrataciones), Contratacion.estado == EstadoContratacion.solicitada
+            ).distinct())
+            Contratacion.query.filter(
+                Contratacion.id.in_(contrataciones),
+                Contratacion.estado.notin_([EstadoContratacion.completada, EstadoContratacion.cancelada])
+            ).update({
+                Contratacion.estado: EstadoContratacion.cancelada,
+                Contratacion.fecha_actualizacion: ahora,
+                Contratacion.version: Contratacion.version + 1
+            }, synchronize_session=False)
+
+    db.session.commit()
+    contadores_usuario.invalidar(usuarios_afectados)
+    return actualizados
+
+
+def _organizadores_con_items(referencias):
+    # organizadores con items del carrito reservados con estas referencias de pago
+    from models.carrito import CarritoItem
+
+    return {fila.organizador_id for fila in db.session.query(CarritoItem.organizador_id).filter(
+        CarritoItem.referencia_pago.in_(referencias)
+    ).distinct()}
+
+
+def conciliar_pagos(horas=None, tamano_lote=None, concurrencia=None, simular=False):
+    """
+    Concilia los pagos de MercadoPago que siguen pendientes con su estado real.
+
+    Recorre los pagos pendientes creados en las últimas `horas` por lotes (por id, sin
+    OFFSET). Por cada lote consulta MercadoPago en paralelo con `concurrencia` hilos,
+    sin transacción abierta, y aplica los cambios con UPDATEs por lote. Un fallo de
+    consulta (timeout, circuito abierto...) solo deja ese pago para la próxima pasada.
+
+    Args:
+        horas (int): Antigüedad máxima de los pagos (por defecto CONCILIACION_VENTANA_HORAS)
+        tamano_lote (int): Pagos por lote (por defecto CONCILIACION_TAMANO_LOTE)
+        concurrencia (int): Consultas simultáneas (por defecto CONCILIACION_CONCURRENCIA)
+        simular (bool): Consultar y contar sin modificar la base de datos
+
+    Returns:
+        dict: Pagos revisados, cambios por estado, sin cambios, no encontrados,
+              errores, lotes y duración en segundos
+    """
+    from tareas.pagos import invalidar_estado
+
+    horas = horas or current_app.config.get('CONCILIACION_VENTANA_HORAS', 72)
+    tamano_lote = tamano_lote or current_app.config.get('CONCILIACION_TAMANO_LOTE', 200)
+    concurrencia = concurrencia or current_app.config.get('CONCILIACION_CONCURRENCIA', 8)
+    corte = datetime.utcnow() - timedelta(hours=horas)
+
+    resumen = {
+        'revisados': 0, 'aprobados': 0, 'rechazados': 0, 'cancelados': 0, 'reembolsados': 0,
+        'sin_cambios': 0, 'no_encontrados': 0, 'errores': 0, 'lotes': 0, 'segundos': 0.0
+    }
+    claves_resumen = {
+        EstadoPago.aprobado: 'aprobados', EstadoPago.rechazado: 'rechazados',
+        EstadoPago.cancelado: 'cancelados', EstadoPago.reembolsado: 'reembolsados'
+    }
+    inicio = time.perf_counter()
+    ultimo_id = 0
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        while True:
+            filas = (db.session.query(Pago.id, Pago.mercadopago_id, Pago.referencia_pago,
+                                      Pago.contratacion_id, Pago.id_trabajo)
+                     .filter(Pago.metodo_pago == MetodoPago.mercadopago,
+                             Pago.estado == EstadoPago.pendiente,
+                             Pago.fecha_creacion >= corte,
+                             Pago.id > ultimo_id)
+                     .order_by(Pago.id)
+                     .limit(tamano_lote)
+                     .all())
+            # no mantener la transacción abierta mientras se consulta MercadoPago
+            db.session.commit()
+            if not filas:
+                break
+            ultimo_id = filas[-1].id
+
+            por_estado = {}
+            ids_mercadopago = []
+            for fila, info in zip(filas, pool.map(_consultar, filas)):
+                if not info.get('success'):
+                    resumen['no_encontrados' if info.get('no_encontrado') else 'errores'] += 1
+                    continue
+                if not fila.mercadopago_id:
+                    ids_mercadopago.append({'id': fila.id, 'mercadopago_id': info['payment_id']})
+                estado = _nuevo_estado(info.get('estado'))
+                if estado is None:
+                    resumen['sin_cambios'] += 1
+                else:
+                    por_estado.setdefault(estado, []).append(fila)
+
+            if simular:
+                for estado, filas_estado in por_estado.items():
+                    resumen[claves_resumen[estado]] += len(filas_estado)
+            else:
+                for estado, cantidad in _aplicar_cambios(por_estado, ids_mercadopago).items():
+                    resumen[claves_resumen[estado]] += cantidad
+                for filas_estado in por_estado.values():
+                    for fila in filas_estado:
+                        if fila.id_trabajo:
+                            invalidar_estado(fila.id_trabajo)
+
+            resumen['revisados'] += len(filas)
+            resumen['lotes'] += 1
+
+    resumen['segundos'] = round(time.perf_counter() - inicio, 2)
+    return resumen
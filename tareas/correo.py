@@ -0,0 +1,300 @@
+# tareas/correo.py
+"""
+Envío de correos de notificación por lotes
+EmailObserver solo encola el correo; hilos de fondo toman lotes de la cola, abren una
+conexión SMTP por lote (Flask-Mail) y envían todos los mensajes por ella, respetando
+un máximo de correos por minuto. Las plantillas se compilan una vez por tipo de
+notificación. Para pruebas y mediciones sin servidor real: simuladores/smtp.py
+"""
+
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from datetime import datetime
+
+from flask_mail import Message
+
+logger = logging.getLogger(__name__)
+
+# plantilla genérica; un tipo puede tener la suya en correos/<tipo>.html y .txt
+PLANTILLA_GENERICA = 'correos/notificacion'
+
+
+class ColaCorreosLlena(Exception):
+    """No hay cupo para encolar más correos en este proceso"""
+
+
+class LimitadorTasa:
+    """Token bucket: como máximo `por_minuto` permisos por minuto, con ráfagas de hasta `rafaga`"""
+
+    def __init__(self, por_minuto, rafaga=None):
+        self.por_segundo = por_minuto / 60.0
+        self.rafaga = rafaga or max(1, int(self.por_segundo))
+        self._fichas = float(self.rafaga)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        # bloquea el hilo hasta que haya una ficha disponible
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.rafaga, self._fichas + (ahora - self._ultimo) * self.por_segundo)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                faltante = (1 - self._fichas) / self.por_segundo
+            time.sleep(faltante)
+
+
+class EnviadorCorreos:
+    """
+    Cola acotada de correos y hilos que los envían por lotes.
+
+    - Cada hilo toma hasta CORREO_TAMANO_LOTE correos y los envía por una sola
+      conexión SMTP (la conexión se renueva cada MAIL_MAX_EMAILS mensajes).
+    - CORREO_MAXIMO_POR_MINUTO limita los envíos de todos los hilos del proceso.
+    - Si la conexión se cae se reabre y se reintenta el mensaje una vez; lo que no
+      se pudo enviar queda en NotificacionFallida como fallo de EmailObserver.
+    - Sin MAIL_SERVER (y fuera de pruebas) el correo solo se registra en el log.
+    - Con NOTIFICACIONES_SINCRONAS=True se envía en el mismo hilo (pruebas).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.trabajadores = 1
+        self.tamano_lote = 100
+        self.max_pendientes = 10000
+        self.por_minuto = 1200
+        self.remitente = None
+        self.url_aplicacion = ''
+        self.habilitado = False
+        self.sincrono = False
+        self._reiniciar()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # lee la configuracion y registra el enviador en la aplicacion
+        self.app = app
+        self.trabajadores = app.config.get('CORREO_TRABAJADORES', 1)
+        self.tamano_lote = app.config.get('CORREO_TAMANO_LOTE', 100)
+        self.max_pendientes = app.config.get('CORREO_MAX_PENDIENTES', 10000)
+        self.por_minuto = app.config.get('CORREO_MAXIMO_POR_MINUTO', 1200)
+        self.remitente = app.config.get('MAIL_DEFAULT_SENDER')
+        self.url_aplicacion = (app.config.get('URL_APLICACION') or '').rstrip('/')
+        self.habilitado = bool(app.config.get('MAIL_SERVER')) or app.testing
+        self.sincrono = app.config.get('NOTIFICACIONES_SINCRONAS', False)
+        self._reiniciar()
+        app.extensions['enviador_correos'] = self
+
+    def _reiniciar(self):
+        # cola, hilos, plantillas y métricas por proceso (los hilos no sobreviven a un fork)
+        self._cola = None
+        self._hilos = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._plantillas = {}
+        self._limitador = LimitadorTasa(self.por_minuto)
+        self._metricas = {'encolados': 0, 'enviados': 0, 'fallidos': 0, 'rechazados': 0,
+                          'conexiones': 0, 'lotes': 0, 'cola_maxima': 0}
+
+    def _obtener_cola(self):
+        if self._cola is None or self._pid != os.getpid():
+            with self._lock:
+                if self._cola is None or self._pid != os.getpid():
+                    self._cola = queue.Queue(maxsize=self.max_pendientes)
+                    self._hilos = [
+                        threading.Thread(target=self._trabajar, name=f'eventlink-correo-{numero}', daemon=True)
+                        for numero in range(self.trabajadores)
+                    ]
+                    for hilo in self._hilos:
+                        hilo.start()
+                    self._pid = os.getpid()
+        return self._cola
+
+    def _sumar(self, clave, valor=1):
+        with self._lock:
+            self._metricas[clave] += valor
+
+    def encolar(self, correo, nombre, datos):
+        """
+        Encola el correo de una notificación.
+
+        Args:
+            correo (str): Dirección del destinatario
+            nombre (str): Nombre del destinatario
+            datos (dict): Datos de la notificación (tareas.notificaciones.datos_notificacion)
+
+        Raises:
+            ColaCorreosLlena: Si hay CORREO_MAX_PENDIENTES correos sin enviar
+        """
+        elemento = {'correo': correo, 'nombre': nombre, 'datos': datos}
+        if self.app is None or not self.habilitado:
+            logger.info("Correo no configurado, notificación solo registrada",
+                        extra={'datos': {'usuario_id': datos.get('usuario_id'), 'titulo': datos.get('titulo')}})
+            return
+        if self.sincrono:
+            self._enviar_lote([elemento])
+            return
+
+        cola = self._obtener_cola()
+        try:
+            cola.put_nowait(elemento)
+        except queue.Full:
+            raise ColaCorreosLlena(f"Hay {self.max_pendientes} correos pendientes en este proceso")
+        with self._lock:
+            self._metricas['encolados'] += 1
+            self._metricas['cola_maxima'] = max(self._metricas['cola_maxima'], cola.qsize())
+
+    def _trabajar(self):
+        cola = self._cola
+        while True:
+            lote = [cola.get()]
+            while len(lote) < self.tamano_lote:
+                try:
+                    lote.append(cola.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    self._enviar_lote(lote)
+            except Exception:
+                logger.exception("Error al enviar lote de correos")
+            finally:
+                for _elemento in lote:
+                    cola.task_done()
+
+    def _plantillas_para(self, tipo):
+        # compiladas una vez por tipo de notificación (y por proceso)
+        plantillas = self._plantillas.get(tipo)
+        if plantillas is None:
+            entorno = self.app.jinja_env
+            plantillas = tuple(
+                entorno.select_template([f'correos/{tipo}.{extension}', f'{PLANTILLA_GENERICA}.{extension}'])
+                for extension in ('html', 'txt')
+            )
+            self._plantillas[tipo] = plantillas
+        return plantillas
+
+    def _mensaje(self, elemento):
+        datos = elemento['datos']
+        html, texto = self._plantillas_para(datos['tipo'])
+        variables = {
+            'nombre': elemento['nombre'],
+            'titulo': datos['titulo'],
+            'mensaje': datos['mensaje'],
+            'tipo': datos['tipo'],
+            'url_notificaciones': f"{self.url_aplicacion}/notificaciones/",
+        }
+        return Message(
+            subject=f"EventLink - {datos['titulo']}",
+            recipients=[elemento['correo']],
+            body=texto.render(variables),
+            html=html.render(variables),
+            sender=self.remitente
+        )
+
+    def _enviar_lote(self, lote):
+        """
+        Envía un lote por una sola conexión. Si la conexión se cae se abre otra y el
+        mensaje en curso se reintenta una vez; si no se puede conectar dos veces
+        seguidas, lo que queda del lote se guarda como fallido.
+        """
+        from flask import current_app
+
+        mail = current_app.extensions['mail']
+        pendientes = list(lote)
+        fallidos = []
+        fallos_conexion = 0
+        while pendientes:
+            self._sumar('conexiones')
+            try:
+                with mail.connect() as conexion:
+                    fallos_conexion = 0
+                    while pendientes:
+                        elemento = pendientes[0]
+                        try:
+                            mensaje = self._mensaje(elemento)
+                        except Exception as e:
+                            logger.exception("No se pudo generar el correo")
+                            fallidos.append((elemento, e))
+                            pendientes.pop(0)
+                            continue
+                        self._limitador.esperar()
+                        try:
+                            conexion.send(mensaje)
+                            self._sumar('enviados')
+                        except smtplib.SMTPRecipientsRefused:
+                            # dirección inválida: reintentar no sirve
+                            self._sumar('rechazados')
+                            logger.warning("Destinatario rechazado por el servidor SMTP",
+                                           extra={'datos': {'usuario_id': elemento['datos'].get('usuario_id')}})
+                        except smtplib.SMTPResponseException as e:
+                            if e.smtp_code >= 500 or elemento.get('reintentado'):
+                                fallidos.append((elemento, e))
+                            else:
+                                # error temporal (4xx): se reintenta una vez al final del lote
+                                elemento['reintentado'] = True
+                                pendientes.append(elemento)
+                        pendientes.pop(0)
+            except (smtplib.SMTPException, OSError) as e:
+                fallos_conexion += 1
+                logger.warning("Conexión SMTP interrumpida: %s", e,
+                               extra={'datos': {'pendientes': len(pendientes)}})
+                if fallos_conexion >= 2:
+                    break
+                if pendientes and pendientes[0].get('reintentado'):
+                    fallidos.append((pendientes.pop(0), e))
+                elif pendientes:
+                    pendientes[0]['reintentado'] = True
+
+        self._sumar('lotes')
+        fallidos.extend((elemento, 'Servidor SMTP no disponible') for elemento in pendientes)
+        if fallidos:
+            self._guardar_fallidos(fallidos)
+
+    def _guardar_fallidos(self, fallidos):
+        from database import db
+        from models.notificacion import NotificacionFallida
+
+        self._sumar('fallidos', len(fallidos))
+        try:
+            db.session.add_all([
+                NotificacionFallida(observador='EmailObserver', datos=elemento['datos'], intentos=1,
+                                    error=str(error)[:1000], fecha_ultimo_intento=datetime.utcnow())
+                for elemento, error in fallidos
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("No se pudieron guardar los correos fallidos",
+                             extra={'datos': {'cantidad': len(fallidos)}})
+
+    def estadisticas(self):
+        """Correos encolados, enviados, fallidos, rechazados, conexiones y lotes en este proceso"""
+        with self._lock:
+            metricas = dict(self._metricas)
+        metricas['pendientes'] = self._cola.qsize() if self._cola is not None and self._pid == os.getpid() else 0
+        metricas['habilitado'] = self.habilitado
+        return metricas
+
+    def esperar_pendientes(self, espera=30.0):
+        """Espera hasta `espera` segundos a que se envíe lo encolado (True si se vació)"""
+        limite = time.monotonic() + espera
+        while self._cola is not None and self._cola.unfinished_tasks:
+            if time.monotonic() >= limite:
+                return False
+            time.sleep(0.05)
+        return True
+
+
+# instancia global (se inicializa con init_app en create_app)
+enviador_correos = EnviadorCorreos()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=enviador_correos._reiniciar)
@@ -0,0 +1,144 @@
+# tareas/ejecutor.py
+"""
+Ejecutor de tareas en segundo plano
+Pool de hilos por proceso que corre cada tarea dentro del contexto de la aplicación
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bitacora import id_peticion
+
+logger = logging.getLogger(__name__)
+
+
+class ColaTareasLlena(Exception):
+    """No hay cupo para encolar más tareas en este proceso"""
+
+
+class EjecutorTareas:
+    """
+    Pool de hilos acotado para tareas en segundo plano.
+
+    Cada tarea corre dentro de app.app_context(), así que puede usar db.session
+    como cualquier vista (la sesión se cierra al terminar la tarea). El número de
+    tareas pendientes por proceso está limitado: cuando se llena, enviar() lanza
+    ColaTareasLlena en lugar de acumular trabajo sin límite.
+
+    Con TAREAS_SINCRONAS=True las tareas se ejecutan en el mismo hilo (útil en pruebas).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_trabajadores = 4
+        self.max_pendientes = 100
+        self.sincronas = False
+        self._pool = None
+        self._pid = None
+        self._pendientes = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # lee la configuracion y registra el ejecutor en la aplicacion
+        self.app = app
+        self.max_trabajadores = app.config.get('TAREAS_MAX_TRABAJADORES', 4)
+        self.max_pendientes = app.config.get('TAREAS_MAX_PENDIENTES', 100)
+        self.sincronas = app.config.get('TAREAS_SINCRONAS', False)
+        self._reiniciar()
+        app.extensions['ejecutor_tareas'] = self
+
+    def _reiniciar(self):
+        # el pool y los cupos se crean de nuevo en cada proceso (los hilos no sobreviven a un fork)
+        self._pool = None
+        self._pid = None
+        self._pendientes = 0
+        self._lock = threading.Lock()
+
+    def _obtener_pool(self):
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_trabajadores,
+                        thread_name_prefix='eventlink-tarea'
+                    )
+                    self._pid = os.getpid()
+        return self._pool
+
+    def hay_capacidad(self):
+        # indica si hay cupo para encolar otra tarea en este proceso
+        return self.sincronas or self._pendientes < self.max_pendientes
+
+    @property
+    def pendientes(self):
+        # tareas encoladas o en ejecucion en este proceso
+        return self._pendientes
+
+    def _liberar_cupo(self, _futuro=None):
+        with self._lock:
+            self._pendientes -= 1
+
+    def enviar(self, tarea, *args, **kwargs):
+        """
+        Encola una tarea para ejecutarse en segundo plano.
+
+        Args:
+            tarea (callable): Función a ejecutar
+            *args, **kwargs: Argumentos de la tarea (usar ids, no objetos de la sesión actual)
+
+        Returns:
+            concurrent.futures.Future o el resultado de la tarea si son síncronas
+
+        Raises:
+            ColaTareasLlena: Si se alcanzó TAREAS_MAX_PENDIENTES
+        """
+        if self.app is None:
+            raise RuntimeError("EjecutorTareas no inicializado (falta init_app)")
+
+        if self.sincronas:
+            return self._ejecutar(tarea, args, kwargs, id_peticion.get())
+
+        pool = self._obtener_pool()
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                raise ColaTareasLlena(f"Hay {self.max_pendientes} tareas pendientes en este proceso")
+            self._pendientes += 1
+
+        try:
+            # la tarea conserva el id de la petición que la encoló (para los logs)
+            futuro = pool.submit(self._ejecutar, tarea, args, kwargs, id_peticion.get())
+        except Exception:
+            self._liberar_cupo()
+            raise
+        futuro.add_done_callback(self._liberar_cupo)
+        return futuro
+
+    def _ejecutar(self, tarea, args, kwargs, peticion=None):
+        marca = id_peticion.set(peticion)
+        with self.app.app_context():
+            try:
+                return tarea(*args, **kwargs)
+            except Exception:
+                from database import db
+                db.session.rollback()
+                logger.exception("Tarea %s falló", getattr(tarea, '__name__', tarea))
+                raise
+            finally:
+                id_peticion.reset(marca)
+
+    def apagar(self, esperar=True):
+        # espera a que terminen las tareas en curso y libera los hilos
+        if self._pool is not None:
+            self._pool.shutdown(wait=esperar)
+            self._pool = None
+
+
+# instancia global (se inicializa con init_app en create_app)
+ejecutor_tareas = EjecutorTareas()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=ejecutor_tareas._reiniciar)
@@ -0,0 +1,350 @@
+# tareas/escritura_notificaciones.py
+"""
+Escritura de notificaciones por lotes
+En lugar de un add + commit por notificación, las filas se acumulan en memoria y se
+guardan con un INSERT de varias filas cuando se junta un lote, cada pocos
+milisegundos, al terminar la petición o el lote del despachador que las agregó, y
+al salir del proceso. Si el INSERT de un lote falla sus filas se insertan de a una:
+las que fallan solas (p. ej. un usuario que ya no existe) pasan a NotificacionFallida
+como entregas fallidas de DatabaseObserver y el resto se guarda. Si no entra ninguna
+(base de datos caída) el lote vuelve al buffer y se reintenta (al menos una vez: un
+reintento después de un commit incierto puede duplicar filas); después de
+NOTIFICACIONES_ESCRITURA_MAX_FALLOS vaciados fallidos seguidos, o si al salir del
+proceso no se pueden guardar, las filas pendientes también pasan a NotificacionFallida.
+Las fallidas se reenvían con `flask reintentar-notificaciones`. Solo si tampoco eso se puede guardar quedan en el log.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_NOTIFICACION = (
+    'titulo', 'mensaje', 'tipo', 'estado', 'usuario_id', 'evento_id', 'servicio_id',
+    'contratacion_id', 'pago_id', 'datos_adicionales', 'fecha_creacion'
+)
+
+
+def fila_notificacion(notificacion=None, **campos):
+    """
+    Fila para el INSERT a partir de una Notificacion sin guardar o directamente de
+    sus campos (más barato que instanciar el modelo). La fecha es la de creación,
+    no la del INSERT.
+    """
+    from models.notificacion import EstadoNotificacion
+
+    if notificacion is not None:
+        campos = {columna: getattr(notificacion, columna) for columna in COLUMNAS_NOTIFICACION}
+    fila = dict.fromkeys(COLUMNAS_NOTIFICACION)
+    fila.update(campos)
+    fila['estado'] = fila['estado'] or EstadoNotificacion.no_leida
+    fila['fecha_creacion'] = fila['fecha_creacion'] or datetime.utcnow()
+    return fila
+
+
+class EscritorNotificaciones:
+    """
+    Buffer de notificaciones que se insertan por lotes.
+
+    - agregar() solo guarda la fila en memoria; con NOTIFICACIONES_ESCRITURA_LOTE
+      filas pendientes despierta al hilo de escritura.
+    - El hilo de escritura guarda lo pendiente cada NOTIFICACIONES_ESCRITURA_INTERVALO
+      segundos; las peticiones que agregaron filas las guardan al terminar.
+    - Un solo vaciado a la vez por proceso. Si el INSERT de un lote falla se insertan
+      sus filas de a una y se apartan como fallidas solo las que fallan; si no entra
+      ninguna, las filas vuelven al inicio del buffer para el siguiente vaciado y tras
+      NOTIFICACIONES_ESCRITURA_MAX_FALLOS fallos seguidos se apartan como fallidas.
+    - Con NOTIFICACIONES_SINCRONAS=True cada agregar() guarda en el momento (pruebas).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.tamano_lote = 500
+        self.intervalo = 0.5
+        self.max_fallos = 5
+        self.sincrono = False
+        self._reiniciar()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # lee la configuracion, guarda lo pendiente al terminar cada peticion y registra el escritor
+        self.app = app
+        self.tamano_lote = app.config.get('NOTIFICACIONES_ESCRITURA_LOTE', 500)
+        self.intervalo = app.config.get('NOTIFICACIONES_ESCRITURA_INTERVALO', 0.5)
+        self.max_fallos = app.config.get('NOTIFICACIONES_ESCRITURA_MAX_FALLOS', 5)
+        self.sincrono = app.config.get('NOTIFICACIONES_SINCRONAS', False)
+        self._reiniciar()
+        if 'escritor_notificaciones' not in app.extensions:
+            app.teardown_request(self._vaciar_al_terminar_peticion)
+        app.extensions['escritor_notificaciones'] = self
+
+    def _reiniciar(self):
+        # el buffer y el hilo son de cada proceso: el hijo de un fork no vuelve a escribir lo del padre
+        self._pendientes = []
+        self._lock = threading.Lock()
+        self._lock_vaciado = threading.Lock()
+        self._despertar = threading.Event()
+        self._hilo = None
+        self._pid = os.getpid()
+        self._fallos_seguidos = 0
+        self._metricas = {'agregadas': 0, 'escritas': 0, 'inserts': 0, 'fallos': 0, 'apartadas': 0,
+                          'pendientes_maximo': 0}
+
+    def _iniciar_hilo(self):
+        if self._hilo is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._vaciar_periodicamente,
+                                          name='eventlink-escritor-notificaciones', daemon=True)
+            self._hilo.start()
+
+    def agregar(self, filas):
+        """
+        Agrega notificaciones al buffer.
+
+        Args:
+            filas (list): Filas de fila_notificacion() (o una sola fila)
+        """
+        if isinstance(filas, dict):
+            filas = [filas]
+        with self._lock:
+            self._pendientes.extend(filas)
+            self._metricas['agregadas'] += len(filas)
+            pendientes = len(self._pendientes)
+            self._metricas['pendientes_maximo'] = max(self._metricas['pendientes_maximo'], pendientes)
+            if self.app is not None and not self.sincrono:
+                self._iniciar_hilo()
+
+        if self.app is None or self.sincrono:
+            self.vaciar()
+            return
+        try:
+            from flask import g
+            g.notificaciones_por_escribir = True
+        except RuntimeError:
+            pass    # fuera de un contexto de aplicación (p. ej. hilos propios)
+        if pendientes >= self.tamano_lote:
+            self._despertar.set()
+
+    def vaciar(self):
+        """
+        Inserta todas las filas pendientes, en lotes de NOTIFICACIONES_ESCRITURA_LOTE.
+        Si el INSERT de un lote falla se insertan sus filas una por una: las que fallan
+        solas (p. ej. un usuario_id que ya no existe) se apartan como fallidas y el
+        resto se guarda.
+
+        Returns:
+            int: Filas insertadas
+
+        Raises:
+            Exception: El error del INSERT si no se pudo guardar ninguna fila del lote
+                       (siguen pendientes, o apartadas como fallidas si ya van
+                       NOTIFICACIONES_ESCRITURA_MAX_FALLOS)
+        """
+        from models.notificacion import Notificacion
+
+        sentencia = insert(Notificacion.__table__)
+        with self._lock_vaciado:
+            with self._lock:
+                filas, self._pendientes = self._pendientes, []
+            escritas = procesadas = 0
+            try:
+                for inicio in range(0, len(filas), self.tamano_lote):
+                    lote = filas[inicio:inicio + self.tamano_lote]
+                    try:
+                        # conexión propia: no depende del estado de la sesión de quien vacía. Con
+                        # una lista de filas SQLAlchemy envía INSERTs de varias filas (insertmanyvalues /
+                        # execute_values) y la sentencia compilada queda en cache
+                        with db.engine.begin() as conexion:
+                            conexion.execute(sentencia, lote)
+                        self._sumar_inserts(1)
+                    except Exception:
+                        lote = self._insertar_por_fila(sentencia, lote)
+                    self._publicar(lote)
+                    escritas += len(lote)
+                    procesadas = inicio + self.tamano_lote
+            except Exception as e:
+                with self._lock:
+                    self._pendientes[:0] = filas[procesadas:]
+                    self._metricas['fallos'] += 1
+                    self._fallos_seguidos += 1
+                    apartar = self._fallos_seguidos >= self.max_fallos
+                if apartar:
+                    self._apartar_pendientes(e)
+                raise
+            self._fallos_seguidos = 0
+            return escritas
+
+    def _insertar_por_fila(self, sentencia, lote):
+        """
+        Inserta las filas del lote de a una y aparta como fallidas las que no se pueden
+        guardar. Si no se guarda ninguna (base de datos caída, no una fila inválida)
+        relanza el error para que el lote completo se reintente.
+
+        Returns:
+            list: Filas insertadas
+        """
+        guardadas, fallidas, error = [], [], None
+        for fila in lote:
+            try:
+                with db.engine.begin() as conexion:
+                    conexion.execute(sentencia, fila)
+                guardadas.append(fila)
+            except Exception as e:
+                fallidas.append((fila, e))
+                error = e
+        self._sumar_inserts(len(guardadas))
+        if not guardadas:
+            raise error
+        if fallidas and not self._apartar(fallidas):
+            # siguen pendientes: el próximo vaciado vuelve a intentarlo
+            with self._lock:
+                self._pendientes[:0] = [fila for fila, _error in fallidas]
+        return guardadas
+
+    def _sumar_inserts(self, cantidad):
+        with self._lock:
+            self._metricas['inserts'] += cantidad
+
+    def _publicar(self, lote):
+        from models.notificacion import EstadoNotificacion
+        from patterns.contadores import contadores_usuario
+        from tareas.tiempo_real import bus_notificaciones
+
+        # el INSERT no pasa por la sesión: los contadores se suman aquí
+        nuevas = Counter(fila['usuario_id'] for fila in lote if fila['estado'] == EstadoNotificacion.no_leida)
+        contadores_usuario.sumar({usuario_id: {'notificaciones': cantidad}
+                                  for usuario_id, cantidad in nuevas.items()})
+        # y se entregan a las pestañas abiertas (SSE)
+        bus_notificaciones.publicar(lote)
+        with self._lock:
+            self._metricas['escritas'] += len(lote)
+
+    def _apartar_pendientes(self, error):
+        """
+        Aparta todas las filas pendientes como fallidas (tras NOTIFICACIONES_ESCRITURA_MAX_FALLOS
+        vaciados fallidos o al salir). Si no se pueden guardar siguen pendientes.
+        Se llama con _lock_vaciado tomado.
+
+        Returns:
+            int: Filas apartadas
+        """
+        with self._lock:
+            filas, self._pendientes = self._pendientes, []
+        if not filas:
+            return 0
+        if not self._apartar([(fila, error) for fila in filas]):
+            with self._lock:
+                self._pendientes[:0] = filas
+            return 0
+        self._fallos_seguidos = 0
+        return len(filas)
+
+    def _apartar(self, fallidas):
+        """
+        Guarda filas como NotificacionFallida de DatabaseObserver (un INSERT) para
+        reenviarlas con `flask reintentar-notificaciones`.
+
+        Args:
+            fallidas (list): Pares (fila, error)
+
+        Returns:
+            bool: True si se guardaron
+        """
+        from models.notificacion import NotificacionFallida
+
+        ahora = datetime.utcnow()
+        registros = [{
+            'observador': 'DatabaseObserver',
+            # los mismos datos que datos_notificacion(): reintentar-notificaciones la reconstruye
+            'datos': {campo: valor.value if campo == 'tipo' else valor
+                      for campo, valor in fila.items() if campo not in ('estado', 'fecha_creacion')},
+            'intentos': max(self._fallos_seguidos, 1),
+            'error': str(error)[:1000],
+            'fecha_creacion': ahora,
+            'fecha_ultimo_intento': ahora
+        } for fila, error in fallidas]
+        try:
+            with db.engine.begin() as conexion:
+                conexion.execute(insert(NotificacionFallida.__table__), registros)
+        except Exception:
+            logger.exception("No se pudieron apartar las notificaciones sin guardar",
+                             extra={'datos': {'pendientes': len(fallidas)}})
+            return False
+        with self._lock:
+            self._metricas['apartadas'] += len(fallidas)
+        logger.error("Notificaciones apartadas como fallidas: %s", fallidas[-1][1],
+                     extra={'datos': {'notificaciones': len(fallidas)}})
+        return True
+
+    def _vaciar_periodicamente(self):
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            if not self._pendientes:
+                continue
+            try:
+                with self.app.app_context():
+                    self.vaciar()
+            except Exception as e:
+                logger.warning("No se pudieron guardar las notificaciones, se reintentará: %s", e,
+                               extra={'datos': {'pendientes': len(self._pendientes)}})
+                time.sleep(self.intervalo)
+
+    def _vaciar_al_terminar_peticion(self, _error=None):
+        from flask import g
+
+        if g.pop('notificaciones_por_escribir', False) and self._pendientes:
+            try:
+                self.vaciar()
+            except Exception as e:
+                # el hilo de escritura las reintenta
+                logger.warning("No se pudieron guardar las notificaciones de la petición: %s", e)
+
+    def estadisticas(self):
+        """Filas agregadas, escritas, INSERTs, fallos y pendientes en este proceso"""
+        with self._lock:
+            return dict(self._metricas, pendientes=len(self._pendientes))
+
+    def apagar(self):
+        # último vaciado al salir; lo que no se pueda guardar pasa a NotificacionFallida
+        # y, si tampoco se puede, queda en el log para recuperarlo
+        if not self._pendientes or self._pid != os.getpid():
+            return
+        if self.app is not None:
+            with self.app.app_context():
+                self._vaciar_o_apartar()
+        else:
+            self._vaciar_o_apartar()
+        if self._pendientes:
+            logger.error("Notificaciones sin guardar al detener el proceso",
+                         extra={'datos': {'notificaciones': [
+                             dict(fila, tipo=fila['tipo'].value, estado=fila['estado'].value)
+                             for fila in self._pendientes
+                         ]}})
+
+    def _vaciar_o_apartar(self):
+        try:
+            self.vaciar()
+        except Exception as e:
+            logger.warning("No se pudieron guardar las notificaciones al detener el proceso: %s", e)
+            with self._lock_vaciado:
+                self._apartar_pendientes(e)
+
+
+# instancia global (se inicializa con init_app en create_app)
+escritor_notificaciones = EscritorNotificaciones()
+
+atexit.register(escritor_notificaciones.apagar)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=escritor_notificaciones._reiniciar)
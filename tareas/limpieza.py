@@ -0,0 +1,120 @@
+# tareas/limpieza.py
+"""
+Limpieza de checkouts abandonados
+Cada checkout del carrito crea una contratación 'solicitada' (y normalmente un pago
+pendiente) antes de ir a MercadoPago; si el usuario nunca paga, esas filas quedan
+para siempre. Esta tarea las elimina por lotes una vez pasada la ventana configurada
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, exists, or_
+
+from database import db
+from models.carrito import CarritoItem, EstadoCarritoItem
+from models.contratacion import Contratacion, EstadoContratacion
+from models.idempotencia import ClaveIdempotencia
+from models.notificacion import Notificacion
+from models.pago import Pago, EstadoPago
+from patterns.contadores import contadores_usuario
+
+
+def _contrataciones_abandonadas(corte):
+    # contrataciones del carrito que siguen 'solicitada' y cuyo pago (si lo hay)
+    # nunca pasó de pendiente ni llegó a MercadoPago
+    pago_con_avance = exists().where(and_(
+        Pago.contratacion_id == Contratacion.id,
+        or_(Pago.estado != EstadoPago.pendiente, Pago.id_transaccion.isnot(None))
+    ))
+    return Contratacion.query.filter(
+        Contratacion.origen == 'carrito',
+        Contratacion.estado == EstadoContratacion.solicitada,
+        Contratacion.fecha_creacion < corte,
+        ~pago_con_avance
+    )
+
+
+def limpiar_checkouts_abandonados(horas=None, tamano_lote=None, simular=False):
+    """
+    Elimina las contrataciones y pagos de checkouts que nunca avanzaron.
+
+    Por cada lote: descarta las claves de idempotencia que apuntan a esas filas,
+    desvincula sus notificaciones, devuelve a pendiente los items que quedaron
+    reservados con esos pagos y borra pagos y contrataciones con DELETE por lote.
+    Al final elimina las claves de idempotencia vencidas.
+
+    Args:
+        horas (int): Antigüedad mínima (por defecto CHECKOUT_ABANDONADO_HORAS)
+        tamano_lote (int): Contrataciones por lote (por defecto LIMPIEZA_TAMANO_LOTE)
+        simular (bool): Solo contar lo que se eliminaría
+
+    Returns:
+        dict: Totales de contrataciones, pagos, items liberados, claves y lotes
+    """
+    from patterns.singleton import payment_gateway
+
+    horas = horas or current_app.config.get('CHECKOUT_ABANDONADO_HORAS', 48)
+    tamano_lote = tamano_lote or current_app.config.get('LIMPIEZA_TAMANO_LOTE', 500)
+    # nunca antes de que venza la preferencia: el usuario aún podría pagarla
+    antiguedad = max(timedelta(hours=horas), payment_gateway.vigencia_preferencia)
+    corte = datetime.utcnow() - antiguedad
+
+    resumen = {'contrataciones': 0, 'pagos': 0, 'items_liberados': 0, 'claves': 0, 'lotes': 0}
+
+    if simular:
+        ids = [fila.id for fila in _contrataciones_abandonadas(corte).with_entities(Contratacion.id)]
+        resumen['contrataciones'] = len(ids)
+        if ids:
+            resumen['pagos'] = Pago.query.filter(Pago.contratacion_id.in_(ids)).count()
+        return resumen
+
+    ultimo_id = 0
+    while True:
+        ids = [fila.id for fila in (_contrataciones_abandonadas(corte)
+                                    .filter(Contratacion.id > ultimo_id)
+                                    .with_entities(Contratacion.id)
+                                    .order_by(Contratacion.id)
+                                    .limit(tamano_lote))]
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+
+        pagos = db.session.query(Pago.id, Pago.referencia_pago).filter(Pago.contratacion_id.in_(ids)).all()
+        ids_pagos = [pago.id for pago in pagos]
+        referencias = [pago.referencia_pago for pago in pagos if pago.referencia_pago]
+
+        condicion_claves = ClaveIdempotencia.contratacion_id.in_(ids)
+        if ids_pagos:
+            condicion_claves = or_(condicion_claves, ClaveIdempotencia.pago_id.in_(ids_pagos))
+        resumen['claves'] += ClaveIdempotencia.query.filter(condicion_claves).delete(synchronize_session=False)
+
+        Notificacion.query.filter(Notificacion.contratacion_id.in_(ids)).update(
+            {Notificacion.contratacion_id: None, Notificacion.pago_id: None}, synchronize_session=False
+        )
+
+        # los DELETE/UPDATE por lote no pasan por la sesión: se invalidan los contadores
+        # de los proveedores (solicitudes eliminadas) y organizadores (items liberados)
+        usuarios_afectados = {fila.proveedor_id for fila in db.session.query(Contratacion.proveedor_id).filter(
+            Contratacion.id.in_(ids)
+        ).distinct()}
+
+        if referencias:
+            usuarios_afectados.update(fila.organizador_id for fila in db.session.query(CarritoItem.organizador_id).filter(
+                CarritoItem.referencia_pago.in_(referencias),
+                CarritoItem.estado == EstadoCarritoItem.procesando
+            ).distinct())
+            # items reservados por un pago que nunca se envió (p. ej. worker caído)
+            resumen['items_liberados'] += CarritoItem.liberar_por_referencias(
+                referencias, {'referencia_pago': None}
+            )
+
+        if ids_pagos:
+            resumen['pagos'] += Pago.query.filter(Pago.id.in_(ids_pagos)).delete(synchronize_session=False)
+        resumen['contrataciones'] += Contratacion.query.filter(Contratacion.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        contadores_usuario.invalidar(usuarios_afectados)
+        resumen['lotes'] += 1
+
+    resumen['claves'] += ClaveIdempotencia.limpiar_vencidas()
+    return resumen
@@ -0,0 +1,89 @@
+# tareas/migraciones.py
+"""
+Migraciones de datos que acompañan a cambios de esquema
+Se ejecutan desde consola después de `flask actualizar-esquema`; son idempotentes
+(volver a ejecutarlas no cambia las filas ya migradas)
+"""
+
+import json
+
+from sqlalchemy import inspect
+from sqlalchemy.dialects.postgresql import JSONB
+
+from database import db
+from models.pago import Pago, MetodoPago
+
+
+def migrar_datos_pagos(tamano_lote=500):
+    """
+    Migra pagos existentes al esquema con JSONB e identificadores de MercadoPago.
+
+    1. En PostgreSQL convierte datos_adicionales a JSONB si la columna es json/texto.
+    2. Copia id_transaccion a mercadopago_id en los pagos de MercadoPago (un UPDATE).
+    3. Por lotes: decodifica los datos_adicionales guardados como texto JSON y mueve
+       la clave 'mercadopago_id' (el id de la preferencia) a la columna preference_id.
+
+    Args:
+        tamano_lote (int): Pagos leídos y actualizados por lote
+
+    Returns:
+        dict: Cambios aplicados en cada paso
+    """
+    resumen = {'columna_jsonb': False, 'mercadopago_id': 0, 'preference_id': 0, 'datos_normalizados': 0}
+    motor = db.engine
+
+    if motor.dialect.name == 'postgresql':
+        columnas = {columna['name']: columna for columna in inspect(motor).get_columns(Pago.__tablename__)}
+        columna = columnas.get('datos_adicionales')
+        if columna is not None and not isinstance(columna['type'], JSONB):
+            with motor.begin() as conexion:
+                conexion.exec_driver_sql(
+                    "ALTER TABLE pagos ALTER COLUMN datos_adicionales TYPE JSONB USING datos_adicionales::jsonb"
+                )
+            resumen['columna_jsonb'] = True
+
+    resumen['mercadopago_id'] = Pago.query.filter(
+        Pago.metodo_pago == MetodoPago.mercadopago,
+        Pago.mercadopago_id.is_(None),
+        Pago.id_transaccion.isnot(None)
+    ).update({Pago.mercadopago_id: Pago.id_transaccion}, synchronize_session=False)
+    db.session.commit()
+
+    ultimo_id = 0
+    while True:
+        filas = (db.session.query(Pago.id, Pago.datos_adicionales, Pago.preference_id)
+                 .filter(Pago.id > ultimo_id, Pago.datos_adicionales.isnot(None))
+                 .order_by(Pago.id)
+                 .limit(tamano_lote)
+                 .all())
+        if not filas:
+            break
+        ultimo_id = filas[-1].id
+
+        cambios = []
+        for fila in filas:
+            datos = fila.datos_adicionales
+            cambio = {}
+            if isinstance(datos, str):
+                # guardado por la versión anterior del modelo como texto JSON
+                try:
+                    datos = json.loads(datos)
+                except ValueError:
+                    datos = {'valor': datos}
+                cambio['datos_adicionales'] = datos
+                resumen['datos_normalizados'] += 1
+            if isinstance(datos, dict) and 'mercadopago_id' in datos:
+                datos = dict(datos)
+                id_preferencia = datos.pop('mercadopago_id')
+                cambio['datos_adicionales'] = datos
+                if id_preferencia and not fila.preference_id:
+                    cambio['preference_id'] = str(id_preferencia)
+                    resumen['preference_id'] += 1
+            if cambio:
+                cambios.append(dict(cambio, id=fila.id))
+
+        if cambios:
+            db.session.bulk_update_mappings(Pago, cambios)
+        db.session.commit()
+
+    return resumen
@@ -0,0 +1,391 @@
+# tareas/notificaciones.py
+"""
+Despacho de notificaciones en segundo plano
+La petición solo encola los datos de la notificación; hilos del proceso la entregan
+a cada observador (base de datos, email, push, log) con reintentos por observador.
+Lo que falla en todos los intentos queda en NotificacionFallida (dead letter) para
+reenviarlo con `flask reintentar-notificaciones`
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from bitacora import id_peticion
+from database import db
+# importado antes de registrar apagar(): atexit corre en orden inverso y el escritor
+# debe guardar después de que el despachador vacíe su cola
+from tareas.escritura_notificaciones import escritor_notificaciones
+
+logger = logging.getLogger(__name__)
+
+# campos con los que se reconstruye la notificación en el hilo que la entrega
+CAMPOS_NOTIFICACION = (
+    'titulo', 'mensaje', 'tipo', 'usuario_id', 'evento_id', 'servicio_id',
+    'contratacion_id', 'pago_id', 'datos_adicionales'
+)
+
+
+def datos_notificacion(notificacion):
+    # datos serializables de una notificación (los objetos de la sesión no cruzan hilos)
+    datos = {campo: getattr(notificacion, campo) for campo in CAMPOS_NOTIFICACION}
+    datos['tipo'] = notificacion.tipo.value
+    # se guardan en columnas JSON (notificación y dead letter): Decimal, fechas... como texto
+    if datos['datos_adicionales'] is not None:
+        datos['datos_adicionales'] = json.loads(json.dumps(datos['datos_adicionales'], default=str))
+    return datos
+
+
+def reconstruir_notificacion(datos):
+    # nueva Notificacion (sin guardar) a partir de datos_notificacion()
+    from models.notificacion import Notificacion, TipoNotificacion
+
+    return Notificacion(**dict(datos, tipo=TipoNotificacion(datos['tipo'])))
+
+
+class DespachadorNotificaciones:
+    """
+    Cola acotada y pool de hilos que entregan las notificaciones a los observadores.
+
+    - Cada observador se reintenta por separado (NOTIFICACIONES_MAX_INTENTOS, con
+      espera exponencial); si uno falla, los demás se entregan igual.
+    - Si la cola está llena (NOTIFICACIONES_MAX_PENDIENTES), la notificación se
+      entrega en la misma petición en lugar de descartarla, y se cuenta.
+    - Cada hilo toma de la cola hasta NOTIFICACIONES_TAMANO_LOTE notificaciones y
+      carga una sola vez las preferencias de todos sus destinatarios (ContextoDespacho).
+    - Con NOTIFICACIONES_SINCRONAS=True se entrega siempre en el mismo hilo (pruebas).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.trabajadores = 2
+        self.max_pendientes = 1000
+        self.max_intentos = 3
+        self.espera_reintento = 0.5
+        self.tamano_lote = 50
+        self.sincronas = False
+        self._reiniciar()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # lee la configuracion y registra el despachador en la aplicacion
+        self.app = app
+        self.trabajadores = app.config.get('NOTIFICACIONES_TRABAJADORES', 2)
+        self.max_pendientes = app.config.get('NOTIFICACIONES_MAX_PENDIENTES', 1000)
+        self.max_intentos = app.config.get('NOTIFICACIONES_MAX_INTENTOS', 3)
+        self.espera_reintento = app.config.get('NOTIFICACIONES_ESPERA_REINTENTO', 0.5)
+        self.tamano_lote = app.config.get('NOTIFICACIONES_TAMANO_LOTE', 50)
+        self.sincronas = app.config.get('NOTIFICACIONES_SINCRONAS', False)
+        self._reiniciar()
+        app.extensions['despachador_notificaciones'] = self
+
+    def _reiniciar(self):
+        # la cola, los hilos y las métricas son de cada proceso (los hilos no sobreviven a un fork)
+        self._cola = None
+        self._hilos = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._metricas = {
+            'encoladas': 0, 'en_linea': 0, 'entregadas': 0, 'reintentos': 0, 'fallidas': 0,
+            'cola_maxima': 0, 'espera_total_ms': 0.0, 'espera_maxima_ms': 0.0, 'por_observador': {}
+        }
+
+    def _obtener_cola(self):
+        if self._cola is None or self._pid != os.getpid():
+            with self._lock:
+                if self._cola is None or self._pid != os.getpid():
+                    self._cola = queue.Queue(maxsize=self.max_pendientes)
+                    self._hilos = [
+                        threading.Thread(target=self._trabajar, name=f'eventlink-notificacion-{numero}', daemon=True)
+                        for numero in range(self.trabajadores)
+                    ]
+                    for hilo in self._hilos:
+                        hilo.start()
+                    self._pid = os.getpid()
+        return self._cola
+
+    def _sumar(self, clave, valor=1, observador=None):
+        with self._lock:
+            if observador is None:
+                self._metricas[clave] += valor
+            else:
+                por_observador = self._metricas['por_observador'].setdefault(
+                    observador, {'entregadas': 0, 'reintentos': 0, 'fallidas': 0})
+                por_observador[clave] += valor
+                self._metricas[clave] += valor
+
+    def encolar(self, sistema, datos):
+        """
+        Encola la entrega de una notificación a los observadores de `sistema`.
+
+        Args:
+            sistema (SistemaNotificaciones): Sistema con los observadores registrados
+            datos (dict): Datos de la notificación (datos_notificacion)
+
+        Returns:
+            bool: True si quedó encolada, False si se entregó en este mismo hilo
+        """
+        if self.app is None or self.sincronas:
+            self._despachar([(sistema, datos, id_peticion.get())])
+            return False
+
+        cola = self._obtener_cola()
+        try:
+            cola.put_nowait((sistema, datos, id_peticion.get(), time.monotonic()))
+        except queue.Full:
+            self._sumar('en_linea')
+            logger.warning("Cola de notificaciones llena, entrega en la petición",
+                           extra={'datos': {'pendientes': cola.qsize()}})
+            self._despachar([(sistema, datos, id_peticion.get())])
+            return False
+
+        with self._lock:
+            self._metricas['encoladas'] += 1
+            self._metricas['cola_maxima'] = max(self._metricas['cola_maxima'], cola.qsize())
+        return True
+
+    def _trabajar(self):
+        cola = self._cola
+        while True:
+            # la primera espera; las siguientes solo si ya están en la cola
+            elementos = [cola.get()]
+            while elementos[-1] is not None and len(elementos) < self.tamano_lote:
+                try:
+                    elementos.append(cola.get_nowait())
+                except queue.Empty:
+                    break
+            terminar = elementos[-1] is None
+            lote = [elemento for elemento in elementos if elemento is not None]
+            try:
+                ahora = time.monotonic()
+                with self._lock:
+                    for _sistema, _datos, _peticion, encolada in lote:
+                        espera_ms = (ahora - encolada) * 1000
+                        self._metricas['espera_total_ms'] += espera_ms
+                        self._metricas['espera_maxima_ms'] = max(self._metricas['espera_maxima_ms'], espera_ms)
+                if lote:
+                    self._despachar([elemento[:3] for elemento in lote])
+            except Exception:
+                logger.exception("Error al despachar notificaciones")
+            finally:
+                for _elemento in elementos:
+                    cola.task_done()
+            if terminar:
+                return
+
+    def _despachar(self, lote):
+        # entrega un lote [(sistema, datos, id_peticion)] dentro de un contexto de aplicación propio
+        if self.app is None:
+            self._entregar_lote(lote)
+        else:
+            with self.app.app_context():
+                self._entregar_lote(lote)
+
+    def _entregar_lote(self, lote):
+        from patterns.observer import ContextoDespacho
+
+        try:
+            contexto = ContextoDespacho.cargar(datos['usuario_id'] for _sistema, datos, _peticion in lote)
+        except Exception as e:
+            # cada observador cargará las preferencias que necesite (y reintentará si falla)
+            db.session.rollback()
+            logger.warning("No se pudieron cargar las preferencias del lote: %s", e)
+            contexto = ContextoDespacho()
+
+        for sistema, datos, peticion in lote:
+            marca = id_peticion.set(peticion)
+            try:
+                notificacion = reconstruir_notificacion(datos)
+                for observador in sistema.observadores:
+                    self.entregar(observador, notificacion, datos, contexto=contexto)
+            finally:
+                id_peticion.reset(marca)
+
+        # las filas de DatabaseObserver del lote en un solo INSERT
+        try:
+            escritor_notificaciones.vaciar()
+        except Exception as e:
+            logger.warning("No se pudieron guardar las notificaciones del lote, se reintentará: %s", e)
+
+    def entregar(self, observador, notificacion, datos, contexto=None, max_intentos=None, intentos_previos=0):
+        """
+        Entrega la notificación a un observador, reintentando si falla.
+
+        Args:
+            observador (NotificacionObserver): Canal de entrega
+            notificacion (Notificacion): Notificación reconstruida en este hilo
+            datos (dict): Datos de la notificación (para el dead letter)
+            contexto (ContextoDespacho): Preferencias de los destinatarios del lote
+            max_intentos (int): Intentos en esta llamada (por defecto NOTIFICACIONES_MAX_INTENTOS)
+            intentos_previos (int): Intentos ya hechos antes (reenvío de fallidas)
+
+        Returns:
+            bool: True si el observador la procesó
+        """
+        nombre = type(observador).__name__
+        max_intentos = max_intentos or self.max_intentos
+        for intento in range(1, max_intentos + 1):
+            try:
+                observador.actualizar(notificacion, contexto)
+                self._sumar('entregadas', observador=nombre)
+                return True
+            except Exception as e:
+                db.session.rollback()
+                if intento < max_intentos:
+                    self._sumar('reintentos', observador=nombre)
+                    logger.warning("Reintentando notificación en %s: %s", nombre, e,
+                                   extra={'datos': {'intento': intento}})
+                    time.sleep(self.espera_reintento * 2 ** (intento - 1))
+                    continue
+                self._sumar('fallidas', observador=nombre)
+                logger.exception("Notificación no entregada en %s tras %d intentos", nombre, intento)
+                if not intentos_previos:
+                    self._guardar_fallida(nombre, datos, intento, e)
+                return False
+
+    def _guardar_fallida(self, observador, datos, intentos, error):
+        from models.notificacion import NotificacionFallida
+
+        try:
+            db.session.add(NotificacionFallida(
+                observador=observador, datos=datos, intentos=intentos,
+                error=str(error)[:1000], fecha_ultimo_intento=datetime.utcnow()
+            ))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("No se pudo guardar la notificación fallida",
+                             extra={'datos': {'observador': observador, 'notificacion': datos}})
+
+    def estadisticas(self):
+        """
+        Métricas de despacho de este proceso.
+
+        Returns:
+            dict: pendientes en cola, máximo observado, encoladas, entregadas en la
+                  petición por cola llena, entregadas, reintentos, fallidas, espera
+                  media/máxima en cola (ms) y contadores por observador
+        """
+        with self._lock:
+            metricas = dict(self._metricas, por_observador={
+                nombre: dict(valores) for nombre, valores in self._metricas['por_observador'].items()
+            })
+        espera_total = metricas.pop('espera_total_ms')
+        return dict(
+            metricas,
+            pendientes=self._cola.qsize() if self._cola is not None and self._pid == os.getpid() else 0,
+            capacidad=self.max_pendientes,
+            trabajadores=self.trabajadores,
+            espera_media_ms=round(espera_total / metricas['encoladas'], 1) if metricas['encoladas'] else 0.0,
+            espera_maxima_ms=round(metricas['espera_maxima_ms'], 1)
+        )
+
+    def apagar(self, espera=5.0):
+        """
+        Detiene los hilos esperando hasta `espera` segundos a que vacíen la cola; lo
+        que quede sin entregar se guarda como fallido para reenviarlo después (solo para los observadores
+        durables: lo que solo se registra en el log no se reenvía).
+        """
+        cola = self._cola
+        if cola is None or self._pid != os.getpid():
+            return
+        for _hilo in self._hilos:
+            try:
+                cola.put(None, timeout=espera)
+            except queue.Full:
+                break
+        limite = time.monotonic() + espera
+        for hilo in self._hilos:
+            hilo.join(max(limite - time.monotonic(), 0))
+
+        restantes = []
+        while True:
+            try:
+                elemento = cola.get_nowait()
+            except queue.Empty:
+                break
+            if elemento is not None:
+                restantes.append(elemento)
+        self._cola = None
+        if restantes and self.app is not None:
+            with self.app.app_context():
+                for sistema, datos, _peticion, _encolada in restantes:
+                    for observador in sistema.observadores:
+                        if not observador.durable:
+                            continue
+                        self._guardar_fallida(type(observador).__name__, datos, 0,
+                                              'Pendiente al detener el proceso')
+
+
+def reintentar_fallidas(tamano_lote=100):
+    """
+    Reenvía las notificaciones fallidas al observador que falló (un intento cada una).
+
+    Las entregadas se eliminan; las que vuelven a fallar suman un intento y
+    quedan para la próxima ejecución.
+
+    Args:
+        tamano_lote (int): Filas leídas por lote
+
+    Returns:
+        dict: revisadas, reenviadas, fallidas y sin_observador
+    """
+    from models.notificacion import NotificacionFallida
+    from patterns.observer import sistema_notificaciones, ContextoDespacho
+
+    observadores = {type(observador).__name__: observador for observador in sistema_notificaciones.observadores}
+    resumen = {'revisadas': 0, 'reenviadas': 0, 'fallidas': 0, 'sin_observador': 0}
+    ultimo_id = 0
+    # solo las que existen al empezar: las que fallen de nuevo y el escritor aparte como
+    # fallidas quedan para la próxima ejecución
+    maximo_id = db.session.query(db.func.max(NotificacionFallida.id)).scalar() or 0
+
+    while True:
+        filas = (NotificacionFallida.query
+                 .filter(NotificacionFallida.id > ultimo_id, NotificacionFallida.id <= maximo_id)
+                 .order_by(NotificacionFallida.id)
+                 .limit(tamano_lote)
+                 .all())
+        if not filas:
+            break
+        ultimo_id = filas[-1].id
+        contexto = ContextoDespacho.cargar(fila.datos['usuario_id'] for fila in filas)
+        filas = [(fila.id, fila.observador, fila.datos, fila.intentos) for fila in filas]
+
+        for fila_id, nombre, datos, intentos in filas:
+            resumen['revisadas'] += 1
+            observador = observadores.get(nombre)
+            if observador is None:
+                resumen['sin_observador'] += 1
+                continue
+            entregada = despachador_notificaciones.entregar(
+                observador, reconstruir_notificacion(datos), datos, contexto=contexto,
+                max_intentos=1, intentos_previos=intentos
+            )
+            if entregada:
+                NotificacionFallida.query.filter_by(id=fila_id).delete(synchronize_session=False)
+                resumen['reenviadas'] += 1
+            else:
+                NotificacionFallida.query.filter_by(id=fila_id).update({
+                    NotificacionFallida.intentos: NotificacionFallida.intentos + 1,
+                    NotificacionFallida.fecha_ultimo_intento: datetime.utcnow()
+                }, synchronize_session=False)
+                resumen['fallidas'] += 1
+            db.session.commit()
+
+    return resumen
+
+
+# instancia global (se inicializa con init_app en create_app)
+despachador_notificaciones = DespachadorNotificaciones()
+
+atexit.register(despachador_notificaciones.apagar)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=despachador_notificaciones._reiniciar)
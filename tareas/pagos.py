@@ -0,0 +1,242 @@
+# tareas/pagos.py
+"""
+Tareas de pagos en segundo plano
+Envían el pago a MercadoPago fuera del ciclo de la petición web y registran el resultado
+en el Pago (estado_trabajo / mensaje_trabajo) para que el cliente lo consulte
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from database import db
+from models.pago import Pago, EstadoPago, EstadoTrabajo
+from tareas.ejecutor import ejecutor_tareas
+
+logger = logging.getLogger(__name__)
+
+# cache en memoria de estados de trabajo: id_trabajo -> (expira, datos)
+# los trabajos resueltos no cambian, los pendientes se cachean poco tiempo
+TTL_ESTADO_RESUELTO = 300
+TTL_ESTADO_PENDIENTE = 1
+_cache_estados = {}
+_lock_cache = threading.Lock()
+
+# sin respuesta de MercadoPago (timeout, conexión caída, 5xx) el pago pudo crearse:
+# queda pendiente hasta que lo resuelvan el webhook o `flask conciliar-pagos`
+MENSAJE_SIN_CONFIRMAR = 'No pudimos confirmar el pago con MercadoPago; te avisaremos cuando se acredite'
+
+
+def nuevo_id_trabajo():
+    # identificador publico del trabajo (no revela el id del pago)
+    return str(uuid.uuid4())
+
+
+def encolar(pago, tarea, *args):
+    """
+    Encola la tarea que envía un pago ya guardado (y con commit) a la pasarela.
+
+    Si no hay cupo en el ejecutor, el pago queda marcado como fallido.
+
+    Args:
+        pago (Pago): Pago con id_trabajo asignado
+        tarea (callable): procesar_pago_carrito o procesar_pago_contratacion
+        *args: Argumentos de la tarea después del id del pago
+
+    Returns:
+        bool: True si la tarea quedó encolada
+    """
+    from tareas.ejecutor import ColaTareasLlena
+
+    try:
+        ejecutor_tareas.enviar(tarea, pago.id, *args)
+        return True
+    except ColaTareasLlena:
+        pago.estado = EstadoPago.rechazado
+        pago.estado_trabajo = EstadoTrabajo.fallido.value
+        pago.mensaje_trabajo = 'Hay demasiados pagos en proceso, intenta de nuevo en unos segundos'
+        db.session.commit()
+        return False
+
+
+def _iniciar_trabajo(pago_id):
+    # marca el trabajo como en proceso; retorna None si ya fue tomado o resuelto
+    pago = Pago.query.get(pago_id)
+    if not pago or pago.estado_trabajo != EstadoTrabajo.en_cola.value:
+        return None
+    pago.estado_trabajo = EstadoTrabajo.procesando.value
+    db.session.commit()
+    return pago
+
+
+def _finalizar_trabajo(pago, exitoso, mensaje):
+    pago.estado_trabajo = (EstadoTrabajo.completado if exitoso else EstadoTrabajo.fallido).value
+    pago.mensaje_trabajo = (mensaje or '')[:255]
+    db.session.commit()
+    invalidar_estado(pago.id_trabajo)
+
+
+def procesar_pago_carrito(pago_id, item_id, datos, clave_idempotencia=None):
+    """
+    Tarea: envía a Checkout API el pago de un item del carrito.
+
+    El item ya está reservado (procesando); si el pago no se aprueba ni queda
+    pendiente, el item vuelve a pendiente para poder pagarlo de nuevo. Si no se
+    sabe si MercadoPago creó el pago (error de transporte) el pago queda pendiente
+    y el item reservado hasta que lleguen el webhook o la conciliación.
+
+    Args:
+        pago_id (int): ID del pago creado por la petición
+        item_id (int): ID del item del carrito reservado
+        datos (dict): Datos de la tarjeta enviados por el frontend (token, cuotas, payer...)
+        clave_idempotencia (str): X-Idempotency-Key enviada a MercadoPago
+    """
+    from models.carrito import CarritoItem, EstadoCarritoItem
+    from patterns.singleton import payment_gateway
+
+    pago = _iniciar_trabajo(pago_id)
+    if not pago:
+        return
+
+    item = CarritoItem.query.get(item_id)
+    if item is None:
+        # el item se eliminó mientras el pago estaba en cola: no se envía nada
+        pago.estado = EstadoPago.rechazado
+        _finalizar_trabajo(pago, False, 'El servicio ya no está en tu carrito')
+        return
+
+    try:
+        resultado_mp = payment_gateway.procesar_pago_checkout_api(
+            monto=pago.monto,
+            descripcion=f"Servicio: {item.servicio.nombre} - Evento: {item.evento.titulo}",
+            token=datos.get('token'),
+            payment_method_id=datos.get('payment_method_id'),
+            installments=datos.get('installments', 1),
+            issuer_id=datos.get('issuer_id'),
+            payer=datos.get('payer', {}),
+            referencia_externa=pago.referencia_pago,
+            clave_idempotencia=clave_idempotencia
+        )
+    except Exception:
+        logger.exception("Error al enviar el pago del carrito", extra={'datos': {'pago_id': pago.id}})
+        resultado_mp = {'success': False, 'incierto': True}
+
+    if resultado_mp.get('incierto'):
+        pago.estado = EstadoPago.pendiente
+        _finalizar_trabajo(pago, True, MENSAJE_SIN_CONFIRMAR)
+    elif resultado_mp.get('success'):
+        payment_status = resultado_mp.get('estado', 'pending')
+        pago.asignar_pago_mercadopago(resultado_mp.get('payment_id'))
+        if payment_status == 'approved':
+            pago.estado = EstadoPago.aprobado
+            pago.fecha_aprobacion = datetime.utcnow()
+            mensaje = '¡Pago procesado exitosamente!'
+        elif payment_status == 'rejected':
+            pago.estado = EstadoPago.rechazado
+            CarritoItem.liberar_items([item])
+            mensaje = 'El pago fue rechazado'
+        else:
+            pago.estado = EstadoPago.pendiente
+            mensaje = 'Pago pendiente de confirmación'
+        _finalizar_trabajo(pago, payment_status != 'rejected', mensaje)
+    else:
+        pago.estado = EstadoPago.rechazado
+        CarritoItem.liberar_items([item])
+        _finalizar_trabajo(pago, False, resultado_mp.get('message', 'Error al procesar el pago'))
+
+
+def procesar_pago_contratacion(pago_id, datos_frontend, clave_idempotencia=None):
+    """
+    Tarea: envía a MercadoPago el pago de una contratación (/pagos/procesar).
+
+    Args:
+        pago_id (int): ID del pago creado por la petición
+        datos_frontend (dict): Datos enviados por el CardForm de MercadoPago
+        clave_idempotencia (str): X-Idempotency-Key enviada a MercadoPago
+    """
+    from controllers.pago_controller import PagoController
+
+    pago = _iniciar_trabajo(pago_id)
+    if not pago:
+        return
+
+    try:
+        resultado = PagoController._procesar_mercadopago(pago, datos_frontend, clave_idempotencia)
+    except Exception:
+        db.session.rollback()
+        logger.exception("Error al enviar el pago de la contratación", extra={'datos': {'pago_id': pago.id}})
+        resultado = {'success': False, 'incierto': True}
+
+    if resultado.get('incierto'):
+        pago.estado = EstadoPago.pendiente
+        _finalizar_trabajo(pago, True, MENSAJE_SIN_CONFIRMAR)
+        return
+    if not resultado.get('success'):
+        pago.estado = EstadoPago.rechazado
+    _finalizar_trabajo(pago, resultado.get('success', False), resultado.get('message'))
+
+
+def invalidar_estado(id_trabajo):
+    # descarta el estado cacheado de un trabajo
+    with _lock_cache:
+        _cache_estados.pop(id_trabajo, None)
+
+
+def segundos_para_reintentar(fecha_creacion, maximo=10):
+    # sugerencia de espera para el siguiente sondeo: crece con la antigüedad del trabajo
+    if not fecha_creacion:
+        return 1
+    edad = (datetime.utcnow() - fecha_creacion).total_seconds()
+    return int(min(maximo, 1 + edad // 5))
+
+
+def consultar_estado(id_trabajo):
+    """
+    Consulta el estado de un trabajo de pago (con cache en memoria).
+
+    Args:
+        id_trabajo (str): Identificador del trabajo
+
+    Returns:
+        dict: organizador_id, pago_id, resuelto, success, estado, estado_trabajo,
+              message, reintentar_en; o None si el trabajo no existe
+    """
+    ahora = time.monotonic()
+    with _lock_cache:
+        en_cache = _cache_estados.get(id_trabajo)
+    if en_cache and en_cache[0] > ahora:
+        return en_cache[1]
+
+    fila = db.session.query(
+        Pago.id, Pago.organizador_id, Pago.estado, Pago.estado_trabajo,
+        Pago.mensaje_trabajo, Pago.id_transaccion, Pago.fecha_creacion
+    ).filter(Pago.id_trabajo == id_trabajo).first()
+
+    if not fila:
+        return None
+
+    resuelto = fila.estado_trabajo in (EstadoTrabajo.completado.value, EstadoTrabajo.fallido.value)
+    datos = {
+        'organizador_id': fila.organizador_id,
+        'pago_id': fila.id,
+        'id_trabajo': id_trabajo,
+        'resuelto': resuelto,
+        'success': fila.estado_trabajo == EstadoTrabajo.completado.value,
+        'estado': fila.estado.value,
+        'estado_trabajo': fila.estado_trabajo,
+        'message': fila.mensaje_trabajo or 'Procesando pago...',
+        'id_transaccion': fila.id_transaccion,
+        'reintentar_en': None if resuelto else segundos_para_reintentar(fila.fecha_creacion)
+    }
+
+    ttl = TTL_ESTADO_RESUELTO if resuelto else TTL_ESTADO_PENDIENTE
+    with _lock_cache:
+        _cache_estados[id_trabajo] = (ahora + ttl, datos)
+        if len(_cache_estados) > 10000:
+            # descartar entradas vencidas para que la cache no crezca sin limite
+            for clave in [c for c, (expira, _) in _cache_estados.items() if expira <= ahora]:
+                del _cache_estados[clave]
+
+    return datos
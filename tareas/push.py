@@ -0,0 +1,383 @@
+# tareas/push.py
+"""
+Envío de notificaciones Web Push
+PushObserver solo encola la notificación; un hilo de fondo toma lotes de la cola,
+carga en una consulta las suscripciones de todos los destinatarios del lote y las
+envía a la vez con asyncio, por una sesión aiohttp con un pool acotado de
+conexiones keep-alive a los servicios push de los navegadores. El contenido va
+cifrado (RFC 8291, aes128gcm) y firmado con VAPID (RFC 8292) con pywebpush y
+py_vapid. Las suscripciones vencidas (404/410) se eliminan por lotes. Para pruebas
+y mediciones sin navegadores: simuladores/push.py
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# tamaño de registro aes128gcm; el servicio push acepta hasta 4096 bytes de cuerpo
+TAMANO_REGISTRO = 4096
+MAXIMO_MENSAJE = 1000
+
+# códigos con los que el servicio push indica que la suscripción ya no existe
+CODIGOS_VENCIDA = (404, 410)
+
+
+def b64url(datos):
+    return base64.urlsafe_b64encode(datos).rstrip(b'=').decode('ascii')
+
+
+def de_b64url(texto):
+    return base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4))
+
+
+def generar_claves_vapid():
+    """
+    Genera un par de claves VAPID (P-256).
+
+    Returns:
+        tuple: (clave privada, clave pública) en base64url, como las usa PushManager.subscribe
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    privada = ec.generate_private_key(ec.SECP256R1())
+    publica = privada.public_key().public_bytes(serialization.Encoding.X962,
+                                                serialization.PublicFormat.UncompressedPoint)
+    return b64url(privada.private_numbers().private_value.to_bytes(32, 'big')), b64url(publica)
+
+
+def cifrar(contenido, p256dh, auth):
+    """
+    Cifra el contenido para una suscripción (RFC 8291, aes128gcm) con pywebpush.
+
+    Args:
+        contenido (bytes): Datos a enviar (menos de TAMANO_REGISTRO - 103 bytes)
+        p256dh (str): Clave pública de la suscripción (base64url)
+        auth (str): Secreto de autenticación de la suscripción (base64url)
+
+    Returns:
+        bytes: Cuerpo de la petición al servicio push
+    """
+    from pywebpush import WebPusher
+
+    suscripcion = {'endpoint': '', 'keys': {'p256dh': p256dh, 'auth': auth}}
+    return WebPusher(suscripcion).encode(contenido, 'aes128gcm')['body']
+
+
+class ClavesVapid:
+    """Clave VAPID del servidor y encabezados firmados por servicio push (se reutilizan ~11 horas)"""
+
+    DURACION = 12 * 3600
+
+    def __init__(self, privada, contacto):
+        from cryptography.hazmat.primitives import serialization
+        from py_vapid import Vapid02
+
+        self._vapid = Vapid02.from_raw(privada.encode('ascii'))
+        self.publica = b64url(self._vapid.public_key.public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint))
+        self.contacto = contacto
+        self._encabezados = {}
+
+    def autorizacion(self, endpoint):
+        """Encabezado Authorization para enviar a `endpoint`"""
+        partes = urlsplit(endpoint)
+        audiencia = f'{partes.scheme}://{partes.netloc}'
+        encabezado, expira = self._encabezados.get(audiencia, (None, 0))
+        if expira - time.time() < 3600:
+            expira = int(time.time()) + self.DURACION
+            encabezado = self._vapid.sign({'aud': audiencia, 'exp': expira, 'sub': self.contacto})['Authorization']
+            self._encabezados[audiencia] = (encabezado, expira)
+        return encabezado
+
+
+class ColaPushLlena(Exception):
+    """No hay cupo para encolar más notificaciones push en este proceso"""
+
+
+class EnviadorPush:
+    """
+    Cola acotada de notificaciones push y un hilo con su propio event loop que las envía.
+
+    - El hilo toma hasta PUSH_TAMANO_LOTE notificaciones, carga las suscripciones de
+      sus destinatarios en una consulta y envía a todas con asyncio (como máximo
+      PUSH_CONEXIONES peticiones a la vez, reutilizando las conexiones entre lotes).
+    - 429, 5xx y errores de conexión se reintentan una vez; si una notificación no
+      llegó a ninguna suscripción por esos errores queda en NotificacionFallida como
+      fallo de PushObserver.
+    - Las suscripciones vencidas (404/410) se eliminan con un DELETE por lote.
+    - Sin PUSH_VAPID_CLAVE_PRIVADA la notificación solo se registra en el log.
+    - Con NOTIFICACIONES_SINCRONAS=True se envía en el mismo hilo (pruebas).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.tamano_lote = 200
+        self.max_pendientes = 10000
+        self.conexiones = 50
+        self.timeout = 10.0
+        self.ttl = 86400
+        self.vapid = None
+        self.sincrono = False
+        self._reiniciar()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # lee la configuracion y registra el enviador en la aplicacion
+        self.app = app
+        self.tamano_lote = app.config.get('PUSH_TAMANO_LOTE', 200)
+        self.max_pendientes = app.config.get('PUSH_MAX_PENDIENTES', 10000)
+        self.conexiones = app.config.get('PUSH_CONEXIONES', 50)
+        self.timeout = app.config.get('PUSH_TIMEOUT', 10.0)
+        self.ttl = app.config.get('PUSH_TTL', 86400)
+        self.sincrono = app.config.get('NOTIFICACIONES_SINCRONAS', False)
+        self.vapid = None
+        if app.config.get('PUSH_VAPID_CLAVE_PRIVADA'):
+            self.vapid = ClavesVapid(app.config['PUSH_VAPID_CLAVE_PRIVADA'],
+                                     app.config.get('PUSH_VAPID_CONTACTO') or 'mailto:admin@eventlink.local')
+        self._reiniciar()
+        app.extensions['enviador_push'] = self
+
+    @property
+    def habilitado(self):
+        return self.vapid is not None
+
+    def _reiniciar(self):
+        # cola, hilo y métricas por proceso (el hilo y su event loop no sobreviven a un fork)
+        self._cola = None
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._metricas = {'encolados': 0, 'enviados': 0, 'vencidas': 0, 'rechazados': 0, 'errores': 0,
+                          'fallidos': 0, 'lotes': 0, 'cola_maxima': 0}
+
+    def _obtener_cola(self):
+        if self._cola is None or self._pid != os.getpid():
+            with self._lock:
+                if self._cola is None or self._pid != os.getpid():
+                    self._cola = queue.Queue(maxsize=self.max_pendientes)
+                    self._hilo = threading.Thread(target=self._trabajar, name='eventlink-push', daemon=True)
+                    self._hilo.start()
+                    self._pid = os.getpid()
+        return self._cola
+
+    def _sumar(self, clave, valor=1):
+        with self._lock:
+            self._metricas[clave] += valor
+
+    def encolar(self, datos):
+        """
+        Encola una notificación para enviarla a todas las suscripciones de su destinatario.
+
+        Args:
+            datos (dict): Datos de la notificación (tareas.notificaciones.datos_notificacion)
+
+        Raises:
+            ColaPushLlena: Si hay PUSH_MAX_PENDIENTES notificaciones sin enviar
+        """
+        if self.app is None or not self.habilitado:
+            logger.info("Web Push no configurado, notificación solo registrada",
+                        extra={'datos': {'usuario_id': datos.get('usuario_id'), 'titulo': datos.get('titulo')}})
+            return
+        if self.sincrono:
+            asyncio.run(self._enviar_con_sesion_temporal([datos]))
+            return
+
+        cola = self._obtener_cola()
+        try:
+            cola.put_nowait(datos)
+        except queue.Full:
+            raise ColaPushLlena(f"Hay {self.max_pendientes} notificaciones push pendientes en este proceso")
+        with self._lock:
+            self._metricas['encolados'] += 1
+            self._metricas['cola_maxima'] = max(self._metricas['cola_maxima'], cola.qsize())
+
+    def _trabajar(self):
+        # el event loop y la sesión viven lo que el hilo: las conexiones se reutilizan entre lotes
+        cola = self._cola
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        sesion = loop.run_until_complete(self._abrir_sesion())
+        while True:
+            lote = [cola.get()]
+            while len(lote) < self.tamano_lote:
+                try:
+                    lote.append(cola.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                loop.run_until_complete(self._enviar_lote(lote, sesion))
+            except Exception:
+                logger.exception("Error al enviar lote de notificaciones push")
+            finally:
+                for _datos in lote:
+                    cola.task_done()
+
+    async def _abrir_sesion(self):
+        # como máximo PUSH_CONEXIONES conexiones (y peticiones en curso) a la vez; las
+        # conexiones keep-alive quedan en el pool del connector entre lotes
+        import aiohttp
+
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.conexiones),
+                                     timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def _enviar_con_sesion_temporal(self, lote):
+        async with await self._abrir_sesion() as sesion:
+            await self._enviar_lote(lote, sesion)
+
+    async def _enviar_lote(self, lote, sesion):
+        with self.app.app_context():
+            suscripciones = self._cargar_suscripciones({datos['usuario_id'] for datos in lote})
+            envios = [(indice, suscripcion) for indice, datos in enumerate(lote)
+                      for suscripcion in suscripciones.get(datos['usuario_id'], ())]
+            contenidos = [self._contenido(datos) for datos in lote]
+
+            resultados = await asyncio.gather(*(
+                self._enviar_uno(sesion, suscripcion, contenidos[indice]) for indice, suscripcion in envios
+            ))
+
+            self._sumar('lotes')
+            self._registrar_resultados(lote, envios, resultados)
+
+    def _cargar_suscripciones(self, usuario_ids):
+        # una consulta por lote, solo las columnas necesarias para enviar
+        from models.suscripcion_push import SuscripcionPush
+
+        filas = SuscripcionPush.query.with_entities(
+            SuscripcionPush.id, SuscripcionPush.usuario_id, SuscripcionPush.endpoint,
+            SuscripcionPush.p256dh, SuscripcionPush.auth
+        ).filter(SuscripcionPush.usuario_id.in_(usuario_ids)).all()
+        suscripciones = {}
+        for fila in filas:
+            suscripciones.setdefault(fila.usuario_id, []).append(fila)
+        return suscripciones
+
+    def _contenido(self, datos):
+        # lo que recibe el Service Worker en event.data.json()
+        return json.dumps({
+            'titulo': datos['titulo'],
+            'mensaje': (datos['mensaje'] or '')[:MAXIMO_MENSAJE],
+            'tipo': datos['tipo'],
+            'url': '/notificaciones/'
+        }, ensure_ascii=False).encode()
+
+    async def _enviar_uno(self, sesion, suscripcion, contenido):
+        # retorna 'enviado', 'vencida', 'rechazado' o 'error'
+        import aiohttp
+
+        try:
+            cuerpo = cifrar(contenido, suscripcion.p256dh, suscripcion.auth)
+        except Exception:
+            logger.warning("Suscripción push con claves inválidas", extra={'datos': {'suscripcion_id': suscripcion.id}})
+            return 'vencida'
+        encabezados = {
+            'Authorization': self.vapid.autorizacion(suscripcion.endpoint),
+            'Content-Encoding': 'aes128gcm',
+            'Content-Type': 'application/octet-stream',
+            'TTL': str(self.ttl),
+            'Urgency': 'normal'
+        }
+        for intento in range(2):
+            espera = ''
+            try:
+                async with sesion.post(suscripcion.endpoint, data=cuerpo, headers=encabezados) as respuesta:
+                    # leer la respuesta completa deja la conexión libre para reutilizarla
+                    await respuesta.read()
+                    codigo, espera = respuesta.status, respuesta.headers.get('Retry-After', '')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            else:
+                if 200 <= codigo < 300:
+                    return 'enviado'
+                if codigo in CODIGOS_VENCIDA:
+                    return 'vencida'
+                if codigo != 429 and codigo < 500:
+                    logger.warning("Servicio push rechazó la notificación",
+                                   extra={'datos': {'suscripcion_id': suscripcion.id, 'codigo': codigo}})
+                    return 'rechazado'
+                error = f'HTTP {codigo}'
+            if intento == 0:
+                await asyncio.sleep(min(float(espera), 5.0) if espera.isdigit() else 0.5)
+        logger.warning("No se pudo enviar la notificación push: %s", error,
+                       extra={'datos': {'suscripcion_id': suscripcion.id}})
+        return 'error'
+
+    def _registrar_resultados(self, lote, envios, resultados):
+        from database import db
+        from models.notificacion import NotificacionFallida
+        from models.suscripcion_push import SuscripcionPush
+
+        conteo = {'enviado': 0, 'vencida': 0, 'rechazado': 0, 'error': 0}
+        enviadas, vencidas, entregadas, con_error = set(), set(), set(), set()
+        for (indice, suscripcion), resultado in zip(envios, resultados):
+            conteo[resultado] += 1
+            if resultado == 'enviado':
+                enviadas.add(suscripcion.id)
+                entregadas.add(indice)
+            elif resultado == 'vencida':
+                vencidas.add(suscripcion.id)
+            elif resultado == 'error':
+                con_error.add(indice)
+        fallidas = [lote[indice] for indice in sorted(con_error - entregadas)]
+
+        with self._lock:
+            self._metricas['enviados'] += conteo['enviado']
+            self._metricas['vencidas'] += conteo['vencida']
+            self._metricas['rechazados'] += conteo['rechazado']
+            self._metricas['errores'] += conteo['error']
+            self._metricas['fallidos'] += len(fallidas)
+
+        try:
+            if vencidas:
+                SuscripcionPush.query.filter(SuscripcionPush.id.in_(vencidas)).delete(synchronize_session=False)
+            if enviadas:
+                SuscripcionPush.query.filter(SuscripcionPush.id.in_(enviadas)).update(
+                    {SuscripcionPush.fecha_ultimo_envio: datetime.utcnow()}, synchronize_session=False)
+            if fallidas:
+                db.session.add_all([
+                    NotificacionFallida(observador='PushObserver', datos=datos, intentos=1,
+                                        error='Servicio push no disponible', fecha_ultimo_intento=datetime.utcnow())
+                    for datos in fallidas
+                ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("No se pudo registrar el resultado del envío push",
+                             extra={'datos': {'vencidas': len(vencidas), 'fallidas': len(fallidas)}})
+
+        if vencidas:
+            logger.info("Suscripciones push vencidas eliminadas", extra={'datos': {'cantidad': len(vencidas)}})
+
+    def estadisticas(self):
+        """Notificaciones encoladas y envíos por resultado en este proceso"""
+        with self._lock:
+            metricas = dict(self._metricas)
+        metricas['pendientes'] = self._cola.qsize() if self._cola is not None and self._pid == os.getpid() else 0
+        metricas['habilitado'] = self.habilitado
+        return metricas
+
+    def esperar_pendientes(self, espera=30.0):
+        """Espera hasta `espera` segundos a que se envíe lo encolado (True si se vació)"""
+        limite = time.monotonic() + espera
+        while self._cola is not None and self._cola.unfinished_tasks:
+            if time.monotonic() >= limite:
+                return False
+            time.sleep(0.05)
+        return True
+
+
+# instancia global (se inicializa con init_app en create_app)
+enviador_push = EnviadorPush()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=enviador_push._reiniciar)
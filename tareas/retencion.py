@@ -0,0 +1,210 @@
+# tareas/retencion.py
+"""
+Retención y particionado de notificaciones
+Las notificaciones archivadas y las antiguas se mueven por lotes a
+notificaciones_historico (INSERT ... SELECT + DELETE por lote, con commit por lote).
+En PostgreSQL la tabla se particiona por mes de fecha_creacion: las consultas del
+usuario solo recorren las particiones recientes y las particiones vacías más
+antiguas que la retención se eliminan enteras. En SQLite el particionado no aplica.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, insert, literal, or_, select
+
+from database import db
+from models.notificacion import Notificacion, NotificacionHistorica, EstadoNotificacion
+from patterns.contadores import contadores_usuario
+
+TABLA = 'notificaciones'
+
+
+def _inicio_mes(fecha, meses=0):
+    # primer día del mes de `fecha` desplazado `meses` meses
+    indice = fecha.year * 12 + fecha.month - 1 + meses
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def _esta_particionada(conexion):
+    return conexion.exec_driver_sql(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s", (TABLA,)
+    ).first() is not None
+
+
+def _particiones(conexion):
+    # nombre -> límite superior (None para la partición por defecto)
+    particiones = {}
+    for nombre, limite in conexion.exec_driver_sql(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s", (TABLA,)
+    ):
+        coincidencia = re.search(r"TO \('([^']+)'\)", limite or '')
+        particiones[nombre] = datetime.fromisoformat(coincidencia.group(1)) if coincidencia else None
+    return particiones
+
+
+def particionar_notificaciones(meses_futuros=None):
+    """
+    Convierte la tabla de notificaciones en una tabla particionada por mes (PostgreSQL).
+
+    La tabla existente se conserva como la partición de todo lo anterior al mes
+    siguiente (ATTACH, sin copiar filas); se agregan las particiones de los próximos
+    meses y una por defecto. Idempotente: si ya está particionada solo crea las
+    particiones que falten. Toma un bloqueo exclusivo de la tabla durante la conversión.
+
+    Returns:
+        dict: Si se convirtió la tabla y las particiones creadas
+    """
+    meses_futuros = meses_futuros or current_app.config.get('NOTIFICACIONES_PARTICIONES_FUTURAS', 3)
+    resumen = {'convertida': False, 'particiones': []}
+    motor = db.engine
+    if motor.dialect.name != 'postgresql':
+        return resumen
+
+    with motor.begin() as conexion:
+        if not _esta_particionada(conexion):
+            _convertir_tabla(conexion)
+            resumen['convertida'] = True
+        resumen['particiones'] = _crear_particiones(conexion, meses_futuros)
+    return resumen
+
+
+def _convertir_tabla(conexion):
+    legado = f'{TABLA}_legado'
+    limite = _inicio_mes(datetime.utcnow(), 1)
+
+    conexion.exec_driver_sql(f"LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE")
+    # la clave de partición no puede ser nula
+    conexion.exec_driver_sql(f"UPDATE {TABLA} SET fecha_creacion = now() AT TIME ZONE 'utc' WHERE fecha_creacion IS NULL")
+    conexion.exec_driver_sql(f"ALTER TABLE {TABLA} ALTER COLUMN fecha_creacion SET NOT NULL")
+    conexion.exec_driver_sql(f"ALTER TABLE {TABLA} RENAME TO {legado}")
+    # los nombres de índices son del esquema: los de la tabla nueva se crean con los nombres actuales
+    for (indice,) in conexion.exec_driver_sql("SELECT indexname FROM pg_indexes WHERE tablename = %s", (legado,)).all():
+        conexion.exec_driver_sql(f'ALTER INDEX "{indice}" RENAME TO "{(indice + "_legado")[:63]}"')
+
+    conexion.exec_driver_sql(f"CREATE TABLE {TABLA} (LIKE {legado} INCLUDING DEFAULTS) PARTITION BY RANGE (fecha_creacion)")
+    # la clave primaria de una tabla particionada debe incluir la clave de partición
+    conexion.exec_driver_sql(f"ALTER TABLE {TABLA} ADD PRIMARY KEY (id, fecha_creacion)")
+    conexion.exec_driver_sql(f"ALTER SEQUENCE {TABLA}_id_seq OWNED BY {TABLA}.id")
+    # todo lo anterior al mes siguiente queda en la tabla original, sin copiar filas
+    conexion.exec_driver_sql(
+        f"ALTER TABLE {TABLA} ATTACH PARTITION {legado} FOR VALUES FROM (MINVALUE) TO ('{limite.isoformat(' ')}')"
+    )
+    # claves foráneas e índices de los modelos (las particiones existentes reutilizan los equivalentes)
+    for clave in Notificacion.__table__.foreign_keys:
+        conexion.exec_driver_sql(
+            f"ALTER TABLE {TABLA} ADD FOREIGN KEY ({clave.parent.name}) "
+            f"REFERENCES {clave.column.table.name} ({clave.column.name})"
+        )
+    for indice in Notificacion.__table__.indexes:
+        indice.create(conexion)
+    conexion.exec_driver_sql(f"CREATE TABLE {TABLA}_default PARTITION OF {TABLA} DEFAULT")
+
+
+def _crear_particiones(conexion, meses_futuros):
+    # particiones mensuales desde la última existente hasta `meses_futuros` meses adelante
+    particiones = _particiones(conexion)
+    limites = [limite for limite in particiones.values() if limite is not None]
+    desde = max(limites) if limites else _inicio_mes(datetime.utcnow())
+    hasta = _inicio_mes(datetime.utcnow(), meses_futuros + 1)
+    creadas = []
+    while desde < hasta:
+        siguiente = _inicio_mes(desde, 1)
+        nombre = f"{TABLA}_p{desde:%Y%m}"
+        rango = f"fecha_creacion >= '{desde.isoformat(' ')}' AND fecha_creacion < '{siguiente.isoformat(' ')}'"
+        # filas que cayeron en la partición por defecto (si la tarea no corrió a tiempo)
+        # se sacan antes de crear la del mes y se vuelven a insertar
+        conexion.exec_driver_sql(
+            f"CREATE TEMP TABLE pendientes ON COMMIT DROP AS SELECT * FROM {TABLA}_default WHERE {rango}"
+        )
+        conexion.exec_driver_sql(f"DELETE FROM {TABLA}_default WHERE {rango}")
+        conexion.exec_driver_sql(
+            f"CREATE TABLE {nombre} PARTITION OF {TABLA} "
+            f"FOR VALUES FROM ('{desde.isoformat(' ')}') TO ('{siguiente.isoformat(' ')}')"
+        )
+        conexion.exec_driver_sql(f"INSERT INTO {TABLA} SELECT * FROM pendientes")
+        conexion.exec_driver_sql("DROP TABLE pendientes")
+        creadas.append(nombre)
+        desde = siguiente
+    return creadas
+
+
+def _eliminar_particiones_vacias(conexion, corte):
+    # particiones completas más antiguas que la retención que ya quedaron vacías
+    eliminadas = []
+    for nombre, limite in _particiones(conexion).items():
+        if limite is None or limite > corte:
+            continue
+        if conexion.exec_driver_sql(f'SELECT 1 FROM "{nombre}" LIMIT 1').first() is None:
+            conexion.exec_driver_sql(f'ALTER TABLE {TABLA} DETACH PARTITION "{nombre}"')
+            conexion.exec_driver_sql(f'DROP TABLE "{nombre}"')
+            eliminadas.append(nombre)
+    return eliminadas
+
+
+def retener_notificaciones(dias=None, dias_archivadas=None, tamano_lote=None, simular=False):
+    """
+    Mueve a notificaciones_historico las notificaciones archivadas de más de
+    `dias_archivadas` días y todas las de más de `dias` días, por lotes.
+
+    Cada lote es un SELECT de ids, un INSERT ... SELECT y un DELETE por id, con
+    commit. Los contadores de los usuarios con notificaciones no leídas movidas se
+    invalidan. En PostgreSQL con la tabla particionada además crea las particiones
+    de los próximos meses y elimina las particiones antiguas que quedaron vacías.
+
+    Args:
+        dias (int): Antigüedad máxima de cualquier notificación (NOTIFICACIONES_RETENCION_DIAS)
+        dias_archivadas (int): Antigüedad máxima de las archivadas (NOTIFICACIONES_RETENCION_ARCHIVADAS_DIAS)
+        tamano_lote (int): Notificaciones por lote (NOTIFICACIONES_RETENCION_LOTE)
+        simular (bool): Solo contar lo que se movería
+
+    Returns:
+        dict: Notificaciones movidas, lotes, particiones creadas y eliminadas
+    """
+    dias = dias or current_app.config.get('NOTIFICACIONES_RETENCION_DIAS', 365)
+    dias_archivadas = dias_archivadas or current_app.config.get('NOTIFICACIONES_RETENCION_ARCHIVADAS_DIAS', 30)
+    tamano_lote = tamano_lote or current_app.config.get('NOTIFICACIONES_RETENCION_LOTE', 1000)
+    ahora = datetime.utcnow()
+    corte = ahora - timedelta(days=dias)
+    condicion = or_(
+        Notificacion.fecha_creacion < corte,
+        and_(Notificacion.estado == EstadoNotificacion.archivada,
+             Notificacion.fecha_creacion < ahora - timedelta(days=dias_archivadas))
+    )
+    resumen = {'movidas': 0, 'lotes': 0, 'particiones_creadas': [], 'particiones_eliminadas': []}
+
+    if simular:
+        resumen['movidas'] = Notificacion.query.filter(condicion).count()
+        return resumen
+
+    columnas = [columna.name for columna in Notificacion.__table__.columns]
+    while True:
+        filas = (db.session.query(Notificacion.id, Notificacion.usuario_id, Notificacion.estado)
+                 .filter(condicion).order_by(Notificacion.id).limit(tamano_lote).all())
+        if not filas:
+            break
+        ids = [fila.id for fila in filas]
+
+        db.session.execute(insert(NotificacionHistorica.__table__).from_select(
+            columnas + ['fecha_movida'],
+            select(*[Notificacion.__table__.c[columna] for columna in columnas], literal(ahora))
+            .where(Notificacion.id.in_(ids))
+        ))
+        db.session.execute(delete(Notificacion.__table__).where(Notificacion.id.in_(ids)))
+        db.session.commit()
+        # el DELETE no pasa por la sesión: se recalculan los contadores afectados
+        contadores_usuario.invalidar(fila.usuario_id for fila in filas if fila.estado == EstadoNotificacion.no_leida)
+        resumen['movidas'] += len(ids)
+        resumen['lotes'] += 1
+
+    motor = db.engine
+    if motor.dialect.name == 'postgresql':
+        with motor.begin() as conexion:
+            if _esta_particionada(conexion):
+                resumen['particiones_creadas'] = _crear_particiones(
+                    conexion, current_app.config.get('NOTIFICACIONES_PARTICIONES_FUTURAS', 3)
+                )
+                resumen['particiones_eliminadas'] = _eliminar_particiones_vacias(conexion, corte)
+    return resumen
@@ -0,0 +1,248 @@
+# tareas/tiempo_real.py
+"""
+Notificaciones en vivo (Server-Sent Events)
+Cada pestaña abierta mantiene una conexión a /notificaciones/eventos y se suscribe
+al bus de su worker. El escritor de notificaciones publica las filas recién
+insertadas y el bus las entrega a las conexiones del usuario, sin consultas ni
+sondeos periódicos. Con varios workers o hosts el bus se comparte por Redis
+(SSE_REDIS_URL): cada worker publica en un canal y un hilo por worker lo escucha y
+entrega a sus conexiones; sin Redis solo llegan a las conexiones del mismo proceso.
+
+Cada conexión ocupa un hilo (o un greenlet con `gunicorn -k gevent`: el generador
+solo usa queue/threading, que gevent reemplaza) hasta SSE_DURACION_MAXIMA segundos;
+luego se cierra y el navegador se reconecta solo.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CANAL_REDIS = 'eventlink:notificaciones'
+
+# campos de la notificación que se envían al navegador
+CAMPOS_EVENTO = ('titulo', 'mensaje', 'tipo', 'servicio_id', 'contratacion_id', 'pago_id', 'fecha_creacion')
+
+
+class DemasiadasConexiones(Exception):
+    """El worker ya tiene SSE_MAX_CONEXIONES conexiones abiertas"""
+
+
+def evento_sse(nombre, datos):
+    # un evento en formato text/event-stream
+    return f"event: {nombre}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+def evento_notificacion(fila):
+    """Datos del evento a partir de una fila de fila_notificacion()"""
+    datos = {campo: fila.get(campo) for campo in CAMPOS_EVENTO}
+    if hasattr(datos['tipo'], 'value'):
+        datos['tipo'] = datos['tipo'].value
+    if isinstance(datos['fecha_creacion'], datetime):
+        datos['fecha_creacion'] = datos['fecha_creacion'].isoformat()
+    return datos
+
+
+class Suscripcion:
+    """Conexión SSE de un usuario: una cola acotada de eventos por entregar"""
+
+    def __init__(self, usuario_id, max_pendientes):
+        self.usuario_id = usuario_id
+        self.cola = queue.Queue(maxsize=max_pendientes)
+
+
+class BusNotificaciones:
+    """
+    Pub/sub de notificaciones nuevas hacia las conexiones SSE de este proceso.
+
+    - publicar() recibe las filas insertadas por el escritor: sin Redis las entrega
+      en el momento; con Redis publica un mensaje por lote y las entrega el hilo que
+      escucha el canal (también en este worker).
+    - Cada conexión tiene una cola de SSE_MAX_PENDIENTES eventos; si el navegador
+      no lee, los eventos nuevos se descartan (el contador se corrige al reconectar).
+    - eventos() es el generador de la respuesta: envía los contadores iniciales,
+      las notificaciones y un comentario cada SSE_KEEPALIVE segundos para detectar
+      conexiones cerradas.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.url_redis = None
+        self.max_conexiones = 500
+        self.max_pendientes = 100
+        self.keepalive = 15.0
+        self.duracion_maxima = 300.0
+        self.reintento_ms = 3000
+        self._reiniciar()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # lee la configuracion y registra el bus
+        self.app = app
+        self.url_redis = app.config.get('SSE_REDIS_URL')
+        self.max_conexiones = app.config.get('SSE_MAX_CONEXIONES', 500)
+        self.max_pendientes = app.config.get('SSE_MAX_PENDIENTES', 100)
+        self.keepalive = app.config.get('SSE_KEEPALIVE', 15.0)
+        self.duracion_maxima = app.config.get('SSE_DURACION_MAXIMA', 300.0)
+        self._reiniciar()
+        app.extensions['bus_notificaciones'] = self
+
+    def _reiniciar(self):
+        # las conexiones, el cliente de Redis y el hilo que escucha son de cada proceso
+        self._suscripciones = defaultdict(set)
+        self._lock = threading.Lock()
+        self._redis = None
+        self._hilo = None
+        self._pid = os.getpid()
+        self._metricas = {'publicadas': 0, 'entregadas': 0, 'descartadas': 0, 'conexiones': 0,
+                          'conexiones_maximo': 0, 'rechazadas': 0, 'errores_bus': 0}
+
+    def _cliente_redis(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.url_redis, socket_timeout=2, socket_connect_timeout=2)
+        return self._redis
+
+    # ----- suscripciones -----
+
+    def suscribir(self, usuario_id):
+        """
+        Registra una conexión del usuario.
+
+        Raises:
+            DemasiadasConexiones: El worker ya tiene SSE_MAX_CONEXIONES conexiones
+        """
+        suscripcion = Suscripcion(usuario_id, self.max_pendientes)
+        with self._lock:
+            if self._metricas['conexiones'] >= self.max_conexiones:
+                self._metricas['rechazadas'] += 1
+                raise DemasiadasConexiones(f"{self._metricas['conexiones']} conexiones abiertas")
+            self._suscripciones[usuario_id].add(suscripcion)
+            self._metricas['conexiones'] += 1
+            self._metricas['conexiones_maximo'] = max(self._metricas['conexiones_maximo'],
+                                                      self._metricas['conexiones'])
+            if self.url_redis:
+                self._iniciar_hilo()
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            conexiones = self._suscripciones.get(suscripcion.usuario_id)
+            if conexiones is None or suscripcion not in conexiones:
+                return
+            conexiones.discard(suscripcion)
+            if not conexiones:
+                del self._suscripciones[suscripcion.usuario_id]
+            self._metricas['conexiones'] -= 1
+
+    # ----- publicación -----
+
+    def publicar(self, filas):
+        """
+        Publica notificaciones recién guardadas (filas de fila_notificacion()).
+        Nunca lanza excepción: las filas ya están en la base.
+        """
+        eventos = [(fila['usuario_id'], evento_notificacion(fila)) for fila in filas]
+        if not eventos:
+            return
+        with self._lock:
+            self._metricas['publicadas'] += len(eventos)
+        if not self.url_redis:
+            self._entregar(eventos)
+            return
+        try:
+            self._cliente_redis().publish(CANAL_REDIS, json.dumps(eventos, default=str))
+        except Exception as e:
+            # sin bus compartido al menos llegan a las conexiones de este worker
+            with self._lock:
+                self._metricas['errores_bus'] += 1
+            logger.warning("No se pudieron publicar las notificaciones en Redis: %s", e,
+                           extra={'datos': {'eventos': len(eventos)}})
+            self._entregar(eventos)
+
+    def _entregar(self, eventos):
+        entregadas = descartadas = 0
+        with self._lock:
+            for usuario_id, datos in eventos:
+                for suscripcion in self._suscripciones.get(usuario_id, ()):
+                    try:
+                        suscripcion.cola.put_nowait(datos)
+                        entregadas += 1
+                    except queue.Full:
+                        descartadas += 1
+            self._metricas['entregadas'] += entregadas
+            self._metricas['descartadas'] += descartadas
+
+    def _iniciar_hilo(self):
+        if self._hilo is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._escuchar_redis, name='eventlink-bus-notificaciones', daemon=True)
+            self._hilo.start()
+
+    def _escuchar_redis(self):
+        # un mensaje por lote publicado por cualquier worker; se reconecta si Redis se cae
+        espera = 1
+        while True:
+            try:
+                suscriptor = self._cliente_redis().pubsub(ignore_subscribe_messages=True)
+                suscriptor.subscribe(CANAL_REDIS)
+                espera = 1
+                while True:
+                    mensaje = suscriptor.get_message(timeout=self.keepalive)
+                    if mensaje and mensaje['type'] == 'message':
+                        self._entregar(json.loads(mensaje['data']))
+            except Exception as e:
+                with self._lock:
+                    self._metricas['errores_bus'] += 1
+                logger.warning("Conexión con el bus de notificaciones perdida, se reintentará en %ss: %s", espera, e)
+                self._redis = None
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+
+    # ----- respuesta SSE -----
+
+    def eventos(self, suscripcion, contadores=None):
+        """
+        Generador del cuerpo text/event-stream de una conexión (no usa el contexto de
+        la petición ni la base: se ejecuta después de que Flask los liberó).
+        """
+        limite = time.monotonic() + self.duracion_maxima
+        try:
+            yield f"retry: {self.reintento_ms}\n\n"
+            if contadores is not None:
+                yield evento_sse('contadores', contadores)
+            while True:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return
+                try:
+                    datos = suscripcion.cola.get(timeout=min(self.keepalive, restante))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield evento_sse('notificacion', datos)
+        finally:
+            self.cancelar(suscripcion)
+
+    def estadisticas(self):
+        """Conexiones abiertas y eventos entregados en este proceso"""
+        with self._lock:
+            metricas = dict(self._metricas)
+            metricas['usuarios_conectados'] = len(self._suscripciones)
+        metricas['bus_compartido'] = bool(self.url_redis)
+        return metricas
+
+
+# instancia global (se inicializa con init_app en create_app)
+bus_notificaciones = BusNotificaciones()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=bus_notificaciones._reiniciar)
@@ -0,0 +1,338 @@
+# tareas/webhooks.py
+"""
+Procesamiento de notificaciones (webhooks) de MercadoPago
+El endpoint solo verifica la firma y guarda el evento en la bandeja (EventoWebhook);
+esta tarea toma los eventos pendientes por lotes, consulta el estado real de cada
+pago en MercadoPago y lo aplica a Pago, Contratacion y CarritoItem
+"""
+
+import hashlib
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from database import db, reintentar_si_conflicto
+from models.webhook import EventoWebhook, EstadoEventoWebhook
+from tareas.ejecutor import ejecutor_tareas, ColaTareasLlena
+
+# estados de MercadoPago agrupados segun el efecto sobre el pago local
+ESTADOS_APROBADOS = {'approved'}
+ESTADOS_RECHAZADOS = {'rejected'}
+ESTADOS_CANCELADOS = {'cancelled'}
+ESTADOS_REEMBOLSADOS = {'refunded', 'charged_back'}
+
+# un solo vaciado de la bandeja programado a la vez por proceso
+_lock_programacion = threading.Lock()
+_procesamiento_programado = False
+
+
+def verificar_firma(secreto, x_signature, x_request_id, data_id):
+    """
+    Verifica el encabezado x-signature de MercadoPago.
+
+    El encabezado tiene la forma "ts=<timestamp>,v1=<hmac>", donde v1 es el
+    HMAC-SHA256 (con la clave secreta del webhook) del manifiesto
+    "id:<data.id>;request-id:<x-request-id>;ts:<ts>;".
+
+    Args:
+        secreto (str): Clave secreta configurada en MercadoPago
+        x_signature (str): Valor del encabezado x-signature
+        x_request_id (str): Valor del encabezado x-request-id
+        data_id (str): data.id de la notificación (query string)
+
+    Returns:
+        bool: True si la firma es válida
+    """
+    if not secreto or not x_signature:
+        return False
+
+    partes = {}
+    for parte in x_signature.split(','):
+        clave, _, valor = parte.strip().partition('=')
+        partes[clave] = valor
+
+    ts, firma = partes.get('ts'), partes.get('v1')
+    if not ts or not firma:
+        return False
+
+    manifiesto = ''
+    if data_id:
+        manifiesto += f"id:{str(data_id).lower()};"
+    if x_request_id:
+        manifiesto += f"request-id:{x_request_id};"
+    manifiesto += f"ts:{ts};"
+
+    esperada = hmac.new(secreto.encode(), manifiesto.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperada, firma)
+
+
+def firmar(secreto, data_id, x_request_id, ts):
+    # genera el encabezado x-signature (lo usa el simulador para enviar eventos de prueba)
+    manifiesto = f"id:{str(data_id).lower()};request-id:{x_request_id};ts:{ts};"
+    firma = hmac.new(secreto.encode(), manifiesto.encode(), hashlib.sha256).hexdigest()
+    return f"ts={ts},v1={firma}"
+
+
+def normalizar_evento(payload, args):
+    """
+    Convierte una notificación (formato webhook JSON o IPN por query string) en
+    una fila para la bandeja de entrada.
+
+    Returns:
+        dict: id_evento, tipo, accion, recurso_id, payload; o None si no es válida
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    tipo = payload.get('type') or payload.get('topic') or args.get('type') or args.get('topic')
+    recurso_id = (payload.get('data') or {}).get('id') or args.get('data.id') or args.get('id')
+    accion = payload.get('action')
+
+    if not tipo or not recurso_id:
+        return None
+
+    # el id de la notificación identifica los reenvíos; el formato IPN no lo trae
+    id_evento = payload.get('id') or f"{tipo}:{recurso_id}:{accion or ''}"
+
+    return {
+        'id_evento': str(id_evento)[:100],
+        'tipo': str(tipo)[:50],
+        'accion': str(accion)[:50] if accion else None,
+        'recurso_id': str(recurso_id)[:64],
+        'payload': payload or dict(args)
+    }
+
+
+def programar_procesamiento():
+    """Encola el vaciado de la bandeja si no hay uno ya programado en este proceso"""
+    global _procesamiento_programado
+
+    with _lock_programacion:
+        if _procesamiento_programado:
+            return False
+        _procesamiento_programado = True
+
+    try:
+        ejecutor_tareas.enviar(_vaciar_bandeja)
+        return True
+    except ColaTareasLlena:
+        # quedan en la bandeja; los toma el siguiente webhook o 'flask procesar-webhooks'
+        with _lock_programacion:
+            _procesamiento_programado = False
+        return False
+
+
+def _vaciar_bandeja():
+    global _procesamiento_programado
+    # los eventos que lleguen desde ahora programan otro vaciado
+    with _lock_programacion:
+        _procesamiento_programado = False
+    return procesar_pendientes()
+
+
+def procesar_pendientes(tamano_lote=None, max_lotes=None):
+    """
+    Procesa los eventos pendientes de la bandeja por lotes.
+
+    Args:
+        tamano_lote (int): Eventos por lote (por defecto WEBHOOKS_TAMANO_LOTE)
+        max_lotes (int): Máximo de lotes a procesar (None = hasta vaciar la bandeja)
+
+    Returns:
+        dict: Totales de eventos procesados, ignorados, reintentos, errores y lotes
+    """
+    tamano_lote = tamano_lote or current_app.config.get('WEBHOOKS_TAMANO_LOTE', 100)
+    resumen = {'eventos': 0, 'procesados': 0, 'ignorados': 0, 'reintentos': 0, 'errores': 0, 'lotes': 0}
+    ultimo_id = 0
+
+    while max_lotes is None or resumen['lotes'] < max_lotes:
+        # los que quedan pendientes para reintento no se vuelven a tomar en esta pasada
+        eventos = (EventoWebhook.query
+                   .filter(EventoWebhook.estado == EstadoEventoWebhook.pendiente,
+                           EventoWebhook.id > ultimo_id)
+                   .order_by(EventoWebhook.id)
+                   .limit(tamano_lote)
+                   .with_for_update(skip_locked=True)
+                   .all())
+        if not eventos:
+            db.session.commit()
+            break
+
+        ultimo_id = eventos[-1].id
+        resultado = _procesar_lote(eventos)
+        resumen['lotes'] += 1
+        resumen['eventos'] += len(eventos)
+        for clave, valor in resultado.items():
+            resumen[clave] += valor
+
+    return resumen
+
+
+def _procesar_lote(eventos):
+    from patterns.singleton import payment_gateway
+
+    max_intentos = current_app.config.get('WEBHOOKS_MAX_INTENTOS', 5)
+    ids_eventos = [evento.id for evento in eventos]
+
+    # un solo GET por pago aunque el lote traiga varias notificaciones del mismo
+    pagos_mp = sorted({evento.recurso_id for evento in eventos if evento.tipo == 'payment'})
+    consultas = {}
+    if pagos_mp:
+        with ThreadPoolExecutor(max_workers=min(8, len(pagos_mp))) as pool:
+            consultas = dict(zip(pagos_mp, pool.map(payment_gateway.consultar_pago, pagos_mp)))
+    # libera los bloqueos de la bandeja antes de escribir en pagos e items
+    db.session.commit()
+
+    def aplicar():
+        lote = EventoWebhook.query.filter(EventoWebhook.id.in_(ids_eventos)).all()
+        infos = [info for info in consultas.values() if info.get('success')]
+        creados, pagos_tocados = _aplicar_estados(infos)
+
+        ahora = datetime.utcnow()
+        resultado = {'procesados': 0, 'ignorados': 0, 'reintentos': 0, 'errores': 0}
+        for evento in lote:
+            if evento.estado != EstadoEventoWebhook.pendiente:
+                continue
+            evento.intentos += 1
+            consulta = consultas.get(evento.recurso_id)
+
+            if evento.tipo != 'payment':
+                evento.estado = EstadoEventoWebhook.ignorado
+                evento.error = f"Tipo '{evento.tipo}' no soportado"
+                resultado['ignorados'] += 1
+            elif consulta.get('success'):
+                evento.estado = EstadoEventoWebhook.procesado
+                resultado['procesados'] += 1
+            elif not consulta.get('reintentable'):
+                evento.estado = EstadoEventoWebhook.ignorado
+                evento.error = consulta.get('message')
+                resultado['ignorados'] += 1
+            elif evento.intentos >= max_intentos:
+                evento.estado = EstadoEventoWebhook.error
+                evento.error = consulta.get('message')
+                resultado['errores'] += 1
+            else:
+                # sigue pendiente: se reintenta en el siguiente vaciado
+                evento.error = consulta.get('message')
+                resultado['reintentos'] += 1
+                continue
+            evento.fecha_procesado = ahora
+
+        db.session.commit()
+        return resultado, creados, pagos_tocados
+
+    resultado, creados, pagos_tocados = reintentar_si_conflicto(aplicar)
+
+    # efectos fuera de la transaccion: notificaciones y cache de estados de trabajo
+    if creados:
+        from controllers.carrito_controller import CarritoController
+        CarritoController._notificar_contrataciones(creados)
+
+    from tareas.pagos import invalidar_estado
+    for id_trabajo in pagos_tocados:
+        invalidar_estado(id_trabajo)
+
+    return resultado
+
+
+def _aplicar_estados(infos):
+    """
+    Aplica el estado de cada pago de MercadoPago a los registros locales (sin commit).
+
+    Los pagos locales se encuentran por external_reference (referencia_pago) o por
+    id de transacción; los items del carrito por referencia_pago. Todo el lote se
+    carga con dos consultas IN.
+
+    Returns:
+        tuple: (contrataciones creadas [(item, contratacion, pago)], ids de trabajo afectados)
+    """
+    from controllers.carrito_controller import CarritoController
+    from models.carrito import CarritoItem, EstadoCarritoItem
+    from models.contratacion import EstadoContratacion
+    from models.pago import Pago, EstadoPago
+
+    if not infos:
+        return [], set()
+
+    referencias = {info['referencia_externa'] for info in infos if info.get('referencia_externa')}
+    ids_mp = {info['payment_id'] for info in infos}
+
+    pagos = Pago.query.options(joinedload(Pago.contratacion)).filter(or_(
+        Pago.referencia_pago.in_(referencias),
+        Pago.mercadopago_id.in_(ids_mp)
+    )).all()
+    items = CarritoItem.query.filter(
+        CarritoItem.referencia_pago.in_(referencias),
+        CarritoItem.estado.in_([EstadoCarritoItem.pendiente, EstadoCarritoItem.procesando])
+    ).all() if referencias else []
+
+    pagos_por_clave = {}
+    for pago in pagos:
+        for clave in (pago.referencia_pago, pago.mercadopago_id):
+            if clave:
+                pagos_por_clave.setdefault(clave, {})[pago.id] = pago
+    items_por_referencia = {}
+    for item in items:
+        items_por_referencia.setdefault(item.referencia_pago, []).append(item)
+
+    creados = []
+    pagos_tocados = set()
+    ahora = datetime.utcnow()
+
+    for info in infos:
+        referencia = info.get('referencia_externa')
+        estado_mp = info.get('estado')
+        pagos_info = {
+            **pagos_por_clave.get(referencia, {}),
+            **pagos_por_clave.get(info['payment_id'], {})
+        }.values()
+        items_info = items_por_referencia.get(referencia, [])
+
+        for pago in pagos_info:
+            if not pago.mercadopago_id:
+                pago.asignar_pago_mercadopago(info['payment_id'])
+            if pago.id_trabajo:
+                pagos_tocados.add(pago.id_trabajo)
+
+        if estado_mp in ESTADOS_APROBADOS:
+            for pago in pagos_info:
+                if pago.estado in (EstadoPago.pendiente, EstadoPago.rechazado):
+                    pago.estado = EstadoPago.aprobado
+                    pago.fecha_aprobacion = ahora
+                # contratación ya aceptada por el proveedor: el pago la confirma
+                if pago.contratacion and pago.contratacion.estado == EstadoContratacion.aceptada:
+                    pago.contratacion.confirmar()
+            if pagos_info:
+                for item in items_info:
+                    item.completar()
+            else:
+                # checkout pro: el pago local se crea al confirmarse
+                procesando = [item for item in items_info if item.estado == EstadoCarritoItem.procesando]
+                creados += CarritoController._confirmar_items_pagados(procesando, {
+                    'id_transaccion': info['payment_id'],
+                    'mercadopago_id': info['payment_id']
+                })
+
+        elif estado_mp in ESTADOS_RECHAZADOS or estado_mp in ESTADOS_CANCELADOS:
+            nuevo_estado = EstadoPago.rechazado if estado_mp in ESTADOS_RECHAZADOS else EstadoPago.cancelado
+            for pago in pagos_info:
+                if pago.estado == EstadoPago.pendiente:
+                    pago.estado = nuevo_estado
+            # vuelven al carrito salvo que el servicio ya se haya vuelto a agregar
+            CarritoItem.liberar_items([item for item in items_info if item.estado == EstadoCarritoItem.procesando])
+
+        elif estado_mp in ESTADOS_REEMBOLSADOS:
+            for pago in pagos_info:
+                if pago.estado == EstadoPago.aprobado:
+                    pago.estado = EstadoPago.reembolsado
+                    contratacion = pago.contratacion
+                    if contratacion and contratacion.estado not in (EstadoContratacion.completada, EstadoContratacion.cancelada):
+                        contratacion.cancelar('Pago reembolsado en MercadoPago')
+
+        # pending / in_process / authorized: no cambia el estado local
+
+    db.session.flush()
+    return creados, pagos_tocados
@@ -0,0 +1,49 @@
+# tests/conftest.py
+"""
+Fixtures comunes: aplicación con TestingConfig (SQLite en memoria, tareas y
+notificaciones síncronas) y un escenario mínimo de organizador, proveedor, evento
+y servicios.
+"""
+
+import os
+
+# app.py crea la aplicación al importarse: la configuración debe elegirse antes
+os.environ['FLASK_ENV'] = 'testing'
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app import app as aplicacion
+from database import db
+
+
+@pytest.fixture
+def app():
+    with aplicacion.app_context():
+        db.create_all()
+        yield aplicacion
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def escenario(app):
+    from models.evento import Evento, TipoEvento
+    from models.servicio import Servicio, CategoriaServicio
+    from models.usuario import Usuario, RolUsuario
+
+    organizador = Usuario('Organizador', 'organizador@eventlink.test', 'clave', RolUsuario.organizador)
+    proveedor = Usuario('Proveedor', 'proveedor@eventlink.test', 'clave', RolUsuario.proveedor)
+    db.session.add_all([organizador, proveedor])
+    db.session.commit()
+
+    evento = Evento('Boda', TipoEvento.social, datetime(2030, 1, 1, 18), datetime(2030, 1, 1, 23),
+                    'Salón', 'Bogotá', organizador.id, numero_invitados=80)
+    servicios = [Servicio(f'Servicio {i}', 'Descripción del servicio', CategoriaServicio.catering, 100,
+                          'Bogotá', proveedor.id) for i in range(4)]
+    db.session.add(evento)
+    db.session.add_all(servicios)
+    db.session.commit()
+    return SimpleNamespace(organizador=organizador, proveedor=proveedor, evento=evento, servicios=servicios)
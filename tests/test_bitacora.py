@@ -0,0 +1,19 @@
+# tests/test_bitacora.py
+"""
+Redacción de datos de pago en los logs (bitacora.redactar): solo se ocultan los
+números que son de tarjeta.
+"""
+
+import pytest
+
+from bitacora import OCULTO, redactar
+
+
+@pytest.mark.parametrize('tarjeta', ['4509953566233704', '5031 7557 3453 0604', '3711-803032-57522'])
+def test_tarjetas_se_ocultan(tarjeta):
+    assert redactar(f'Pago con tarjeta {tarjeta} rechazado') == f'Pago con tarjeta {OCULTO} rechazado'
+
+
+@pytest.mark.parametrize('numero', ['1234567890123', '1700000000000000', '4509953566233705'])
+def test_otros_numeros_largos_quedan_visibles(numero):
+    assert redactar(f'Pago {numero} aprobado') == f'Pago {numero} aprobado'
@@ -0,0 +1,109 @@
+# tests/test_conciliacion.py
+"""
+Conciliación de pagos pendientes contra el simulador local de MercadoPago
+(simuladores.mercadopago): el estado real de cada pago se consulta por HTTP y se
+aplica a Pago, Contratacion y CarritoItem.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from database import db
+from models.carrito import CarritoItem, EstadoCarritoItem
+from models.contratacion import Contratacion, EstadoContratacion
+from models.pago import Pago, EstadoPago, MetodoPago
+from patterns.singleton import payment_gateway
+from simuladores.mercadopago import ConfiguracionSimulador, iniciar
+from tareas.conciliacion import conciliar_pagos
+
+
+@pytest.fixture
+def mercadopago(monkeypatch):
+    servidor = iniciar(ConfiguracionSimulador(semilla=1))
+    monkeypatch.setattr(payment_gateway._cliente_http, 'url_base', servidor.url)
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _pago_en_mercadopago(servidor, referencia, titular, estado=None):
+    # pago creado en el simulador por la API real; `estado` lo cambia después (p. ej. cancelado)
+    resultado = payment_gateway.procesar_pago_checkout_api(
+        monto=100, descripcion='Servicio', token='tarjeta', payment_method_id='visa',
+        payer={'email': 'organizador@eventlink.test', 'first_name': titular},
+        referencia_externa=referencia
+    )
+    assert resultado['success'], resultado
+    if estado:
+        servidor.almacen.pagos[str(resultado['payment_id'])]['status'] = estado
+    return resultado['payment_id']
+
+
+def _reserva(escenario, servicio, referencia, con_mercadopago_id=True, payment_id=None):
+    # contratación aceptada, item del carrito en 'procesando' y Pago local pendiente
+    contratacion = Contratacion(escenario.evento.id, servicio.id, escenario.organizador.id,
+                                escenario.proveedor.id, datetime(2030, 1, 1, 18), 100)
+    contratacion.estado = EstadoContratacion.aceptada
+    item = CarritoItem(servicio.id, escenario.evento.id, escenario.organizador.id, datetime(2030, 1, 1, 18),
+                       estado=EstadoCarritoItem.procesando, referencia_pago=referencia)
+    db.session.add_all([contratacion, item])
+    db.session.flush()
+    pago = Pago(contratacion_id=contratacion.id, organizador_id=escenario.organizador.id, monto=100,
+                metodo_pago=MetodoPago.mercadopago, estado=EstadoPago.pendiente, referencia_pago=referencia,
+                mercadopago_id=str(payment_id) if con_mercadopago_id and payment_id else None)
+    db.session.add(pago)
+    db.session.commit()
+    return contratacion.id, item.id, pago.id
+
+
+def test_conciliar_pagos_aplica_estados_de_mercadopago(escenario, mercadopago):
+    servicios = escenario.servicios
+    aprobado = _reserva(escenario, servicios[0], 'REF-APRO',
+                        payment_id=_pago_en_mercadopago(mercadopago, 'REF-APRO', 'APRO'))
+    # sin mercadopago_id: se encuentra por external_reference
+    _pago_en_mercadopago(mercadopago, 'REF-OTHE', 'OTHE')
+    rechazado = _reserva(escenario, servicios[1], 'REF-OTHE', con_mercadopago_id=False)
+    cancelado = _reserva(escenario, servicios[2], 'REF-CANC',
+                         payment_id=_pago_en_mercadopago(mercadopago, 'REF-CANC', 'APRO', estado='cancelled'))
+    pendiente = _reserva(escenario, servicios[3], 'REF-CONT',
+                         payment_id=_pago_en_mercadopago(mercadopago, 'REF-CONT', 'CONT'))
+
+    resumen = conciliar_pagos(concurrencia=4)
+
+    assert resumen['revisados'] == 4
+    assert (resumen['aprobados'], resumen['rechazados'], resumen['cancelados']) == (1, 1, 1)
+    assert resumen['sin_cambios'] == 1 and resumen['errores'] == 0
+
+    db.session.expire_all()
+    estados = {
+        nombre: (db.session.get(Pago, pago_id).estado,
+                 db.session.get(Contratacion, contratacion_id).estado,
+                 db.session.get(CarritoItem, item_id).estado)
+        for nombre, (contratacion_id, item_id, pago_id)
+        in {'aprobado': aprobado, 'rechazado': rechazado, 'cancelado': cancelado, 'pendiente': pendiente}.items()
+    }
+    assert estados['aprobado'] == (EstadoPago.aprobado, EstadoContratacion.confirmada, EstadoCarritoItem.completado)
+    assert estados['rechazado'] == (EstadoPago.rechazado, EstadoContratacion.aceptada, EstadoCarritoItem.pendiente)
+    assert estados['cancelado'] == (EstadoPago.cancelado, EstadoContratacion.aceptada, EstadoCarritoItem.pendiente)
+    assert estados['pendiente'] == (EstadoPago.pendiente, EstadoContratacion.aceptada, EstadoCarritoItem.procesando)
+    assert db.session.get(Pago, rechazado[2]).mercadopago_id is not None
+
+
+def test_pago_rechazado_con_servicio_agregado_de_nuevo(escenario, mercadopago):
+    servicio = escenario.servicios[0]
+    _, item_reservado, pago_id = _reserva(escenario, servicio, 'REF-OTHE',
+                                          payment_id=_pago_en_mercadopago(mercadopago, 'REF-OTHE', 'OTHE'))
+    # mientras el pago estaba en curso el organizador volvió a agregar el servicio
+    de_nuevo = CarritoItem(servicio.id, escenario.evento.id, escenario.organizador.id, datetime(2030, 1, 1, 18))
+    db.session.add(de_nuevo)
+    db.session.commit()
+
+    resumen = conciliar_pagos()
+
+    assert resumen['rechazados'] == 1 and resumen['errores'] == 0
+    db.session.expire_all()
+    assert db.session.get(Pago, pago_id).estado == EstadoPago.rechazado
+    # queda uno solo pendiente (uq_carrito_item_pendiente): el que está en el carrito
+    assert db.session.get(CarritoItem, item_reservado).estado == EstadoCarritoItem.cancelado
+    assert db.session.get(CarritoItem, de_nuevo.id).estado == EstadoCarritoItem.pendiente
@@ -0,0 +1,50 @@
+# tests/test_contrataciones.py
+"""
+Cancelación de contrataciones: solo desde solicitada, confirmada o en progreso.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from database import db
+from models.contratacion import Contratacion, EstadoContratacion
+
+
+def _contratacion(escenario, estado):
+    contratacion = Contratacion(escenario.evento.id, escenario.servicios[0].id, escenario.organizador.id,
+                                escenario.proveedor.id, datetime(2030, 1, 1, 18), 100, estado=estado)
+    db.session.add(contratacion)
+    db.session.commit()
+    return contratacion.id
+
+
+def _cancelar(app, escenario, contratacion_id):
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = escenario.organizador.id
+        sesion['user_rol'] = 'organizador'
+    return cliente.post(f'/contrataciones/{contratacion_id}/cancelar', data={'motivo': 'Cambio de planes'})
+
+
+@pytest.mark.parametrize('estado', [EstadoContratacion.completada, EstadoContratacion.cancelada])
+def test_estado_no_cancelable(app, escenario, estado):
+    contratacion_id = _contratacion(escenario, estado)
+
+    respuesta = _cancelar(app, escenario, contratacion_id)
+
+    assert respuesta.status_code == 400
+    db.session.expire_all()
+    contratacion = db.session.get(Contratacion, contratacion_id)
+    assert contratacion.estado == estado
+    assert not contratacion.notas_especiales
+
+
+def test_solicitada_se_cancela(app, escenario):
+    contratacion_id = _contratacion(escenario, EstadoContratacion.solicitada)
+
+    respuesta = _cancelar(app, escenario, contratacion_id)
+
+    assert respuesta.status_code == 302
+    db.session.expire_all()
+    assert db.session.get(Contratacion, contratacion_id).estado == EstadoContratacion.cancelada
@@ -0,0 +1,58 @@
+# tests/test_correo.py
+"""
+Envío de correos de notificación por lotes (tareas.correo) contra el sumidero SMTP
+local (simuladores.smtp): los mensajes llegan por SMTP real y se revisan en el
+sumidero.
+"""
+
+from email import message_from_bytes
+from email.policy import default as politica_correo
+
+import pytest
+
+from app import mail
+from simuladores.smtp import iniciar
+from tareas.correo import enviador_correos
+
+
+@pytest.fixture
+def sumidero(app):
+    servidor = iniciar()
+    original = dict(app.config)
+    app.config.update(MAIL_SERVER=servidor.host, MAIL_PORT=servidor.puerto, MAIL_USE_TLS=False,
+                      MAIL_USE_SSL=False, MAIL_USERNAME=None, MAIL_PASSWORD=None,
+                      MAIL_SUPPRESS_SEND=False, TESTING=False, NOTIFICACIONES_SINCRONAS=False,
+                      CORREO_TAMANO_LOTE=10, CORREO_TRABAJADORES=1)
+    mail.init_app(app)
+    enviador_correos.init_app(app)
+    yield servidor
+    app.config.clear()
+    app.config.update(original)
+    mail.init_app(app)
+    enviador_correos.init_app(app)
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_lote_de_correos_llega_al_sumidero(sumidero):
+    destinatarios = [f'usuario{numero}@eventlink.test' for numero in range(5)]
+    for numero, correo in enumerate(destinatarios):
+        enviador_correos.encolar(correo, f'Usuario {numero}', {
+            'titulo': f'Contratación aceptada {numero}', 'mensaje': 'Tu contratación fue aceptada',
+            'tipo': 'contratacion_aceptada', 'usuario_id': numero
+        })
+
+    assert enviador_correos.esperar_pendientes(espera=10)
+
+    estadisticas = enviador_correos.estadisticas()
+    assert (estadisticas['enviados'], estadisticas['fallidos'], estadisticas['rechazados']) == (5, 0, 0)
+    assert sumidero.estadisticas()['mensajes'] == 5
+
+    recibidos = list(sumidero.mensajes)
+    assert sorted(destinatario.strip('<>') for mensaje in recibidos
+                  for destinatario in mensaje['destinatarios']) == destinatarios
+    mensajes = [message_from_bytes(mensaje['contenido'], policy=politica_correo) for mensaje in recibidos]
+    por_destinatario = {mensaje['To']: mensaje for mensaje in mensajes}
+    assert por_destinatario['usuario3@eventlink.test']['Subject'] == 'EventLink - Contratación aceptada 3'
+    cuerpo = por_destinatario['usuario3@eventlink.test'].get_body(('plain',)).get_content()
+    assert 'Usuario 3' in cuerpo and 'Tu contratación fue aceptada' in cuerpo
@@ -0,0 +1,64 @@
+# tests/test_escritura_notificaciones.py
+"""
+Notificaciones que el escritor por lotes no logra guardar: pasan a
+NotificacionFallida (DatabaseObserver) en lugar de perderse, sin arrastrar a las
+demás filas de su lote.
+"""
+
+import pytest
+
+from database import db
+from models.notificacion import Notificacion, NotificacionFallida, TipoNotificacion
+from tareas.escritura_notificaciones import escritor_notificaciones, fila_notificacion
+
+
+def _fila(usuario_id, titulo='Nueva contratación'):
+    return fila_notificacion(titulo=titulo, mensaje='Mensaje', tipo=TipoNotificacion.nueva_contratacion,
+                             usuario_id=usuario_id)
+
+
+def test_fila_invalida_no_arrastra_al_lote(escenario):
+    escritor_notificaciones._pendientes.extend([_fila(escenario.proveedor.id),
+                                                _fila(None, 'Sin destinatario'),
+                                                _fila(escenario.organizador.id, 'Otra')])
+
+    # usuario_id es NOT NULL: el INSERT del lote falla y se guarda fila por fila
+    assert escritor_notificaciones.vaciar() == 2
+
+    assert escritor_notificaciones.estadisticas()['pendientes'] == 0
+    assert sorted((notificacion.usuario_id, notificacion.titulo) for notificacion in Notificacion.query) == sorted([
+        (escenario.proveedor.id, 'Nueva contratación'), (escenario.organizador.id, 'Otra')
+    ])
+    fallidas = NotificacionFallida.query.all()
+    assert [(fallida.observador, fallida.datos['titulo']) for fallida in fallidas] == [
+        ('DatabaseObserver', 'Sin destinatario')
+    ]
+    assert fallidas[0].datos['tipo'] == 'nueva_contratacion'
+
+
+def test_apartadas_como_fallidas_tras_varios_fallos(escenario, monkeypatch):
+    monkeypatch.setattr(escritor_notificaciones, 'max_fallos', 2)
+    # sola en el lote no entra ninguna fila: se reintenta como si la base estuviera caída
+    with pytest.raises(Exception):
+        escritor_notificaciones.agregar(_fila(None, 'Sin destinatario'))
+    assert escritor_notificaciones.estadisticas()['pendientes'] == 1
+    assert NotificacionFallida.query.count() == 0
+
+    with pytest.raises(Exception):
+        escritor_notificaciones.vaciar()
+
+    assert escritor_notificaciones.estadisticas()['pendientes'] == 0
+    assert [fallida.datos['titulo'] for fallida in NotificacionFallida.query] == ['Sin destinatario']
+
+    # con el buffer libre las siguientes se guardan en el momento
+    escritor_notificaciones.agregar(_fila(escenario.proveedor.id, 'Otra'))
+    assert [notificacion.titulo for notificacion in Notificacion.query] == ['Otra']
+
+
+def test_pendientes_al_apagar_pasan_a_fallidas(escenario):
+    escritor_notificaciones._pendientes.append(_fila(None, 'Sin destinatario'))
+
+    escritor_notificaciones.apagar()
+
+    assert escritor_notificaciones.estadisticas()['pendientes'] == 0
+    assert [fallida.datos['titulo'] for fallida in NotificacionFallida.query] == ['Sin destinatario']
@@ -0,0 +1,65 @@
+# tests/test_esquema.py
+"""
+actualizar_esquema en una base de datos anterior a uq_carrito_item_pendiente:
+los items pendientes repetidos se resuelven antes de crear el índice.
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect
+
+from database import actualizar_esquema, db
+from models.carrito import CarritoItem, EstadoCarritoItem
+
+
+def _sin_indice():
+    with db.engine.begin() as conexion:
+        conexion.exec_driver_sql("DROP INDEX uq_carrito_item_pendiente")
+
+
+def test_pendientes_repetidos_se_cancelan_antes_del_indice(escenario):
+    _sin_indice()
+    servicio = escenario.servicios[0]
+    items = [CarritoItem(servicio.id, escenario.evento.id, escenario.organizador.id, datetime(2030, 1, 1, 18))
+             for _numero in range(3)]
+    otro = CarritoItem(escenario.servicios[1].id, escenario.evento.id, escenario.organizador.id,
+                       datetime(2030, 1, 1, 18))
+    db.session.add_all(items + [otro])
+    db.session.commit()
+
+    cambios = actualizar_esquema()
+
+    assert 'indice uq_carrito_item_pendiente' in cambios
+    db.session.expire_all()
+    # queda el más reciente
+    assert [item.estado for item in items] == [EstadoCarritoItem.cancelado] * 2 + [EstadoCarritoItem.pendiente]
+    assert otro.estado == EstadoCarritoItem.pendiente
+    assert not CarritoItem.agregar_pendiente(
+        CarritoItem(servicio.id, escenario.evento.id, escenario.organizador.id, datetime(2030, 1, 1, 18)))
+
+
+def test_indice_unico_que_no_se_puede_crear(escenario, monkeypatch):
+    _sin_indice()
+    servicio = escenario.servicios[0]
+    db.session.add_all([CarritoItem(servicio.id, escenario.evento.id, escenario.organizador.id,
+                                    datetime(2030, 1, 1, 18)) for _numero in range(2)])
+    db.session.commit()
+    indice = next(indice for indice in CarritoItem.__table__.indexes if indice.name == 'uq_carrito_item_pendiente')
+    monkeypatch.setitem(indice.info, 'deduplicar', lambda conexion: 0)
+
+    with pytest.raises(RuntimeError):
+        actualizar_esquema()
+
+
+def test_indice_reemplazado_se_elimina(app):
+    with db.engine.begin() as conexion:
+        conexion.exec_driver_sql(
+            "CREATE INDEX ix_notificaciones_usuario_estado ON notificaciones (usuario_id, estado, fecha_creacion)")
+
+    cambios = actualizar_esquema()
+
+    assert 'indice ix_notificaciones_usuario_estado eliminado' in cambios
+    indices = {indice['name'] for indice in inspect(db.engine).get_indexes('notificaciones')}
+    assert 'ix_notificaciones_usuario_estado' not in indices
+    assert 'ix_notificaciones_usuario_estado_fecha' in indices
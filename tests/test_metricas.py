@@ -0,0 +1,28 @@
+# tests/test_metricas.py
+"""
+Almacén de las métricas de la pasarela (patterns.metricas): se elige con la
+configuración de la aplicación y se abre recién al usarlo.
+"""
+
+from types import SimpleNamespace
+
+from patterns.metricas import AlmacenMetricasMemoria, AlmacenMetricasSqlite, RegistroMetricas
+from patterns.singleton import payment_gateway
+
+
+def test_pruebas_usan_el_almacen_del_proceso(app):
+    assert isinstance(payment_gateway.metricas.almacen, AlmacenMetricasMemoria)
+
+
+def test_almacen_sqlite_se_abre_al_usarlo(tmp_path):
+    ruta = tmp_path / 'metricas.sqlite3'
+    registro = RegistroMetricas()
+    registro.init_app(SimpleNamespace(config={'METRICAS_ARCHIVO': str(ruta), 'METRICAS_INTERVALO': 60}))
+    assert not ruta.exists()
+
+    registro.observar('consulta', 0.02, True)
+    registro.vaciar()
+
+    assert isinstance(registro.almacen, AlmacenMetricasSqlite)
+    assert ruta.exists()
+    assert registro.resumen()['operaciones']['consulta']['exitos'] == 1
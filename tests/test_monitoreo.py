@@ -0,0 +1,37 @@
+# tests/test_monitoreo.py
+"""
+Rutas de estado y métricas: solo administradores con sesión o un monitor con
+METRICAS_TOKEN.
+"""
+
+import pytest
+
+RUTAS = ['/pagos/estado-pasarela', '/pagos/metricas-pasarela', '/notificaciones/metricas-despacho']
+
+
+def _iniciar_sesion(cliente, rol):
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = 1
+        sesion['user_rol'] = rol
+
+
+@pytest.mark.parametrize('ruta', RUTAS)
+def test_sin_sesion_ni_token(app, ruta):
+    assert app.test_client().get(ruta).status_code == 401
+
+
+@pytest.mark.parametrize('ruta', RUTAS)
+def test_solo_administradores(app, ruta):
+    cliente = app.test_client()
+    _iniciar_sesion(cliente, 'organizador')
+    assert cliente.get(ruta).status_code == 403
+    _iniciar_sesion(cliente, 'admin')
+    assert cliente.get(ruta).status_code == 200
+
+
+@pytest.mark.parametrize('ruta', RUTAS)
+def test_token_de_monitoreo(app, monkeypatch, ruta):
+    monkeypatch.setitem(app.config, 'METRICAS_TOKEN', 'secreto')
+    cliente = app.test_client()
+    assert cliente.get(ruta, headers={'Authorization': 'Bearer otro'}).status_code == 401
+    assert cliente.get(ruta, headers={'Authorization': 'Bearer secreto'}).status_code == 200
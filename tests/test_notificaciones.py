@@ -0,0 +1,33 @@
+# tests/test_notificaciones.py
+"""
+Despachador de notificaciones (tareas.notificaciones): lo que queda en la cola al
+detener el proceso pasa a NotificacionFallida solo para los observadores que se
+reenvían, con datos que caben en la columna JSON.
+"""
+
+import os
+import queue
+import time
+from decimal import Decimal
+
+from models.notificacion import NotificacionFallida
+from patterns.factory import NotificacionFactory
+from patterns.observer import DatabaseObserver, LogObserver, SistemaNotificaciones
+from tareas.notificaciones import DespachadorNotificaciones, datos_notificacion
+
+
+def test_pendientes_al_apagar(app, escenario):
+    despachador = DespachadorNotificaciones(app)
+    despachador._cola, despachador._pid = queue.Queue(), os.getpid()
+    sistema = SistemaNotificaciones()
+    sistema.registrar_observador(DatabaseObserver())
+    sistema.registrar_observador(LogObserver())
+    datos = datos_notificacion(
+        NotificacionFactory.crear_notificacion_pago(escenario.proveedor.id, None, Decimal('150000.50')))
+    despachador._cola.put((sistema, datos, None, time.monotonic()))
+
+    despachador.apagar(espera=0)
+
+    fallidas = NotificacionFallida.query.all()
+    assert [fallida.observador for fallida in fallidas] == ['DatabaseObserver']
+    assert fallidas[0].datos['datos_adicionales'] == {'monto': '150000.50'}
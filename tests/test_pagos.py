@@ -0,0 +1,87 @@
+# tests/test_pagos.py
+"""
+Tarea que envía a MercadoPago el pago de un item del carrito (tareas.pagos):
+items que ya no existen y errores de transporte, en los que no se sabe si el pago
+se creó.
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from database import db
+from models.carrito import CarritoItem, EstadoCarritoItem
+from models.contratacion import Contratacion
+from models.pago import Pago, EstadoPago, EstadoTrabajo, MetodoPago
+from patterns.singleton import payment_gateway
+from tareas.pagos import MENSAJE_SIN_CONFIRMAR, procesar_pago_carrito
+
+DATOS_TARJETA = {'token': 'tarjeta', 'payment_method_id': 'visa',
+                 'payer': {'email': 'organizador@eventlink.test', 'first_name': 'APRO'}}
+
+
+def _pago_en_cola(escenario):
+    servicio = escenario.servicios[0]
+    contratacion = Contratacion(escenario.evento.id, servicio.id, escenario.organizador.id,
+                                escenario.proveedor.id, datetime(2030, 1, 1, 18), 100)
+    item = CarritoItem(servicio.id, escenario.evento.id, escenario.organizador.id, datetime(2030, 1, 1, 18),
+                       estado=EstadoCarritoItem.procesando, referencia_pago='REF-1')
+    db.session.add_all([contratacion, item])
+    db.session.flush()
+    pago = Pago(contratacion_id=contratacion.id, organizador_id=escenario.organizador.id, monto=100,
+                metodo_pago=MetodoPago.mercadopago, estado=EstadoPago.pendiente, referencia_pago='REF-1',
+                id_trabajo='trabajo-1', estado_trabajo=EstadoTrabajo.en_cola.value)
+    db.session.add(pago)
+    db.session.commit()
+    return pago.id, item.id
+
+
+def test_item_eliminado_finaliza_el_trabajo(escenario):
+    pago_id, item_id = _pago_en_cola(escenario)
+    CarritoItem.query.filter_by(id=item_id).delete()
+    db.session.commit()
+
+    procesar_pago_carrito(pago_id, item_id, DATOS_TARJETA)
+
+    pago = db.session.get(Pago, pago_id)
+    assert pago.estado_trabajo == EstadoTrabajo.fallido.value
+    assert pago.estado == EstadoPago.rechazado
+
+
+def test_error_de_transporte_deja_el_pago_pendiente(escenario, monkeypatch):
+    pago_id, item_id = _pago_en_cola(escenario)
+
+    def crear(*_args, **_kwargs):
+        raise requests.ReadTimeout('Read timed out (detalle interno)')
+
+    monkeypatch.setattr(payment_gateway, '_mercadopago_configurado', True)
+    monkeypatch.setattr(payment_gateway, 'obtener_sdk',
+                        lambda *_args: SimpleNamespace(payment=lambda: SimpleNamespace(create=crear)))
+
+    procesar_pago_carrito(pago_id, item_id, DATOS_TARJETA)
+
+    db.session.expire_all()
+    pago = db.session.get(Pago, pago_id)
+    # MercadoPago pudo crear el cargo: lo resuelven el webhook o la conciliación
+    assert pago.estado == EstadoPago.pendiente
+    assert pago.estado_trabajo == EstadoTrabajo.completado.value
+    assert pago.mensaje_trabajo == MENSAJE_SIN_CONFIRMAR
+    assert db.session.get(CarritoItem, item_id).estado == EstadoCarritoItem.procesando
+
+
+@pytest.mark.parametrize('estado_http, incierto', [(502, True), (400, False)])
+def test_respuesta_sin_pago_de_mercadopago(escenario, monkeypatch, estado_http, incierto):
+    pago_id, item_id = _pago_en_cola(escenario)
+    respuesta = {'status': estado_http, 'response': {'message': 'error'}}
+    monkeypatch.setattr(payment_gateway, '_mercadopago_configurado', True)
+    monkeypatch.setattr(payment_gateway, 'obtener_sdk',
+                        lambda *_args: SimpleNamespace(payment=lambda: SimpleNamespace(create=lambda *_a: respuesta)))
+
+    procesar_pago_carrito(pago_id, item_id, DATOS_TARJETA)
+
+    db.session.expire_all()
+    esperado = (EstadoPago.pendiente, EstadoCarritoItem.procesando) if incierto \
+        else (EstadoPago.rechazado, EstadoCarritoItem.pendiente)
+    assert (db.session.get(Pago, pago_id).estado, db.session.get(CarritoItem, item_id).estado) == esperado
@@ -0,0 +1,66 @@
+# tests/test_push.py
+"""
+Envío de notificaciones Web Push (tareas.push) contra el servicio push local
+(simuladores.push): el simulador verifica VAPID y descifra cada notificación con
+las claves de la suscripción, y responde 404/410 a las que ya no existen.
+"""
+
+import pytest
+
+from database import db
+from models.suscripcion_push import SuscripcionPush
+from simuladores.push import iniciar
+from tareas.push import enviador_push, generar_claves_vapid
+
+
+@pytest.fixture
+def servicio_push(app):
+    servidor = iniciar()
+    original = app.config.get('PUSH_VAPID_CLAVE_PRIVADA')
+    app.config['PUSH_VAPID_CLAVE_PRIVADA'] = generar_claves_vapid()[0]
+    enviador_push.init_app(app)
+    yield servidor
+    app.config['PUSH_VAPID_CLAVE_PRIVADA'] = original
+    enviador_push.init_app(app)
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def _suscribir(usuario_id, suscripcion):
+    fila = SuscripcionPush(usuario_id, suscripcion['endpoint'], suscripcion['keys']['p256dh'],
+                           suscripcion['keys']['auth'])
+    db.session.add(fila)
+    db.session.commit()
+    return fila.id
+
+
+def test_envio_cifrado_y_suscripciones_vencidas(escenario, servicio_push):
+    usuario_id = escenario.organizador.id
+    vigentes = [_suscribir(usuario_id, suscripcion) for suscripcion in servicio_push.crear_suscripciones(2)]
+    vencida = _suscribir(usuario_id, servicio_push.crear_suscripciones(1, vencidas=1.0)[0])
+    # endpoint que el servicio push no conoce (404)
+    inexistente = _suscribir(usuario_id, dict(servicio_push.crear_suscripciones(1)[0],
+                                              endpoint=f'{servicio_push.url}/push/desconocido'))
+    # suscripción de otro usuario: no recibe nada
+    ajena = servicio_push.crear_suscripciones(1)[0]
+    _suscribir(escenario.proveedor.id, ajena)
+
+    # NOTIFICACIONES_SINCRONAS (pruebas): se envía en el momento
+    enviador_push.encolar({'titulo': 'Pago recibido', 'mensaje': 'Recibiste un pago de $100',
+                           'tipo': 'pago_recibido', 'usuario_id': usuario_id})
+
+    estadisticas = enviador_push.estadisticas()
+    assert (estadisticas['enviados'], estadisticas['vencidas'], estadisticas['errores']) == (2, 2, 0)
+    simulador = servicio_push.estadisticas()
+    assert simulador['recibidas'] == 2 and simulador['vencidas'] == 2
+    assert not simulador.get('vapid_invalido') and not simulador.get('no_descifradas')
+    # el simulador descifró lo que recibe el Service Worker
+    assert servicio_push.ultimas == [{'titulo': 'Pago recibido', 'mensaje': 'Recibiste un pago de $100',
+                                      'tipo': 'pago_recibido', 'url': '/notificaciones/'}] * 2
+    assert servicio_push.recibidas[ajena['endpoint'].rsplit('/', 1)[1]] == 0
+
+    db.session.expire_all()
+    restantes = {fila.id: fila for fila in SuscripcionPush.query.filter_by(usuario_id=usuario_id)}
+    assert set(restantes) == set(vigentes)
+    assert vencida not in restantes and inexistente not in restantes
+    assert all(fila.fecha_ultimo_envio is not None for fila in restantes.values())
@@ -0,0 +1,104 @@
+# tests/test_retencion.py
+"""
+Retención de notificaciones (tareas.retencion): qué se mueve al histórico y en
+cuántos lotes (SQLite), y las sentencias de particionado de PostgreSQL sobre una
+conexión que solo las registra.
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from database import db
+from models.notificacion import Notificacion, NotificacionHistorica, EstadoNotificacion, TipoNotificacion
+from tareas import retencion
+
+
+def _notificacion(usuario_id, dias, estado=EstadoNotificacion.no_leida):
+    notificacion = Notificacion('Aviso', 'Mensaje', TipoNotificacion.bienvenida, usuario_id)
+    notificacion.estado = estado
+    notificacion.fecha_creacion = datetime.utcnow() - timedelta(days=dias)
+    db.session.add(notificacion)
+    return notificacion
+
+
+def test_retener_notificaciones(escenario):
+    usuario_id = escenario.organizador.id
+    antiguas = [_notificacion(usuario_id, 400), _notificacion(usuario_id, 370, EstadoNotificacion.leida)]
+    archivada_vieja = _notificacion(usuario_id, 40, EstadoNotificacion.archivada)
+    conservadas = [_notificacion(usuario_id, 40, EstadoNotificacion.leida),
+                   _notificacion(usuario_id, 10, EstadoNotificacion.archivada),
+                   _notificacion(usuario_id, 1)]
+    db.session.commit()
+    movidas = {notificacion.id for notificacion in antiguas + [archivada_vieja]}
+    restantes = {notificacion.id for notificacion in conservadas}
+
+    assert retencion.retener_notificaciones(dias=365, dias_archivadas=30, simular=True)['movidas'] == 3
+    resumen = retencion.retener_notificaciones(dias=365, dias_archivadas=30, tamano_lote=2)
+
+    assert (resumen['movidas'], resumen['lotes']) == (3, 2)
+    assert {fila.id for fila in db.session.query(Notificacion.id)} == restantes
+    historico = NotificacionHistorica.query.all()
+    assert {fila.id for fila in historico} == movidas
+    assert all(fila.fecha_movida and fila.usuario_id == usuario_id for fila in historico)
+
+
+class _Conexion:
+    # registra las sentencias; las consultas de filas responden con `filas`
+    def __init__(self, filas=None):
+        self.sentencias = []
+        self.filas = filas or {}
+
+    def exec_driver_sql(self, sentencia, *_parametros):
+        self.sentencias.append(sentencia)
+        return SimpleNamespace(first=lambda: self.filas.get(sentencia))
+
+
+@pytest.fixture
+def ahora(monkeypatch):
+    class Fecha(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime(2030, 5, 17, 10)
+
+    monkeypatch.setattr(retencion, 'datetime', Fecha)
+
+
+def test_crear_particiones(monkeypatch, ahora):
+    monkeypatch.setattr(retencion, '_particiones', lambda _conexion: {
+        'notificaciones_legado': datetime(2030, 5, 1), 'notificaciones_p203005': datetime(2030, 6, 1),
+        'notificaciones_default': None})
+    conexion = _Conexion()
+
+    creadas = retencion._crear_particiones(conexion, 2)
+
+    assert creadas == ['notificaciones_p203006', 'notificaciones_p203007']
+    rango = "fecha_creacion >= '2030-06-01 00:00:00' AND fecha_creacion < '2030-07-01 00:00:00'"
+    assert conexion.sentencias[:5] == [
+        f"CREATE TEMP TABLE pendientes ON COMMIT DROP AS SELECT * FROM notificaciones_default WHERE {rango}",
+        f"DELETE FROM notificaciones_default WHERE {rango}",
+        "CREATE TABLE notificaciones_p203006 PARTITION OF notificaciones "
+        "FOR VALUES FROM ('2030-06-01 00:00:00') TO ('2030-07-01 00:00:00')",
+        "INSERT INTO notificaciones SELECT * FROM pendientes",
+        "DROP TABLE pendientes",
+    ]
+    assert len(conexion.sentencias) == 10
+
+
+def test_eliminar_particiones_vacias(monkeypatch):
+    monkeypatch.setattr(retencion, '_particiones', lambda _conexion: {
+        'notificaciones_p202901': datetime(2029, 2, 1), 'notificaciones_p202902': datetime(2029, 3, 1),
+        'notificaciones_p203005': datetime(2030, 6, 1), 'notificaciones_default': None})
+    # la de febrero todavía tiene filas
+    conexion = _Conexion({'SELECT 1 FROM "notificaciones_p202902" LIMIT 1': (1,)})
+
+    eliminadas = retencion._eliminar_particiones_vacias(conexion, datetime(2029, 6, 1))
+
+    assert eliminadas == ['notificaciones_p202901']
+    assert conexion.sentencias == [
+        'SELECT 1 FROM "notificaciones_p202901" LIMIT 1',
+        'ALTER TABLE notificaciones DETACH PARTITION "notificaciones_p202901"',
+        'DROP TABLE "notificaciones_p202901"',
+        'SELECT 1 FROM "notificaciones_p202902" LIMIT 1',
+    ]
@@ -233,6 +233,28 @@ async function processMercadoPagoPayment(contratacionId) {
     }
 }
 
+// Espera a que termine un pago enviado en segundo plano.
+// Consulta urlEstado respetando la espera sugerida por el servidor (Retry-After)
+// y resuelve con el estado final del trabajo.
+async function esperarTrabajoPago(urlEstado, reintentarEn = 1, tiempoMaximo = 120) {
+    const inicio = Date.now();
+    let espera = reintentarEn;
+
+    while ((Date.now() - inicio) / 1000 < tiempoMaximo) {
+        await new Promise(resolve => setTimeout(resolve, espera * 1000));
+
+        const response = await fetch(urlEstado, { headers: { 'Accept': 'application/json' } });
+        const data = await response.json();
+
+        if (response.status !== 202) {
+            return data;
+        }
+        espera = parseInt(response.headers.get('Retry-After')) || data.reintentar_en || espera;
+    }
+
+    return { success: false, resuelto: false, message: 'El pago sigue en proceso. Revisa tu historial de pagos en unos minutos.' };
+}
+
 // ========== NOTIFICACIONES ==========
 
 async function markNotificationAsRead(notificationId) {
@@ -396,6 +418,119 @@ function initRealtimeValidation() {
 // Inicializar validaciones en tiempo real
 document.addEventListener('DOMContentLoaded', initRealtimeValidation);
 
+// ========== NOTIFICACIONES PUSH ==========
+
+function base64UrlABytes(texto) {
+    const relleno = '='.repeat((4 - texto.length % 4) % 4);
+    const binario = atob((texto + relleno).replace(/-/g, '+').replace(/_/g, '/'));
+    return Uint8Array.from(binario, caracter => caracter.charCodeAt(0));
+}
+
+async function suscribirPush(reenviar = true) {
+    const registro = await navigator.serviceWorker.ready;
+    let suscripcion = await registro.pushManager.getSubscription();
+    if (suscripcion && !reenviar) return;
+    if (!suscripcion) {
+        const respuesta = await fetch('/notificaciones/push/clave-publica');
+        if (!respuesta.ok) return;
+        const { clave_publica } = await respuesta.json();
+        suscripcion = await registro.pushManager.subscribe({
+            userVisibleOnly: true,
+            applicationServerKey: base64UrlABytes(clave_publica)
+        });
+    }
+    await fetch('/notificaciones/push/suscribir', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(suscripcion)
+    });
+}
+
+async function cancelarPush() {
+    const registro = await navigator.serviceWorker.ready;
+    const suscripcion = await registro.pushManager.getSubscription();
+    if (!suscripcion) return;
+    await fetch('/notificaciones/push/cancelar', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ endpoint: suscripcion.endpoint })
+    });
+    await suscripcion.unsubscribe();
+}
+
+// El checkbox de push del perfil pide permiso y suscribe (o cancela) este navegador;
+// con el permiso ya concedido se crea otra suscripción si el navegador descartó la anterior
+function initPushNotifications() {
+    if (!('serviceWorker' in navigator) || !('PushManager' in window)) return;
+
+    const casilla = document.getElementById('notificaciones_push');
+    if (casilla) {
+        casilla.addEventListener('change', async () => {
+            try {
+                if (casilla.checked && await Notification.requestPermission() === 'granted') {
+                    await suscribirPush();
+                } else if (!casilla.checked) {
+                    await cancelarPush();
+                }
+            } catch (error) {
+                console.warn('No se pudo actualizar la suscripción push:', error);
+            }
+        });
+    }
+
+    if (Notification.permission === 'granted' && (!casilla || casilla.checked)) {
+        suscribirPush(false).catch(error => console.warn('No se pudo renovar la suscripción push:', error));
+    }
+}
+
+document.addEventListener('DOMContentLoaded', initPushNotifications);
+
+// ========== NOTIFICACIONES EN VIVO (SSE) ==========
+
+function actualizarContador(id, valor) {
+    const contador = document.getElementById(id);
+    if (!contador) return;
+    contador.textContent = valor > 0 ? valor : '';
+    contador.classList.toggle('d-none', !(valor > 0));
+}
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto || '';
+    return div.innerHTML;
+}
+
+// Una conexión EventSource por pestaña: los contadores llegan al conectar y cada
+// notificación nueva suma 1 a la campana. El navegador se reconecta solo cuando el
+// servidor cierra el flujo; si lo rechaza (p. ej. 503) se reintenta más tarde
+function initNotificacionesEnVivo() {
+    if (!('EventSource' in window) || !document.getElementById('contador-notificaciones')) return;
+
+    const flujo = new EventSource('/notificaciones/eventos');
+
+    flujo.addEventListener('contadores', (evento) => {
+        const contadores = JSON.parse(evento.data);
+        actualizarContador('contador-notificaciones', contadores.notificaciones);
+        actualizarContador('contador-carrito', contadores.carrito);
+        actualizarContador('contador-solicitudes', contadores.solicitudes);
+    });
+
+    flujo.addEventListener('notificacion', (evento) => {
+        const notificacion = JSON.parse(evento.data);
+        const contador = document.getElementById('contador-notificaciones');
+        actualizarContador('contador-notificaciones', (parseInt(contador.textContent, 10) || 0) + 1);
+        showAlert(`<strong>${escaparHtml(notificacion.titulo)}</strong> ${escaparHtml(notificacion.mensaje)}`, 'info');
+    });
+
+    flujo.addEventListener('error', () => {
+        if (flujo.readyState === EventSource.CLOSED) {
+            setTimeout(initNotificacionesEnVivo, 30000);
+        }
+    });
+}
+
+document.addEventListener('DOMContentLoaded', initNotificacionesEnVivo);
+
 // Exportar funciones globales para uso desde HTML inline
 window.EventLink = {
     searchServices,
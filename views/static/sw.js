@@ -0,0 +1,33 @@
+// EventLink - Service Worker: notificaciones push
+
+// El servidor envía {titulo, mensaje, tipo, url} cifrado; el navegador lo entrega descifrado
+self.addEventListener('push', event => {
+    let datos = {};
+    try {
+        datos = event.data ? event.data.json() : {};
+    } catch (error) {
+        datos = { mensaje: event.data ? event.data.text() : '' };
+    }
+
+    event.waitUntil(self.registration.showNotification(datos.titulo || 'EventLink', {
+        body: datos.mensaje || '',
+        icon: '/static/img/logo.png',
+        tag: datos.tipo || 'eventlink',
+        data: { url: datos.url || '/notificaciones/' }
+    }));
+});
+
+// Al hacer clic se enfoca una pestaña de EventLink abierta o se abre una nueva
+self.addEventListener('notificationclick', event => {
+    event.notification.close();
+    const url = new URL(event.notification.data.url, self.location.origin).href;
+
+    event.waitUntil(clients.matchAll({ type: 'window', includeUncontrolled: true }).then(ventanas => {
+        for (const ventana of ventanas) {
+            if (ventana.url === url && 'focus' in ventana) {
+                return ventana.focus();
+            }
+        }
+        return clients.openWindow(url);
+    }));
+});